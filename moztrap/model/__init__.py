@@ -10,10 +10,14 @@ from .mtmodel import ConcurrencyError
 from .core.models import Product, ProductVersion, ApiKey
 from .core.auth import User, Role, Permission
 from .environments.models import Environment, Profile, Element, Category
-from .execution.models import Run, RunSuite, RunCaseVersion, Result, StepResult
+from .execution.models import (
+    Run, RunSuite, RunCaseVersion, Result, StepResult, RunSummary,
+    ArchivedResult, ArchivedStepResult)
+from .jobs.models import Job
 from .library.bulk import BulkParser
 from .library.models import (
-    Case, CaseVersion, CaseAttachment, CaseStep, Suite, SuiteCase)
+    Case, CaseVersion, CaseAttachment, CaseStep, Suite, SuiteCase,
+    SearchToken)
 from .tags.models import Tag
 
 # version of the REST endpoint APIs for TastyPie
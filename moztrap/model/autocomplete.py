@@ -0,0 +1,148 @@
+"""
+In-process indexes of object names, for autocomplete.
+
+Autocomplete queries come with every keystroke, so rather than querying the
+database each time, each process keeps a sorted list of the names of the
+(not deleted) objects of a model, optionally one per "scope" (e.g. per
+product). An index is reloaded when it is next used after the model's table
+has been written to (see ``counts.generation``), or once it is older than
+``settings.MOZTRAP_COUNT_CACHE_TIMEOUT`` seconds, since with a per-process
+cache backend other processes' writes don't change the generation we see.
+
+Names starting with the typed text are suggested first, then names containing
+it elsewhere, each in alphabetical order, and at most ``limit`` of them.
+
+"""
+import bisect
+import heapq
+import time
+
+from django.conf import settings
+
+from . import counts
+
+
+
+AUTOCOMPLETE_LIMIT = 20
+
+# scope key for an index of all objects, regardless of scope
+ALL = "*"
+
+
+
+class NameIndex(object):
+    """
+    Autocomplete index of the names of the objects of a model.
+
+    If ``scope_field`` (the name of a foreign key, such as "product") is
+    given, suggestions can be limited to objects with given values of it.
+
+    """
+    def __init__(self, model, scope_field=None):
+        self.model = model
+        self.scope_field = scope_field
+        self._scopes = {}
+
+
+    def suggest(self, text, scopes=(ALL,), limit=AUTOCOMPLETE_LIMIT):
+        """
+        Return list of up to ``limit`` ``Suggestion`` for ``text``.
+
+        ``scopes`` is a list of values of ``scope_field`` (None for objects
+        without one) whose objects should be included; by default, all
+        objects are.
+
+        """
+        text = text.lower()
+        generation = counts.generation(self.model)
+        found = []
+        for scope in scopes:
+            found.extend(self._index(scope, generation).search(text, limit))
+        return sorted(found)[:limit]
+
+
+    def _index(self, scope, generation):
+        """Return up-to-date ``ScopeIndex`` for ``scope``."""
+        index = self._scopes.get(scope)
+        if (index is None or index.generation != generation or
+                index.age() > settings.MOZTRAP_COUNT_CACHE_TIMEOUT):
+            qs = self.model.objects.order_by()
+            if scope is not ALL:
+                qs = qs.filter(**{self.scope_field: scope})
+            fields = ["id", "name"]
+            if self.scope_field is not None:
+                fields.append("{0}_id".format(self.scope_field))
+            index = ScopeIndex(qs.values_list(*fields), generation)
+            self._scopes[scope] = index
+        return index
+
+
+
+class Suggestion(tuple):
+    """A matching name: (rank, lower-case name, name, id, scope, start)."""
+    @property
+    def name(self):
+        return self[2]
+
+
+    @property
+    def id(self):
+        return self[3]
+
+
+    @property
+    def scope(self):
+        return self[4]
+
+
+    @property
+    def start(self):
+        """Index in ``name`` where the matching text starts."""
+        return self[5]
+
+
+
+class ScopeIndex(object):
+    """Sorted names of the objects of one scope."""
+    def __init__(self, rows, generation):
+        """Index ``rows`` of (id, name[, scope]) at ``generation``."""
+        self.generation = generation
+        self.loaded = time.time()
+        entries = sorted(
+            (name.lower(), name, row[0], row[2] if len(row) > 2 else None)
+            for row in rows
+            for name in [row[1]]
+            )
+        self.entries = entries
+        self.keys = [e[0] for e in entries]
+
+
+    def age(self):
+        """Return seconds since this index was loaded."""
+        return time.time() - self.loaded
+
+
+    def search(self, text, limit):
+        """Return up to ``limit`` best ``Suggestion`` matching ``text``."""
+        found = []
+        # names starting with text are together, in order, in sorted keys
+        i = bisect.bisect_left(self.keys, text)
+        while (i < len(self.keys) and len(found) < limit and
+               self.keys[i].startswith(text)):
+            lower, name, obj_id, scope = self.entries[i]
+            found.append(Suggestion((0, lower, name, obj_id, scope, 0)))
+            i += 1
+
+        if len(found) < limit:
+            found.extend(
+                heapq.nsmallest(
+                    limit - len(found),
+                    (
+                        Suggestion((1, lower, name, obj_id, scope, start))
+                        for lower, name, obj_id, scope in self.entries
+                        for start in [lower.find(text)]
+                        if start > 0
+                        )
+                    )
+                )
+        return found
@@ -0,0 +1,89 @@
+"""
+Archive (or purge) results superseded or deleted long enough ago.
+
+See ``moztrap.model.execution.retention``. By default the
+``MOZTRAP_RETENTION_DAYS`` and ``MOZTRAP_RETENTION_PURGE`` settings are
+applied once; with ``--schedule``, a background job is queued instead that
+applies them every ``MOZTRAP_RETENTION_INTERVAL`` seconds (processed by the
+``run_jobs`` worker).
+
+"""
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from moztrap.model.execution import retention
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves results superseded or deleted over --days ago (and their step "
+        "results) to the archive tables, or purges them.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--days",
+            type="int",
+            default=None,
+            help="Age in days past which results are archived (default: "
+            "the MOZTRAP_RETENTION_DAYS setting).",
+            ),
+        make_option(
+            "--purge",
+            action="store_true",
+            default=None,
+            help="Delete old results instead of archiving them.",
+            ),
+        make_option(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="Only report how many results would be archived or purged.",
+            ),
+        make_option(
+            "--schedule",
+            action="store_true",
+            default=False,
+            help="Queue the recurring retention job (using the settings).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+
+        if options["schedule"]:
+            job = retention.schedule()
+            if verbosity:
+                self.stdout.write(
+                    u"Queued {0}, due {1}.\n".format(job, job.run_after))
+            return
+
+        days = options["days"]
+        if days is None:
+            days = settings.MOZTRAP_RETENTION_DAYS
+        if days < 0:
+            raise CommandError("--days must not be negative.")
+        purge = options["purge"]
+        if purge is None:
+            purge = settings.MOZTRAP_RETENTION_PURGE
+
+        found = retention.apply_retention(
+            days, purge=purge, dry_run=options["dry_run"])
+
+        if verbosity:
+            if options["dry_run"]:
+                action = "Would purge" if purge else "Would archive"
+            else:
+                action = "Purged" if purge else "Archived"
+            self.stdout.write(
+                "{0} {1} results and {2} step results older than {3} "
+                "days.\n".format(
+                    action,
+                    found[retention.Result],
+                    found[retention.StepResult],
+                    days,
+                    )
+                )
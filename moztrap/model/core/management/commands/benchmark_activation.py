@@ -0,0 +1,138 @@
+"""
+Time activation (and re-activation) of runs with many caseversions.
+
+For each requested size, a product version with the given number of
+environments, a suite of that many active caseversions and a run of that suite
+are created; then the run is activated and refreshed, and both are timed.
+Everything created is deleted again afterwards, but as activation commits its
+own transaction, run this against a scratch copy of the database.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moztrap import model
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Times activation and refresh of runs with the given numbers of "
+        "caseversions. Nothing created is kept.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--sizes",
+            default="1000,10000,50000",
+            help="Comma-separated numbers of caseversions per run.",
+            ),
+        make_option(
+            "--envs",
+            type="int",
+            default=12,
+            help="Number of environments of each run and caseversion.",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+        try:
+            sizes = [int(s) for s in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError(
+                "--sizes must be comma-separated integers, not {0!r}.".format(
+                    options["sizes"]))
+        num_envs = options["envs"]
+
+        for size in sizes:
+            if verbosity > 1:
+                self.stdout.write(
+                    "Creating run with {0} caseversions...\n".format(size))
+            activate, refresh = self.benchmark(size, num_envs)
+            if verbosity:
+                self.stdout.write(
+                    "{0} caseversions x {1} environments: activate {2:.2f}s, "
+                    "refresh {3:.2f}s\n".format(
+                        size, num_envs, activate, refresh))
+
+
+    def benchmark(self, size, num_envs):
+        """Return (activate, refresh) seconds for run of ``size`` cases."""
+        run = create_run(size, num_envs)
+        try:
+            start = time.time()
+            run.activate()
+            activate = time.time() - start
+
+            start = time.time()
+            run.refresh()
+            refresh = time.time() - start
+        finally:
+            delete_run(run)
+
+        return activate, refresh
+
+
+
+def create_run(size, num_envs):
+    """Create and return a draft run of ``size`` caseversions in one suite."""
+    product = model.Product.objects.create(name="Activation benchmark")
+    pv = model.ProductVersion.objects.create(product=product, version="1.0")
+    envs = [model.Environment.objects.create() for i in range(num_envs)]
+    pv.environments.add(*envs)
+
+    suite = model.Suite.objects.create(
+        product=product, name="Activation benchmark", status="active")
+
+    model.Case.objects.bulk_create(
+        [model.Case(product=product) for i in range(size)])
+    case_ids = list(
+        model.Case.objects.filter(product=product).order_by(
+            "id").values_list("id", flat=True))
+
+    model.CaseVersion.objects.bulk_create(
+        [
+            model.CaseVersion(
+                case_id=case_id,
+                productversion=pv,
+                name="Case {0}".format(i),
+                status="active",
+                latest=True,
+                )
+            for i, case_id in enumerate(case_ids)
+            ]
+        )
+    model.SuiteCase.objects.bulk_create(
+        [
+            model.SuiteCase(suite=suite, case_id=case_id, order=i)
+            for i, case_id in enumerate(case_ids)
+            ]
+        )
+
+    through = model.CaseVersion.environments.through
+    through.objects.bulk_create(
+        [
+            through(caseversion_id=cv_id, environment=env)
+            for cv_id in model.CaseVersion.objects.filter(
+                productversion=pv).values_list("id", flat=True)
+            for env in envs
+            ]
+        )
+
+    run = model.Run.objects.create(
+        productversion=pv, name="Activation benchmark")
+    model.RunSuite.objects.create(run=run, suite=suite)
+
+    return run
+
+
+
+def delete_run(run):
+    """Permanently delete ``run`` and everything ``create_run`` made for it."""
+    pv = run.productversion
+    env_ids = list(pv.environments.values_list("id", flat=True))
+    pv.product.delete(permanent=True)
+    model.Environment.everything.filter(id__in=env_ids).delete(permanent=True)
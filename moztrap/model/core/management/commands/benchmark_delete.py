@@ -0,0 +1,208 @@
+"""
+Measure memory used by soft-deleting runs with many results.
+
+For each requested size, an active run of that many caseversions (in
+``--envs`` environments) is created, with a result (and a step result) for
+each caseversion in each environment. Then the run is soft-deleted two ways,
+each in a forked child process whose growth in peak memory is reported: by
+collecting everything the deletion cascades to with Django's delete
+collector, as ``SoftDeleteCollector`` used to, and with the set-based
+``SoftDeleteCollector``. Both deletions are rolled back, and everything
+created is deleted again afterwards, but run this against a scratch copy of
+the database.
+
+"""
+from optparse import make_option
+import os
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models.deletion import Collector
+
+from moztrap import model
+from moztrap.model.mtmodel import MTModel, SoftDeleteCollector, utcnow
+
+from .benchmark_activation import create_run, delete_run
+
+
+
+# username of the tester of the benchmark results
+TESTER = "delete-benchmark"
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures peak memory growth and time of soft-deleting runs with "
+        "the given numbers of caseversions, by loading the cascade and "
+        "set-based. Nothing created is kept.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--sizes",
+            default="1000,10000",
+            help="Comma-separated numbers of caseversions per run.",
+            ),
+        make_option(
+            "--envs",
+            type="int",
+            default=4,
+            help="Number of environments (results per caseversion).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+        try:
+            sizes = [int(s) for s in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError(
+                "--sizes must be comma-separated integers, not {0!r}.".format(
+                    options["sizes"]))
+        num_envs = options["envs"]
+        if num_envs < 1:
+            raise CommandError("--envs must be positive.")
+
+        for size in sizes:
+            if verbosity > 1:
+                self.stdout.write(
+                    "Creating run with {0} caseversions...\n".format(size))
+            run = create_run_with_results(size, num_envs)
+            try:
+                loaded = measure(load_cascade, run)
+                set_based = measure(soft_delete, run)
+            finally:
+                delete_run(run)
+                model.User.objects.filter(username=TESTER).delete()
+            if verbosity:
+                self.stdout.write(
+                    "{0} results: loading cascade {1:.1f}MB in {2:.2f}s, "
+                    "set-based {3:.1f}MB in {4:.2f}s\n".format(
+                        size * num_envs,
+                        loaded[0] / 1024.0,
+                        loaded[1],
+                        set_based[0] / 1024.0,
+                        set_based[1],
+                        )
+                    )
+
+
+
+def measure(func, run):
+    """
+    Return (peak memory growth in KB, seconds) of ``func(run)``.
+
+    ``func`` is called in a forked child process, in a transaction that is
+    rolled back.
+
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            using = router.db_for_write(run.__class__)
+            # don't share the parent's database connection
+            connections[using].connection = None
+            transaction.enter_transaction_management(using=using)
+            transaction.managed(True, using=using)
+            before = _peak_memory()
+            start = time.time()
+            func(run)
+            elapsed = time.time() - start
+            growth = _peak_memory() - before
+            transaction.rollback(using=using)
+            transaction.leave_transaction_management(using=using)
+            os.write(write_fd, "{0} {1}".format(growth, elapsed))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    output = os.read(read_fd, 100)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    if not output:
+        raise CommandError("Measuring {0} failed.".format(func.__name__))
+    growth, elapsed = output.split()
+    return int(growth), float(elapsed)
+
+
+
+def _peak_memory():
+    """Return peak memory (resident set size) of this process, in KB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+
+def load_cascade(run):
+    """Soft-delete ``run`` after loading all it cascades to, as it used to."""
+    collector = Collector(using=router.db_for_write(run.__class__))
+    collector.collect([run])
+    for model_class, instances in collector.data.iteritems():
+        if issubclass(model_class, MTModel):
+            model_class._base_manager.filter(
+                pk__in=[obj.pk for obj in instances],
+                deleted_on__isnull=True,
+                ).update(deleted_on=utcnow())
+
+
+
+def soft_delete(run):
+    """Soft-delete ``run`` with ``SoftDeleteCollector``."""
+    collector = SoftDeleteCollector(using=router.db_for_write(run.__class__))
+    collector.collect([run])
+    collector.delete()
+
+
+
+def create_run_with_results(size, num_envs):
+    """Create and return active run of ``size`` caseversions, with results."""
+    run = create_run(size, num_envs)
+    run.activate()
+
+    tester = model.User.objects.create(username=TESTER)
+    rcvs = list(
+        model.RunCaseVersion.objects.filter(run=run).values_list(
+            "id", "caseversion_id"))
+    envs = list(run.environments.all())
+
+    model.CaseStep.objects.bulk_create(
+        [
+            model.CaseStep(caseversion_id=cv_id, number=1, instruction="Do")
+            for rcv_id, cv_id in rcvs
+            ]
+        )
+    steps = dict(
+        model.CaseStep.objects.filter(
+            caseversion__runcaseversions__run=run).values_list(
+            "caseversion_id", "id"))
+
+    model.Result.objects.bulk_create(
+        [
+            model.Result(
+                tester=tester,
+                runcaseversion_id=rcv_id,
+                environment=env,
+                status=model.Result.STATUS.passed,
+                )
+            for rcv_id, cv_id in rcvs
+            for env in envs
+            ]
+        )
+    model.StepResult.objects.bulk_create(
+        [
+            model.StepResult(
+                result_id=result_id,
+                step_id=steps[cv_id],
+                status=model.StepResult.STATUS.passed,
+                )
+            for result_id, cv_id in model.Result.objects.filter(
+                runcaseversion__run=run).values_list(
+                "id", "runcaseversion__caseversion_id")
+            ]
+        )
+
+    return run
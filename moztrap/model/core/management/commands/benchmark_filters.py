@@ -0,0 +1,217 @@
+"""
+Time list filtering on multi-valued relationships, joined vs subquery.
+
+A run of the requested number of caseversions (each with tags and steps) is
+created and activated, as by ``benchmark_activation``. Then common filter
+combinations of the manage-cases and run-tests lists are timed two ways: as
+filters used to work, with the lookups joined into the list query, keywords
+searched for with LIKE, and duplicates removed by DISTINCT; and as the list
+filters now work, with multi-valued lookups in subqueries and keywords looked
+up in the search index. Each timing is the best of ``--repeat`` runs of
+counting the list and fetching its first page. Everything created is deleted
+again afterwards, but run this against a scratch copy of the database.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.datastructures import MultiValueDict
+
+from moztrap import model
+from moztrap.view.filters import (
+    CaseVersionFilterSet, RunTestsRunCaseVersionFilterSet)
+from moztrap.model.library import search
+from moztrap.view.lists.filters import KeywordFilter, SearchFilter
+
+from .benchmark_activation import create_run, delete_run
+
+
+
+TAGS = 20
+TAGS_PER_CASE = 3
+STEPS_PER_CASE = 5
+PAGESIZE = 20
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Times filtering of the manage-cases and run-tests lists, with "
+        "DISTINCT joins and with subqueries. Nothing created is kept.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--size",
+            type="int",
+            default=10000,
+            help="Number of caseversions to filter.",
+            ),
+        make_option(
+            "--repeat",
+            type="int",
+            default=3,
+            help="Number of times to run each query (the best is reported).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+        size = options["size"]
+        repeat = options["repeat"]
+        if size < 1 or repeat < 1:
+            raise CommandError("--size and --repeat must be positive.")
+
+        if verbosity > 1:
+            self.stdout.write(
+                "Creating run with {0} caseversions...\n".format(size))
+        run = create_run(size, 2)
+        try:
+            tags = add_tags_and_steps(run)
+            run.activate()
+
+            for label, qs, filterset, data in combinations(run, tags):
+                joined, subquery, found = self.benchmark(
+                    qs, filterset, data, repeat)
+                if verbosity:
+                    self.stdout.write(
+                        "{0} ({1} found): joined {2:.3f}s, "
+                        "subquery {3:.3f}s\n".format(
+                            label, found, joined, subquery))
+        finally:
+            delete_run(run)
+
+
+    def benchmark(self, queryset, filterset, data, repeat):
+        """
+        Return (joined, subquery) best seconds, and number found.
+
+        ``filterset`` is the FilterSet class of the list, and ``data`` maps
+        its filter keys to lists of values.
+
+        """
+        bound = filterset().bind(
+            MultiValueDict(
+                dict(("filter-" + k, v) for k, v in data.items())))
+        joined_qs = joined_filter(queryset, bound)
+        subquery_qs = bound.filter(queryset)
+
+        joined = best_time(joined_qs, repeat)
+        subquery = best_time(subquery_qs, repeat)
+
+        found = subquery_qs.count()
+        if joined_qs.count() != found:
+            raise CommandError(
+                "Joined and subquery filtering found different objects.")
+
+        return joined, subquery, found
+
+
+
+def best_time(queryset, repeat):
+    """Return best time to count ``queryset`` and fetch its first page."""
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        queryset.all().count()
+        list(queryset.all()[:PAGESIZE])
+        times.append(time.time() - start)
+    return min(times)
+
+
+
+def joined_filter(queryset, boundfilterset):
+    """Filter ``queryset`` with joins and DISTINCT, as filters used to."""
+    for boundfilter in boundfilterset:
+        flt = boundfilter._filter
+        values = boundfilter.values
+        if not values:
+            continue
+        if isinstance(flt, KeywordFilter):
+            lookup = flt.lookup
+            if isinstance(flt, SearchFilter):
+                lookup = search.FIELDS[flt.field]
+                if flt.lookup != "pk":
+                    lookup = "{0}__{1}".format(flt.lookup, lookup)
+            for value in values:
+                queryset = queryset.filter(
+                    **{"{0}__icontains".format(lookup): value})
+        else:
+            filters = {"{0}__in".format(flt.lookup): values}
+            filters.update(flt.extra_filters)
+            queryset = queryset.filter(**filters)
+    return queryset.distinct()
+
+
+
+def add_tags_and_steps(run):
+    """Tag and add steps to caseversions of ``run``; return tag ids."""
+    product = run.productversion.product
+    model.Tag.objects.bulk_create(
+        [
+            model.Tag(name="Tag {0}".format(i), product=product)
+            for i in range(TAGS)
+            ]
+        )
+    tag_ids = list(
+        model.Tag.objects.filter(product=product).order_by(
+            "id").values_list("id", flat=True))
+
+    cv_ids = list(
+        model.CaseVersion.objects.filter(
+            productversion=run.productversion).order_by(
+            "id").values_list("id", flat=True))
+
+    through = model.CaseVersion.tags.through
+    through.objects.bulk_create(
+        [
+            through(
+                caseversion_id=cv_id,
+                tag_id=tag_ids[(i + j) % len(tag_ids)],
+                )
+            for i, cv_id in enumerate(cv_ids)
+            for j in range(TAGS_PER_CASE)
+            ]
+        )
+    model.CaseStep.objects.bulk_create(
+        [
+            model.CaseStep(
+                caseversion_id=cv_id,
+                number=n,
+                instruction="Step {0}: open page{1}".format(n, i),
+                expected="Expected {0}".format(n),
+                )
+            for i, cv_id in enumerate(cv_ids)
+            for n in range(1, STEPS_PER_CASE + 1)
+            ]
+        )
+    search.index(cv_ids)
+
+    return tag_ids
+
+
+
+def combinations(run, tags):
+    """Yield (label, queryset, filterset class, data) to benchmark."""
+    suite = run.suites.get()
+    cases = model.CaseVersion.objects.filter(
+        productversion=run.productversion)
+    rcvs = model.RunCaseVersion.objects.filter(run=run)
+    common = [
+        ("tag", {"tag": [tags[0]]}),
+        ("two tags", {"tag": [tags[0], tags[1]]}),
+        ("instruction", {"instruction": ["page1"]}),
+        ("tag + instruction", {"tag": [tags[0]], "instruction": ["step 2"]}),
+        ("tag + suite", {"tag": [tags[0]], "suite": [suite.id]}),
+        ]
+    for label, data in common:
+        yield (
+            "manage cases by " + label, cases, CaseVersionFilterSet, data)
+    for label, data in common:
+        yield (
+            "run tests by " + label,
+            rcvs,
+            RunTestsRunCaseVersionFilterSet,
+            data,
+            )
@@ -0,0 +1,111 @@
+"""
+Time reordering of product versions over product size.
+
+For each requested size, a product with that many cases is created, each case
+with a caseversion for each of ``--versions`` product versions. Then the
+``latest`` flags of the caseversions are recomputed two ways: one case at a
+time, as ``Product.reorder_versions`` used to (with ``set_latest_version``),
+and with the set-based ``reorder_versions``. Everything created is deleted
+again afterwards, but run this against a scratch copy of the database.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moztrap import model
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Times recomputing latest caseversions of products with the given "
+        "numbers of cases, per case and set-based. Nothing created is kept.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--sizes",
+            default="1000,10000,30000",
+            help="Comma-separated numbers of cases per product.",
+            ),
+        make_option(
+            "--versions",
+            type="int",
+            default=3,
+            help="Number of product versions (and caseversions per case).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+        try:
+            sizes = [int(s) for s in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError(
+                "--sizes must be comma-separated integers, not {0!r}.".format(
+                    options["sizes"]))
+        num_versions = options["versions"]
+        if num_versions < 1:
+            raise CommandError("--versions must be positive.")
+
+        for size in sizes:
+            if verbosity > 1:
+                self.stdout.write(
+                    "Creating product with {0} cases...\n".format(size))
+            per_case, set_based = self.benchmark(size, num_versions)
+            if verbosity:
+                self.stdout.write(
+                    "{0} cases x {1} versions: per case {2:.2f}s, "
+                    "set-based {3:.2f}s\n".format(
+                        size, num_versions, per_case, set_based))
+
+
+    def benchmark(self, size, num_versions):
+        """Return (per case, set-based) seconds for ``size`` cases."""
+        product = create_product(size, num_versions)
+        try:
+            start = time.time()
+            for case in product.cases.all():
+                case.set_latest_version()
+            per_case = time.time() - start
+
+            start = time.time()
+            product.reorder_versions()
+            set_based = time.time() - start
+        finally:
+            product.delete(permanent=True)
+
+        return per_case, set_based
+
+
+
+def create_product(size, num_versions):
+    """Create and return product of ``size`` cases in ``num_versions``."""
+    product = model.Product.objects.create(name="Reorder benchmark")
+    pvs = [
+        model.ProductVersion.objects.create(
+            product=product, version="{0}.0".format(i))
+        for i in range(1, num_versions + 1)
+        ]
+
+    model.Case.objects.bulk_create(
+        [model.Case(product=product) for i in range(size)])
+    case_ids = list(
+        model.Case.objects.filter(product=product).order_by(
+            "id").values_list("id", flat=True))
+
+    model.CaseVersion.objects.bulk_create(
+        [
+            model.CaseVersion(
+                case_id=case_id,
+                productversion=pv,
+                name="Case {0}".format(i),
+                )
+            for pv in pvs
+            for i, case_id in enumerate(case_ids)
+            ]
+        )
+
+    return product
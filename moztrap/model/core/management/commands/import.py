@@ -28,16 +28,26 @@ The data must be in JSON format and structured like this::
         ]
     }
 
+The file is parsed incrementally and its suites and cases are committed in
+chunks of ``--chunk-size``, so files of any size can be imported in constant
+memory; progress is reported after each commit. With ``--checkpoint``, the
+progress is also recorded in the given file; if the import is interrupted,
+run the command again with the same checkpoint file to resume it. The
+checkpoint file is removed when the import completes.
+
 """
 
 from django.core.management.base import BaseCommand, CommandError
 
 from optparse import make_option
 import json
+import os
 import os.path
 
 from moztrap.model.core.models import Product, ProductVersion
-from moztrap.model.library.importer import Importer
+from moztrap.model.library.importer import (
+    Importer, StreamImportResult, JSONStreamError, stream_items,
+    STREAM_CHUNK_SIZE)
 
 
 
@@ -56,6 +66,18 @@ class Command(BaseCommand):
             default=False,
             help="Force importing cases, even if the case name is a"
             " duplicate"),
+        make_option(
+            "--chunk-size",
+            type="int",
+            default=STREAM_CHUNK_SIZE,
+            help="Number of suites and cases to import and commit at a time.",
+            ),
+        make_option(
+            "--checkpoint",
+            default=None,
+            help="File to record progress in, and to resume an interrupted"
+            " import from.",
+            ),
 
         )
 
@@ -64,6 +86,7 @@ class Command(BaseCommand):
             raise CommandError("Usage: {0}".format(self.args))
 
         force_dupes = options.get("force_dupes")
+        verbosity = int(options.get("verbosity", 1))
 
         try:
             product = Product.objects.get(name=args[0])
@@ -79,11 +102,13 @@ class Command(BaseCommand):
                     args[1], args[0])
                 )
 
+        checkpoint = Checkpoint(options.get("checkpoint"))
+
         try:
             files = []
             # if this is a directory, import all files in it
             if os.path.isdir(args[2]):
-                for file in os.listdir(args[2]):
+                for file in sorted(os.listdir(args[2])):
                     if not file.startswith("."):
                         files.append("{0}/{1}".format(args[2], file))
             else:
@@ -91,12 +116,40 @@ class Command(BaseCommand):
 
             results_for_files = None
             for file in files:
+                if checkpoint.is_completed(file):
+                    if verbosity:
+                        self.stdout.write(
+                            "Skipping {0}: already imported.\n".format(file))
+                    continue
+
+                # record and report each commit, so the import can be resumed
+                def progress(result):
+                    checkpoint.save(file, result.processed)
+                    if verbosity:
+                        self.stdout.write(
+                            "Committed {0} items of {1}: {2} cases, "
+                            "{3} suites, {4} warnings.\n".format(
+                                result.processed,
+                                file,
+                                result.num_cases,
+                                result.num_suites,
+                                result.warning_count,
+                                )
+                            )
+
                 with open(file) as fh:
 
-                    # try to import this as JSON
+                    # import this as a JSON stream
                     try:
-                        case_data = json.load(fh)   # pragma: no branch
-                    except ValueError as e:
+                        result = Importer().import_stream(
+                            product_version,
+                            stream_items(fh),
+                            force_dupes=force_dupes,
+                            chunk_size=options.get("chunk_size"),
+                            skip=checkpoint.skip(file),
+                            progress=progress,
+                            )
+                    except JSONStreamError as e:
                         raise CommandError(
                             "Could not parse JSON: {0}: {1}".format(
                                 str(e),
@@ -106,14 +159,14 @@ class Command(BaseCommand):
                     # @@@: support importing as CSV.  Rather than returning an
                     # error above, just try CSV import instead.
 
-                    result = Importer().import_data(
-                        product_version, case_data, force_dupes=force_dupes)
+                    checkpoint.complete(file)
 
                     # append this result to those for any of the other files.
                     if not results_for_files:
-                        results_for_files = result
-                    else:
-                        results_for_files.append(result)  # pragma: no branch
+                        results_for_files = StreamImportResult()
+                    results_for_files.append(result)
+
+            checkpoint.remove()
 
             if results_for_files:
                 result_list = results_for_files.get_as_list()
@@ -128,3 +181,73 @@ class Command(BaseCommand):
                 'Could not open "{0}", I/O error {1}: {2}'.format(
                     args[2], errno, strerror)
                 )
+
+
+
+class Checkpoint(object):
+    """
+    Progress of an import, recorded in a JSON file.
+
+    The file holds a dictionary mapping the (absolute) path of each file
+    being imported to the number of its items committed so far, or to
+    ``true`` once it has been imported completely.  With no path, nothing
+    is recorded.
+
+    """
+
+    def __init__(self, path):
+        """Load the checkpoint from the file at path, if it exists."""
+
+        self.path = path
+        self.files = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as fh:
+                    self.files = json.load(fh)
+            except ValueError as e:
+                raise CommandError(
+                    'Could not read checkpoint "{0}": {1}'.format(path, e))
+
+
+    def skip(self, file):
+        """Return the number of items of file already committed."""
+
+        processed = self.files.get(os.path.abspath(file), 0)
+        return 0 if processed is True else processed
+
+
+    def is_completed(self, file):
+        """Return True if file has been imported completely."""
+
+        return self.files.get(os.path.abspath(file)) is True
+
+
+    def save(self, file, processed):
+        """Record that processed items of file have been committed."""
+
+        self._write(os.path.abspath(file), processed)
+
+
+    def complete(self, file):
+        """Record that file has been imported completely."""
+
+        self._write(os.path.abspath(file), True)
+
+
+    def remove(self):
+        """Remove the checkpoint file; the import is complete."""
+
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    def _write(self, file, value):
+        """Record value for file, replacing the checkpoint file atomically."""
+
+        self.files[file] = value
+        if self.path is None:
+            return
+        tmp = "{0}.tmp".format(self.path)
+        with open(tmp, "w") as fh:
+            json.dump(self.files, fh)
+        os.rename(tmp, self.path)
@@ -0,0 +1,94 @@
+"""
+Record results from a file of newline-delimited JSON.
+
+Each line of the file is one result object, as submitted to the result API::
+
+    {"case": "1", "environment": "23", "run_id": "1", "status": "passed"}
+
+The file is read incrementally and results are committed in chunks, so files
+of any size can be ingested in constant memory. If ingestion is interrupted,
+run the command again with ``--skip`` set to the number of lines already
+committed.
+
+"""
+from optparse import make_option
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moztrap.model.core.auth import User
+from moztrap.model.execution.ingest import ingest_stream, STREAM_CHUNK_SIZE
+
+
+
+class Command(BaseCommand):
+    args = "<username> <filename>"
+    help = (
+        "Records results from a file (or - for stdin) of newline-delimited "
+        "JSON, as submitted by the given user.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--chunk-size",
+            type="int",
+            default=STREAM_CHUNK_SIZE,
+            help="Number of lines to record and commit at a time.",
+            ),
+        make_option(
+            "--skip",
+            type="int",
+            default=0,
+            help="Number of lines to skip (e.g. already committed).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        if not len(args) == 2:
+            raise CommandError("Usage: {0}".format(self.args))
+        verbosity = int(options.get("verbosity", 1))
+
+        try:
+            user = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError('User "{0}" does not exist'.format(args[0]))
+
+        if args[1] == "-":
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(args[1])
+            except IOError as e:
+                raise CommandError(
+                    'Could not open file "{0}": {1}'.format(args[1], e))
+
+        # report each commit, so an interrupted run can be resumed
+        def progress(outcome):
+            if verbosity:
+                self.stdout.write(
+                    "Committed {0} lines: {1} results, {2} errors.\n".format(
+                        outcome.processed,
+                        outcome.created,
+                        outcome.error_count,
+                        )
+                    )
+
+        try:
+            outcome = ingest_stream(
+                stream,
+                user,
+                chunk_size=options["chunk_size"],
+                skip=options["skip"],
+                progress=progress,
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if verbosity:
+            for index, message in outcome.errors:
+                self.stdout.write(
+                    u"Line {0}: {1}\n".format(index + 1, message))
+            self.stdout.write(
+                "Processed {0} lines: {1} results recorded, {2} errors.\n".format(
+                    outcome.processed, outcome.created, outcome.error_count))
@@ -0,0 +1,60 @@
+"""
+Rebuild the denormalized ``RunSummary`` rollup of every run from scratch.
+
+Any run whose stored rollup differs from a fresh count is reported, so drift
+in the incremental maintenance can be spotted.
+
+"""
+from django.core.management.base import BaseCommand
+
+from moztrap.model.execution.models import Run, RunSummary
+
+
+
+class Command(BaseCommand):
+    args = "[<run_id> <run_id> ...]"
+    help = (
+        "Recounts the result summary of the given runs (or all runs) and "
+        "reports any that had drifted.")
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+
+        runs = Run.objects.order_by("id")
+        if args:
+            runs = runs.filter(pk__in=args)
+
+        stored = dict(
+            (s.run_id, s) for s in RunSummary.everything.filter(run__in=runs))
+
+        rebuilt = drifted = 0
+        for run in runs.iterator():
+            old = stored.get(run.id)
+            new = RunSummary.refresh(run)
+            rebuilt += 1
+
+            if old is None:
+                if verbosity > 1:
+                    self.stdout.write(
+                        u"Run '{0}' (id {1}): summary created.\n".format(
+                            run, run.id))
+                continue
+
+            diffs = [
+                u"{0} {1} -> {2}".format(
+                    c, getattr(old, c), getattr(new, c))
+                for c in RunSummary.COUNTERS
+                if getattr(old, c) != getattr(new, c)
+                ]
+            if diffs:
+                drifted += 1
+                if verbosity:
+                    self.stdout.write(
+                        u"Run '{0}' (id {1}) had drifted: {2}\n".format(
+                            run, run.id, ", ".join(diffs)))
+
+        if verbosity:
+            self.stdout.write(
+                "Rebuilt {0} run summaries; {1} had drifted.\n".format(
+                    rebuilt, drifted))
@@ -0,0 +1,35 @@
+"""
+Rebuild the keyword search index of caseversion text.
+
+Only needed for caseversions (or steps) created or changed in bulk, bypassing
+the signals that keep the index up to date, or after switching to a search
+backend that uses an index.
+
+"""
+from django.core.management.base import BaseCommand
+
+from moztrap.model.library.models import CaseVersion
+from moztrap.model.library import search
+
+
+
+class Command(BaseCommand):
+    args = "[<caseversion_id> <caseversion_id> ...]"
+    help = (
+        "Rebuilds the search index of the given caseversions (or all "
+        "caseversions).")
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+
+        caseversions = CaseVersion.everything.order_by("id")
+        if args:
+            caseversions = caseversions.filter(pk__in=args)
+        ids = list(caseversions.values_list("id", flat=True))
+
+        search.index(ids)
+
+        if verbosity:
+            self.stdout.write(
+                "Indexed {0} caseversions.\n".format(len(ids)))
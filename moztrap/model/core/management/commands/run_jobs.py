@@ -0,0 +1,68 @@
+"""
+Worker that processes queued background jobs.
+
+Runs until interrupted, polling the database for due jobs. Several workers can
+run at once; each job is claimed by only one of them. The read transaction is
+ended after every poll, so (e.g. under MySQL's REPEATABLE READ isolation) an
+idle worker sees jobs queued after it started.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from moztrap.model.jobs.models import Job, worker_name
+
+
+
+class Command(BaseCommand):
+    help = "Processes queued background jobs (e.g. run activation)."
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Process the jobs that are due now, then exit.",
+            ),
+        make_option(
+            "--sleep",
+            type="float",
+            default=5,
+            help="Seconds to wait between polls when no job is due.",
+            ),
+        make_option(
+            "--max-jobs",
+            type="int",
+            default=0,
+            help="Exit after processing this many jobs (0 for no limit).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+        worker = worker_name()
+
+        processed = 0
+        while not options["max_jobs"] or processed < options["max_jobs"]:
+            job = Job.claim_next(worker)
+            # end the snapshot, so the next poll sees newly queued jobs
+            transaction.commit_unless_managed()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            job.execute()
+            processed += 1
+            if verbosity:
+                self.stdout.write(
+                    u"{0} (attempt {1}): {2}\n".format(
+                        job, job.attempts, job.status))
+
+        if verbosity > 1:
+            self.stdout.write("Processed {0} jobs.\n".format(processed))
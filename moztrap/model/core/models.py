@@ -5,13 +5,14 @@ Core MozTrap models (Product).
 import uuid
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 
 from pkg_resources import parse_version
 from preferences.models import Preferences
 
 from ..environments.models import HasEnvironmentsModel
-from ..mtmodel import MTModel, MTManager, TeamModel
+from ..mtmodel import MTModel, MTManager, TeamModel, BulkCloner
+from .. import counts
 from .auth import Role, User
 
 
@@ -51,19 +52,45 @@ class Product(MTModel, TeamModel):
         If an ``update_instance`` is given, update it with new order and
         ``latest`` flag.
 
+        The new order and ``latest`` flags of all versions are saved with one
+        UPDATE, and the ``latest`` flags of the caseversions of all cases of
+        the product are recomputed with two more (see
+        ``CaseVersion.set_latest_versions``).
+
         """
         ordered = sorted(self.versions.all(), key=by_version)
+        if ordered:
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            cursor.execute(
+                """UPDATE {table}
+                SET {order} = CASE {id} {whens} END,
+                    {latest} = ({id} = %s),
+                    {cc_version} = {cc_version} + 1
+                WHERE {id} IN ({ids})
+                """.format(
+                    table=qn(ProductVersion._meta.db_table),
+                    order=qn("order"),
+                    latest=qn("latest"),
+                    id=qn("id"),
+                    cc_version=qn("cc_version"),
+                    whens=" ".join(["WHEN %s THEN %s"] * len(ordered)),
+                    ids=", ".join(["%s"] * len(ordered)),
+                    ),
+                [p for i, v in enumerate(ordered, 1) for p in (v.id, i)]
+                + [ordered[-1].id]
+                + [v.id for v in ordered],
+                )
+            transaction.commit_unless_managed()
+            counts.invalidate(ProductVersion)
         for i, version in enumerate(ordered, 1):
-            version.order = i
-            version.latest = (i == len(ordered))
-            version.save(force_update=True, skip_reorder=True, notrack=True)
             if version == update_instance:
-                update_instance.order = version.order
-                update_instance.latest = version.latest
+                update_instance.order = i
+                update_instance.latest = (i == len(ordered))
                 update_instance.cc_version += 1
-        # now we have to update latest caseversions too, @@@ too slow?
-        for case in self.cases.all():
-            case.set_latest_version()
+
+        CaseVersion = ProductVersion.caseversions.related.model
+        CaseVersion.set_latest_versions(self.cases.all())
 
 
 
@@ -168,6 +195,23 @@ class ProductVersion(MTModel, TeamModel, HasEnvironmentsModel):
         return super(ProductVersion, self).clone(*args, **kwargs)
 
 
+    def clone_caseversions(self, caseversions, user=None):
+        """
+        Clone given caseversions (of other versions) into this version.
+
+        Cloned caseversions keep their name and case; their steps,
+        attachments, tags and environments are cloned with them, in bulk.
+
+        """
+        cloner = BulkCloner(user)
+        for cv in caseversions:
+            cv.clone(
+                overrides={"productversion": self, "name": cv.name},
+                cloner=cloner,
+                )
+        cloner.run()
+
+
 
 def by_version(productversion):
     """
@@ -0,0 +1,164 @@
+"""
+Cached counts of queryset results.
+
+Counting a filtered list (with its joins and DISTINCT) can cost more than
+fetching a page of it, so ``cached_count`` keeps counts in the cache for a
+short time (``settings.MOZTRAP_COUNT_CACHE_TIMEOUT`` seconds).
+
+Counts are keyed by the SQL of the count query, so every distinct combination
+of filters gets its own entry, and by a "generation" token for each table the
+query (or any subquery in its filters) reads. Writing to a table (via
+``save``, ``delete``, changes to many-to-many relations, or ``MTQuerySet``
+bulk update/create/delete) replaces its generation token, so counts that read
+it are never served again. Writes bypassing the ORM must call ``invalidate``
+themselves; anything missed is still only stale until the timeout.
+
+Other data derived from query results can be cached the same way, with keys
+from ``cache_key``.
+
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.db.models.sql import Query
+from django.db.models.sql.constants import TABLE_NAME
+from django.db.utils import DatabaseError
+
+
+
+# generation tokens outlive the counts that depend on them
+GENERATION_TIMEOUT = 24 * 60 * 60
+
+
+
+def cached_count(queryset, limit=None):
+    """
+    Return tuple (count, capped) for ``queryset``, using the cache.
+
+    If ``limit`` is given, counting stops past ``limit`` objects: ``count``
+    is then at most ``limit``, and ``capped`` is True if there are more. The
+    database counts the first ``limit + 1`` ids, rather than returning them.
+
+    """
+    qs = queryset.order_by()
+    key = cache_key("counts", qs, limit)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    if limit is None:
+        # @@@ Django 1.5 should not require the .values fallback; Bug 18248
+        try:
+            found = qs.count()
+        except DatabaseError:
+            found = qs.values("id").count()
+        result = (found, False)
+    else:
+        ids = qs.values_list("id", flat=True)[:limit + 1]
+        sql, params = ids.query.get_compiler(ids.db).as_sql()
+        cursor = connections[ids.db].cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM ({0}) AS capped".format(sql), params)
+        found = cursor.fetchone()[0]
+        result = (min(found, limit), found > limit)
+
+    cache.set(key, result, settings.MOZTRAP_COUNT_CACHE_TIMEOUT)
+    return result
+
+
+
+def cache_key(prefix, queryset, *extra):
+    """
+    Return cache key for data derived from the results of ``queryset``.
+
+    The key depends on the SQL of the query, any ``extra`` values, and the
+    generation tokens of the tables the query reads, so it changes whenever
+    those tables are written to.
+
+    """
+    query = queryset.query.clone()
+    sql, params = query.get_compiler(queryset.db).as_sql()
+    tables = sorted(_tables(query))
+
+    return "{0}:{1}".format(
+        prefix,
+        hashlib.md5(
+            repr((queryset.db, extra, sql, params, _generations(tables)))
+            ).hexdigest()
+        )
+
+
+
+def invalidate(*models):
+    """Discard cached counts reading the tables of any of ``models``."""
+    cache.set_many(
+        dict(
+            (_generation_key(m._meta.db_table), _token()) for m in models),
+        GENERATION_TIMEOUT,
+        )
+
+
+
+def generation(model):
+    """
+    Return token for the current state of ``model``'s table.
+
+    The token changes whenever counts reading the table are invalidated, so
+    it can also be used to check other data derived from the table.
+
+    """
+    return _generations([model._meta.db_table])[0]
+
+
+
+def _generations(tables):
+    """Return list of current generation tokens for ``tables``."""
+    keys = [_generation_key(t) for t in tables]
+    found = cache.get_many(keys)
+    missing = dict((k, _token()) for k in keys if k not in found)
+    if missing:
+        cache.set_many(missing, GENERATION_TIMEOUT)
+        found.update(missing)
+    return [found[k] for k in keys]
+
+
+
+def _tables(query):
+    """Return set of tables ``query`` reads, including in its subqueries."""
+    tables = set(join[TABLE_NAME] for join in query.alias_map.values())
+    nodes = [query.where]
+    while nodes:
+        node = nodes.pop()
+        for child in node.children:
+            if hasattr(child, "children"):
+                nodes.append(child)
+            elif isinstance(child, tuple):
+                # (constraint, lookup type, annotation, value)
+                value = getattr(child[-1], "query", child[-1])
+                if isinstance(value, Query):
+                    tables.update(_tables(value))
+    return tables
+
+
+
+def _generation_key(table):
+    return "counts:generation:{0}".format(table)
+
+
+
+def _token():
+    return uuid.uuid4().hex
+
+
+
+def _model_changed(sender, **kwargs):
+    invalidate(sender)
+
+
+post_save.connect(_model_changed, dispatch_uid="counts_post_save")
+post_delete.connect(_model_changed, dispatch_uid="counts_post_delete")
+m2m_changed.connect(_model_changed, dispatch_uid="counts_m2m_changed")
@@ -121,6 +121,12 @@ class EnvironmentResource(MTResource):
         return Environment
 
 
+    def obj_get_list(self, request=None, **kwargs):
+        """Load the elements of all listed environments together."""
+        return super(EnvironmentResource, self).obj_get_list(
+            request, **kwargs).with_labels()
+
+
     def hydrate_m2m(self, bundle):
         """Validate the elements,
         which should each belong to separate categories."""
@@ -5,9 +5,12 @@ Models for environments.
 import itertools
 from collections import defaultdict
 
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
 
-from ..mtmodel import MTModel
+from ..mtmodel import MTModel, MTManager, MTQuerySet, utcnow
+from .. import counts
 
 
 
@@ -33,18 +36,53 @@ class Profile(MTModel):
         Create profile of environments as Cartesian product of given elements.
 
         Elements are split by category, and then an environment is generated
-        for each combination of one element from each category.
+        for each combination of one element from each category. Environments
+        and their element links are bulk-inserted, so the number of queries
+        doesn't grow with the number of environments.
+
+        If ``dry_run=True`` is given, nothing is created, and the number of
+        environments that would be generated is returned instead.
 
         """
+        dry_run = kwargs.pop("dry_run", False)
+
         by_category = defaultdict(list)
         for element in elements:
-            by_category[element.category].append(element)
+            by_category[element.category_id].append(element)
+        combinations = list(itertools.product(*by_category.values()))
+
+        if dry_run:
+            return len(combinations)
 
         new = cls.objects.create(name=name, **kwargs)
 
-        for element_list in itertools.product(*by_category.values()):
-            e = Environment.objects.create(profile=new)
-            e.elements.add(*element_list)
+        user = kwargs.get("user")
+        now = utcnow()
+        Environment.objects.bulk_create(
+            [
+                Environment(
+                    profile=new,
+                    created_on=now,
+                    created_by=user,
+                    modified_on=now,
+                    modified_by=user,
+                    )
+                for combination in combinations
+                ]
+            )
+        # ids are assigned in insertion order
+        env_ids = Environment._base_manager.filter(profile=new).order_by(
+            "id").values_list("id", flat=True)
+
+        through = Environment.elements.through
+        through._default_manager.bulk_create(
+            [
+                through(environment_id=env_id, element_id=element.id)
+                for env_id, combination in zip(env_ids, combinations)
+                for element in combination
+                ]
+            )
+        counts.invalidate(through)
 
         return new
 
@@ -64,6 +102,113 @@ class Profile(MTModel):
 
 
 
+class ProtectedQuerySet(MTQuerySet):
+    """
+    An ``MTQuerySet`` of objects that can't be deleted while they are in use.
+
+    Subclasses implement ``in_use_ids``.
+
+    """
+    _with_deletable = False
+
+
+    def in_use_ids(self):
+        """Return values queryset of ids of all objects in use."""
+        raise NotImplementedError()
+
+
+    def in_use(self):
+        """Return a clone limited to the objects that are in use."""
+        return self._clone(_with_deletable=False).filter(
+            pk__in=self.in_use_ids())
+
+
+    def with_deletable(self):
+        """
+        Return a clone that loads ``deletable`` of all fetched objects.
+
+        Deletability of all fetched objects is loaded with a single query,
+        instead of a query per object.
+
+        """
+        return self._clone(_with_deletable=True)
+
+
+    def _clone(self, *args, **kwargs):
+        """Clone queryset, preserving the ``with_deletable`` flag."""
+        kwargs.setdefault("_with_deletable", self._with_deletable)
+        return super(ProtectedQuerySet, self)._clone(*args, **kwargs)
+
+
+    def iterator(self):
+        """Iterate over fetched objects, with deletability if requested."""
+        if not self._with_deletable:
+            return super(ProtectedQuerySet, self).iterator()
+        objs = list(super(ProtectedQuerySet, self).iterator())
+        if objs:
+            in_use = set(
+                self.model._base_manager.filter(
+                    pk__in=[o.pk for o in objs]).filter(
+                    pk__in=self.in_use_ids()).values_list("pk", flat=True))
+            for obj in objs:
+                obj._deletable = obj.pk not in in_use
+        return iter(objs)
+
+
+    def delete(self, user=None, permanent=False):
+        """Delete these objects, or raise ProtectedError if any is in use."""
+        in_use = list(self.in_use())
+        if in_use:
+            raise models.ProtectedError(
+                u"{0} in use cannot be deleted: {1}".format(
+                    unicode(self.model._meta.verbose_name_plural).capitalize(),
+                    u", ".join(unicode(o) for o in in_use),
+                    ),
+                in_use,
+                )
+        return super(ProtectedQuerySet, self).delete(
+            user=user, permanent=permanent)
+
+
+
+class ProtectedManager(MTManager):
+    """Manager for models using a ``ProtectedQuerySet``."""
+    # the ProtectedQuerySet subclass for this model
+    queryset_class = ProtectedQuerySet
+
+
+    def get_query_set(self):
+        """Return a ``queryset_class`` queryset for all queries."""
+        return super(ProtectedManager, self).get_query_set()._clone(
+            klass=self.queryset_class)
+
+
+    def with_deletable(self):
+        """Return queryset that batch-loads deletability."""
+        return self.get_query_set().with_deletable()
+
+
+
+def _in_use(obj):
+    """Return True if ``obj`` is currently in use, so can't be deleted."""
+    return obj.__class__.everything.filter(pk=obj.pk).in_use().exists()
+
+
+
+class CategoryQuerySet(ProtectedQuerySet):
+    """Categories are in use if they have elements in an environment."""
+    def in_use_ids(self):
+        """Return values queryset of ids of all categories in use."""
+        return Environment.elements.through._default_manager.filter(
+            environment__deleted_on__isnull=True).values("element__category")
+
+
+
+class CategoryManager(ProtectedManager):
+    queryset_class = CategoryQuerySet
+
+
+
 class Category(MTModel):
     """
     A category of parallel environment elements.
@@ -74,6 +219,9 @@ class Category(MTModel):
     """
     name = models.CharField(max_length=200)
 
+    everything = CategoryManager(show_deleted=True)
+    objects = CategoryManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -85,17 +233,23 @@ class Category(MTModel):
         verbose_name_plural = "categories"
 
 
-    # @@@ there should be some way to annotate this onto a queryset efficiently
     @property
     def deletable(self):
-        """Return True if this category can be deleted, otherwise False."""
-        return not Environment.objects.filter(elements__category=self).exists()
+        """
+        Return True if this category can be deleted, otherwise False.
+
+        Uses the value loaded by ``with_deletable``, if any.
+
+        """
+        try:
+            return self._deletable
+        except AttributeError:
+            return not _in_use(self)
 
 
-    # @@@ this protection should apply to queryset.delete as well
     def delete(self, *args, **kwargs):
         """Delete this category, or raise ProtectedError if its in use."""
-        if not self.deletable:
+        if _in_use(self):
             raise models.ProtectedError(
                 "Category '{0}' is in use and cannot be deleted.".format(
                     self.name),
@@ -105,6 +259,20 @@ class Category(MTModel):
 
 
 
+class ElementQuerySet(ProtectedQuerySet):
+    """Elements are in use if they are in an environment."""
+    def in_use_ids(self):
+        """Return values queryset of ids of all elements in use."""
+        return Environment.elements.through._default_manager.filter(
+            environment__deleted_on__isnull=True).values("element")
+
+
+
+class ElementManager(ProtectedManager):
+    queryset_class = ElementQuerySet
+
+
+
 class Element(MTModel):
     """
     An individual environment factor (e.g. "OS X" or "English").
@@ -113,6 +281,9 @@ class Element(MTModel):
     name = models.CharField(max_length=200)
     category = models.ForeignKey(Category, related_name="elements")
 
+    everything = ElementManager(show_deleted=True)
+    objects = ElementManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -123,17 +294,23 @@ class Element(MTModel):
         ordering = ["name"]
 
 
-    # @@@ there should be some way to annotate this onto a queryset efficiently
     @property
     def deletable(self):
-        """Return True if this element can be deleted, otherwise False."""
-        return not self.environments.exists()
+        """
+        Return True if this element can be deleted, otherwise False.
+
+        Uses the value loaded by ``with_deletable``, if any.
+
+        """
+        try:
+            return self._deletable
+        except AttributeError:
+            return not _in_use(self)
 
 
-    # @@@ this protection should apply to queryset.delete as well
     def delete(self, *args, **kwargs):
         """Delete this element, or raise ProtectedError if its in use."""
-        if not self.deletable:
+        if _in_use(self):
             raise models.ProtectedError(
                 "Element '{0}' is in use and cannot be deleted.".format(
                     self.name),
@@ -143,6 +320,44 @@ class Element(MTModel):
 
 
 
+class EnvironmentQuerySet(ProtectedQuerySet):
+    """
+    Environments can batch-load their elements.
+
+    Environments are in use if a product version has them.
+
+    """
+    def in_use_ids(self):
+        """Return values queryset of ids of all environments in use."""
+        from moztrap.model import ProductVersion
+        return ProductVersion.environments.through._default_manager.filter(
+            productversion__deleted_on__isnull=True).values("environment")
+
+
+    def with_labels(self):
+        """
+        Return a clone that loads the elements of all fetched environments.
+
+        The elements (and their categories) of all environments are loaded
+        with two more queries in total, so ``ordered_elements`` and the unicode
+        label of each environment need no further queries.
+
+        """
+        return self.prefetch_related("elements__category")
+
+
+
+class EnvironmentManager(ProtectedManager):
+    """Manager for environments; see ``EnvironmentQuerySet``."""
+    queryset_class = EnvironmentQuerySet
+
+
+    def with_labels(self):
+        """Return queryset that batch-loads environment elements."""
+        return self.get_query_set().with_labels()
+
+
+
 class Environment(MTModel):
     """
     A collection of elements representing a testing environment.
@@ -161,6 +376,9 @@ class Environment(MTModel):
 
     elements = models.ManyToManyField(Element, related_name="environments")
 
+    everything = EnvironmentManager(show_deleted=True)
+    objects = EnvironmentManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -177,7 +395,15 @@ class Environment(MTModel):
 
 
     def ordered_elements(self):
-        """All elements in category name order."""
+        """
+        All elements in category name order.
+
+        Uses elements loaded by ``with_labels``, if any, without querying.
+
+        """
+        if "elements" in getattr(self, "_prefetched_objects_cache", {}):
+            return iter(
+                sorted(self.elements.all(), key=lambda e: e.category.name))
         return iter(self.elements.order_by("category__name"))
 
 
@@ -187,18 +413,23 @@ class Environment(MTModel):
         return super(Environment, self).clone(*args, **kwargs)
 
 
-    # @@@ there should be some way to annotate this onto a queryset efficiently
     @property
     def deletable(self):
-        """Return True if this environment can be deleted, otherwise False."""
-        from moztrap.model import ProductVersion
-        return not ProductVersion.objects.filter(environments=self).exists()
+        """
+        Return True if this environment can be deleted, otherwise False.
+
+        Uses the value loaded by ``with_deletable``, if any.
+
+        """
+        try:
+            return self._deletable
+        except AttributeError:
+            return not _in_use(self)
 
 
-    # @@@ this protection should apply to queryset.delete as well
     def delete(self, *args, **kwargs):
         """Delete this environment, or raise ProtectedError if its in use."""
-        if not self.deletable:
+        if _in_use(self):
             from moztrap.model import ProductVersion
             raise models.ProtectedError(
                 "Environment '{0}' is in use and cannot be deleted.".format(
@@ -210,7 +441,7 @@ class Environment(MTModel):
 
     def remove_from_profile(self, user=None):
         """Remove environment from its profile and delete it if not in use."""
-        if self.deletable:
+        if not _in_use(self):
             self.delete(user=user)
         else:
             self.profile = None
@@ -261,8 +492,8 @@ class HasEnvironmentsModel(models.Model):
         """
         Return model instances to cascade env profile changes to.
 
-        Return value should be a dictionary mapping model classes to iterables
-        of model instances to cascade to.
+        Return value should be a dictionary mapping model classes to querysets
+        (or lists) of model instances to cascade to.
 
         ``objs`` arg is list of objs`` of this class to cascade from;
         ``adding`` arg is True if cascading for an addition of envs to the
@@ -272,30 +503,145 @@ class HasEnvironmentsModel(models.Model):
         return {}
 
 
+    @classmethod
+    def _add_envs(cls, objs, envs):
+        """
+        Add environments to objects of this class, cascading to children.
+
+        ``objs`` is a queryset or list of objects of this class, ``envs`` a
+        list of environments or environment ids. The links of each model
+        cascaded to are added with a single statement, however many objects
+        there are. Returns dictionary mapping model classes to the number of
+        environment links added.
+
+        """
+        touched = {cls: _add_env_links(cls, objs, envs)}
+        for model, instances in cls.cascade_envs_to(objs, adding=True).items():
+            _add_counts(touched, model._add_envs(instances, envs))
+        return touched
+
+
     @classmethod
     def _remove_envs(cls, objs, envs):
-        """Remove one or environments from one or more objects of this class."""
+        """
+        Remove environments from objects of this class, cascading to children.
+
+        Like ``_add_envs``, returns dictionary mapping model classes to the
+        number of environment links removed.
+
+        """
+        touched = {}
         for model, instances in cls.cascade_envs_to(objs, adding=False).items():
-            model._remove_envs(instances, envs)
-        m2m_reverse_name = cls.environments.field.related_query_name()
-        cls.environments.through._base_manager.filter(
-            **{
-                "{0}__in".format(m2m_reverse_name): objs,
-                "environment__in": envs
-                }
-              ).delete()
+            _add_counts(touched, model._remove_envs(instances, envs))
+        _add_counts(touched, {cls: _remove_env_links(cls, objs, envs)})
+        return touched
 
 
     def remove_envs(self, *envs):
-        """Remove one or more environments from this object's profile."""
-        self._remove_envs([self], envs)
+        """
+        Remove one or more environments from this object's profile.
+
+        Returns dictionary mapping model classes to the number of environment
+        links removed.
+
+        """
+        return self._remove_envs([self], envs)
 
 
     def add_envs(self, *envs):
-        """Add one or more environments to this object's profile."""
-        # @@@ optimize this to reduce queries once we have bulk insert in 1.4
-        self.environments.add(*envs)
-        for model, instances in self.cascade_envs_to(
-                [self], adding=True).items():
-            for instance in instances:
-                instance.add_envs(*envs)
+        """
+        Add one or more environments to this object's profile.
+
+        Returns dictionary mapping model classes to the number of environment
+        links added.
+
+        """
+        return self._add_envs([self], envs)
+
+
+
+def _add_counts(touched, more):
+    """Add counts in dictionary ``more`` to those in ``touched``."""
+    for model, count in more.items():
+        touched[model] = touched.get(model, 0) + count
+
+
+
+def _env_links(model, objs, envs):
+    """
+    Return dict of SQL fragments and list of params for environment links.
+
+    The links are those between (the environments of) ``model`` objects
+    ``objs`` and environments ``envs``; returns None if there can't be any.
+
+    """
+    env_ids = [int(getattr(e, "pk", e)) for e in envs]
+    if not env_ids:
+        return None
+    if not isinstance(objs, QuerySet):
+        objs = [getattr(o, "pk", o) for o in objs]
+    try:
+        objs_sql, objs_params = model._base_manager.filter(
+            pk__in=objs).values("pk").query.sql_with_params()
+    except EmptyResultSet:
+        return None
+
+    qn = connection.ops.quote_name
+    field = model.environments.field
+    through = field.rel.through._meta
+    fragments = {
+        "through": qn(through.db_table),
+        "obj": qn(through.get_field(field.m2m_field_name()).column),
+        "env": qn(through.get_field(field.m2m_reverse_field_name()).column),
+        "objs": objs_sql,
+        "envs": ",".join(["%s"] * len(env_ids)),
+        }
+    return fragments, list(objs_params) + env_ids
+
+
+
+def _add_env_links(model, objs, envs):
+    """Link ``model`` objects ``objs`` to ``envs``; return number added."""
+    links = _env_links(model, objs, envs)
+    if links is None:
+        return 0
+    fragments, params = links
+    fragments["objtable"] = connection.ops.quote_name(model._meta.db_table)
+    fragments["envtable"] = connection.ops.quote_name(
+        Environment._meta.db_table)
+
+    cursor = connection.cursor()
+    cursor.execute(
+        """INSERT INTO {through} ({obj}, {env})
+        SELECT o.id, e.id FROM {objtable} as o, {envtable} as e
+        WHERE o.id IN ({objs})
+            AND e.id IN ({envs})
+            AND NOT EXISTS (
+                SELECT 1 FROM {through} as existing
+                WHERE existing.{obj} = o.id AND existing.{env} = e.id)
+        """.format(**fragments),
+        params,
+        )
+    transaction.commit_unless_managed()
+    counts.invalidate(model.environments.through)
+    return cursor.rowcount
+
+
+
+def _remove_env_links(model, objs, envs):
+    """Unlink ``model`` objects ``objs`` from ``envs``; return number removed."""
+    links = _env_links(model, objs, envs)
+    if links is None:
+        return 0
+    fragments, params = links
+
+    cursor = connection.cursor()
+    cursor.execute(
+        """DELETE FROM {through}
+        WHERE {obj} IN ({objs}) AND {env} IN ({envs})
+        """.format(**fragments),
+        params,
+        )
+    transaction.commit_unless_managed()
+    counts.invalidate(model.environments.through)
+    return cursor.rowcount
@@ -1,21 +1,24 @@
+from django.conf.urls.defaults import url
+from django.db import transaction
 from django.db.models import Max
 from tastypie.resources import ModelResource, ALL_WITH_RELATIONS
-from tastypie import fields
+from tastypie import fields, http
+from tastypie.exceptions import BadRequest
+from tastypie.utils import trailing_slash
 from tastypie.bundle import Bundle
 
 import json
 
-from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.http import HttpResponse
 
+from .ingest import ingest_results, ingest_stream, record_run_results
 from .models import Run, RunCaseVersion, RunSuite, Result
 from ..mtapi import MTResource, MTApiKeyAuthentication
 from ..core.api import (ProductVersionResource, ProductResource,
                         ReportResultsAuthorization, UserResource)
 from ..environments.api import EnvironmentResource
-from ..environments.models import Environment
 from ..library.api import CaseVersionResource, BaseSelectionResource
-from ..library.models import CaseVersion, Suite
+from ..library.models import Suite
 
 from ...view.lists.filters import filter_url
 
@@ -111,6 +114,29 @@ class RunResource(ModelResource):
         return super(RunResource, self).dispatch_list(request, **kwargs)
 
 
+    def override_urls(self):
+        """Add an endpoint for polling the status of a run's jobs."""
+        return [
+            url(r"^(?P<resource_name>{0})/(?P<pk>\d+)/jobs{1}$".format(
+                    self._meta.resource_name, trailing_slash()),
+                self.wrap_view("get_jobs"),
+                name="api_run_jobs"),
+            ]
+
+
+    def get_jobs(self, request, **kwargs):
+        """Return status of the run's latest background jobs."""
+        self.method_check(request, allowed=["get"])
+        try:
+            run = Run.objects.get(pk=kwargs["pk"])
+        except Run.DoesNotExist:
+            return http.HttpNotFound()
+        return self.create_response(
+            request,
+            {"objects": [job.status_data() for job in run.get_jobs()[:10]]},
+            )
+
+
     def create_response(self, request, data,
                         response_class=HttpResponse, **response_kwargs):
         """On posting a run, return a url to the MozTrap UI for that new run."""
@@ -140,8 +166,15 @@ class RunResource(ModelResource):
         return resp
 
 
+    @transaction.commit_on_success
     def obj_create(self, bundle, request=None, **kwargs):
-        """Set the created_by field for the run to the request's user"""
+        """
+        Set the created_by field for the run to the request's user.
+
+        The run, its runcaseversions and results are created in one
+        transaction: if any result fails to record, none of them are kept.
+
+        """
 
         bundle = super(RunResource, self).obj_create(bundle=bundle, request=request, **kwargs)
         bundle.obj.created_by = request.user
@@ -154,50 +187,19 @@ class RunResource(ModelResource):
         Handle the runcaseversion creation during a POST of a new Run.
 
         Tastypie handles the creation of the run itself.  But we handle the
-        RunCaseVersions and Results because we have special handler methods for
-        setting the statuses which we want to keep DRY.
+        RunCaseVersions and Results, creating them in bulk with
+        ``record_run_results``.
 
         """
 
-        try:
-            run = bundle.obj
-            run.save()
-
-            # walk results
-
-            for data in bundle.data["runcaseversions"]:
-
-                status = data.pop("status")
-
-                # find caseversion for case
-                cv = CaseVersion.objects.get(
-                    productversion=run.productversion,
-                    case=data.pop("case"),
-                    )
-
-                # create runcaseversion for this run to caseversion
-                rcv, created = RunCaseVersion.objects.get_or_create(
-                    run=run,
-                    caseversion=cv,
-                    )
-
-
-                data["user"] = bundle.request.user
-                data["environment"] = Environment.objects.get(
-                    pk=data["environment"])
+        run = bundle.obj
+        run.save()
 
-                # create result via methods on runcaseversion
-                rcv.get_result_method(status)(**data)
+        record_run_results(
+            run, bundle.data["runcaseversions"], bundle.request.user)
 
-            bundle.data["runcaseversions"] = []
-            return bundle
-
-        except KeyError as e:
-            raise ValidationError(
-                "bad result object data missing key: {0}".format(e))
-
-        except ObjectDoesNotExist as e:
-            raise ValidationError(e)
+        bundle.data["runcaseversions"] = []
+        return bundle
 
 
 
@@ -235,6 +237,23 @@ class ResultResource(ModelResource):
             ]
         }
 
+    The response reports how many results were recorded, and why any objects
+    were not::
+
+        {
+            "created": 2,
+            "errors": [
+                {"index": 1, "error": "invalid result status: bogus"}
+            ]
+        }
+
+    Large uploads can instead be POSTed to ``result/stream/`` as
+    newline-delimited JSON, one result object per line. The lines are
+    recorded and committed ``chunk_size`` (a query parameter) at a time; the
+    response also reports the number of lines ``processed``. To resume an
+    interrupted upload, send it again with a ``skip`` query parameter of the
+    number of lines already processed.
+
     """
 
     class Meta:
@@ -246,50 +265,65 @@ class ResultResource(ModelResource):
         authorization = ReportResultsAuthorization()
 
 
-    def obj_create(self, bundle, request=None, **kwargs):
+    def patch_list(self, request, **kwargs):
         """
-        Manually create the proper results objects.
+        Record all the submitted results in bulk.
 
-        This is necessary because we have special handler methods in
-        RunCaseVersion for setting the statuses which we want to keep DRY.
+        Results are recorded with ``ingest_results`` rather than one at a time
+        through ``obj_create``. Objects that can't be recorded don't prevent
+        the others from being recorded; the response lists their errors by
+        index. If no object could be recorded the response is a 400.
 
         """
+        deserialized = self.deserialize(
+            request,
+            request.raw_post_data,
+            format=request.META.get("CONTENT_TYPE", "application/json"),
+            )
+        if "objects" not in deserialized:
+            raise BadRequest("Invalid data sent.")
 
-        data = bundle.data.copy()
+        outcome = ingest_results(deserialized["objects"], request.user)
 
-        try:
-            status = data.pop("status")
-            case = data.pop("case")
-            env = Environment.objects.get(pk=data.get("environment"))
-            run = data.pop("run_id")
+        response_class = http.HttpAccepted
+        if outcome.errors and not outcome.created:
+            response_class = http.HttpBadRequest
+        return self.create_response(
+            request, outcome.as_dict(), response_class=response_class)
 
-        except KeyError as e:
-            raise ValidationError(
-                "bad result object data missing key: {0}".format(e))
 
-        except Environment.DoesNotExist as e:
-            raise ValidationError(
-                "Specified environment does not exist: {0}".format(e))
+    def override_urls(self):
+        """Add an endpoint for streaming newline-delimited JSON results."""
+        return [
+            url(r"^(?P<resource_name>{0})/stream{1}$".format(
+                    self._meta.resource_name, trailing_slash()),
+                self.wrap_view("stream_results"),
+                name="api_stream_results"),
+            ]
 
 
-        data["environment"] = env
+    def stream_results(self, request, **kwargs):
+        """Record newline-delimited JSON results, read from the request."""
+        self.method_check(request, allowed=["post"])
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        self.throttle_check(request)
 
         try:
-            rcv = RunCaseVersion.objects.get(
-                run__id=run,
-                caseversion__case__id=case,
-                environments=env,
-                )
-
-        except RunCaseVersion.DoesNotExist as e:
-            raise ValidationError(
-                "RunCaseVersion not found for run: {0}, case: {1}, environment: {2}:\nError {3}".format(
-                        str(run), str(case), str(env), e))
-
-        data["user"] = request.user
-
-        bundle.obj = rcv.get_result_method(status)(**data)
-        return bundle
+            skip = int(request.GET.get("skip", 0))
+            chunk_size = int(request.GET.get("chunk_size", 0)) or None
+        except ValueError as e:
+            raise BadRequest("Invalid skip or chunk_size: {0}".format(e))
+
+        outcome = ingest_stream(
+            request, request.user, chunk_size=chunk_size, skip=skip)
+
+        self.log_throttled_access(request)
+        response_class = http.HttpResponse
+        if outcome.error_count and not outcome.created:
+            response_class = http.HttpBadRequest
+        return self.create_response(
+            request, outcome.as_dict(), response_class=response_class)
 
 
 
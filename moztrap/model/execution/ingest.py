@@ -0,0 +1,539 @@
+"""
+Bulk ingest of submitted results.
+
+Automation submits results as dictionaries like this::
+
+    {
+        "case": "326",
+        "environment": "23",
+        "run_id": "1",
+        "status": "failed",
+        "comment": "why u no pass?",
+        "stepnumber": 1,
+        "bug": "http://www.deathvalleydogs.com"
+    }
+
+(``comment`` is optional and used for failed and invalidated results;
+``stepnumber`` and ``bug`` are optional and used for failed results.)
+
+``ingest_results`` records a whole list of these with a handful of queries,
+rather than several per result: all the (run, case, environment) keys are
+resolved to runcaseversions at once, previously-latest results are unset with
+one UPDATE per environment, and the new results and step results are inserted
+with ``bulk_create``. Items that can't be recorded are reported by index
+instead of aborting the rest of the batch.
+
+``record_run_results`` does the same for a new run posted with results, adding
+the submitted cases to the run in bulk as it goes.
+
+``ingest_stream`` records newline-delimited JSON (one result dictionary per
+line) from any iterable of lines, such as an open file or an ``HttpRequest``.
+Lines are read incrementally and committed in chunks, so memory use doesn't
+grow with the size of the upload; an interrupted upload can be resumed by
+skipping the lines that were already committed.
+
+"""
+from collections import defaultdict
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..mtmodel import bulk_insert, utcnow
+from ..environments.models import Environment
+from ..library.models import CaseStep, CaseVersion
+from .models import RunCaseVersion, Result, StepResult, RunSummary
+
+
+
+# Maximum ids in the IN clause of a single lookup query.
+LOOKUP_CHUNK_SIZE = 500
+
+# Result statuses that can be submitted.
+SUBMITTED_STATES = Result.COMPLETED_STATES
+
+REQUIRED_KEYS = ["status", "case", "environment", "run_id"]
+
+# Lines of a result stream recorded (and committed) together.
+STREAM_CHUNK_SIZE = 1000
+
+# Error messages kept (and reported) when ingesting a result stream.
+STREAM_MAX_ERRORS = 100
+
+
+
+class IngestResult(object):
+    """
+    Outcome of ingesting a batch of results.
+
+    * created: the number of results recorded
+    * errors: list of (index, message) for items that were not recorded
+
+    """
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+
+    def add_error(self, index, message):
+        """Record that the item at ``index`` was not recorded."""
+        self.errors.append((index, message))
+
+
+    def append(self, other):
+        """Add the counts and errors of another ``IngestResult`` to this."""
+        self.created += other.created
+        self.errors.extend(other.errors)
+
+
+    def as_dict(self):
+        """Return JSON-serializable dict describing this outcome."""
+        return {
+            "created": self.created,
+            "errors": [
+                {"index": index, "error": message}
+                for index, message in self.errors
+                ],
+            }
+
+
+
+class StreamIngestResult(IngestResult):
+    """
+    Outcome of ingesting a stream of results.
+
+    In addition to ``created`` and ``errors``, has these attributes:
+
+    * processed: the number of lines read and committed, including any that
+      were skipped; skip this many lines to resume an interrupted upload
+    * chunks: the number of chunks committed
+    * error_count: the number of lines not recorded; only the first
+      ``max_errors`` of them are kept in ``errors``
+
+    """
+    def __init__(self, max_errors=STREAM_MAX_ERRORS):
+        super(StreamIngestResult, self).__init__()
+        self.max_errors = max_errors
+        self.processed = 0
+        self.chunks = 0
+        self.error_count = 0
+
+
+    def add_error(self, index, message):
+        """Record that line ``index`` was not recorded."""
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            super(StreamIngestResult, self).add_error(index, message)
+
+
+    def append(self, other):
+        """Add the counts and errors of an ``IngestResult`` to this."""
+        self.created += other.created
+        for index, message in other.errors:
+            self.add_error(index, message)
+
+
+    def as_dict(self):
+        """Return JSON-serializable dict describing this outcome."""
+        data = super(StreamIngestResult, self).as_dict()
+        data.update({
+                "processed": self.processed,
+                "chunks": self.chunks,
+                "error_count": self.error_count,
+                })
+        return data
+
+
+
+@transaction.commit_on_success
+def ingest_results(items, user, offset=0):
+    """
+    Record a list of submitted result dictionaries for ``user``.
+
+    Returns an ``IngestResult``. Error indexes are positions in ``items``,
+    plus ``offset`` (so a caller ingesting a larger stream in batches can
+    report positions in the whole stream).
+
+    """
+    outcome = IngestResult()
+
+    parsed = []
+    for index, item in enumerate(items, offset):
+        try:
+            parsed.append((index, parse_result(item)))
+        except ValidationError as e:
+            outcome.add_error(index, e.messages[0])
+
+    good_envs = _existing_environments(set(p["env_id"] for i, p in parsed))
+    rcvs = _runcaseversions(
+        [p for i, p in parsed if p["env_id"] in good_envs])
+
+    entries = []
+    for index, data in parsed:
+        if data["env_id"] not in good_envs:
+            outcome.add_error(
+                index,
+                "Specified environment does not exist: {0}".format(
+                    data["env_id"]))
+            continue
+        try:
+            rcv_id, run_id, cv_id = rcvs[
+                (data["run_id"], data["case_id"], data["env_id"])]
+        except KeyError:
+            outcome.add_error(
+                index,
+                "RunCaseVersion not found for run: {0}, case: {1}, "
+                "environment: {2}".format(
+                    data["run_id"], data["case_id"], data["env_id"]))
+            continue
+        data.update({"rcv_id": rcv_id, "run_id": run_id, "cv_id": cv_id})
+        entries.append(data)
+
+    if entries:
+        record_results(entries, user)
+        outcome.created = len(entries)
+
+    outcome.errors.sort()
+    return outcome
+
+
+
+def record_run_results(run, items, user):
+    """
+    Record submitted result dicts (without ``run_id``) for new ``run``.
+
+    Unlike ``ingest_results``, the cases don't have to be in the run already:
+    each case is mapped to its caseversion in the run's product version and
+    added to the run (see ``Run.add_caseversions``). Results needn't be in an
+    environment of the runcaseversion.
+
+    All items are checked before anything is recorded; if any is bad a
+    ``ValidationError`` is raised. The caller's transaction (see
+    ``RunResource.obj_create``) must cover the run and its results, so that
+    a failure rolls back the run as well.
+
+    """
+    entries = [parse_result(dict(item, run_id=run.id)) for item in items]
+
+    case_ids = sorted(set(data["case_id"] for data in entries))
+    cv_ids = {}
+    for chunk in _chunked(case_ids):
+        cv_ids.update(
+            CaseVersion.objects.filter(
+                productversion=run.productversion_id,
+                case__in=chunk,
+                ).values_list("case", "id"))
+    missing = [case_id for case_id in case_ids if case_id not in cv_ids]
+    if missing:
+        raise ValidationError(
+            "No caseversion in product version {0} for case(s): {1}".format(
+                run.productversion_id, ", ".join(map(str, missing))))
+
+    env_ids = set(data["env_id"] for data in entries)
+    missing = sorted(env_ids.difference(_existing_environments(env_ids)))
+    if missing:
+        raise ValidationError(
+            "Specified environment does not exist: {0}".format(
+                ", ".join(map(str, missing))))
+
+    rcv_ids = run.add_caseversions(cv_ids.values(), user=user)
+    for data in entries:
+        data["cv_id"] = cv_ids[data["case_id"]]
+        data["rcv_id"] = rcv_ids[data["cv_id"]]
+    record_results(entries, user)
+
+
+
+def ingest_stream(lines, user, chunk_size=None, skip=0, progress=None,
+                  max_errors=STREAM_MAX_ERRORS):
+    """
+    Record newline-delimited JSON results from iterable ``lines``.
+
+    Lines are recorded and committed ``chunk_size`` (default
+    ``STREAM_CHUNK_SIZE``) at a time; blank lines are ignored. The first
+    ``skip`` lines are read but not recorded. If given, ``progress`` is called
+    with the ``StreamIngestResult`` after each chunk is committed.
+
+    Returns a ``StreamIngestResult``; error indexes are (zero-based) line
+    numbers.
+
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    outcome = StreamIngestResult(max_errors)
+
+    chunk = []
+    for index, line in enumerate(lines):
+        if index < skip:
+            outcome.processed += 1
+            continue
+        chunk.append((index, line))
+        if len(chunk) >= chunk_size:
+            _ingest_lines(chunk, user, outcome, progress)
+            chunk = []
+    if chunk:
+        _ingest_lines(chunk, user, outcome, progress)
+
+    return outcome
+
+
+
+def _ingest_lines(chunk, user, outcome, progress):
+    """Record and commit a chunk of (index, line) pairs into ``outcome``."""
+    indexes = []
+    items = []
+    errors = []
+    for index, line in chunk:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            errors.append((index, "invalid JSON: {0}".format(e)))
+        else:
+            indexes.append(index)
+
+    recorded = ingest_results(items, user)
+    errors.extend((indexes[i], message) for i, message in recorded.errors)
+    for index, message in sorted(errors):
+        outcome.add_error(index, message)
+    outcome.created += recorded.created
+    outcome.processed += len(chunk)
+    outcome.chunks += 1
+
+    if progress is not None:
+        progress(outcome)
+
+
+
+def parse_result(item):
+    """
+    Return normalized dict of submitted result ``item``.
+
+    The dict has keys ``status``, ``case_id``, ``env_id``, ``run_id``,
+    ``comment``, ``stepnumber`` and ``bug``. Raises ``ValidationError`` if
+    ``item`` is malformed.
+
+    """
+    if not isinstance(item, dict):
+        raise ValidationError("result object must be a dictionary")
+    for key in REQUIRED_KEYS:
+        if key not in item:
+            raise ValidationError(
+                "bad result object data missing key: '{0}'".format(key))
+
+    status = item["status"]
+    if status not in SUBMITTED_STATES:
+        raise ValidationError(u"invalid result status: {0}".format(status))
+
+    data = {"status": status, "comment": u"", "stepnumber": None, "bug": u""}
+    try:
+        data["case_id"] = int(item["case"])
+        data["env_id"] = int(item["environment"])
+        data["run_id"] = int(item["run_id"])
+        if status == Result.STATUS.failed and (
+                item.get("stepnumber") is not None):
+            data["stepnumber"] = int(item["stepnumber"])
+    except (TypeError, ValueError) as e:
+        raise ValidationError("bad result object data: {0}".format(e))
+
+    if status != Result.STATUS.passed:
+        data["comment"] = item.get("comment") or u""
+    if status == Result.STATUS.failed:
+        data["bug"] = item.get("bug") or u""
+
+    return data
+
+
+
+def _existing_environments(env_ids):
+    """Return the set of ids in ``env_ids`` of environments that exist."""
+    found = set()
+    for chunk in _chunked(list(env_ids)):
+        found.update(
+            Environment.objects.filter(pk__in=chunk).values_list(
+                "id", flat=True))
+    return found
+
+
+
+def _runcaseversions(parsed):
+    """
+    Resolve (run id, case id, env id) of each of ``parsed`` in bulk.
+
+    Returns dict mapping each resolvable key to a tuple (runcaseversion id,
+    run id, caseversion id).
+
+    """
+    case_ids = defaultdict(set)
+    env_ids = set()
+    for data in parsed:
+        case_ids[data["run_id"]].add(data["case_id"])
+        env_ids.add(data["env_id"])
+
+    # (run id, case id) -> list of (rcv id, caseversion id)
+    by_case = defaultdict(list)
+    for run_id, cases in case_ids.items():
+        for chunk in _chunked(sorted(cases)):
+            for rcv_id, case_id, cv_id in RunCaseVersion.objects.filter(
+                    run=run_id, caseversion__case__in=chunk).order_by(
+                    "id").values_list("id", "caseversion__case", "caseversion"):
+                by_case[(run_id, case_id)].append((rcv_id, cv_id))
+
+    through = RunCaseVersion.environments.through
+    linked = set()
+    rcv_ids = [rcv_id for found in by_case.values() for rcv_id, cv in found]
+    for chunk in _chunked(rcv_ids):
+        linked.update(
+            through._default_manager.filter(
+                runcaseversion__in=chunk,
+                environment__in=env_ids,
+                ).values_list("runcaseversion", "environment"))
+
+    resolved = {}
+    for (run_id, case_id), found in by_case.items():
+        for env_id in env_ids:
+            for rcv_id, cv_id in found:
+                if (rcv_id, env_id) in linked:
+                    resolved[(run_id, case_id, env_id)] = (
+                        rcv_id, run_id, cv_id)
+                    break
+    return resolved
+
+
+
+def record_results(entries, user):
+    """
+    Save results (and step results) for the resolved ``entries``.
+
+    Each entry is a dict as returned by ``parse_result``, plus ``rcv_id`` and
+    ``cv_id``: the ids of the runcaseversion and of its caseversion.
+
+    """
+    now = utcnow()
+    completed = Result.COMPLETED_STATES
+
+    # the last result submitted for a runcaseversion/environment is latest
+    latest = {}
+    for i, data in enumerate(entries):
+        latest[(data["rcv_id"], data["env_id"])] = i
+
+    run_of = dict((data["rcv_id"], data["run_id"]) for data in entries)
+    rcv_ids = sorted(run_of)
+    deltas = defaultdict(lambda: defaultdict(int))
+
+    # results no longer latest come out of the run summaries; and we need to
+    # know which runcaseversion/environments already have a completed result
+    already_completed = set()
+    for chunk in _chunked(rcv_ids):
+        for rcv_id, env_id, status, tester_id, is_latest in (
+                Result.objects.filter(
+                    runcaseversion__in=chunk, status__in=completed).values_list(
+                    "runcaseversion",
+                    "environment",
+                    "status",
+                    "tester",
+                    "is_latest",
+                    )):
+            key = (rcv_id, env_id)
+            already_completed.add(key)
+            if is_latest and tester_id == user.id and key in latest:
+                deltas[run_of[rcv_id]][status] -= 1
+
+    rcvs_by_env = defaultdict(set)
+    for rcv_id, env_id in latest:
+        rcvs_by_env[env_id].add(rcv_id)
+    for env_id, env_rcv_ids in rcvs_by_env.items():
+        for chunk in _chunked(sorted(env_rcv_ids)):
+            Result.objects.filter(
+                tester=user,
+                environment=env_id,
+                runcaseversion__in=chunk,
+                is_latest=True,
+                ).update(is_latest=False)
+
+    results = []
+    for i, data in enumerate(entries):
+        key = (data["rcv_id"], data["env_id"])
+        is_latest = latest[key] == i
+        if is_latest:
+            deltas[data["run_id"]][data["status"]] += 1
+            if key not in already_completed:
+                deltas[data["run_id"]]["completed"] += 1
+        results.append(
+            Result(
+                tester=user,
+                runcaseversion_id=data["rcv_id"],
+                environment_id=data["env_id"],
+                status=data["status"],
+                comment=data["comment"],
+                is_latest=is_latest,
+                created_on=now,
+                created_by=user,
+                modified_on=now,
+                modified_by=user,
+                )
+            )
+    bulk_insert(Result, results, now)
+
+    failed = [
+        (data, result) for data, result in zip(entries, results)
+        if data["status"] == Result.STATUS.failed
+        ]
+    _record_step_failures(failed, user, now)
+
+    # failing a case marks its runcaseversion modified
+    for chunk in _chunked(
+            sorted(set(data["rcv_id"] for data, result in failed))):
+        RunCaseVersion.objects.filter(pk__in=chunk).update(user=user)
+
+    for run_id, run_deltas in deltas.items():
+        RunSummary.adjust(run_id, **run_deltas)
+
+
+
+def _record_step_failures(failed, user, now):
+    """
+    Save failed step results for ``failed`` entries with a step number.
+
+    ``failed`` is a list of (entry, saved failed ``Result``) pairs.
+
+    """
+    steps = {}
+    with_step = [
+        (data, result) for data, result in failed
+        if data["stepnumber"] is not None
+        ]
+    cv_ids = sorted(set(data["cv_id"] for data, result in with_step))
+    numbers = set(data["stepnumber"] for data, result in with_step)
+    for chunk in _chunked(cv_ids):
+        for cv_id, number, step_id in CaseStep.objects.filter(
+                caseversion__in=chunk, number__in=numbers).values_list(
+                "caseversion", "number", "id"):
+            steps[(cv_id, number)] = step_id
+
+    stepresults = []
+    for data, result in with_step:
+        step_id = steps.get((data["cv_id"], data["stepnumber"]))
+        if step_id is None:
+            continue
+        stepresults.append(
+            StepResult(
+                result_id=result.id,
+                step_id=step_id,
+                status=StepResult.STATUS.failed,
+                bug_url=data["bug"],
+                created_on=now,
+                created_by=user,
+                modified_on=now,
+                modified_by=user,
+                )
+            )
+    StepResult.objects.bulk_create(stepresults)
+
+
+
+def _chunked(items, size=LOOKUP_CHUNK_SIZE):
+    """Yield successive lists of at most ``size`` of ``items``."""
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
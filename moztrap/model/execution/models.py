@@ -3,17 +3,24 @@ Models for test execution (runs, results).
 
 """
 import datetime
+from collections import defaultdict
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
-from django.db import connection, transaction, models
-from django.db.models import Q, Count, Max
+from django.db import connection, transaction, models, IntegrityError
+from django.db.models import Count, Max
+from django.db.models.query import QuerySet
 
 from model_utils import Choices
 
-from ..mtmodel import MTModel, TeamModel, DraftStatusModel
+from .. import counts
+from ..mtmodel import (
+    MTModel, MTManager, MTQuerySet, TeamModel, DraftStatusModel, utcnow,
+    pre_soft_delete_cascade)
 from ..core.auth import User
 from ..core.models import ProductVersion
 from ..environments.models import Environment, HasEnvironmentsModel
+from ..jobs.models import Job, handler as job_handler
 from ..library.models import CaseVersion, Suite, CaseStep
 
 
@@ -104,6 +111,35 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
             self.update_case_versions()
 
 
+    def enqueue_activate(self, user=None):
+        """Queue a background job to activate this run; return the job."""
+        return Job.enqueue("run.activate", self, user=user)
+
+
+    def enqueue_refresh(self, user=None):
+        """Queue a background job to refresh this run; return the job."""
+        return Job.enqueue("run.refresh", self, user=user)
+
+
+    def enqueue_clone_for_series(self, build, user=None):
+        """
+        Queue a job to clone and activate a series member for ``build``.
+
+        The job's result is the id of the new run.
+
+        """
+        return Job.enqueue(
+            "run.clone_for_series", self, user=user, build=build)
+
+
+    def get_jobs(self):
+        """Return queryset of background jobs for this run, newest first."""
+        return Job.objects.filter(
+            content_type=ContentType.objects.get_for_model(self),
+            object_id=self.id,
+            ).order_by("-id")
+
+
     def update_case_versions(self):
         """
         Update the runcaseversions with any changes to suites.
@@ -129,45 +165,38 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
 
         """
 
-        # get the list of environments for this run
-        run_env_ids = self.environments.values_list("id", flat=True)
-
         # make a list of cvs in order by RunSuite, then SuiteCase.
         # This list is built from the run / suite / env combination and has
         # no knowledge of any possibly existing runcaseversions yet.
-        if len(run_env_ids):
-            cursor = connection.cursor()
-            sql = """SELECT DISTINCT cv.id as id
-                FROM execution_run as r
-                    INNER JOIN execution_runsuite as rs
-                        ON rs.run_id = r.id
-                    INNER JOIN library_suitecase as sc
-                        ON rs.suite_id = sc.suite_id
-                    INNER JOIN library_suite as s
-                        ON sc.suite_id = s.id
-                    INNER JOIN library_caseversion as cv
-                        ON cv.case_id = sc.case_id
-                        AND cv.productversion_id = r.productversion_id
-                    INNER JOIN library_caseversion_environments as cve
-                        ON cv.id = cve.caseversion_id
-                WHERE cv.status = 'active'
-                    AND cv.deleted_on IS NULL
-                    AND s.status = 'active'
-                    AND rs.run_id = {0}
-                    AND cve.environment_id IN ({1})
-                ORDER BY rs.order, sc.order
-                """.format(self.id, ",".join(map(str, run_env_ids)))
-            cursor.execute(sql)
-
-            cv_list = [x[0] for x in cursor.fetchall()]
-
-            # @@@ do we need to check for duplicates?
-            # use itertools.unique_everseen
-            #if len(set(cv_list)) != len(cv_list):
-            #    cv_list = itertools.unique_everseen(cv_list)
-
-        else:
-            cv_list = []
+        cursor = connection.cursor()
+        sql = """SELECT DISTINCT cv.id as id
+            FROM execution_run as r
+                INNER JOIN execution_runsuite as rs
+                    ON rs.run_id = r.id
+                INNER JOIN library_suitecase as sc
+                    ON rs.suite_id = sc.suite_id
+                INNER JOIN library_suite as s
+                    ON sc.suite_id = s.id
+                INNER JOIN library_caseversion as cv
+                    ON cv.case_id = sc.case_id
+                    AND cv.productversion_id = r.productversion_id
+                INNER JOIN library_caseversion_environments as cve
+                    ON cv.id = cve.caseversion_id
+                INNER JOIN execution_run_environments as re
+                    ON re.environment_id = cve.environment_id
+                    AND re.run_id = r.id
+                INNER JOIN environments_environment as e
+                    ON e.id = re.environment_id
+            WHERE cv.status = 'active'
+                AND cv.deleted_on IS NULL
+                AND s.status = 'active'
+                AND e.deleted_on IS NULL
+                AND rs.run_id = %s
+            ORDER BY rs.{0}, sc.{0}
+            """.format(connection.ops.quote_name("order"))
+        cursor.execute(sql, [self.id])
+
+        cv_list = [x[0] for x in cursor.fetchall()]
 
         # delete rcvs that we won't be needing anymore
         self._delete_runcaseversions(cv_list)
@@ -188,28 +217,24 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
                     caseversion=dup["caseversion_id"]).exclude(
                         id=rcv_to_save.id).delete()
 
-        # remaining rcvs should be ones we want to keep, and we need to inject
-        # those ids into the insert/update list for bulk_insert.  So create
-        # a dict mapping cv_id: rcv_id.  If one exists, its order field will
-        # be updated in the build_update cmd.
+        # remaining rcvs should be ones we want to keep.  Map cv_id to the
+        # existing rcv's (id, order), so we only touch the ones whose order
+        # has changed.
         existing_rcv_map = {}
-        for map_item in self.runcaseversions.values("id", "caseversion_id"):
-            existing_rcv_map[map_item["caseversion_id"]] = map_item["id"]
-
-        # build the list of rcvs that we DO need.  Be sure to include the ids
-        # for rcvs that already exist so that we will just be updating the
-        # order and not replacing it.  We will use a special manager that does
-        # an update on insert error.
+        for rcv_id, cv_id, order in self.runcaseversions.values_list(
+                "id", "caseversion_id", "order"):
+            existing_rcv_map[cv_id] = (rcv_id, order)
 
+        # (rcv id, new order) for existing rcvs that have moved
+        rcv_orders_to_update = []
         # runcaseversion objects we will use to bulk create
-        rcv_to_update = []
         rcv_proxies_to_create = []
 
-        order = 1
-        for cv in cv_list:
+        for order, cv in enumerate(cv_list, 1):
             if cv in existing_rcv_map:
-                # we will just update the order value
-                rcv_to_update.append({"caseversion_id": cv, "order": order})
+                rcv_id, old_order = existing_rcv_map[cv]
+                if order != old_order:
+                    rcv_orders_to_update.append((rcv_id, order))
             else:
                 # we need to create a new one
                 kwargs = {
@@ -218,87 +243,123 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
                     "order": order
                     }
                 rcv_proxies_to_create.append(RunCaseVersion(**kwargs))
-            order += 1
 
-        # update existing rcvs
-        for rcv in rcv_to_update:
-            self.runcaseversions.filter(
-                caseversion=rcv["caseversion_id"]).update(order=rcv["order"])
+        # update order of existing rcvs
+        self._bulk_update_runcaseversion_order(rcv_orders_to_update)
 
         # insert these rcvs in bulk
         self._bulk_insert_new_runcaseversions(rcv_proxies_to_create)
 
         self._bulk_update_runcaseversion_environments_for_lock()
+        counts.invalidate(RunCaseVersion, RunCaseVersion.environments.through)
+
+        RunSummary.refresh(self)
 
         self._lock_caseversions_complete()
 
 
     def _delete_runcaseversions(self, cv_list):
         """Hook to delete runcaseversions we know we don't need anymore."""
-        self.runcaseversions.exclude(caseversion__in=cv_list).delete(
-            permanent=True)
+        keep = set(cv_list)
+        unneeded = [
+            rcv_id for rcv_id, cv_id
+            in self.runcaseversions.values_list("id", "caseversion_id")
+            if cv_id not in keep
+            ]
+        for chunk in _chunked(unneeded):
+            self.runcaseversions.filter(id__in=chunk).delete(permanent=True)
+
+
+    def _bulk_update_runcaseversion_order(self, rcv_orders):
+        """
+        Set new order of existing runcaseversions, given (id, order) pairs.
+
+        Each chunk of runcaseversions is updated in a single statement with a
+        CASE expression, rather than one UPDATE per runcaseversion.
+
+        """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        now = utcnow()
+        for chunk in _chunked(rcv_orders):
+            sql = """UPDATE {table}
+                SET {order} = CASE {id} {whens} END,
+                    {modified_on} = %s,
+                    {modified_by} = NULL,
+                    {cc_version} = {cc_version} + 1
+                WHERE {id} IN ({ids})
+                """.format(
+                table=qn(RunCaseVersion._meta.db_table),
+                order=qn("order"),
+                id=qn("id"),
+                modified_on=qn("modified_on"),
+                modified_by=qn("modified_by_id"),
+                cc_version=qn("cc_version"),
+                whens=" ".join(["WHEN %s THEN %s"] * len(chunk)),
+                ids=",".join(["%s"] * len(chunk)),
+                )
+            params = [v for pair in chunk for v in pair]
+            params.append(now)
+            params.extend(rcv_id for rcv_id, order in chunk)
+            cursor.execute(sql, params)
 
 
     def _bulk_insert_new_runcaseversions(self, rcv_proxies):
         """Hook to bulk-insert runcaseversions we know we DO need."""
-        self.runcaseversions.bulk_create(rcv_proxies)
+        self.runcaseversions.bulk_create(
+            rcv_proxies, batch_size=BULK_CHUNK_SIZE)
 
 
     def _bulk_update_runcaseversion_environments_for_lock(self):
         """
         update runcaseversion_environment records with latest state.
 
-        Approach:
-          do another raw sql query to get all existing_rcv_envs for this run
-          existing_rcv_envs - needed_rcv_envs = list to delete (no longer needed)
-          needed_rcv_envs - existing_rcv_envs = list to create
-        build a list of RunCaseVersion_environment objects
-        and use bulk_create.
+        Each runcaseversion of the run needs a link to every environment that
+        its caseversion and the run have in common.  Stale links are removed
+        with a single DELETE, and missing ones added with a single
+        INSERT ... SELECT, so nothing is pulled into Python.
 
         """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        through = qn(RunCaseVersion.environments.through._meta.db_table)
+
+        # all (rcv, env) pairs needed for the non-deleted rcvs of this run
+        needed = """FROM execution_runcaseversion as rcv
+                INNER JOIN library_caseversion_environments as cve
+                    ON cve.caseversion_id = rcv.caseversion_id
+                INNER JOIN execution_run_environments as re
+                    ON re.environment_id = cve.environment_id
+                    AND re.run_id = rcv.run_id
+                INNER JOIN environments_environment as e
+                    ON e.id = cve.environment_id
+            WHERE rcv.run_id = %s
+                AND rcv.deleted_on IS NULL
+                AND e.deleted_on IS NULL"""
+
+        cursor.execute(
+            """DELETE FROM {through}
+            WHERE runcaseversion_id IN (
+                SELECT id FROM execution_runcaseversion
+                WHERE run_id = %s AND deleted_on IS NULL)
+            AND NOT EXISTS (
+                SELECT 1 {needed}
+                    AND rcv.id = {through}.runcaseversion_id
+                    AND cve.environment_id = {through}.environment_id)
+            """.format(through=through, needed=needed),
+            [self.id, self.id],
+            )
 
-        # re-query all the rcvs (including newly created) for this run
-        final_rcvs = RunCaseVersion.objects.filter(run=self).select_related(
-            "caseversion").prefetch_related("caseversion__environments")
-
-        final_rcv_ids = [x.id for x in final_rcvs]
-
-        # runcaseversion_environments that were there prior to our changes
-        prev_rcv_envs_set = set(RunCaseVersion.environments.through.objects.filter(
-            runcaseversion_id__in=final_rcv_ids).values_list(
-                "runcaseversion_id", "environment_id"))
-
-        # runcaseversion_environment objects we will use to bulk create
-        # loop through all cvs and fetch the env intersection with this run
-        needed_rcv_envs_tuples = []
-        run_env_ids = set(
-            self.environments.values_list("id", flat=True))
-        for rcv in final_rcvs:
-            case_env_ids = set([x.id for x in rcv.caseversion.environments.all()])
-            for env in run_env_ids.intersection(case_env_ids):
-                needed_rcv_envs_tuples.append((rcv.id, env))
-        needed_rcv_envs_set = set(needed_rcv_envs_tuples)
-
-        # get the set of rcv_envs we need to delete because they don't belong
-        # to the needed set.
-        delete_rcv_envs = prev_rcv_envs_set - needed_rcv_envs_set
-        if len(delete_rcv_envs):
-            delquery = Q()
-            for combo in delete_rcv_envs:
-                delquery = delquery | Q(
-                    **{"runcaseversion_id": combo[0],
-                       "environment_id": combo[1]})
-            RunCaseVersion.environments.through.objects.filter(delquery).delete()
-
-        # get the set of rcv_envs we need to create that don't already exist
-        needed_rcv_envs_set = needed_rcv_envs_set - prev_rcv_envs_set
-
-        # build all the objects to pass to bulk_create
-        needed_rcv_envs = [RunCaseVersion.environments.through(
-            runcaseversion_id=needed[0],
-            environment_id=needed[1]) for needed in needed_rcv_envs_set]
-
-        RunCaseVersion.environments.through.objects.bulk_create(needed_rcv_envs)
+        cursor.execute(
+            """INSERT INTO {through} (runcaseversion_id, environment_id)
+            SELECT rcv.id, cve.environment_id {needed}
+                AND NOT EXISTS (
+                    SELECT 1 FROM {through} as existing
+                    WHERE existing.runcaseversion_id = rcv.id
+                    AND existing.environment_id = cve.environment_id)
+            """.format(through=through, needed=needed),
+            [self.id],
+            )
 
 
     def _lock_caseversions_complete(self):
@@ -306,24 +367,102 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
         pass
 
 
+    def add_caseversions(self, caseversion_ids, user=None):
+        """
+        Include the given caseversions in this run, in bulk.
+
+        Runcaseversions are created (with bulk inserts) for caseversions not
+        already in the run, and linked to the environments their caseversion
+        has in common with the run. Returns a dict mapping each caseversion id
+        to the id of its runcaseversion.
+
+        """
+        caseversion_ids = list(set(caseversion_ids))
+        rcv_ids = self._runcaseversion_ids(caseversion_ids)
+
+        now = utcnow()
+        self._bulk_insert_new_runcaseversions(
+            [
+                RunCaseVersion(
+                    run_id=self.id,
+                    caseversion_id=cv_id,
+                    created_on=now,
+                    created_by=user,
+                    modified_on=now,
+                    modified_by=user,
+                    )
+                for cv_id in caseversion_ids if cv_id not in rcv_ids
+                ]
+            )
+
+        created = self._runcaseversion_ids(
+            [cv_id for cv_id in caseversion_ids if cv_id not in rcv_ids])
+        rcv_ids.update(created)
+
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        added = 0
+        for chunk in _chunked(created.values()):
+            cursor.execute(
+                """INSERT INTO {through} (runcaseversion_id, environment_id)
+                SELECT rcv.id, cve.environment_id
+                FROM execution_runcaseversion as rcv
+                    INNER JOIN library_caseversion_environments as cve
+                        ON cve.caseversion_id = rcv.caseversion_id
+                    INNER JOIN execution_run_environments as re
+                        ON re.environment_id = cve.environment_id
+                        AND re.run_id = rcv.run_id
+                    INNER JOIN environments_environment as e
+                        ON e.id = cve.environment_id
+                WHERE e.deleted_on IS NULL
+                    AND rcv.id IN ({ids})
+                """.format(
+                    through=qn(
+                        RunCaseVersion.environments.through._meta.db_table),
+                    ids=",".join(["%s"] * len(chunk)),
+                    ),
+                chunk,
+                )
+            added += cursor.rowcount
+        transaction.commit_unless_managed()
+        counts.invalidate(RunCaseVersion.environments.through)
+
+        RunSummary.adjust(self, total=added)
+
+        return rcv_ids
+
+
+    def _runcaseversion_ids(self, caseversion_ids):
+        """Map given caseversion ids to ids of this run's runcaseversions."""
+        rcv_ids = {}
+        for chunk in _chunked(caseversion_ids):
+            rcv_ids.update(
+                RunCaseVersion.objects.filter(
+                    run=self, caseversion__in=chunk).values_list(
+                    "caseversion_id", "id"))
+        return rcv_ids
+
+
+    def get_summary(self):
+        """Return the ``RunSummary`` for this run, building it if needed."""
+        try:
+            summary = self.summary
+        except RunSummary.DoesNotExist:
+            summary = None
+        if summary is None:
+            summary = RunSummary.refresh(self)
+            self.summary = summary
+        return summary
+
+
     def result_summary(self):
         """Return a dict summarizing status of results."""
-        return result_summary(Result.objects.filter(runcaseversion__run=self))
+        return self.get_summary().result_summary()
 
 
     def completion(self):
         """Return fraction of case/env combos that have a completed result."""
-        total = RunCaseVersion.environments.through._default_manager.filter(
-            runcaseversion__run=self).count()
-        completed = Result.objects.filter(
-            status__in=Result.COMPLETED_STATES,
-            runcaseversion__run=self).values(
-            "runcaseversion", "environment").distinct().count()
-
-        try:
-            return float(completed) / total
-        except ZeroDivisionError:
-            return 0
+        return self.get_summary().completion()
 
 
 
@@ -337,6 +476,122 @@ def _environment_intersection(run, caseversion):
 
 
 
+# Runcaseversions per statement when writing them in bulk: rows per INSERT
+# (large runs would exceed MySQL's max_allowed_packet in one statement) and ids
+# per hand-written UPDATE or INSERT ... SELECT, which Django doesn't batch.
+BULK_CHUNK_SIZE = 80
+
+
+
+def _chunked(items, size=None):
+    """Yield successive lists of at most ``size`` (or BULK_CHUNK_SIZE)."""
+    size = size or BULK_CHUNK_SIZE
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+
+class RunCaseVersionQuerySet(MTQuerySet):
+    """An ``MTQuerySet`` that can batch-load result statistics."""
+    _with_result_stats = False
+
+
+    def with_result_stats(self):
+        """
+        Return a clone that attaches result statistics to fetched instances.
+
+        Completion, result summary, testers and bug URLs of all fetched
+        runcaseversions are loaded with a constant number of grouped queries,
+        instead of several queries per runcaseversion.
+
+        """
+        return self._clone(_with_result_stats=True)
+
+
+    def _clone(self, *args, **kwargs):
+        """Clone queryset, preserving the ``with_result_stats`` flag."""
+        kwargs.setdefault("_with_result_stats", self._with_result_stats)
+        return super(RunCaseVersionQuerySet, self)._clone(*args, **kwargs)
+
+
+    def iterator(self):
+        """Iterate over fetched instances, with result stats if requested."""
+        if not self._with_result_stats:
+            return super(RunCaseVersionQuerySet, self).iterator()
+        rcvs = list(super(RunCaseVersionQuerySet, self).iterator())
+        _attach_result_stats(rcvs)
+        return iter(rcvs)
+
+
+
+class RunCaseVersionManager(MTManager):
+    """Manager for runcaseversions; see ``RunCaseVersionQuerySet``."""
+    def get_query_set(self):
+        """Return a ``RunCaseVersionQuerySet`` for all queries."""
+        return super(RunCaseVersionManager, self).get_query_set()._clone(
+            klass=RunCaseVersionQuerySet)
+
+
+    def with_result_stats(self):
+        """Return queryset that batch-loads result statistics."""
+        return self.get_query_set().with_result_stats()
+
+
+
+def _attach_result_stats(rcvs):
+    """
+    Compute and attach result statistics to the given runcaseversions.
+
+    Uses six queries regardless of the number of runcaseversions. The attached
+    values are returned by ``completion``, ``result_summary``, ``testers`` and
+    ``bug_urls``.
+
+    """
+    if not rcvs:
+        return
+    ids = [rcv.id for rcv in rcvs]
+    states = Result.COMPLETED_STATES
+
+    summaries = result_summaries(rcvs)
+
+    completed = dict(
+        (row["runcaseversion"], row["count"]) for row in
+        Result.objects.filter(
+            runcaseversion__in=ids, status__in=states).values(
+            "runcaseversion").annotate(
+            count=Count("environment", distinct=True)))
+
+    totals = dict(
+        (row["runcaseversion"], row["count"]) for row in
+        RunCaseVersion.environments.through._default_manager.filter(
+            runcaseversion__in=ids,
+            environment__deleted_on__isnull=True).values(
+            "runcaseversion").annotate(count=Count("id")))
+
+    tester_ids = defaultdict(set)
+    for rcv_id, tester_id in Result.objects.filter(
+            runcaseversion__in=ids).values_list(
+            "runcaseversion", "tester").distinct():
+        tester_ids[rcv_id].add(tester_id)
+    users = User.objects.in_bulk(set().union(*tester_ids.values()))
+
+    bug_urls = defaultdict(set)
+    for rcv_id, bug_url in StepResult.objects.filter(
+            result__runcaseversion__in=ids).exclude(bug_url="").values_list(
+            "result__runcaseversion", "bug_url").distinct():
+        bug_urls[rcv_id].add(bug_url)
+
+    for rcv in rcvs:
+        total = totals.get(rcv.id, 0)
+        rcv._completion = (
+            float(completed.get(rcv.id, 0)) / total if total else 0)
+        rcv._result_summary = summaries[rcv.id]
+        rcv._testers = [
+            users[t] for t in sorted(tester_ids[rcv.id]) if t in users]
+        rcv._bug_urls = bug_urls[rcv.id]
+
+
+
 class RunCaseVersion(HasEnvironmentsModel, MTModel):
     """
     An ordered association between a Run and a CaseVersion.
@@ -350,6 +605,9 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
     caseversion = models.ForeignKey(CaseVersion, related_name="runcaseversions")
     order = models.IntegerField(default=0, db_index=True)
 
+    everything = RunCaseVersionManager(show_deleted=True)
+    objects = RunCaseVersionManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -358,6 +616,10 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
 
     def bug_urls(self):
         """Returns set of bug URLs associated with this run/caseversion."""
+        try:
+            return self._bug_urls
+        except AttributeError:
+            pass
         return set(
             StepResult.objects.filter(
                 result__runcaseversion=self).exclude(
@@ -385,19 +647,39 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
         ret = super(RunCaseVersion, self).save(*args, **kwargs)
 
         if adding and inherit_envs:
-            self.environments.add(
-                *_environment_intersection(self.run, self.caseversion))
+            env_ids = _environment_intersection(self.run, self.caseversion)
+            self.environments.add(*env_ids)
+            RunSummary.adjust(self.run_id, total=len(env_ids))
 
         return ret
 
 
+    @classmethod
+    def _remove_envs(cls, objs, envs):
+        """Remove environments, then recount summaries of affected runs."""
+        run_ids = set(
+            cls.objects.filter(pk__in=objs).values_list("run", flat=True))
+        touched = super(RunCaseVersion, cls)._remove_envs(objs, envs)
+        for run_id in run_ids:
+            RunSummary.refresh(run_id)
+        return touched
+
+
     def result_summary(self):
         """Return a dict summarizing status of results."""
+        try:
+            return self._result_summary
+        except AttributeError:
+            pass
         return result_summary(self.results.all())
 
 
     def completion(self):
         """Return fraction of environments that have a completed result."""
+        try:
+            return self._completion
+        except AttributeError:
+            pass
         total = self.environments.count()
         completed = self.results.filter(
             status__in=Result.COMPLETED_STATES).values(
@@ -411,6 +693,10 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
 
     def testers(self):
         """Return list of testers with assigned / executed results."""
+        try:
+            return self._testers
+        except AttributeError:
+            pass
         return User.objects.filter(
             pk__in=self.results.values_list("tester", flat=True).distinct())
 
@@ -509,6 +795,26 @@ class RunSuite(MTModel):
 
 
 
+class ArchiveDescriptor(object):
+    """
+    Opt-in access to the archived rows of a model.
+
+    Returns the manager of the archive model named ``archive_model`` (in the
+    same app), so ``Result.archived.filter(...)`` queries ``ArchivedResult``.
+    The model's own managers are left alone.
+
+    """
+    def __init__(self, archive_model):
+        self.archive_model = archive_model
+
+
+    def __get__(self, instance, owner):
+        """Return default manager of the archive model."""
+        archive = models.get_model(owner._meta.app_label, self.archive_model)
+        return archive._default_manager
+
+
+
 class Result(MTModel):
     """A result of a User running a RunCaseVersion in an Environment."""
     STATUS = Choices("assigned", "started", "passed", "failed", "invalidated")
@@ -530,6 +836,9 @@ class Result(MTModel):
     reviewed_by = models.ForeignKey(
         User, related_name="reviews", blank=True, null=True)
 
+    # results moved to the archive by ``retention``; only queried on request
+    archived = ArchiveDescriptor("ArchivedResult")
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -550,23 +859,59 @@ class Result(MTModel):
 
 
     def save(self, *args, **kwargs):
+        """
+        Save result, keeping the run's ``RunSummary`` up to date.
+
+        New results are counted into the summary incrementally; changes to an
+        existing result cause the run's summary to be recounted. The caller's
+        transaction (if any) covers the result and the summary alike.
+
+        """
         if self.pk is None:
             self.set_latest()
-        super(Result, self).save(*args, **kwargs)
+            completed = self.status in self.COMPLETED_STATES
+            # only the first completed result counts a case/env combo complete
+            new_combo = completed and not Result.objects.filter(
+                runcaseversion=self.runcaseversion,
+                environment=self.environment,
+                status__in=self.COMPLETED_STATES,
+                ).exists()
+            super(Result, self).save(*args, **kwargs)
+            if completed:
+                RunSummary.adjust(
+                    self.runcaseversion.run_id,
+                    completed=int(new_combo),
+                    **{self.status: 1}
+                    )
+        else:
+            super(Result, self).save(*args, **kwargs)
+            RunSummary.refresh(self.runcaseversion.run_id)
 
 
     def set_latest(self):
         """
         Set this result to latest, and unset all others with this env/user/rcv
 
-        """
+        Completed results that are no longer latest are subtracted from the
+        run's ``RunSummary``.
 
-        Result.objects.filter(
+        """
+        others = Result.objects.filter(
             tester=self.tester,
             runcaseversion=self.runcaseversion,
             environment=self.environment,
             is_latest=True,
-            ).exclude(pk=self.pk).update(is_latest=False)
+            ).exclude(pk=self.pk)
+
+        deltas = defaultdict(int)
+        for status in others.filter(
+                status__in=self.COMPLETED_STATES).values_list(
+                "status", flat=True):
+            deltas[status] -= 1
+
+        others.update(is_latest=False)
+
+        RunSummary.adjust(self.runcaseversion.run_id, **deltas)
 
         self.is_latest = True
 
@@ -582,6 +927,8 @@ class StepResult(MTModel):
         max_length=50, db_index=True, choices=STATUS, default=STATUS.passed)
     bug_url = models.URLField(blank=True)
 
+    archived = ArchiveDescriptor("ArchivedStepResult")
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -589,24 +936,311 @@ class StepResult(MTModel):
 
 
 
+class ArchiveModel(models.Model):
+    """
+    Common base for tables of rows moved out of an ``MTModel`` table.
+
+    Archived rows keep the id and (change-tracking) fields they had, so they
+    can be copied across with ``INSERT ... SELECT``; they are never changed.
+    See ``moztrap.model.execution.retention``.
+
+    """
+    id = models.IntegerField(primary_key=True)
+    created_on = models.DateTimeField()
+    created_by = models.ForeignKey(
+        User, blank=True, null=True, related_name="+",
+        on_delete=models.SET_NULL)
+    modified_on = models.DateTimeField()
+    modified_by = models.ForeignKey(
+        User, blank=True, null=True, related_name="+",
+        on_delete=models.SET_NULL)
+    deleted_on = models.DateTimeField(blank=True, null=True)
+    deleted_by = models.ForeignKey(
+        User, blank=True, null=True, related_name="+",
+        on_delete=models.SET_NULL)
+    cc_version = models.IntegerField(default=0)
+    archived_on = models.DateTimeField(db_index=True)
+
+
+    class Meta:
+        abstract = True
+
+
+
+class ArchivedResult(ArchiveModel):
+    """A superseded or deleted ``Result``, moved to the archive."""
+    STATUS = Result.STATUS
+    REVIEW = Result.REVIEW
+
+    tester = models.ForeignKey(User, related_name="archived_results")
+    runcaseversion = models.ForeignKey(
+        RunCaseVersion, related_name="archived_results")
+    environment = models.ForeignKey(
+        Environment, related_name="archived_results")
+    status = models.CharField(max_length=50, choices=STATUS)
+    comment = models.TextField(blank=True)
+    is_latest = models.BooleanField(default=False)
+    review = models.CharField(max_length=50, choices=REVIEW)
+    reviewed_by = models.ForeignKey(
+        User, related_name="archived_reviews", blank=True, null=True)
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return "%s, run by %s in %s: %s (archived)" % (
+            self.runcaseversion, self.tester, self.environment, self.status)
+
+
+
+class ArchivedStepResult(ArchiveModel):
+    """A ``StepResult`` of an archived result."""
+    STATUS = StepResult.STATUS
+
+    result = models.ForeignKey(ArchivedResult, related_name="stepresults")
+    step = models.ForeignKey(CaseStep, related_name="archived_stepresults")
+    status = models.CharField(max_length=50, choices=STATUS)
+    bug_url = models.URLField(blank=True)
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return "%s (%s: %s)" % (self.result, self.step, self.status)
+
+
+
+
+class RunSummary(MTModel):
+    """
+    Denormalized rollup of result counts and completion for a Run.
+
+    Result counts only include latest results; ``completed`` is the number of
+    case/environment combinations in the run with a completed result, out of
+    ``total`` combinations.
+
+    New results adjust the rollup incrementally; it is recounted from scratch
+    whenever the run's runcaseversions are locked in. The
+    ``rebuild_run_summaries`` management command recounts all of them and
+    reports any drift.
+
+    """
+    run = models.OneToOneField(Run, related_name="summary")
+    passed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    invalidated = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+
+    COUNTERS = ["passed", "failed", "invalidated", "completed", "total"]
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return "Summary of run '%s'" % (self.run,)
+
+
+    def result_summary(self):
+        """Return a dict summarizing status of results."""
+        return dict((s, getattr(self, s)) for s in Result.COMPLETED_STATES)
+
+
+    def completion(self):
+        """Return fraction of case/env combos that have a completed result."""
+        try:
+            return float(self.completed) / self.total
+        except ZeroDivisionError:
+            return 0
+
+
+    @classmethod
+    def compute(cls, run):
+        """Count and return a dict of current rollup values for ``run``."""
+        values = result_summary(Result.objects.filter(runcaseversion__run=run))
+        values["completed"] = Result.objects.filter(
+            status__in=Result.COMPLETED_STATES,
+            runcaseversion__run=run).values(
+            "runcaseversion", "environment").distinct().count()
+        values["total"] = (
+            RunCaseVersion.environments.through._default_manager.filter(
+                runcaseversion__run=run).count())
+        return values
+
+
+    @classmethod
+    def refresh(cls, run):
+        """
+        Recount and store the rollup for ``run`` (instance or id).
+
+        Returns the up-to-date ``RunSummary``. If another request creates the
+        run's summary at the same time, that one is updated.
+
+        """
+        run_id = getattr(run, "pk", run)
+        values = cls.compute(run_id)
+        try:
+            summary = cls.everything.get(run=run_id)
+        except cls.DoesNotExist:
+            sid = transaction.savepoint()
+            try:
+                summary = cls.everything.create(run_id=run_id, **values)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                # a locking read sees the row even if our snapshot doesn't
+                summary = cls.everything.select_for_update().get(run=run_id)
+            else:
+                transaction.savepoint_commit(sid)
+                return summary
+        cls.everything.filter(pk=summary.pk).update(notrack=True, **values)
+        for k, v in values.items():
+            setattr(summary, k, v)
+        summary.cc_version += 1
+        return summary
+
+
+    @classmethod
+    def adjust(cls, run, **deltas):
+        """
+        Add ``deltas`` to the stored counters for ``run`` (instance or id).
+
+        Does nothing if ``run`` has no stored rollup yet; it will be counted
+        from scratch when first needed.
+
+        """
+        updates = dict(
+            (k, models.F(k) + v) for k, v in deltas.items() if v)
+        if updates:
+            cls.everything.filter(run=getattr(run, "pk", run)).update(
+                notrack=True, **updates)
+
+
+
 def result_summary(results):
     """
     Given a queryset of results, return a dict summarizing their states.
 
+    Only latest results are counted, in a single grouped query.
+
+    """
+    summary = dict((s, 0) for s in Result.COMPLETED_STATES)
+    for row in _latest_completed(results).values("status").annotate(
+            count=Count("id")):
+        summary[row["status"]] = row["count"]
+    return summary
+
+
+
+def result_summaries(parents):
+    """
+    Summarize the results of several runs or runcaseversions in one query.
+
+    ``parents`` is a list of ``Run`` or of ``RunCaseVersion`` instances, or a
+    queryset of either. Returns a dict mapping parent id to a dict like the
+    one ``result_summary`` returns; ids without results map to zero counts.
+
     """
     states = Result.COMPLETED_STATES
+    summaries = defaultdict(lambda: dict((s, 0) for s in states))
 
-    result_ids = results.filter(is_latest=True).values_list("id", flat=True)
+    if isinstance(parents, QuerySet):
+        model = parents.model
+        in_parents = parents.values("pk")
+    else:
+        parents = list(parents)
+        if not parents:
+            return summaries
+        model = parents[0].__class__
+        in_parents = [p.pk for p in parents]
+        for pk in in_parents:
+            summaries[pk] = dict((s, 0) for s in states)
 
-    if not result_ids:
-        return dict((s, 0) for s in states)
+    key = _SUMMARY_PARENT_LOOKUPS[model]
+    results = Result.objects.filter(**{"{0}__in".format(key): in_parents})
+    for row in _latest_completed(results).values(key, "status").annotate(
+            count=Count("id")):
+        summaries[row[key]][row["status"]] = row["count"]
 
-    cols = ["COUNT(CASE WHEN status=%s THEN 1 ELSE NULL END)"] * len(states)
-    sql = "SELECT {0} FROM {1} WHERE id IN ({2})".format(
-        ",".join(cols), Result._meta.db_table, ",".join(map(str, result_ids))
-        )
+    return summaries
 
+
+
+def _latest_completed(results):
+    """Narrow results queryset to latest completed results, unordered."""
+    return results.filter(
+        is_latest=True, status__in=Result.COMPLETED_STATES).order_by()
+
+
+
+def _results_cascade(sender, where, params, **kwargs):
+    """
+    Refresh stored summaries of runs whose results are (un)deleted.
+
+    Receives ``pre_soft_delete_cascade`` for ``Result``; finds the runs
+    now, and returns a callable refreshing their summaries afterwards.
+
+    """
+    qn = connection.ops.quote_name
     cursor = connection.cursor()
-    cursor.execute(sql, states)
+    cursor.execute(
+        "SELECT DISTINCT s.{run_id} FROM {summaries} AS s "
+        "INNER JOIN {rcvs} AS rcv ON rcv.{run_id} = s.{run_id} "
+        "WHERE rcv.{id} IN (SELECT {rcv_id} FROM {results} WHERE {where})"
+        .format(
+            run_id=qn("run_id"),
+            summaries=qn(RunSummary._meta.db_table),
+            rcvs=qn(RunCaseVersion._meta.db_table),
+            id=qn("id"),
+            rcv_id=qn("runcaseversion_id"),
+            results=qn(Result._meta.db_table),
+            where=where,
+            ),
+        params,
+        )
+    run_ids = [row[0] for row in cursor.fetchall()]
+
+    def refresh():
+        for run_id in run_ids:
+            RunSummary.refresh(run_id)
+
+    return refresh
+
+
+pre_soft_delete_cascade.connect(
+    _results_cascade,
+    sender=Result,
+    dispatch_uid="execution_results_cascade",
+    )
+
+
+
+# lookup from Result to the id of each model results can be summarized by
+_SUMMARY_PARENT_LOOKUPS = {
+    Run: "runcaseversion__run",
+    RunCaseVersion: "runcaseversion",
+    }
+
+
+
+@job_handler("run.activate")
+def _activate_run(run, user=None):
+    """Job handler to activate a run."""
+    run.activate(user=user)
+
+
+
+@job_handler("run.refresh")
+def _refresh_run(run, user=None):
+    """Job handler to refresh the runcaseversions of an active run."""
+    run.refresh(user=user)
+
+
+
+@job_handler("run.clone_for_series")
+def _clone_run_for_series(run, user=None, build=None):
+    """Job handler to clone and activate a series run; returns its id."""
+    series_run = run.clone_for_series(build=build, user=user)
+    series_run.activate(user=user)
+    return series_run.id
+
+
 
-    return dict(zip(states, cursor.fetchone()))
+# register the recurring retention job
+from . import retention
@@ -0,0 +1,229 @@
+"""
+Retention of old results.
+
+Every new result leaves the tester's previous result for the same
+runcaseversion and environment behind with ``is_latest=False``, and deleted
+results are only soft-deleted, so the results tables grow without bound.
+``apply_retention`` moves results superseded or deleted more than ``days``
+days ago (along with their step results) into the ``ArchivedResult`` and
+``ArchivedStepResult`` tables, or with ``purge=True`` deletes them outright.
+
+Results are moved set-wise, with ``INSERT ... SELECT`` and ``DELETE``
+statements covering a window of ``RETENTION_CHUNK_SIZE`` result ids each; each
+window is committed on its own, so an interrupted run can simply be repeated.
+Archived results remain queryable through ``Result.archived`` (and
+``runcaseversion.archived_results`` etc.), but never show up in
+``Result.objects`` or ``Result.everything``.
+
+The ``apply_retention`` management command applies the policy once, or
+queues a ``results.retention`` job that reapplies it with the configured
+settings every ``MOZTRAP_RETENTION_INTERVAL`` seconds.
+
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .. import counts
+from ..mtmodel import utcnow
+from ..jobs.models import Job, handler as job_handler
+from .models import (
+    Result, StepResult, ArchivedResult, ArchivedStepResult, RunCaseVersion,
+    RunSummary)
+
+
+
+# result ids covered by each batch of archiving (or purging) statements
+RETENTION_CHUNK_SIZE = 10000
+
+# kind of the recurring retention job
+RETENTION_JOB = "results.retention"
+
+
+
+def apply_retention(days, purge=False, dry_run=False):
+    """
+    Archive (or ``purge``) results superseded or deleted over ``days`` ago.
+
+    Return dictionary mapping ``Result`` and ``StepResult`` to the number of
+    their objects archived or purged; with ``dry_run``, nothing is changed
+    and the numbers that would be are returned.
+
+    """
+    expired, params = _expired(utcnow() - datetime.timedelta(days=days))
+    cursor = connection.cursor()
+
+    if dry_run:
+        cursor.execute(
+            "SELECT COUNT(*) FROM {0} WHERE {1}".format(
+                _table(Result), expired),
+            params,
+            )
+        num_results = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT COUNT(*) FROM {0} WHERE {1} IN "
+            "(SELECT {2} FROM {3} WHERE {4})".format(
+                _table(StepResult),
+                _qn("result_id"),
+                _qn("id"),
+                _table(Result),
+                expired,
+                ),
+            params,
+            )
+        return {Result: num_results, StepResult: cursor.fetchone()[0]}
+
+    cursor.execute(
+        "SELECT MIN({0}), MAX({0}) FROM {1} WHERE {2}".format(
+            _qn("id"), _table(Result), expired),
+        params,
+        )
+    low, high = cursor.fetchone()
+    found = {Result: 0, StepResult: 0}
+    if low is None:
+        return found
+
+    archived_on = None if purge else utcnow()
+    for start in range(low, high + 1, RETENTION_CHUNK_SIZE):
+        num_results, num_stepresults = _move_window(
+            "{0} >= %s AND {0} < %s AND ({1})".format(_qn("id"), expired),
+            [start, start + RETENTION_CHUNK_SIZE] + params,
+            archived_on,
+            )
+        found[Result] += num_results
+        found[StepResult] += num_stepresults
+
+    counts.invalidate(Result, StepResult, ArchivedResult, ArchivedStepResult)
+    return found
+
+
+
+def schedule(user=None, run_after=None):
+    """
+    Queue the recurring retention job, unless it is already queued.
+
+    The job applies the retention settings, then queues itself to run again
+    ``MOZTRAP_RETENTION_INTERVAL`` seconds later. Return the queued job.
+
+    """
+    queued = Job.objects.filter(
+        kind=RETENTION_JOB, status=Job.STATUS.queued).order_by("id")
+    for job in queued[:1]:
+        return job
+    return Job.enqueue(RETENTION_JOB, user=user, run_after=run_after)
+
+
+
+@job_handler(RETENTION_JOB)
+def _retention_job(target, user=None):
+    """
+    Job handler applying the retention settings; returns counts by model.
+
+    The next run is queued whatever the outcome of this one, so a failure
+    (once its retries are used up) doesn't end the schedule.
+
+    """
+    try:
+        found = apply_retention(
+            days=settings.MOZTRAP_RETENTION_DAYS,
+            purge=settings.MOZTRAP_RETENTION_PURGE,
+            )
+    finally:
+        schedule(
+            user=user,
+            run_after=utcnow() + datetime.timedelta(
+                seconds=settings.MOZTRAP_RETENTION_INTERVAL),
+            )
+    return dict((m._meta.object_name, n) for m, n in found.items())
+
+
+
+@transaction.commit_on_success
+def _move_window(where, params, archived_on):
+    """
+    Archive (unless ``archived_on`` is None) and delete results ``where``.
+
+    Their step results go along with them, and the stored summaries of the
+    runs they belong to are recounted. Return tuple of numbers of results and
+    step results moved.
+
+    """
+    cursor = connection.cursor()
+    in_results = "{0} IN (SELECT {1} FROM {2} WHERE {3})".format(
+        _qn("result_id"), _qn("id"), _table(Result), where)
+
+    cursor.execute(
+        "SELECT DISTINCT {run_id} FROM {rcvs} WHERE {id} IN "
+        "(SELECT {rcv_id} FROM {results} WHERE {where})".format(
+            run_id=_qn("run_id"),
+            rcvs=_table(RunCaseVersion),
+            id=_qn("id"),
+            rcv_id=_qn("runcaseversion_id"),
+            results=_table(Result),
+            where=where,
+            ),
+        params,
+        )
+    run_ids = [row[0] for row in cursor.fetchall()]
+
+    if archived_on is not None:
+        for model, archive, condition in [
+                (Result, ArchivedResult, where),
+                (StepResult, ArchivedStepResult, in_results),
+                ]:
+            columns = [
+                _qn(f.column) for f in archive._meta.fields
+                if f.name != "archived_on"
+                ]
+            cursor.execute(
+                "INSERT INTO {archive} ({columns}, {archived_on}) "
+                "SELECT {columns}, %s FROM {table} WHERE {condition}".format(
+                    archive=_table(archive),
+                    columns=", ".join(columns),
+                    archived_on=_qn("archived_on"),
+                    table=_table(model),
+                    condition=condition,
+                    ),
+                [archived_on] + params,
+                )
+
+    cursor.execute(
+        "DELETE FROM {0} WHERE {1}".format(_table(StepResult), in_results),
+        params,
+        )
+    num_stepresults = cursor.rowcount
+    cursor.execute(
+        "DELETE FROM {0} WHERE {1}".format(_table(Result), where), params)
+    num_results = cursor.rowcount
+
+    for run_id in RunSummary.everything.filter(
+            run__in=run_ids).values_list("run", flat=True):
+        RunSummary.refresh(run_id)
+
+    return num_results, num_stepresults
+
+
+
+def _expired(cutoff):
+    """Return SQL condition (and params) for results expired at ``cutoff``."""
+    return (
+        "({is_latest} = %s AND {modified_on} < %s) "
+        "OR {deleted_on} < %s".format(
+            is_latest=_qn("is_latest"),
+            modified_on=_qn("modified_on"),
+            deleted_on=_qn("deleted_on"),
+            ),
+        [False, cutoff, cutoff],
+        )
+
+
+
+def _table(model):
+    return _qn(model._meta.db_table)
+
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
@@ -0,0 +1,19 @@
+"""
+Admin config for jobs.
+
+"""
+from django.contrib import admin
+
+from ..mtadmin import MTModelAdmin
+from . import models
+
+
+
+class JobAdmin(MTModelAdmin):
+    list_display = [
+        "__unicode__", "status", "attempts", "run_after", "finished_on"]
+    list_filter = ["status", "kind"]
+
+
+
+admin.site.register(models.Job, JobAdmin)
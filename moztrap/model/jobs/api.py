@@ -0,0 +1,44 @@
+from tastypie.resources import ModelResource
+
+from ..mtapi import MTApiKeyAuthentication, MTAuthorization
+from .models import Job
+
+
+
+class JobResource(ModelResource):
+    """
+    Status of a background job.
+
+    Clients that queue a long-running operation can poll this to find out
+    when it's finished. The job's error (a traceback) is not exposed.
+
+    """
+
+    class Meta:
+        queryset = Job.objects.all()
+        list_allowed_methods = ["get"]
+        detail_allowed_methods = ["get"]
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "object_id",
+            "attempts",
+            "created_on",
+            "started_on",
+            "finished_on",
+            ]
+        filtering = {
+            "kind": "exact",
+            "status": "exact",
+            "object_id": "exact",
+            }
+        authentication = MTApiKeyAuthentication()
+        authorization = MTAuthorization()
+
+
+    def dehydrate(self, bundle):
+        """Add the job's result and whether it's finished."""
+        bundle.data["finished"] = bundle.obj.finished
+        bundle.data["result"] = bundle.obj.get_result()
+        return bundle
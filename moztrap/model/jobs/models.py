@@ -0,0 +1,301 @@
+"""
+Models for background jobs.
+
+Long-running operations (such as activating a run with many cases) can be
+queued as a ``Job`` instead of being done inside the web request. Jobs are
+stored in the database and processed by the ``run_jobs`` management command,
+so no external broker is needed.
+
+Job kinds are pluggable: any app can register a handler for a kind with the
+``handler`` decorator. A handler is called with the job's target object (or
+``None``), the user who queued the job, and the job's keyword arguments; its
+return value (if JSON-serializable) is stored as the job's result.
+
+If the ``MOZTRAP_JOBS_ALWAYS_EAGER`` setting is ``True`` (the default), jobs
+are run as soon as they are queued, in the same process, and a failing
+handler's exception propagates to the caller; set it to ``False`` to have them
+run by ``run_jobs`` workers instead, which retry failed jobs. A job left
+running for more than ``MOZTRAP_JOBS_TIMEOUT`` seconds (its worker having
+died) is queued again, or fails if it has no attempts left.
+
+"""
+import datetime
+import json
+import os
+import socket
+import traceback
+
+from django.conf import settings
+from django.contrib.contenttypes import generic
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+from model_utils import Choices
+
+from ..mtmodel import MTModel, utcnow
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+# maps job kind to handler callable
+_handlers = {}
+
+
+
+def handler(kind):
+    """Decorator registering the decorated callable to handle jobs of kind."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+
+class Job(MTModel):
+    """A queued (or finished) background operation."""
+    STATUS = Choices("queued", "running", "done", "failed")
+
+    kind = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(
+        max_length=30, db_index=True, choices=STATUS, default=STATUS.queued)
+
+    # the object the job operates on, if any
+    content_type = models.ForeignKey(ContentType, blank=True, null=True)
+    object_id = models.PositiveIntegerField(blank=True, null=True)
+    target = generic.GenericForeignKey()
+
+    # JSON-encoded keyword arguments for the handler, and its return value
+    arguments = models.TextField(blank=True)
+    result = models.TextField(blank=True)
+
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    # a queued job isn't picked up until this time (used for retry backoff)
+    run_after = models.DateTimeField(default=utcnow, db_index=True)
+    started_on = models.DateTimeField(blank=True, null=True)
+    finished_on = models.DateTimeField(blank=True, null=True)
+    worker = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+
+
+    def __unicode__(self):
+        """Unicode representation is kind and id."""
+        return u"{0} job {1}".format(self.kind, self.id)
+
+
+    class Meta:
+        ordering = ["run_after", "id"]
+
+
+    @classmethod
+    def enqueue(cls, kind, target=None, user=None, run_after=None, **kwargs):
+        """
+        Queue and return a new job of ``kind`` on ``target`` (may be None).
+
+        If ``run_after`` is given, the job isn't run until that time (not even
+        with ``MOZTRAP_JOBS_ALWAYS_EAGER``). Additional keyword arguments are
+        passed on to the handler, and so must be JSON-serializable.
+
+        """
+        job = cls(kind=kind, arguments=json.dumps(kwargs))
+        if target is not None:
+            job.target = target
+        if run_after is not None:
+            job.run_after = run_after
+        job.save(user=user)
+        if (getattr(settings, "MOZTRAP_JOBS_ALWAYS_EAGER", True) and
+                run_after is None):
+            job.claim("eager")
+            job.execute(eager=True)
+        return job
+
+
+    @classmethod
+    def claim_next(cls, worker):
+        """
+        Claim and return the next due queued job for ``worker``, or None.
+
+        Claiming is a conditional UPDATE, so when several workers are racing
+        for the same job only one of them gets it. Stale jobs are recovered
+        first (see ``recover_stale``).
+
+        """
+        cls.recover_stale()
+        due = cls.objects.filter(
+            status=cls.STATUS.queued, run_after__lte=utcnow()).order_by(
+            "run_after", "id").values_list("id", flat=True)
+        for job_id in due[:10]:
+            job = cls.objects.get(pk=job_id)
+            if job.claim(worker):
+                return job
+        return None
+
+
+    @classmethod
+    def recover_stale(cls, timeout=None):
+        """
+        Requeue jobs left running for more than ``timeout`` seconds.
+
+        ``timeout`` defaults to the ``MOZTRAP_JOBS_TIMEOUT`` setting. The
+        worker of such a job is presumed dead; as its claim counted as an
+        attempt, a job with no attempts left fails instead. Return the number
+        of jobs recovered.
+
+        """
+        if timeout is None:
+            timeout = getattr(settings, "MOZTRAP_JOBS_TIMEOUT", 60 * 60)
+        now = utcnow()
+        stale = cls.objects.filter(
+            status=cls.STATUS.running,
+            started_on__lt=now - datetime.timedelta(seconds=timeout),
+            )
+        error = u"Timed out after {0} seconds.".format(timeout)
+        requeued = stale.filter(
+            attempts__lt=models.F("max_attempts")).update(
+            notrack=True, status=cls.STATUS.queued, error=error, run_after=now)
+        failed = stale.update(
+            notrack=True,
+            status=cls.STATUS.failed,
+            error=error,
+            finished_on=now,
+            )
+        return requeued + failed
+
+
+    def claim(self, worker):
+        """Mark this queued job running for ``worker``; False if we lost it."""
+        now = utcnow()
+        claimed = self.__class__.objects.filter(
+            pk=self.pk, status=self.STATUS.queued).update(
+            notrack=True,
+            status=self.STATUS.running,
+            worker=worker,
+            started_on=now,
+            attempts=models.F("attempts") + 1,
+            )
+        if claimed:
+            self.status = self.STATUS.running
+            self.worker = worker
+            self.started_on = now
+            self.attempts += 1
+            self.cc_version += 1
+        return bool(claimed)
+
+
+    def execute(self, eager=False):
+        """
+        Run this (claimed) job's handler and record the outcome.
+
+        A job that raises is queued again with exponential backoff until
+        it has been attempted ``max_attempts`` times; after that it fails.
+        If ``eager`` (run as it is queued, with no worker to retry it) the job
+        fails at once, and the exception is raised again.
+
+        """
+        try:
+            func = _handlers[self.kind]
+        except KeyError:
+            self._finish(
+                self.STATUS.failed,
+                error=u"No handler for job kind '{0}'.".format(self.kind))
+            return
+
+        try:
+            result = func(
+                self.target, user=self.created_by, **self.get_arguments())
+        except Exception:
+            logger.exception("job %s failed", self.id)
+            error = traceback.format_exc()
+            if eager:
+                self._finish(self.STATUS.failed, error=error)
+                raise
+            if self.attempts < self.max_attempts:
+                self._update(
+                    status=self.STATUS.queued,
+                    error=error,
+                    run_after=utcnow() + datetime.timedelta(
+                        seconds=10 * 2 ** (self.attempts - 1)),
+                    )
+            else:
+                self._finish(self.STATUS.failed, error=error)
+        else:
+            self._finish(self.STATUS.done, result=json.dumps(result))
+
+
+    def retry(self, user=None):
+        """Queue a failed job to be run again, with a fresh set of attempts."""
+        self.status = self.STATUS.queued
+        self.attempts = 0
+        self.run_after = utcnow()
+        self.finished_on = None
+        self.save(user=user)
+
+
+    def get_arguments(self):
+        """Return dict of handler keyword arguments."""
+        return dict(
+            (str(k), v) for k, v in json.loads(self.arguments or "{}").items())
+
+
+    def get_result(self):
+        """Return the handler's return value, or None if not done."""
+        if not self.result:
+            return None
+        return json.loads(self.result)
+
+
+    def status_data(self, user=None):
+        """
+        Return JSON-serializable dict describing this job, for polling.
+
+        The error (a traceback) is only included for the job's creator.
+
+        """
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "finished": self.finished,
+            "attempts": self.attempts,
+            "result": self.get_result(),
+            "created_on": _isoformat(self.created_on),
+            "started_on": _isoformat(self.started_on),
+            "finished_on": _isoformat(self.finished_on),
+            }
+        if user is not None and user.id == self.created_by_id:
+            data["error"] = self.error
+        return data
+
+
+    @property
+    def finished(self):
+        """True if the job is done or has failed for good."""
+        return self.status in [self.STATUS.done, self.STATUS.failed]
+
+
+    def _finish(self, status, **values):
+        """Record that this job has ended with ``status``."""
+        self._update(status=status, finished_on=utcnow(), **values)
+
+
+    def _update(self, **values):
+        """Set ``values`` on this job, in the database and the instance."""
+        self.__class__.objects.filter(pk=self.pk).update(
+            notrack=True, **values)
+        for k, v in values.items():
+            setattr(self, k, v)
+        self.cc_version += 1
+
+
+
+def worker_name():
+    """Return a name identifying this worker process."""
+    return u"{0}:{1}".format(socket.gethostname(), os.getpid())
+
+
+
+def _isoformat(dt):
+    """Return ISO-formatted ``dt``, or None."""
+    return dt.isoformat() if dt is not None else None
@@ -6,6 +6,7 @@ from tastypie.resources import ModelResource, ALL, ALL_WITH_RELATIONS
 from ..core.api import (ProductVersionResource, ProductResource,
                         UserResource)
 from .models import CaseVersion, Case, Suite, CaseStep, SuiteCase
+from . import search
 from ...model.core.models import ProductVersion
 from ..mtapi import MTResource, MTAuthorization
 from ..environments.api import EnvironmentResource
@@ -227,6 +228,17 @@ class CaseVersionResource(MTResource):
         return ["case", "productversion"]
 
 
+    def apply_filters(self, request, applicable_filters):
+        """Also filter by keyword search, e.g. ``?search_name=login``."""
+        qs = super(CaseVersionResource, self).apply_filters(
+            request, applicable_filters)
+        if hasattr(request, "GET"):
+            for field in sorted(search.FIELDS):
+                for text in request.GET.getlist("search_{0}".format(field)):
+                    qs = qs.filter(pk__in=search.matching(field, text))
+        return qs
+
+
     def obj_update(self, bundle, request=None, **kwargs):
         """Set the modified_by field for the object to the request's user,
         avoid ConcurrencyError by updating cc_version."""
@@ -1,12 +1,52 @@
-"""Importer for suites and cases from a dictionary."""
+"""
+Importer for suites and cases from a dictionary.
+
+Cases are imported in chunks of ``IMPORT_CHUNK_SIZE``. Existing case names,
+tags and suites (and the users named in each chunk) are loaded into
+dictionaries up front, every case of a chunk is validated before anything is
+written, and then its cases, caseversions, steps, environments, tags and
+suite memberships are inserted in bulk. Case names, tags and suites are
+matched case-insensitively.
+
+``stream_items`` parses the suites and cases of a JSON file incrementally,
+one at a time, and ``Importer.import_stream`` imports them and commits in
+chunks, so files of any size can be imported in constant memory. An
+interrupted import can be resumed by skipping the items already committed.
+
+"""
 
 import json
+import re
 
 from django.db import transaction
+from django.db.models import Q
 
+from .. import counts
+from ..mtmodel import bulk_insert, utcnow
 from ..core.auth import User
 from ..tags.models import Tag
 from .models import Case, CaseVersion, CaseStep, Suite, SuiteCase
+from . import search
+
+
+
+# cases validated and written together
+IMPORT_CHUNK_SIZE = 1000
+
+# emails per query when looking up users
+USER_CHUNK_SIZE = 500
+
+# suites and cases of a stream imported (and committed) together
+STREAM_CHUNK_SIZE = 1000
+
+# warnings kept (and reported) when importing a stream
+STREAM_MAX_WARNINGS = 100
+
+# bytes read from a JSON stream at a time
+STREAM_READ_SIZE = 64 * 1024
+
+# largest suite or case (in bytes) a JSON stream may contain
+STREAM_MAX_ITEM_SIZE = 16 * 1024 * 1024
 
 
 
@@ -53,6 +93,13 @@ class Importer(object):
     * suites: the number of suites imported
     * warnings: list of warnings about the imported items, if any.
 
+    To import a large JSON file without loading it all, call its
+    ``import_stream`` method instead::
+
+        with open(filename) as fh:
+            import_result = importer.import_stream(
+                productversion, stream_items(fh))
+
     """
 
     @transaction.commit_on_success
@@ -97,6 +144,81 @@ class Importer(object):
         return result
 
 
+    def import_stream(self, productversion, items, force_dupes=False,
+                      chunk_size=None, skip=0, progress=None):
+        """
+        Import suites and cases from an iterable of (section, item) pairs.
+
+        Keyword arguments:
+
+        * productversion -- The ProductVersion model object for which the
+          items will be imported
+        * items -- an iterable of ("suites", suite_dict) and ("cases",
+          case_dict) pairs, such as ``stream_items(fh)``
+        * force_dupes -- if True, will import cases with duplicate names.  If
+          False, they will be skipped.
+        * chunk_size -- the number of items imported and committed together
+          (default ``STREAM_CHUNK_SIZE``)
+        * skip -- the number of items to read but not import (e.g. those
+          committed by an interrupted import)
+        * progress -- if given, called with the ``StreamImportResult`` after
+          each chunk is committed
+
+        Return a ``StreamImportResult``.
+
+        """
+
+        chunk_size = chunk_size or STREAM_CHUNK_SIZE
+        result = StreamImportResult()
+        case_importer = CaseImporter(
+            productversion, SuiteImporter(productversion.product))
+
+        chunk = []
+        for index, item in enumerate(items):
+            if index < skip:
+                result.processed += 1
+                continue
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                self._import_chunk(
+                    case_importer, chunk, result, force_dupes, progress)
+                chunk = []
+        if chunk:
+            self._import_chunk(
+                case_importer, chunk, result, force_dupes, progress)
+
+        return result
+
+
+    def _import_chunk(self, case_importer, chunk, result, force_dupes,
+                      progress):
+        """Import and commit a chunk of (section, item) pairs into result."""
+
+        result.append(self._commit_chunk(case_importer, chunk, force_dupes))
+        result.processed += len(chunk)
+        if progress is not None:
+            progress(result)
+
+
+    @transaction.commit_on_success
+    def _commit_chunk(self, case_importer, chunk, force_dupes):
+        """Import a chunk of (section, item) pairs in one transaction."""
+
+        suite_importer = case_importer.suite_importer
+        suite_importer.add_dicts(
+            [item for section, item in chunk if section == "suites"])
+
+        result = case_importer.import_cases(
+            [item for section, item in chunk if section == "cases"],
+            force_dupes=force_dupes,
+            )
+
+        # create the suites of this chunk, so they are committed with it
+        result.append(suite_importer.import_suites())
+
+        return result
+
+
 
 class CaseImporter(object):
     """Imports cases and links to or creates associated tags, suites."""
@@ -129,6 +251,12 @@ class CaseImporter(object):
         # cache of user emails
         self.user_cache = UserCache()
 
+        # lower-cased names of the caseversions of the productversion, and
+        # ids of its environments; loaded when first needed
+        self.names = None
+        self.environment_ids = None
+
+
     def import_cases(self, case_dict_list, force_dupes=False):
         """
         Import the test cases in the data.
@@ -156,12 +284,48 @@ class CaseImporter(object):
                 }
             ]
 
+        ``case_dict_list`` can be any iterable; it is consumed in chunks of
+        ``IMPORT_CHUNK_SIZE`` cases.
 
         """
 
         result = ImportResult()
 
+        chunk = []
         for new_case in case_dict_list:
+            chunk.append(new_case)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                result.append(self.import_chunk(chunk, force_dupes))
+                chunk = []
+        if chunk:
+            result.append(self.import_chunk(chunk, force_dupes))
+
+        return result
+
+
+    def import_chunk(self, case_dicts, force_dupes=False):
+        """
+        Validate and import a list of case dictionaries.
+
+        Cases that fail validation are skipped (with a warning); the rest are
+        written in bulk.
+
+        """
+
+        result = ImportResult()
+
+        self.user_cache.preload(
+            [c["created_by"] for c in case_dicts if "created_by" in c])
+        if self.names is None:
+            self.names = set(
+                n.lower() for n in CaseVersion.objects.filter(
+                    productversion=self.productversion).values_list(
+                    "name", flat=True)
+                )
+
+        # (case dict, user, steps, index of its no-steps warning) per case
+        valid = []
+        for new_case in case_dicts:
 
             if not "name" in new_case:
                 result.warn(
@@ -171,16 +335,11 @@ class CaseImporter(object):
                 continue
 
             # Don't re-import if we have the same case name and Product Version
-            if not force_dupes and CaseVersion.objects.filter(
-                name=new_case["name"],
-                productversion=self.productversion,
-                ).exists():
-
+            if not force_dupes and new_case["name"].lower() in self.names:
                 result.warn(
                     ImportResult.SKIP_CASE_NAME_CONFLICT,
                     new_case,
                     )
-
                 continue
 
             user = None
@@ -195,90 +354,144 @@ class CaseImporter(object):
                         email,
                         )
 
-            # the case looks good so far, but there may be a problem with
-            # one of the steps.  So, create a savepoint in case something
-            # is inherently wrong with this case, we can roll back to skip
-            # it, and still import the rest of the cases.
-            sid = transaction.savepoint()
-
-            # create the top-level case object which holds the versions
-            case = Case.objects.create(
-                product=self.productversion.product,
-                idprefix=new_case.get("idprefix", ""),
-                )
-
-            # create the case version which holds the details
-            caseversion = CaseVersion.objects.create(
-                productversion=self.productversion,
-                case=case,
-                name=new_case["name"],
-                description=new_case.get("description", ""),
-                user=user,
-                )
-
-            # add the steps to this case version
+            no_steps_warning = None
             if "steps" in new_case:
                 try:
-                    self.import_steps(caseversion, new_case["steps"])
+                    steps = self.import_steps(new_case["steps"])
                 except ValueError as e:
                     result.warn(
                         e.args[0],
                         new_case,
                         )
-
-                    transaction.savepoint_rollback(sid)
                     continue
             else:
+                steps = []
+                # the warning is about the caseversion, once it is created
+                no_steps_warning = len(result.warnings)
                 result.warn(
                     ImportResult.WARN_NO_STEPS,
-                    caseversion,
+                    None,
                     )
 
-            if "tags" in new_case:
-                self.tag_importer.add_names(caseversion, new_case["tags"])
+            self.names.add(new_case["name"].lower())
+            valid.append((new_case, user, steps, no_steps_warning))
 
-            if "suites" in new_case:
-                self.suite_importer.add_names(case, new_case["suites"])
-
-            # case has been created, increment our count for reporting
-            result.num_cases += 1
-
-            # this case went ok.  We'll save it as complete in the overall
-            # transaction.
-            transaction.savepoint_commit(sid)
-
-            # now create the tags and add case versions to them
-            self.tag_importer.import_tags()
-
-            # now create the suites and add cases to them
-            result.append(self.suite_importer.import_suites())
+        if valid:
+            self.write_cases(valid, result)
 
         return result
 
 
-    def import_steps(self, caseversion, step_data):
+    def import_steps(self, step_data):
         """
-        Add the steps to this case version.
+        Return list of unsaved CaseSteps (without caseversion) for step_data.
 
         Keyword arguments:
 
-        * caseversion -- the CaseVersion object that step_data applies to
-        * step_data -- a dictionary containing the steps for the case
+        * step_data -- a list of dictionaries containing the steps for a case
 
-        Instruction is a required field for a step, but expected is optional.
+        Instruction is a required field for a step, but expected is optional;
+        raise ValueError if it is missing.
 
         """
 
+        steps = []
         for step_num, new_step in enumerate(step_data):
             try:
-                casestep = CaseStep.objects.create(
-                    caseversion=caseversion,
-                    number=step_num + 1,
-                    instruction=new_step["instruction"],
-                    expected=new_step.get("expected", ""),
+                steps.append(
+                    CaseStep(
+                        number=step_num + 1,
+                        instruction=new_step["instruction"],
+                        expected=new_step.get("expected", ""),
+                        )
                     )
             except KeyError:
                 raise ValueError(ImportResult.SKIP_STEP_NO_INSTRUCTION)
+        return steps
+
+
+    def write_cases(self, valid, result):
+        """
+        Create cases, caseversions and steps for validated cases, in bulk.
+
+        Also give the caseversions the productversion's environments, add
+        them to their tags and suites and index them for search.
+
+        """
+
+        now = utcnow()
+        product = self.productversion.product
+
+        cases = [
+            Case(
+                product=product,
+                idprefix=new_case.get("idprefix", ""),
+                created_on=now,
+                modified_on=now,
+                )
+            for new_case, user, steps, no_steps_warning in valid
+            ]
+        bulk_insert(Case, cases, now)
+
+        caseversions = [
+            CaseVersion(
+                productversion=self.productversion,
+                case=case,
+                name=new_case["name"],
+                description=new_case.get("description", ""),
+                # a new case has only this version
+                latest=True,
+                created_on=now,
+                created_by=user,
+                modified_on=now,
+                modified_by=user,
+                )
+            for case, (new_case, user, steps, no_steps_warning)
+            in zip(cases, valid)
+            ]
+        bulk_insert(CaseVersion, caseversions, now)
+
+        all_steps = []
+        for caseversion, (new_case, user, steps, no_steps_warning) in zip(
+                caseversions, valid):
+            for step in steps:
+                step.caseversion = caseversion
+                step.created_on = step.modified_on = now
+            all_steps.extend(steps)
+            if no_steps_warning is not None:
+                result.warnings[no_steps_warning]["item"] = caseversion
+        CaseStep.everything.bulk_create(all_steps)
+
+        if self.environment_ids is None:
+            self.environment_ids = list(
+                self.productversion.environments.values_list("id", flat=True))
+        through = CaseVersion.environments.through
+        through._default_manager.bulk_create(
+            [
+                through(caseversion_id=cv.id, environment_id=env_id)
+                for cv in caseversions
+                for env_id in self.environment_ids
+                ]
+            )
+        counts.invalidate(through)
+
+        for case, caseversion, (new_case, user, steps, no_steps_warning) in zip(
+                cases, caseversions, valid):
+            if "tags" in new_case:
+                self.tag_importer.add_names(caseversion, new_case["tags"])
+
+            if "suites" in new_case:
+                self.suite_importer.add_names(case, new_case["suites"])
+
+        # now create the tags and add case versions to them
+        self.tag_importer.import_tags()
+
+        # now create the suites and add cases to them
+        result.append(self.suite_importer.import_suites())
+
+        search.index([cv.id for cv in caseversions])
+
+        result.num_cases += len(valid)
 
 
 
@@ -295,6 +508,25 @@ class UserCache(object):
         """Create a UserCache with an internal dictionary cache."""
 
         self.cache = {}
+        # emails searched for in bulk and not found, not yet reported
+        self.missing = set()
+
+
+    def preload(self, emails):
+        """
+        Look up all not yet cached ``emails`` with as few queries as possible.
+
+        """
+
+        emails = list(
+            set(emails).difference(self.cache).difference(self.missing))
+        for i in range(0, len(emails), USER_CHUNK_SIZE):
+            chunk = emails[i:i + USER_CHUNK_SIZE]
+            found = set()
+            for user in User.objects.filter(email__in=chunk):
+                self.cache[user.email] = user
+                found.add(user.email)
+            self.missing.update(set(chunk).difference(found))
 
 
     def get_user(self, email):
@@ -304,7 +536,6 @@ class UserCache(object):
         Keyword arguments:
 
         * email -- a string containing an email address
-        * result -- an ImportResult object to post results to
 
         If the email is already in the cache, then return that user.
         If this method had already searched for the user and not found it,
@@ -317,6 +548,11 @@ class UserCache(object):
         if email in self.cache:
             return self.cache[email]
 
+        elif email in self.missing:
+            self.missing.remove(email)
+            self.cache[email] = None
+            raise User.DoesNotExist()
+
         else:
             try:
                 user = User.objects.get(email=email)
@@ -332,7 +568,7 @@ class UserCache(object):
 
 class TagImporter(object):
     """
-    Imports suites based on lists and dicts of suites used to build it.
+    Imports tags based on lists of tag names for caseversions.
 
     """
 
@@ -341,6 +577,8 @@ class TagImporter(object):
 
         self.product = product
         self.map = {}
+        # existing tags by lower-cased name; loaded when first needed
+        self.tags = None
 
 
     def add_names(self, caseversion, tag_names):
@@ -365,7 +603,8 @@ class TagImporter(object):
         Import all added tags.
 
         Check for existing tags to prevent creating a global tag with the same
-        name as a product tag, and vice versa.
+        name as a product tag, and vice versa.  Names are matched
+        case-insensitively.
 
         Use or create tags in this order of priority:
 
@@ -375,25 +614,41 @@ class TagImporter(object):
 
         """
 
-        for tag_name, caseversions in self.map.items():
-            existing_tags = Tag.objects.filter(
-                name=tag_name,
-                product__in=[None, self.product],
-                ).order_by("-product")
-
-            # If there is a product tag, it will be sorted to first.
-            # If not, then the only item will be the global one, so
-            # use that.
-            if list(existing_tags):
-                tag = existing_tags[0]
-
-            else:
-                tag = Tag.objects.create(
+        if not self.map:
+            return
+
+        if self.tags is None:
+            self.tags = {}
+            for tag in Tag.objects.filter(
+                    Q(product__isnull=True) | Q(product=self.product)):
+                # a product tag wins over a global one of the same name
+                if tag.product_id or tag.name.lower() not in self.tags:
+                    self.tags[tag.name.lower()] = tag
+
+        now = utcnow()
+        new_tags = []
+        for tag_name in self.map:
+            if tag_name.lower() not in self.tags:
+                tag = Tag(
                     name=tag_name,
                     product=self.product,
+                    created_on=now,
+                    modified_on=now,
                     )
+                self.tags[tag_name.lower()] = tag
+                new_tags.append(tag)
+        bulk_insert(Tag, new_tags, now)
 
-            tag.caseversions.add(*caseversions)
+        through = CaseVersion.tags.through
+        pairs = set()
+        for tag_name, caseversions in self.map.items():
+            tag = self.tags[tag_name.lower()]
+            pairs.update((cv.id, tag.id) for cv in caseversions)
+        through._default_manager.bulk_create(
+            [through(caseversion_id=cv_id, tag_id=tag_id)
+             for cv_id, tag_id in sorted(pairs)]
+            )
+        counts.invalidate(through)
 
         # we have imported these items.  clear them out now.
         self.map.clear()
@@ -428,6 +683,8 @@ class SuiteImporter(object):
         self.product = product
         self.map = {}
         self.result = ImportResult()
+        # existing suites by lower-cased name; loaded when first needed
+        self.suites = None
 
 
     def add_names(self, case, suite_names):
@@ -491,28 +748,56 @@ class SuiteImporter(object):
 
 
     def import_suites(self):
-        """Import all mapped suites."""
+        """
+        Import all mapped suites.
 
-        for suite_name, suite_data in self.map.items():
+        Existing suites of the product are matched case-insensitively.
+        Return the result of the suites imported (and warned on) since the
+        last call.
 
-            suite, created = Suite.objects.get_or_create(
-                name=suite_name,
-                product=self.product,
-                defaults={"description": suite_data.get("description", "")},
+        """
+
+        if self.suites is None and self.map:
+            self.suites = dict(
+                (s.name.lower(), s)
+                for s in Suite.objects.filter(product=self.product)
                 )
 
-            if created:
-                self.result.num_suites += 1
+        now = utcnow()
+        new_suites = []
+        for suite_name, suite_data in self.map.items():
+            if suite_name.lower() not in self.suites:
+                suite = Suite(
+                    name=suite_name,
+                    product=self.product,
+                    description=suite_data.get("description", ""),
+                    created_on=now,
+                    modified_on=now,
+                    )
+                self.suites[suite_name.lower()] = suite
+                new_suites.append(suite)
+        bulk_insert(Suite, new_suites, now)
+        self.result.num_suites += len(new_suites)
 
-            # now add any cases the suite may have specified
-            if "cases" in suite_data:
-                for case in suite_data["cases"]:
-                    SuiteCase.objects.create(case=case, suite=suite)
+        # now add any cases the suite may have specified
+        SuiteCase.everything.bulk_create(
+            [
+                SuiteCase(
+                    case=case,
+                    suite=self.suites[suite_name.lower()],
+                    created_on=now,
+                    modified_on=now,
+                    )
+                for suite_name, suite_data in self.map.items()
+                for case in suite_data.get("cases", [])
+                ]
+            )
 
         # we have imported (or warned on) these items, so reset map.
         self.map.clear()
 
-        return self.result
+        result, self.result = self.result, ImportResult()
+        return result
 
 
 
@@ -586,10 +871,234 @@ class ImportResult(object):
         """
 
         result_list = [
-            "{0}: {1}".format(x["reason"], json.dumps(x["item"], indent=4))
+            "{0}: {1}".format(
+                x["reason"],
+                # model objects (e.g. caseversions) are shown by name
+                json.dumps(x["item"], indent=4, default=unicode),
+                )
             for x in self.warnings
             ]
 
         result_list.append("Imported {0} cases".format(self.num_cases))
         result_list.append("Imported {0} suites".format(self.num_suites))
         return result_list
+
+
+
+class StreamImportResult(ImportResult):
+    """
+    Results of importing a stream of suites and cases.
+
+    In addition to ``num_cases``, ``num_suites`` and ``warnings``, has these
+    attributes:
+
+    * processed -- the number of items read and committed, including any
+      that were skipped; skip this many items to resume an interrupted import
+    * warning_count -- the number of warnings; only the first ``max_warnings``
+      of them are kept in ``warnings``
+
+    """
+
+    def __init__(self, max_warnings=STREAM_MAX_WARNINGS):
+        """Construct a StreamImportResult keeping up to max_warnings."""
+
+        super(StreamImportResult, self).__init__()
+        self.max_warnings = max_warnings
+        self.processed = 0
+        self.warning_count = 0
+
+
+    def warn(self, reason, item):
+        """Add a warning to the result, unless max_warnings are kept."""
+
+        self.warning_count += 1
+        if len(self.warnings) < self.max_warnings:
+            super(StreamImportResult, self).warn(reason, item)
+
+
+    def append(self, result):
+        """Append the results object into this results object."""
+
+        self.num_cases += result.num_cases
+        self.num_suites += result.num_suites
+        for warning in result.warnings:
+            self.warn(warning["reason"], warning["item"])
+        if isinstance(result, StreamImportResult):
+            self.processed += result.processed
+            self.warning_count += result.warning_count - len(result.warnings)
+
+
+    def get_as_list(self):
+        """Return a list of the statuses, noting any warnings not kept."""
+
+        result_list = super(StreamImportResult, self).get_as_list()
+        omitted = self.warning_count - len(self.warnings)
+        if omitted:
+            result_list.insert(
+                -2, "Omitted {0} more warnings".format(omitted))
+        return result_list
+
+
+
+class JSONStreamError(ValueError):
+    """The JSON of a stream is malformed."""
+
+
+
+def stream_items(fh, read_size=None):
+    """
+    Yield (section, item) pairs for the suites and cases in JSON file ``fh``.
+
+    The file holds a dictionary structured as for ``Importer.import_data``.
+    It is read ``read_size`` (default ``STREAM_READ_SIZE``) bytes at a time,
+    and only one suite or case is parsed into memory at once.  Pairs are
+    yielded in file order, with ``section`` either "suites" or "cases"; any
+    other top-level keys are parsed and ignored.
+
+    Raise ``JSONStreamError`` if the JSON is malformed.
+
+    """
+
+    reader = _JSONReader(fh, read_size or STREAM_READ_SIZE)
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.next()
+    else:
+        while True:
+            if reader.peek() != '"':
+                raise reader.error("Expecting property name")
+            key = reader.value()
+            reader.expect(":")
+
+            if key in ["suites", "cases"] and reader.peek() == "[":
+                reader.next()
+                if reader.peek() == "]":
+                    reader.next()
+                else:
+                    while True:
+                        yield key, reader.value()
+                        if reader.delimiter("]"):
+                            break
+            else:
+                reader.value()
+
+            if reader.delimiter("}"):
+                break
+
+    if reader.peek():
+        raise reader.error("Extra data")
+
+
+
+class _JSONReader(object):
+    """Incremental reader of JSON values and delimiters from a file."""
+
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, fh, read_size):
+        """Read from file fh, read_size bytes at a time."""
+
+        self.fh = fh
+        self.read_size = read_size
+        self.buffer = ""
+        self.pos = 0
+        # bytes of the file discarded from the start of the buffer
+        self.offset = 0
+        self.eof = False
+
+
+    def fill(self):
+        """Read more of the file into the buffer; False at end of file."""
+
+        if self.eof:
+            return False
+        data = self.fh.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+
+    def peek(self):
+        """Return the next non-whitespace character, or "" at end of file."""
+
+        while True:
+            self.pos = self.whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+
+    def next(self):
+        """Consume and return the next non-whitespace character."""
+
+        char = self.peek()
+        self.pos += len(char)
+        return char
+
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be char."""
+
+        if self.peek() != char:
+            raise self.error("Expecting {0}".format(char))
+        self.pos += 1
+
+
+    def delimiter(self, close):
+        """Consume a comma (return False) or the close character (True)."""
+
+        char = self.peek()
+        if char not in [",", close]:
+            raise self.error("Expecting , delimiter")
+        self.pos += 1
+        return char == close
+
+
+    def value(self):
+        """
+        Parse and return the next JSON value.
+
+        The buffer is extended until the value is complete; a value that
+        ends at the end of the buffer may be a truncated number or literal.
+
+        """
+
+        if not self.peek():
+            raise self.error("Expecting value")
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError as e:
+                value, end = e, None
+
+            if end is not None and (
+                    end < len(self.buffer) or
+                    self.buffer[end - 1] in "}]\"" or
+                    self.eof):
+                self.pos = end
+                return value
+
+            if len(self.buffer) - self.pos > STREAM_MAX_ITEM_SIZE:
+                raise self.error(
+                    "Value larger than {0} bytes".format(
+                        STREAM_MAX_ITEM_SIZE)
+                    )
+            if not self.fill():
+                if end is not None:
+                    self.pos = end
+                    return value
+                raise self.error(str(value).split(":")[0])
+
+
+    def error(self, message):
+        """Return JSONStreamError with message, at the current position."""
+
+        return JSONStreamError(
+            "{0}: byte {1}".format(message, self.offset + self.pos))
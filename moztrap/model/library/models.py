@@ -3,13 +3,17 @@ Models for test-case library (cases, suites).
 
 """
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
+
+from model_utils import Choices
 
 from ..attachments.models import Attachment
-from ..mtmodel import MTModel, DraftStatusModel
+from ..mtmodel import (
+    MTModel, DraftStatusModel, CLONE_CHUNK_SIZE, post_bulk_clone, utcnow)
 from ..core.models import Product, ProductVersion
 from ..environments.models import HasEnvironmentsModel
 from ..tags.models import Tag
+from .. import counts
 
 
 
@@ -113,7 +117,14 @@ class CaseVersion(MTModel, DraftStatusModel, HasEnvironmentsModel):
 
 
     def save(self, *args, **kwargs):
-        """Save CaseVersion, updating latest version."""
+        """
+        Save CaseVersion, updating latest version and syncing name.
+
+        When saving a batch of caseversions, pass ``skip_set_latest=True`` and
+        ``skip_sync_name=True``, and call ``sync_cases`` with the batch at the
+        end instead.
+
+        """
         skip_set_latest = kwargs.pop("skip_set_latest", False)
         skip_sync_name = kwargs.pop("skip_sync_name", False)
         super(CaseVersion, self).save(*args, **kwargs)
@@ -122,14 +133,148 @@ class CaseVersion(MTModel, DraftStatusModel, HasEnvironmentsModel):
 
         # keep the name in sync for all caseversions
         if not skip_sync_name:
-            for cv in self.case.versions.all():
-                if not cv == self:
-                    cv.name = self.name
-                    cv.save(
-                        skip_sync_name=True,
-                        skip_set_latest=True,
-                        )
+            CaseVersion.sync_names([self], user=kwargs.get("user"))
+
+
+    @classmethod
+    def sync_cases(cls, caseversions, user=None):
+        """
+        Sync names and latest versions of the cases of saved ``caseversions``.
+
+        For a batch of caseversions saved with ``skip_sync_name`` and
+        ``skip_set_latest``, in one pass over all their cases.
+
+        """
+        cls.sync_names(caseversions, user=user)
+        _set_latest_versions(set(cv.case_id for cv in caseversions))
+
+
+    @classmethod
+    def sync_names(cls, caseversions, user=None):
+        """
+        Give the other versions of the case of each caseversion its name.
+
+        Versions with a different name are renamed with one UPDATE (per chunk
+        of them), which also bumps their ``cc_version`` and modification
+        timestamp and user, and are reindexed for search.
+
+        """
+        names = dict((cv.case_id, cv.name) for cv in caseversions)
+        case_ids = list(names)
+        renamed = []
+        for i in range(0, len(case_ids), CLONE_CHUNK_SIZE):
+            renamed.extend(
+                (cv_id, case_id)
+                for cv_id, case_id, name in cls.objects.filter(
+                    case__in=case_ids[i:i + CLONE_CHUNK_SIZE]).values_list(
+                    "id", "case", "name")
+                if name != names[case_id]
+                )
+        if not renamed:
+            return
+
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        now = utcnow()
+        for i in range(0, len(renamed), CLONE_CHUNK_SIZE):
+            chunk = renamed[i:i + CLONE_CHUNK_SIZE]
+            chunk_case_ids = list(set(case_id for cv_id, case_id in chunk))
+            cursor.execute(
+                """UPDATE {table}
+                SET {name} = CASE {case_id} {whens} END,
+                    {modified_on} = %s,
+                    {modified_by} = %s,
+                    {cc_version} = {cc_version} + 1
+                WHERE {id} IN ({ids})
+                """.format(
+                    table=qn(cls._meta.db_table),
+                    name=qn("name"),
+                    case_id=qn("case_id"),
+                    modified_on=qn("modified_on"),
+                    modified_by=qn("modified_by_id"),
+                    cc_version=qn("cc_version"),
+                    id=qn("id"),
+                    whens=" ".join(["WHEN %s THEN %s"] * len(chunk_case_ids)),
+                    ids=", ".join(["%s"] * len(chunk)),
+                    ),
+                [
+                    p for case_id in chunk_case_ids
+                    for p in (case_id, names[case_id])
+                    ]
+                + [now, user.id if user is not None else None]
+                + [cv_id for cv_id, case_id in chunk],
+                )
+        transaction.commit_unless_managed()
+        counts.invalidate(cls)
+        search.index(
+            [cv_id for cv_id, case_id in renamed], search.CASEVERSION_FIELDS)
+
+
+    @classmethod
+    def set_latest_versions(cls, cases):
+        """
+        Mark latest version of each of ``cases``, marking others non-latest.
 
+        ``cases`` is a queryset of cases. Like ``Case.set_latest_version``,
+        but for all the cases at once, in two UPDATE statements that only
+        touch caseversions whose ``latest`` flag changes.
+
+        """
+        qn = connection.ops.quote_name
+        cases = cases.order_by().values("pk")
+        cases_sql, cases_params = cases.query.get_compiler(
+            cases.db).as_sql()
+        # caseversions of the cases on the highest-ordered product version;
+        # wrapped in a derived table, since MySQL can't otherwise select
+        # from the table being updated
+        latest_sql = """SELECT latest_ids.id FROM (
+            SELECT cv.{id} AS id
+            FROM {cv} AS cv
+            INNER JOIN {pv} AS pv ON pv.{id} = cv.{productversion_id}
+            WHERE cv.{deleted_on} IS NULL AND cv.{case_id} IN ({cases})
+            AND pv.{order} = (
+                SELECT MAX(pv2.{order})
+                FROM {cv} AS cv2
+                INNER JOIN {pv} AS pv2 ON pv2.{id} = cv2.{productversion_id}
+                WHERE cv2.{case_id} = cv.{case_id}
+                AND cv2.{deleted_on} IS NULL)
+            ) AS latest_ids"""
+        names = dict(
+            (name, qn(name)) for name in [
+                "id",
+                "productversion_id",
+                "case_id",
+                "deleted_on",
+                "order",
+                "latest",
+                "cc_version",
+                ]
+            )
+        names.update(
+            cv=qn(cls._meta.db_table),
+            pv=qn(ProductVersion._meta.db_table),
+            cases=cases_sql,
+            )
+        latest_sql = latest_sql.format(**names)
+
+        cursor = connection.cursor()
+        cursor.execute(
+            """UPDATE {cv}
+            SET {latest} = %s, {cc_version} = {cc_version} + 1
+            WHERE {latest} = %s AND {deleted_on} IS NULL
+            AND {case_id} IN ({cases}) AND {id} NOT IN ({latest_ids})
+            """.format(latest_ids=latest_sql, **names),
+            [False, True] + list(cases_params) + list(cases_params),
+            )
+        cursor.execute(
+            """UPDATE {cv}
+            SET {latest} = %s, {cc_version} = {cc_version} + 1
+            WHERE {latest} = %s AND {id} IN ({latest_ids})
+            """.format(latest_ids=latest_sql, **names),
+            [True, False] + list(cases_params),
+            )
+        transaction.commit_unless_managed()
+        counts.invalidate(cls)
 
 
     def delete(self, *args, **kwargs):
@@ -205,9 +350,10 @@ class CaseVersion(MTModel, DraftStatusModel, HasEnvironmentsModel):
         Also sets ``envs_narrowed`` flag.
 
         """
-        super(CaseVersion, self).remove_envs(*envs)
+        touched = super(CaseVersion, self).remove_envs(*envs)
         self.envs_narrowed = True
         self.save()
+        return touched
 
 
     @classmethod
@@ -278,6 +424,28 @@ class CaseStep(MTModel):
 
 
 
+class SearchToken(models.Model):
+    """
+    A word in the text of a caseversion, for keyword search.
+
+    One row per distinct word in each searchable ``field`` of a caseversion
+    (its name or description, or the instructions or expected results of its
+    steps). This is derived data, maintained by ``search.TokenIndexBackend``,
+    so it isn't an ``MTModel``: it has no history and is really deleted.
+
+    """
+    FIELD = Choices("name", "description", "instruction", "expected")
+
+    caseversion = models.ForeignKey(CaseVersion, related_name="searchtokens")
+    field = models.CharField(max_length=20, choices=FIELD)
+    token = models.CharField(max_length=50, db_index=True)
+
+
+    def __unicode__(self):
+        return self.token
+
+
+
 class Suite(MTModel, DraftStatusModel):
     """An ordered suite of test cases."""
     DEFAULT_STATUS = DraftStatusModel.STATUS.active
@@ -344,3 +512,30 @@ class SuiteCase(MTModel):
                 "'{0}' is already in suite '{1}'".format(
                     self.case, self.suite)
                 )
+
+
+
+def _set_latest_versions(case_ids):
+    """Mark latest versions of cases with given ids, in chunks."""
+    case_ids = list(case_ids)
+    for i in range(0, len(case_ids), CLONE_CHUNK_SIZE):
+        CaseVersion.set_latest_versions(
+            Case.objects.filter(pk__in=case_ids[i:i + CLONE_CHUNK_SIZE]))
+
+
+
+def _caseversions_cloned(sender, instances, **kwargs):
+    """Mark latest versions of cases given bulk-cloned caseversions."""
+    _set_latest_versions(set(cv.case_id for cv in instances))
+
+
+post_bulk_clone.connect(
+    _caseversions_cloned,
+    sender=CaseVersion,
+    dispatch_uid="library_caseversions_cloned",
+    )
+
+
+
+# keep the search index up to date
+from . import search
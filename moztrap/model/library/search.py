@@ -0,0 +1,182 @@
+"""
+Keyword search of caseversion text.
+
+Caseversions can be searched by the words of their name or description, or of
+the instructions or expected results of their steps. The search backend is
+set by ``settings.MOZTRAP_SEARCH_BACKEND``:
+
+``TokenIndexBackend`` (the default) keeps an index of the words of each
+field in the ``SearchToken`` table, updated whenever a caseversion or step is
+saved or deleted. Searching for some text finds caseversions with, for every
+word of the text, a word in the field beginning with it; so "log" finds "Log
+in" and "logout", but not "blog".
+
+``LikeBackend`` needs no index; it finds caseversions whose field contains
+the text anywhere (with SQL ``LIKE``), by scanning the table.
+
+Caseversions (or steps) created in bulk don't send the signals that keep the
+index up to date; index them with ``index`` afterwards, or rebuild the whole
+index with the ``rebuild_search_index`` management command.
+
+"""
+import re
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.utils.importlib import import_module
+
+from ..mtmodel import post_bulk_clone
+from .models import CaseVersion, CaseStep, SearchToken
+
+
+
+# searchable fields, and their lookup from CaseVersion
+FIELDS = {
+    "name": "name",
+    "description": "description",
+    "instruction": "steps__instruction",
+    "expected": "steps__expected",
+    }
+
+CASEVERSION_FIELDS = ["name", "description"]
+STEP_FIELDS = ["instruction", "expected"]
+
+# caseversions indexed per batch of queries
+INDEX_CHUNK_SIZE = 500
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+
+def get_backend():
+    """Return an instance of the configured search backend."""
+    module_name, class_name = settings.MOZTRAP_SEARCH_BACKEND.rsplit(".", 1)
+    return getattr(import_module(module_name), class_name)()
+
+
+
+def matching(field, text):
+    """
+    Return queryset of ids of caseversions whose ``field`` matches ``text``.
+
+    The queryset is suitable for an ``__in`` lookup of caseversions, e.g.
+    ``RunCaseVersion.objects.filter(caseversion__in=matching(...))``.
+
+    """
+    if field not in FIELDS:
+        raise ValueError("Unknown search field: {0}".format(field))
+    return get_backend().matching(field, text)
+
+
+
+def index(caseversion_ids, fields=None):
+    """Update the search index for the given caseversions (and fields)."""
+    get_backend().index(caseversion_ids, fields)
+
+
+
+def tokenize(text):
+    """Return set of lower-case words in ``text``, truncated to fit index."""
+    max_length = SearchToken._meta.get_field("token").max_length
+    return set(
+        word[:max_length] for word in TOKEN_RE.findall((text or "").lower()))
+
+
+
+class LikeBackend(object):
+    """Search by scanning for text anywhere in the field; no index."""
+    def matching(self, field, text):
+        """Return queryset of ids of caseversions with ``text`` in field."""
+        return CaseVersion._base_manager.filter(
+            **{"{0}__icontains".format(FIELDS[field]): text}).values("pk")
+
+
+    def index(self, caseversion_ids, fields=None):
+        """Nothing to index."""
+        pass
+
+
+
+class TokenIndexBackend(object):
+    """Search by prefixes of the words in an index of caseversion text."""
+    def matching(self, field, text):
+        """Return queryset of ids of caseversions matching ``text``."""
+        tokens = tokenize(text)
+        if not tokens:
+            # no words to look up (e.g. only punctuation)
+            return LikeBackend().matching(field, text)
+
+        matches = None
+        for token in sorted(tokens):
+            qs = SearchToken.objects.filter(
+                field=field, token__startswith=token)
+            if matches is not None:
+                qs = qs.filter(caseversion__in=matches)
+            matches = qs.values("caseversion")
+        return matches
+
+
+    def index(self, caseversion_ids, fields=None):
+        """Replace index of ``fields`` (default all) of given caseversions."""
+        fields = list(fields or FIELDS)
+        cv_fields = [f for f in CASEVERSION_FIELDS if f in fields]
+        step_fields = [f for f in STEP_FIELDS if f in fields]
+        caseversion_ids = list(set(caseversion_ids))
+
+        for i in range(0, len(caseversion_ids), INDEX_CHUNK_SIZE):
+            chunk = caseversion_ids[i:i + INDEX_CHUNK_SIZE]
+            tokens = set()
+            if cv_fields:
+                for row in CaseVersion._base_manager.filter(
+                        pk__in=chunk).values_list("id", *cv_fields):
+                    for field, text in zip(cv_fields, row[1:]):
+                        tokens.update(
+                            (row[0], field, t) for t in tokenize(text))
+            if step_fields:
+                for row in CaseStep.objects.filter(
+                        caseversion__in=chunk).values_list(
+                        "caseversion", *step_fields):
+                    for field, text in zip(step_fields, row[1:]):
+                        tokens.update(
+                            (row[0], field, t) for t in tokenize(text))
+
+            SearchToken.objects.filter(
+                caseversion__in=chunk, field__in=fields).delete()
+            SearchToken.objects.bulk_create(
+                [
+                    SearchToken(caseversion_id=cv_id, field=field, token=t)
+                    for cv_id, field, t in tokens
+                    ]
+                )
+
+
+
+def _caseversion_saved(sender, instance, **kwargs):
+    index([instance.id], CASEVERSION_FIELDS)
+
+
+def _step_changed(sender, instance, **kwargs):
+    index([instance.caseversion_id], STEP_FIELDS)
+
+
+def _caseversions_cloned(sender, instances, **kwargs):
+    index([cv.id for cv in instances], CASEVERSION_FIELDS)
+
+
+def _steps_cloned(sender, instances, **kwargs):
+    index([step.caseversion_id for step in instances], STEP_FIELDS)
+
+
+post_save.connect(
+    _caseversion_saved, sender=CaseVersion, dispatch_uid="search_caseversion")
+post_save.connect(
+    _step_changed, sender=CaseStep, dispatch_uid="search_step_saved")
+post_delete.connect(
+    _step_changed, sender=CaseStep, dispatch_uid="search_step_deleted")
+post_bulk_clone.connect(
+    _caseversions_cloned,
+    sender=CaseVersion,
+    dispatch_uid="search_caseversions_cloned",
+    )
+post_bulk_clone.connect(
+    _steps_cloned, sender=CaseStep, dispatch_uid="search_steps_cloned")
@@ -5,16 +5,21 @@ Soft-deletion (including cascade) and tracking of user and timestamp for model
 creation, modification, and soft-deletion.
 
 """
+from collections import defaultdict, namedtuple, OrderedDict
 import datetime
 
-from django.db import models, router
-from django.db.models.deletion import Collector
+from django.db import (
+    connection, connections, models, router, transaction, DEFAULT_DB_ALIAS)
 from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.db.models import signals, Max
 from django.db.models.signals import class_prepared
+from django.dispatch import Signal
 
 from model_utils import Choices
 
 from .core.auth import User
+from . import counts
 
 
 
@@ -28,50 +33,511 @@ def utcnow():
 
 
 
-class SoftDeleteCollector(Collector):
+# ids covered by each UPDATE of a cascading soft-delete or undelete
+DELETE_BATCH_SIZE = 10000
+
+# sent before a soft-delete or undelete cascade updates rows of the sender
+# model, with the SQL condition (``where`` and ``params``) selecting them. As
+# the condition may select other rows afterwards, a receiver can return a
+# callable to be called once all the rows have been updated.
+pre_soft_delete_cascade = Signal(providing_args=["where", "params"])
+
+
+
+class SoftDeleteCollector(object):
     """
-    A variant of Django's default delete-cascade collector that implements soft
-    delete.
+    Soft-deletes (or undeletes) objects and their dependents, set-wise.
+
+    Dependent objects are never loaded, nor are their ids. Each level of the
+    cascade is described by an SQL condition selecting its rows: the rows of
+    every ``MTModel`` with a cascading foreign key to the previous level's
+    rows, ``fk IN (SELECT id ... WHERE <previous condition>)``. Rows are
+    followed whether or not they are changed themselves, so the cascade
+    passes through dependents that were already deleted, until a level
+    selects no rows. Each UPDATE covers at most ``DELETE_BATCH_SIZE`` ids.
+
+    ``delete`` and ``undelete`` return a dictionary mapping models to the
+    number of their objects (soft-)deleted or undeleted.
 
     """
-    def collect(self, objs, *args, **kwargs):
-        """
-        Collect ``objs`` and dependent objects.
+    def __init__(self, using=None):
+        self.using = using or DEFAULT_DB_ALIAS
+        self.roots = []
 
-        We override in order to store "root" objects for undelete.
 
-        """
-        if kwargs.get("source", None) is None:
-            self.root_objs = objs
-        super(SoftDeleteCollector, self).collect(objs, *args, **kwargs)
+    def collect(self, objs):
+        """Collect ``objs`` (queryset or list of instances) and dependents."""
+        qn = connections[self.using].ops.quote_name
+        if isinstance(objs, QuerySet):
+            pks = objs.order_by().values("pk")
+            try:
+                sql, params = pks.query.get_compiler(self.using).as_sql()
+            except EmptyResultSet:
+                return
+            # selected via a derived table, as MySQL can't otherwise select
+            # from the table being updated
+            self.roots.append(
+                (
+                    objs.model,
+                    "{0} IN (SELECT roots.id FROM ({1}) AS roots)".format(
+                        qn("id"), sql),
+                    list(params),
+                    )
+                )
+        else:
+            pks = [obj.pk for obj in objs]
+            for i in range(0, len(pks), CLONE_CHUNK_SIZE):
+                chunk = pks[i:i + CLONE_CHUNK_SIZE]
+                self.roots.append(
+                    (
+                        objs[0].__class__,
+                        "{0} IN ({1})".format(
+                            qn("id"), ", ".join(["%s"] * len(chunk))),
+                        chunk,
+                        )
+                    )
 
 
     def delete(self, user=None):
         """
-        Soft-delete all collected instances.
+        Soft-delete all collected objects not already deleted.
 
         """
-        now = utcnow()
-        for model, instances in self.data.iteritems():
-            pk_list = [obj.pk for obj in instances]
-            model._base_manager.filter(
-                pk__in=pk_list, deleted_on__isnull=True).update(
-                deleted_by=user, deleted_on=now)
+        found = self._cascade(
+            "{deleted_on} IS NULL", [], utcnow(), user.id if user else None)
+        transaction.commit_unless_managed(using=self.using)
+        counts.invalidate(*found.keys())
+        return found
 
 
     def undelete(self, user=None):
         """
-        Undelete all collected instances that were deleted.
+        Undelete all collected objects that were deleted.
+
+        Only dependents deleted along with (at the same time as) one of the
+        collected objects are undeleted.
+
+        """
+        qn = connections[self.using].ops.quote_name
+        cursor = connections[self.using].cursor()
+        deletion_times = set()
+        for model, where, params in self.roots:
+            cursor.execute(
+                "SELECT DISTINCT {0} FROM {1} WHERE {0} IS NOT NULL "
+                "AND {2}".format(
+                    qn("deleted_on"), qn(model._meta.db_table), where),
+                params,
+                )
+            deletion_times.update(row[0] for row in cursor.fetchall())
+        if not deletion_times:
+            return {}
+
+        found = self._cascade(
+            "{{deleted_on}} IN ({0})".format(
+                ", ".join(["%s"] * len(deletion_times))),
+            list(deletion_times),
+            None,
+            None,
+            )
+        transaction.commit_unless_managed(using=self.using)
+        counts.invalidate(*found.keys())
+        return found
+
+
+    def _cascade(self, condition, condition_params, deleted_on, deleted_by):
+        """
+        Update collected objects and their dependents matching ``condition``.
+
+        Updated rows get the given ``deleted_on`` and ``deleted_by`` (user
+        id). Return dictionary mapping models to number of rows updated.
+
+        The levels of the cascade are all found first, then updated deepest
+        first, as updating a level could change which rows the conditions of
+        the levels above it select (e.g. a queryset of undeleted objects).
+
+        """
+        levels = []
+        queue = [
+            (model, where, params, ()) for model, where, params in self.roots]
+        while queue:
+            model, where, params, path = queue.pop(0)
+            bounds = self._bounds(model, where, params)
+            if bounds is None:
+                continue
+            levels.append((model, where, params, bounds))
+            path = path + ((model, where, params),)
+            for related in _cascades(model):
+                queue.append(
+                    self._child_level(related, where, params, path))
+
+        after = []
+        for model, where, params, bounds in levels:
+            for receiver, response in pre_soft_delete_cascade.send(
+                    sender=model, where=where, params=params):
+                if callable(response):
+                    after.append(response)
+
+        found = defaultdict(int)
+        for model, where, params, bounds in reversed(levels):
+            updated = self._update(
+                model,
+                bounds,
+                "({0}) AND {1}".format(where, condition),
+                params + condition_params,
+                deleted_on,
+                deleted_by,
+                )
+            if updated:
+                found[model] += updated
+
+        for func in after:
+            func()
+        return dict(found)
+
+
+    def _child_level(self, related, where, params, path):
+        """
+        Return the cascade level along ``related`` from rows ``where``.
+
+        Returns a tuple (model, where, params, path); ``path`` is the levels
+        (model, where, params) leading to it, the last of which is the parent.
+
+        """
+        qn = connections[self.using].ops.quote_name
+        parent = path[-1][0]
+        child = related.model
+        # nested derived tables (which MySQL needs to select from a table
+        # being updated) each get their own alias
+        subquery = (
+            "SELECT level{depth}.id FROM ("
+            "SELECT {id} AS id FROM {table} WHERE {where}"
+            ") AS level{depth}"
+            )
+        child_where = "{0} IN ({1})".format(
+            qn(related.field.column),
+            subquery.format(
+                depth=len(path),
+                id=qn("id"),
+                table=qn(parent._meta.db_table),
+                where=where,
+                ),
+            )
+        child_params = list(params)
+        # rows reached before on this path (along a relation of a model to
+        # itself) aren't followed again, so the cascade ends
+        for i, (model, seen_where, seen_params) in enumerate(path):
+            if model is child:
+                child_where += " AND {0} NOT IN ({1})".format(
+                    qn("id"),
+                    subquery.format(
+                        depth="{0}_{1}".format(len(path), i),
+                        id=qn("id"),
+                        table=qn(model._meta.db_table),
+                        where=seen_where,
+                        ),
+                    )
+                child_params.extend(seen_params)
+        return child, child_where, child_params, path
+
+
+    def _bounds(self, model, where, params):
+        """Return (lowest, highest) id of ``model`` rows ``where``, or None."""
+        qn = connections[self.using].ops.quote_name
+        cursor = connections[self.using].cursor()
+        cursor.execute(
+            "SELECT MIN({0}), MAX({0}) FROM {1} WHERE {2}".format(
+                qn("id"), qn(model._meta.db_table), where),
+            params,
+            )
+        low, high = cursor.fetchone()
+        if low is None:
+            return None
+        return low, high
+
+
+    def _update(self, model, bounds, where, params, deleted_on, deleted_by):
+        """
+        Set ``deleted_on`` and ``deleted_by`` of rows of ``model`` ``where``.
+
+        ``where`` may refer to the ``{deleted_on}`` column. The rows, with ids
+        within ``bounds`` (lowest, highest), are updated in windows of
+        ``DELETE_BATCH_SIZE`` ids; return number of rows updated.
 
         """
-        # timestamps on which root obj(s) were deleted; only cascade items also
-        # deleted in one of these same cascade batches should be undeleted.
-        deletion_times = set([o.deleted_on for o in self.root_objs])
-        for model, instances in self.data.iteritems():
-            pk_list = [obj.pk for obj in instances]
-            model._base_manager.filter(
-                pk__in=pk_list, deleted_on__in=deletion_times).update(
-                deleted_by=None, deleted_on=None)
+        qn = connections[self.using].ops.quote_name
+        table = qn(model._meta.db_table)
+        id_col = qn("id")
+        where = where.replace("{deleted_on}", qn("deleted_on"))
+        cursor = connections[self.using].cursor()
+
+        low, high = bounds
+        updated = 0
+        for start in range(low, high + 1, DELETE_BATCH_SIZE):
+            cursor.execute(
+                """UPDATE {table}
+                SET {deleted_on} = %s, {deleted_by} = %s
+                WHERE {id} >= %s AND {id} < %s AND {where}
+                """.format(
+                    table=table,
+                    deleted_on=qn("deleted_on"),
+                    deleted_by=qn("deleted_by_id"),
+                    id=id_col,
+                    where=where,
+                    ),
+                [deleted_on, deleted_by, start, start + DELETE_BATCH_SIZE]
+                + params,
+                )
+            updated += cursor.rowcount
+        return updated
+
+
+
+def _cascades(model):
+    """Return relations by which deleting ``model`` cascades to MTModels."""
+    return [
+        related for related in model._meta.get_all_related_objects(
+            include_hidden=True)
+        if issubclass(related.model, MTModel)
+        and related.field.rel.on_delete is models.CASCADE
+        ]
+
+
+
+# objects per query when cloning in bulk; keeps SQLite under its limit of 999
+# parameters per query
+CLONE_CHUNK_SIZE = 300
+
+# sent (once the whole tree is cloned) with the clones ``BulkCloner`` inserted
+# in bulk for each model, since bulk inserts don't send ``post_save``
+post_bulk_clone = Signal(providing_args=["instances"])
+
+
+
+# a scheduled clone: source object, its (unsaved) clone, and its cascade
+_Clone = namedtuple("_Clone", ["source", "clone", "cascade"])
+
+
+
+class BulkCloner(object):
+    """
+    Clones trees of objects a level at a time, with bulk inserts.
+
+    The clones of each model on a level of the tree are bulk-inserted, and
+    their new ids are read back in insertion order to map each source object
+    to its clone. Reverse-FK children of a whole level are then fetched with a
+    query per relation and scheduled for the next level, through their own
+    ``clone`` method (so their cascade and override defaults apply).
+    Many-to-many rows are copied with an INSERT ... SELECT per relation.
+
+    Nothing is committed unless no transaction is managed, so a clone made
+    in a view is covered by the request's transaction.
+
+    """
+    def __init__(self, user=None):
+        self.user = user
+        self.now = utcnow()
+        self._pending = []
+        self._created = OrderedDict()
+
+
+    def add(self, obj, cascade=None, overrides=None):
+        """Schedule ``obj`` to be cloned (in bulk) by ``run``."""
+        self._pending.append(self._schedule(obj, cascade, overrides))
+
+
+    def clone(self, obj, cascade=None, overrides=None):
+        """Save and return a clone of ``obj``; clone its cascade in bulk."""
+        entry = self._schedule(obj, cascade, overrides)
+        entry.clone.save(force_insert=True)
+        self._cascade(obj.__class__, [entry])
+        self._run()
+        return entry.clone
+
+
+    def run(self):
+        """Clone all scheduled objects, and everything they cascade to."""
+        self._run()
+
+
+    def _run(self):
+        while self._pending:
+            level, self._pending = self._pending, []
+            by_model = _grouped(level, lambda e: e.source.__class__)
+            for model, entries in by_model.items():
+                self._insert(model, entries)
+            for model, entries in by_model.items():
+                self._cascade(model, entries)
+
+        created, self._created = self._created, OrderedDict()
+        for model, clones in created.items():
+            post_bulk_clone.send(sender=model, instances=clones)
+
+
+    def _schedule(self, obj, cascade, overrides):
+        """Return ``_Clone`` for ``obj``, with its clone's field values set."""
+        if cascade is None:
+            cascade = {}
+        else:
+            try:
+                cascade.iteritems
+            except AttributeError:
+                cascade = dict((i, _unfiltered) for i in cascade)
+
+        overrides = dict(overrides or {})
+        overrides["created_on"] = self.now
+        overrides["created_by"] = self.user
+        overrides["modified_on"] = self.now
+        overrides["modified_by"] = self.user
+
+        clone = obj.__class__()
+        for field in obj._meta.fields:
+            if field.primary_key:
+                continue
+            if field.name in overrides:
+                setattr(clone, field.name, overrides[field.name])
+            else:
+                # by attname, so foreign keys aren't fetched
+                setattr(clone, field.attname, getattr(obj, field.attname))
+
+        return _Clone(obj, clone, cascade)
+
+
+    def _insert(self, model, entries):
+        """Bulk-insert the clones of ``entries`` and set their ids."""
+        clones = [e.clone for e in entries]
+        bulk_insert(model, clones, self.now)
+        self._created.setdefault(model, []).extend(clones)
+
+
+    def _cascade(self, model, entries):
+        """Clone the relations in the cascade of cloned ``entries``."""
+        by_relation = OrderedDict()
+        for entry in entries:
+            for name, filter_func in entry.cascade.items():
+                by_relation.setdefault((name, filter_func), []).append(entry)
+
+        for (name, filter_func), group in by_relation.items():
+            mgr = getattr(group[0].source, name)
+            if mgr.__class__.__name__ == "ManyRelatedManager":  # M2M
+                self._copy_m2m(mgr, filter_func, group)
+            elif mgr.__class__.__name__ == "RelatedManager":  # reverse FK
+                self._add_children(
+                    getattr(model, name).related, filter_func, group)
+            else:
+                raise ValueError(
+                    "Cannot cascade-clone '{0}'; "
+                    "not a many-to-many or reverse foreignkey.".format(name))
+
+
+    def _add_children(self, related, filter_func, entries):
+        """Schedule related objects of ``entries``, pointing to the clones."""
+        fk = related.field
+        clones = dict((e.source.id, e.clone) for e in entries)
+        source_ids = list(clones)
+        for i in range(0, len(source_ids), CLONE_CHUNK_SIZE):
+            children = filter_func(
+                related.model.objects.filter(
+                    **{"{0}__in".format(fk.name):
+                           source_ids[i:i + CLONE_CHUNK_SIZE]}
+                    )
+                )
+            for child in children:
+                child.clone(
+                    overrides={fk.name: clones[getattr(child, fk.attname)]},
+                    cloner=self,
+                    )
+
+
+    def _copy_m2m(self, mgr, filter_func, entries):
+        """Give clones of ``entries`` the related objects of their sources."""
+        through = mgr.through
+        if not through._meta.auto_created:
+            raise ValueError(
+                "Cannot cascade-clone through custom intermediary model "
+                "{0}.".format(through.__name__))
+
+        targets = mgr.model._default_manager.all()
+        if issubclass(mgr.model, MTModel):
+            targets = targets.filter(deleted_on__isnull=True)
+        targets = filter_func(targets).order_by().values("pk")
+        targets_sql, targets_params = targets.query.get_compiler(
+            targets.db).as_sql()
+
+        qn = connection.ops.quote_name
+        table = qn(through._meta.db_table)
+        source = qn(through._meta.get_field(mgr.source_field_name).column)
+        target = qn(through._meta.get_field(mgr.target_field_name).column)
+        cursor = connection.cursor()
+        for i in range(0, len(entries), CLONE_CHUNK_SIZE):
+            chunk = entries[i:i + CLONE_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            # saved clones may already have gotten some related objects
+            cursor.execute(
+                "DELETE FROM {0} WHERE {1} IN ({2})".format(
+                    table, source, placeholders),
+                [e.clone.id for e in chunk],
+                )
+            cursor.execute(
+                """INSERT INTO {table} ({source}, {target})
+                SELECT CASE {source} {cases} END, {target}
+                FROM {table}
+                WHERE {source} IN ({ids}) AND {target} IN ({targets})
+                """.format(
+                    table=table,
+                    source=source,
+                    target=target,
+                    cases=" ".join(["WHEN %s THEN %s"] * len(chunk)),
+                    ids=placeholders,
+                    targets=targets_sql,
+                    ),
+                [pk for e in chunk for pk in (e.source.id, e.clone.id)]
+                + [e.source.id for e in chunk]
+                + list(targets_params),
+                )
+        transaction.commit_unless_managed()
+        counts.invalidate(through)
+
+
+
+def bulk_insert(model, objs, now):
+    """
+    Bulk-insert ``objs`` of MTModel ``model``, all created ``now``; set ids.
+
+    Bulk inserts don't return ids, so the rows created at ``now`` with ids
+    above the largest id before the insert are read back in insertion order.
+    Raises ``ConcurrencyError`` if their number doesn't match.
+
+    """
+    if not objs:
+        return
+    start = model.everything.aggregate(start=Max("id"))["start"] or 0
+    model.everything.bulk_create(objs)
+    ids = list(
+        model.everything.filter(pk__gt=start, created_on=now).order_by(
+            "id").values_list("id", flat=True)
+        )
+    if len(ids) != len(objs):
+        raise ConcurrencyError(
+            "Inserted {0} {1} objects, but found {2}.".format(
+                len(objs), model.__name__, len(ids))
+            )
+    for obj, pk in zip(objs, ids):
+        obj.id = pk
+
+
+
+def _unfiltered(queryset):
+    """Cascade filter that clones all related objects."""
+    return queryset
+
+
+
+def _grouped(items, key):
+    """Return ordered dict mapping ``key(item)`` to lists of ``items``."""
+    groups = OrderedDict()
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return groups
 
 
 
@@ -100,29 +566,45 @@ class MTQuerySet(QuerySet):
             kwargs["modified_on"] = utcnow()
         # increment the concurrency control version for all updated objects
         kwargs["cc_version"] = models.F("cc_version") + 1
-        return super(MTQuerySet, self).update(*args, **kwargs)
+        updated = super(MTQuerySet, self).update(*args, **kwargs)
+        counts.invalidate(self.model)
+        return updated
+
+
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Insert the given list of objects in bulk.
+
+        """
+        created = super(MTQuerySet, self).bulk_create(objs, batch_size)
+        counts.invalidate(self.model)
+        return created
 
 
     def delete(self, user=None, permanent=False):
         """
         Soft-delete all objects in this queryset, unless permanent=True.
 
+        Return dictionary mapping models to number of objects soft-deleted.
+
         """
         if permanent:
             return super(MTQuerySet, self).delete()
         collector = SoftDeleteCollector(using=self.db)
         collector.collect(self)
-        collector.delete(user)
+        return collector.delete(user)
 
 
     def undelete(self, user=None):
         """
         Undelete all objects in this queryset.
 
+        Return dictionary mapping models to number of objects undeleted.
+
         """
         collector = SoftDeleteCollector(using=self.db)
         collector.collect(self)
-        collector.undelete(user)
+        return collector.undelete(user)
 
 
 
@@ -203,6 +685,9 @@ class MTModel(models.Model):
         # MTModels always have an auto-PK and we don't set PKs explicitly, so
         # we can assume that a set PK means this should be an update.
         if kwargs.get("force_update") or self.id is not None:
+            using = router.db_for_write(self.__class__, instance=self)
+            signals.pre_save.send(
+                sender=self.__class__, instance=self, raw=False, using=using)
             non_pks = [f for f in self._meta.local_fields if not f.primary_key]
             # This isn't a race condition because the save will only take
             # effect if previous_version is actually up to date.
@@ -216,11 +701,19 @@ class MTModel(models.Model):
                     "No {0} row with id {1} and version {2} updated.".format(
                         self.__class__, self.id, previous_version)
                     )
+            # we bypass Model.save, so send its post-save signal ourselves
+            signals.post_save.send(
+                sender=self.__class__,
+                instance=self,
+                created=False,
+                raw=False,
+                using=using,
+                )
         else:
             return super(MTModel, self).save(*args, **kwargs)
 
 
-    def clone(self, cascade=None, overrides=None, user=None):
+    def clone(self, cascade=None, overrides=None, user=None, cloner=None):
         """
         Clone this instance and return the new, cloned instance.
 
@@ -233,71 +726,42 @@ class MTModel(models.Model):
         pointing to the original instance, not the cloned one.)
 
         If ``cascade`` is a dictionary, keys are m2m/reverse-FK accessor names,
-        and values are a callable that takes the queryset of all related
-        objects and returns those that should be cloned.
-
-        """
-        if cascade is None:
-            cascade = {}
-        else:
-            try:
-                cascade.iteritems
-            except AttributeError:
-                cascade = dict((i, lambda qs: qs) for i in cascade)
+        and values are a callable that takes a queryset of related objects
+        and returns those that should be cloned.
 
-        if overrides is None:
-            overrides = {}
+        Everything the cascade reaches is cloned in bulk, a level of the
+        object tree at a time (see ``BulkCloner``). If a ``cloner`` is given,
+        this instance is only scheduled on it, to be cloned in bulk (by the
+        cloner's user) when its ``run`` method is called, and None is
+        returned.
 
-        overrides["created_on"] = utcnow()
-        overrides["created_by"] = user
-        overrides["modified_by"] = user
-
-        clone = self.__class__()
-
-        for field in self._meta.fields:
-            if field.primary_key:
-                continue
-            val = overrides.get(field.name, getattr(self, field.name))
-            setattr(clone, field.name, val)
-
-        clone.save(force_insert=True)
-
-        for name, filter_func in cascade.items():
-            mgr = getattr(self, name)
-            if mgr.__class__.__name__ == "ManyRelatedManager":  # M2M
-                clone_mgr = getattr(clone, name)
-                existing = set(clone_mgr.all())
-                new = set(filter_func(mgr.all()))
-                clone_mgr.add(*new.difference(existing))
-                clone_mgr.remove(*existing.difference(new))
-            elif mgr.__class__.__name__ == "RelatedManager":  # reverse FK
-                reverse_name = getattr(self.__class__, name).related.field.name
-                for obj in filter_func(mgr.all()):
-                    obj.clone(overrides={reverse_name: clone})
-            else:
-                raise ValueError(
-                    "Cannot cascade-clone '{0}'; "
-                    "not a many-to-many or reverse foreignkey.".format(name))
-
-        return clone
+        """
+        if cloner is not None:
+            cloner.add(self, cascade, overrides)
+            return None
+        return BulkCloner(user).clone(self, cascade, overrides)
 
 
     def delete(self, user=None, permanent=False):
         """
         (Soft) delete this instance, unless permanent=True.
 
+        Return dictionary mapping models to number of objects soft-deleted.
+
         """
         if permanent:
             return super(MTModel, self).delete()
-        self._collector.delete(user)
+        return self._collector.delete(user)
 
 
     def undelete(self, user=None):
         """
         Undelete this instance.
 
+        Return dictionary mapping models to number of objects undeleted.
+
         """
-        self._collector.undelete(user)
+        return self._collector.undelete(user)
 
 
     @property
@@ -137,6 +137,7 @@ INSTALLED_APPS = [
     "moztrap.model.execution",
     "moztrap.model.attachments",
     "moztrap.model.tags",
+    "moztrap.model.jobs",
     "moztrap.view",
     "moztrap.view.lists",
     "moztrap.view.markup",
@@ -214,6 +215,34 @@ FORBIDDEN_PASSWORDS = [
 
 ALLOW_ANONYMOUS_ACCESS = False
 
+# Run background jobs (e.g. run activation) as soon as they are queued, in the
+# web process. Set to False to leave them to the ``run_jobs`` worker command
+# instead; at least one worker must then be running (see docs/deployment.rst).
+MOZTRAP_JOBS_ALWAYS_EAGER = True
+
+# A job running for longer than this many seconds is presumed to have lost its
+# worker, and is queued again (or fails, if it has no attempts left).
+MOZTRAP_JOBS_TIMEOUT = 60 * 60
+
+# Seconds to cache the total counts shown on paginated lists. Counts are also
+# discarded as soon as the data they count is changed.
+MOZTRAP_COUNT_CACHE_TIMEOUT = 60
+
+# Seconds to cache the objects listed in finder columns. They are also
+# discarded as soon as the data they list is changed.
+MOZTRAP_FINDER_CACHE_TIMEOUT = 60
+
+# Backend for keyword search of test case text; see moztrap.model.library.search
+MOZTRAP_SEARCH_BACKEND = "moztrap.model.library.search.TokenIndexBackend"
+
+# Results superseded or deleted more than this many days ago are moved to the
+# archive tables (or deleted, if MOZTRAP_RETENTION_PURGE is True) by the
+# ``apply_retention`` command, and by the recurring job it can schedule, which
+# runs every MOZTRAP_RETENTION_INTERVAL seconds.
+MOZTRAP_RETENTION_DAYS = 365
+MOZTRAP_RETENTION_PURGE = False
+MOZTRAP_RETENTION_INTERVAL = 24 * 60 * 60
+
 INSTALLED_APPS += ["icanhaz"]
 ICANHAZ_DIRS = [join(BASE_PATH, "jstemplates")]
 
@@ -5,6 +5,7 @@ from tastypie.api import Api
 from moztrap.model.core import api as core
 from moztrap.model.environments import api as environments
 from moztrap.model.execution import api as execution
+from moztrap.model.jobs import api as jobs
 from moztrap.model.library import api as library
 from moztrap.model.tags import api as tags
 from moztrap.model import API_VERSION
@@ -32,6 +33,7 @@ v1_api.register(core.ProductResource())
 v1_api.register(core.ProductVersionResource())
 v1_api.register(core.ProductVersionEnvironmentsResource())
 v1_api.register(tags.TagResource())
+v1_api.register(jobs.JobResource())
 
 urlpatterns = patterns(
     "moztrap.view.api",
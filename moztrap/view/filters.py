@@ -96,7 +96,7 @@ class RunCaseVersionFilterSet(filters.FilterSet):
             ),
         filters.KeywordExactFilter(
             "id", lookup="caseversion__case__id", coerce=int),
-        filters.KeywordFilter("name", lookup="caseversion__name"),
+        filters.SearchFilter("name"),
         filters.ModelFilter(
             "tag",
             lookup="caseversion__tags",
@@ -111,12 +111,9 @@ class RunCaseVersionFilterSet(filters.FilterSet):
             lookup="run__productversion",
             key="productversion",
             queryset=model.ProductVersion.objects.all()),
-        filters.KeywordFilter(
-            "instruction", lookup="caseversion__steps__instruction"),
-        filters.KeywordFilter(
-            "expected result",
-            lookup="caseversion__steps__expected",
-            key="expected"),
+        filters.SearchFilter("instruction"),
+        filters.SearchFilter(
+            "expected result", field="expected", key="expected"),
         filters.ModelFilter(
             "creator",
             lookup="caseversion__created_by",
@@ -139,17 +136,14 @@ class RunTestsRunCaseVersionFilterSet(filters.FilterSet):
     filters = [
         filters.KeywordExactFilter(
             "id", lookup="caseversion__case__id", coerce=int),
-        filters.KeywordFilter("name", lookup="caseversion__name"),
+        filters.SearchFilter("name"),
         filters.ModelFilter(
             "tag",
             lookup="caseversion__tags",
             queryset=model.Tag.objects.all()),
-        filters.KeywordFilter(
-            "instruction", lookup="caseversion__steps__instruction"),
-        filters.KeywordFilter(
-            "expected result",
-            lookup="caseversion__steps__expected",
-            key="expected"),
+        filters.SearchFilter("instruction"),
+        filters.SearchFilter(
+            "expected result", field="expected", key="expected"),
         filters.ModelFilter(
             "creator",
             lookup="caseversion__created_by",
@@ -209,7 +203,7 @@ class CaseVersionFilterSet(filters.FilterSet):
     filters = [
         filters.ChoicesFilter("status", choices=model.CaseVersion.STATUS),
         cases.PrefixIDFilter("id"),
-        filters.KeywordFilter("name"),
+        filters.SearchFilter("name", lookup="pk"),
         filters.ModelFilter(
             "tag", lookup="tags", queryset=model.Tag.objects.all()),
         filters.ModelFilter(
@@ -221,11 +215,9 @@ class CaseVersionFilterSet(filters.FilterSet):
             lookup="productversion",
             key="productversion",
             queryset=model.ProductVersion.objects.all().select_related()),
-        filters.KeywordFilter("instruction", lookup="steps__instruction"),
-        filters.KeywordFilter(
-            "expected result",
-            lookup="steps__expected",
-            key="expected"),
+        filters.SearchFilter("instruction", lookup="pk"),
+        filters.SearchFilter(
+            "expected result", field="expected", lookup="pk", key="expected"),
         filters.ModelFilter(
             "creator", lookup="created_by", queryset=model.User.objects.all()),
         filters.ModelFilter(
@@ -9,13 +9,16 @@ from django.shortcuts import redirect
 
 
 
-def actions(model, allowed_actions, permission=None, fall_through=False):
+def actions(model, allowed_actions, permission=None, fall_through=False,
+            methods=None):
     """
     View decorator for handling single-model actions on manage list pages.
 
     Handles any POST keys named "action-method", where "method" must be in
     ``allowed_actions``. The value of the key should be an ID of a ``model``,
-    and "method" will be called on it, with any errors handled.
+    and "method" will be called on it, with any errors handled. If the
+    ``methods`` dictionary maps an action name to a different method name,
+    that method is called instead (e.g. to queue a background job).
 
     By default, any "POST" request will be redirected back to the same URL
     (unless it's an AJAX request, in which case it sets the request method to
@@ -43,7 +46,8 @@ def actions(model, allowed_actions, permission=None, fall_through=False):
                         except model.DoesNotExist:
                             pass
                         else:
-                            getattr(obj, action)(user=request.user)
+                            method = (methods or {}).get(action, action)
+                            getattr(obj, method)(user=request.user)
                             action_taken = True
                 if action_taken or not fall_through:
                     if request.is_ajax():
@@ -1,4 +1,4 @@
-from filters import KeywordFilter
+from filters import KeywordFilter, filter_queryset
 from django.db.models import Q
 
 
@@ -51,6 +51,6 @@ class PrefixIDFilter(KeywordFilter):
             query_filters = query_filters | Q(**kwargs)
 
         if values:
-            return queryset.filter(query_filters).distinct()
+            return filter_queryset(queryset, query_filters)
 
         return queryset
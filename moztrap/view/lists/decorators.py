@@ -5,4 +5,5 @@ Decorators for list views.
 from .actions import actions
 from .filters import filter
 from .finder import finder
+from .pagination import keyset
 from .sort import sort
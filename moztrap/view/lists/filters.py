@@ -9,9 +9,13 @@ import json
 import urlparse
 
 from django.core.urlresolvers import reverse, resolve
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.sql.constants import LOOKUP_SEP
 from django.utils.datastructures import MultiValueDict
 
 from moztrap.model.core.models import ProductVersion
+from moztrap.model.library import search
 
 
 def filter_url(path_or_view, obj):
@@ -46,6 +50,60 @@ def filter_url(path_or_view, obj):
 
 
 
+def filter_queryset(queryset, *args, **kwargs):
+    """
+    Return ``queryset`` filtered by the given Q objects and/or lookups.
+
+    A lookup that spans a multi-valued relationship (many-to-many or reverse
+    foreign key) joins in a row for every related object, so the result would
+    need ``.distinct()``. Instead, such filters are applied as a subquery of
+    the matching primary keys, so each object is still selected once. Lookups
+    in a single call still all apply to the same related object, as with a
+    single ``queryset.filter(...)``.
+
+    """
+    lookups = list(kwargs)
+    for q in args:
+        lookups.extend(_q_lookups(q))
+    model = queryset.model
+    if any(is_multivalued(model, lookup) for lookup in lookups):
+        matching = model._base_manager.filter(*args, **kwargs).values("pk")
+        return queryset.filter(pk__in=matching)
+    return queryset.filter(*args, **kwargs)
+
+
+
+def is_multivalued(model, lookup):
+    """Return True if ``lookup`` on ``model`` spans a to-many relationship."""
+    opts = model._meta
+    for name in lookup.split(LOOKUP_SEP):
+        if name == "pk":
+            name = opts.pk.name
+        try:
+            field, field_model, direct, m2m = opts.get_field_by_name(name)
+        except FieldDoesNotExist:
+            # a lookup type, such as "in" or "icontains"
+            return False
+        if m2m or not direct:
+            return True
+        if getattr(field, "rel", None) is None:
+            return False
+        opts = field.rel.to._meta
+    return False
+
+
+
+def _q_lookups(q):
+    """Yield the lookups used in Q object ``q``."""
+    for child in q.children:
+        if isinstance(child, Q):
+            for lookup in _q_lookups(child):
+                yield lookup
+        else:
+            yield child[0]
+
+
+
 def filter(ctx_name, filters=None, filterset_class=None):
     """
     View decorator that handles filtering of a queryset.
@@ -314,8 +372,7 @@ class Filter(object):
         if values:
             filters = {"{0}__in".format(self.lookup): values}
             filters.update(self.extra_filters)
-            return queryset.filter(
-                **filters).distinct()
+            return filter_queryset(queryset, **filters)
         return queryset
 
 
@@ -436,10 +493,32 @@ class KeywordFilter(KeywordExactFilter):
     def filter(self, queryset, values):
         """Values are ANDed in a 'contains' search of the field text."""
         for value in values:
-            queryset = queryset.filter(
-                **{"{0}__icontains".format(self.lookup): value})
+            queryset = filter_queryset(
+                queryset, **{"{0}__icontains".format(self.lookup): value})
 
-        if values:
-            return queryset.distinct()
+        return queryset
 
+
+
+class SearchFilter(KeywordFilter):
+    """
+    Values are ANDed in a keyword search of caseversion text.
+
+    ``field`` is the searchable field (see ``moztrap.model.library.search``),
+    defaulting to ``name``; ``lookup`` is the caseversion of the filtered
+    objects, defaulting to "caseversion" (use "pk" to filter caseversions).
+
+    """
+    def __init__(self, name, field=None, lookup="caseversion", **kwargs):
+        """Looks for ``field`` argument."""
+        self.field = name if field is None else field
+        super(SearchFilter, self).__init__(name, lookup=lookup, **kwargs)
+
+
+    def filter(self, queryset, values):
+        """Filter to objects whose caseversion matches all values."""
+        for value in values:
+            queryset = queryset.filter(
+                **{"{0}__in".format(self.lookup):
+                       search.matching(self.field, value)})
         return queryset
@@ -1,17 +1,31 @@
 """
 Finder; a multi-column hierarchical object navigator.
 
+Columns show at most ``page_size`` objects at a time; the rest are loaded on
+request, a window at a time. Windows of column objects are cached (for
+``settings.MOZTRAP_FINDER_CACHE_TIMEOUT`` seconds), and discarded as soon as
+any table they are read from is written to (see ``moztrap.model.counts``).
+
 """
 from functools import wraps
 import posixpath
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.shortcuts import render
 
+from moztrap.model import counts
+
 from .filters import filter_url
 
 
 
+# default maximum number of objects shown in a column at once
+PAGE_SIZE = 100
+
+
+
 def finder(finder_cls):
     """
     View decorator that takes care of everything needed to render a finder on
@@ -33,7 +47,10 @@ def finder(finder_cls):
                         "finder": {
                             "finder": finder,
                             col_name: finder.objects(
-                                col_name, request.GET["id"])
+                                col_name,
+                                request.GET.get("id"),
+                                _offset(request.GET.get("offset")),
+                                ),
                             },
                         }
                     )
@@ -76,6 +93,11 @@ class Finder(object):
             zip([c.name for c in self.columns[:-1]], self.columns[1:])
             )
         self.columns_by_model = dict((c.model, c) for c in self.columns)
+        # lookup from each column's model to its parent column's model
+        self.parent_lookups = dict(
+            (c.name, _relation_name(c.model, p.model))
+            for c, p in zip(self.columns[1:], self.columns[:-1])
+            )
 
 
     def column_template(self, column_name):
@@ -111,16 +133,25 @@ class Finder(object):
         return None
 
 
-    def objects(self, column_name, parent=None):
+    def more_query_url(self, column_name, parent, offset):
+        """Return URL for ajax query to fetch column objects from offset."""
+        url = "?finder=1&col=%s" % column_name
+        if parent is not None:
+            url += "&id=%s" % parent
+        return url + "&offset=%s" % offset
+
+
+    def objects(self, column_name, parent=None, offset=0):
         """
         Given a column name, return the list of objects.
 
         If a parent is given and there is a parent column, filter the list by
-        that parent.
+        that parent. If the column has a ``page_size``, at most that many
+        objects, starting at ``offset``, are returned.
 
         """
         col = self._get_column_by_name(column_name)
-        ret = col.objects()
+        qs = col.objects()
         if parent is not None:
             try:
                 parent_col = self.parent_columns[col.name]
@@ -128,30 +159,24 @@ class Finder(object):
                 raise ValueError(
                     "Column {0} has no parent.".format(column_name))
 
-            opts = col.model._meta
+            attr = self.parent_lookups[col.name]
+            if attr is None:
+                raise ValueError(
+                    "Cannot find relationship from {0} to {1}".format(
+                        col.model, parent_col.model))
 
-            attr = None
-            for field in [
-                    f for f in opts.fields if isinstance(f, models.ForeignKey)
-                    ] + opts.many_to_many:
-                if field.rel.to is parent_col.model:
-                    attr = field.name
-                    break
+            qs = qs.filter(**{attr: parent})
 
-            if attr is None:
-                try:
-                    attr = [
-                        r.get_accessor_name()
-                        for r in opts.get_all_related_many_to_many_objects()
-                        if r.model is parent_col.model
-                        ][0]
-                except IndexError:
-                    raise ValueError(
-                        "Cannot find relationship from {0} to {1}".format(
-                            col.model, parent_col.model))
+        if col.page_size is None:
+            return ColumnObjects(_cached_list(qs))
 
-            ret = ret.filter(**{attr: parent})
-        return ret
+        found = _cached_list(qs[offset:offset + col.page_size + 1])
+        more_url = None
+        if len(found) > col.page_size:
+            found = found[:col.page_size]
+            more_url = self.more_query_url(
+                column_name, parent, offset + col.page_size)
+        return ColumnObjects(found, more_url)
 
 
     def _get_column_by_name(self, column_name):
@@ -162,14 +187,23 @@ class Finder(object):
 
 
 
+class ColumnObjects(list):
+    """Objects shown in a column, with ajax URL for more of them, if any."""
+    def __init__(self, objects, more_url=None):
+        super(ColumnObjects, self).__init__(objects)
+        self.more_url = more_url
+
+
 
 class Column(object):
-    def __init__(self, name, template_name, queryset, goto=None):
+    def __init__(self, name, template_name, queryset, goto=None,
+                 page_size=PAGE_SIZE):
         self.name = name
         self.template_name = template_name
         self.model = queryset.model
         self.queryset = queryset
         self.goto = goto
+        self.page_size = page_size
 
 
     def objects(self):
@@ -183,3 +217,46 @@ class Column(object):
             return filter_url(self.goto, obj)
 
         return None
+
+
+
+def _relation_name(model, parent_model):
+    """
+    Return name of lookup from ``model`` to ``parent_model``, or None.
+
+    The lookup may be via a foreign key or many-to-many field of ``model``,
+    or via a many-to-many field of ``parent_model``.
+
+    """
+    opts = model._meta
+    for field in [
+            f for f in opts.fields if isinstance(f, models.ForeignKey)
+            ] + opts.many_to_many:
+        if field.rel.to is parent_model:
+            return field.name
+
+    for r in opts.get_all_related_many_to_many_objects():
+        if r.model is parent_model:
+            return r.get_accessor_name()
+
+    return None
+
+
+
+def _cached_list(queryset):
+    """Return list of objects of ``queryset``, using the cache."""
+    key = counts.cache_key("finder", queryset)
+    objects = cache.get(key)
+    if objects is None:
+        objects = list(queryset)
+        cache.set(key, objects, settings.MOZTRAP_FINDER_CACHE_TIMEOUT)
+    return objects
+
+
+
+def _offset(value):
+    """Return non-negative integer offset from query string value, or 0."""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
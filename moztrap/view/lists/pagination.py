@@ -1,9 +1,24 @@
 """
 List pagination utilities.
 
+``Pager`` paginates by page number, using OFFSET and a (cached) count. For
+very long lists a view can switch to ``KeysetPager`` with the ``keyset``
+decorator; it seeks past the sort key of the last object seen instead, so
+deep pages are as fast as the first.
+
+Both count no further than ``count_limit`` objects; past that the total is
+shown as "more than" the limit.
+
 """
+from functools import wraps
 import math
-from django.db.utils import DatabaseError
+import operator
+
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.sql.constants import LOOKUP_SEP
+
+from ...model.counts import cached_count
 from ..utils.querystring import update_querystring
 
 
@@ -11,6 +26,10 @@ from ..utils.querystring import update_querystring
 PAGESIZES = [10, 20, 50, 100]
 DEFAULT_PAGESIZE = 20
 
+# paginated lists count no further than this by default
+COUNT_LIMIT = 10000
+KEYSET_COUNT_LIMIT = 1000
+
 
 
 def from_request(request):
@@ -26,6 +45,21 @@ def from_request(request):
 
 
 
+def keyset_from_request(request):
+    """
+    Given a request, return tuple (pagesize, after, before).
+
+    ``after`` and ``before`` are object ids, or None.
+
+    """
+    pagesize = positive_integer(
+        request.GET.get("pagesize", DEFAULT_PAGESIZE), DEFAULT_PAGESIZE)
+    after = object_id(request.GET.get("after"))
+    before = None if after else object_id(request.GET.get("before"))
+    return pagesize, after, before
+
+
+
 def pagesize_url(url, pagesize):
     return update_querystring(url, pagesize=pagesize, pagenumber=1)
 
@@ -36,15 +70,58 @@ def pagenumber_url(url, pagenumber):
 
 
 
+def keyset_url(url, after=None, before=None):
+    """Return ``url`` with keyset position set; first page if neither."""
+    return update_querystring(
+        url, after=after, before=before, pagenumber=None)
+
+
+
+def keyset(ctx_name, count_limit=KEYSET_COUNT_LIMIT):
+    """
+    Paginate queryset ``ctx_name`` with a ``KeysetPager``.
+
+    The ``paginate`` template tag will use a ``KeysetPager`` rather than a
+    ``Pager`` for this queryset. ``count_limit`` is passed on to the pager.
+
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            try:
+                ctx = response.context_data
+            except AttributeError:
+                return response
+            ctx.setdefault("keyset_pagination", {})[ctx_name] = count_limit
+            return response
+
+        return _wrapped_view
+
+    return decorator
+
+
+
 class Pager(object):
-    """Handles pagination given queryset, page size, and page number."""
-    def __init__(self, queryset, pagesize, pagenumber):
+    """
+    Handles pagination given queryset, page size, and page number.
+
+    If there are more than ``count_limit`` objects, ``total`` is
+    ``count_limit`` and ``total_capped`` is True; pages past the limit are
+    then reached with ``next`` only. If ``count_limit`` is None, all objects
+    are counted.
+
+    """
+    def __init__(self, queryset, pagesize, pagenumber,
+                 count_limit=COUNT_LIMIT):
         """Initialize a ``Pager`` with queryset, page size, and page number."""
         self._queryset = queryset
         self._sliced_qs = None
         self._cached_total = None
         self.pagesize = pagesize
         self.pagenumber = pagenumber
+        self.count_limit = count_limit
+        self._total_capped = False
 
 
     def sizes(self):
@@ -59,7 +136,10 @@ class Pager(object):
 
     def pages(self):
         """Returns an iterable of valid page numbers."""
-        return xrange(1, self.num_pages + 1)
+        last = self.num_pages
+        if self.total_capped:
+            last = max(last, self.pagenumber)
+        return xrange(1, last + 1)
 
 
     def display_pages(self):
@@ -91,20 +171,20 @@ class Pager(object):
 
     @property
     def total(self):
-        """The total number of objects."""
+        """The total number of objects (possibly capped)."""
         if self._cached_total is None:
-            # @@@ Django 1.5 should not require the .values part and could be
-            # changed to just:
-            #     self._cached_total = self._queryset.count()
-            # Bug 18248
-            try:
-                self._cached_total = self._queryset.count()
-            except DatabaseError:
-                self._cached_total = self._queryset.values("id").count()
-
+            self._cached_total, self._total_capped = cached_count(
+                self._queryset, self.count_limit)
         return self._cached_total
 
 
+    @property
+    def total_capped(self):
+        """True if there are more than ``total`` objects."""
+        self.total
+        return self._total_capped
+
+
     @property
     def objects(self):
         """
@@ -142,6 +222,9 @@ class Pager(object):
 
     def _constrain(self, num):
         """Return given ``num`` constrained to between 0 and self.total."""
+        if self.total_capped:
+            # past the counted objects; the page is as full as it can be
+            return max(0, num)
         return min(self.total, max(0, num))
 
 
@@ -158,12 +241,247 @@ class Pager(object):
     def next(self):
         """Page number of the next page; None if there is no next page."""
         next = self.pagenumber + 1
-        if next > self.num_pages:
+        if self.total_capped and next > self.num_pages:
+            if len(self.objects) < self.pagesize:
+                return None
+        elif next > self.num_pages:
             return None
         return next
 
 
 
+class KeysetPager(object):
+    """
+    Paginates a queryset by seeking past a known object in its ordering.
+
+    Pages are identified by the id of the object just before them (``after``)
+    or just after them (``before``), rather than by page number. Objects are
+    ordered by the queryset's ordering, with id added as a tie-breaker, and
+    each page is fetched by filtering on those sort keys, so no OFFSET is
+    needed. NULL sort values are assumed to sort lowest (as in MySQL and
+    SQLite).
+
+    If ``count_limit`` is None, ``total`` counts all objects; if it is a
+    number, counting stops past that many (and ``total_capped`` is True);
+    if it is False, ``total`` is None.
+
+    """
+    keyset = True
+
+
+    def __init__(self, queryset, pagesize, after=None, before=None,
+                 count_limit=KEYSET_COUNT_LIMIT):
+        """Initialize a ``KeysetPager`` with queryset, page size, position."""
+        self._queryset = queryset
+        self._objects = None
+        self._cached_total = None
+        self.pagesize = pagesize
+        self.after = after
+        self.before = before
+        self.count_limit = count_limit
+        self._total_capped = False
+        self._prev = None
+        self._next = None
+
+
+    def sizes(self):
+        """Returns an ordered list of pagesize links to display."""
+        return sorted(set(PAGESIZES + [self.pagesize]))
+
+
+    @property
+    def counted(self):
+        """True if the total number of objects is counted."""
+        return self.count_limit is not False
+
+
+    @property
+    def total(self):
+        """The total number of objects (possibly capped), or None."""
+        if self.count_limit is False:
+            return None
+        if self._cached_total is None:
+            self._cached_total, self._total_capped = cached_count(
+                self._queryset, self.count_limit)
+        return self._cached_total
+
+
+    @property
+    def total_capped(self):
+        """True if there are more than ``total`` objects."""
+        self.total
+        return self._total_capped
+
+
+    @property
+    def objects(self):
+        """The list of objects on the current page."""
+        if self._objects is None:
+            self._load()
+        return self._objects
+
+
+    @property
+    def prev(self):
+        """Id to seek before for the previous page; None if no previous."""
+        self.objects
+        return self._prev
+
+
+    @property
+    def next(self):
+        """Id to seek after for the next page; None if no next page."""
+        self.objects
+        return self._next
+
+
+    def key_fields(self):
+        """Return list of (field name, descending) the pages are ordered by."""
+        query = self._queryset.query
+        ordering = query.order_by or (
+            query.default_ordering and self._queryset.model._meta.ordering
+            ) or []
+
+        fields = []
+        for name in ordering:
+            if name == "?" or "." in name:
+                continue
+            descending = name.startswith("-")
+            name = name.lstrip("-")
+            if name == "pk":
+                name = "id"
+            if name == "id":
+                fields.append((name, descending))
+                break
+            fields.extend(
+                _order_fields(self._queryset.model, name, descending))
+        else:
+            fields.append(("id", fields[0][1] if fields else False))
+        return fields
+
+
+    def _load(self):
+        """Fetch the current page of objects, and neighbor positions."""
+        fields = self.key_fields()
+        qs = self._queryset.order_by(
+            *[("-" if desc else "") + name for name, desc in fields])
+
+        forward = self.before is None
+        position = self.after if forward else self.before
+        values = None
+        if position is not None:
+            values = self._queryset.filter(pk=position).values_list(
+                *[name for name, desc in fields])[:1]
+            values = values[0] if values else None
+
+        if values is None:
+            # first page (position is missing or was removed)
+            forward = True
+            page_qs = qs
+        else:
+            page_qs = qs.filter(_seek(fields, values, forward))
+            if not forward:
+                page_qs = page_qs.reverse()
+
+        objects = list(page_qs[:self.pagesize + 1])
+        more = len(objects) > self.pagesize
+        objects = objects[:self.pagesize]
+
+        if not forward:
+            objects.reverse()
+            if not objects:
+                # nothing before the first object; show the first page
+                self.before = None
+                return self._load()
+
+        self._objects = objects
+        if objects:
+            has_prev = more if not forward else values is not None
+            has_next = more if forward else True
+            if has_prev:
+                self._prev = objects[0].pk
+            if has_next:
+                self._next = objects[-1].pk
+
+
+
+def _order_fields(model, name, descending, seen=()):
+    """
+    Return list of (field name, descending) that ``name`` sorts ``model`` by.
+
+    Like the ORM's ORDER BY, a relation with a default ordering sorts by the
+    related model's ordering fields, not by its id; seeking has to compare
+    the same columns.
+
+    """
+    field = None
+    related = model
+    for part in name.split(LOOKUP_SEP):
+        try:
+            field = related._meta.get_field(part)
+        except FieldDoesNotExist:
+            return [(name, descending)]
+        if field.rel is None:
+            break
+        related = field.rel.to
+
+    if field is None or field.rel is None or related in seen:
+        return [(name, descending)]
+    fields = []
+    for item in related._meta.ordering:
+        if item == "?" or "." in item:
+            continue
+        related_descending = item.startswith("-")
+        item = item.lstrip("-")
+        if item == "pk":
+            item = related._meta.pk.name
+        fields.extend(
+            _order_fields(
+                model,
+                LOOKUP_SEP.join([name, item]),
+                descending != related_descending,
+                seen + (related,),
+                )
+            )
+    return fields or [(name, descending)]
+
+
+
+def _seek(fields, values, forward):
+    """
+    Return Q matching objects following ``values`` of ``fields`` in order.
+
+    ``fields`` is a list of (field name, descending); ``forward`` is False
+    to instead match the objects preceding ``values``.
+
+    """
+    conditions = []
+    equal = []
+    for (name, descending), value in zip(fields, values):
+        greater = (not descending) == forward
+        if value is None:
+            step = Q(**{name + "__isnull": False}) if greater else None
+            same = Q(**{name + "__isnull": True})
+        else:
+            if greater:
+                step = Q(**{name + "__gt": value})
+            elif name == "id":
+                step = Q(**{name + "__lt": value})
+            else:
+                step = (
+                    Q(**{name + "__lt": value}) |
+                    Q(**{name + "__isnull": True})
+                    )
+            same = Q(**{name: value})
+        if step is not None:
+            conditions.append(reduce(operator.and_, equal + [step]))
+        equal.append(same)
+    if not conditions:
+        return Q(pk__in=[])
+    return reduce(operator.or_, conditions)
+
+
+
 def positive_integer(val, default):
     """Attempt to coerce ``val`` to a positive integer, with fallback."""
     try:
@@ -175,3 +493,13 @@ def positive_integer(val, default):
         val = 1
 
     return val
+
+
+
+def object_id(val):
+    """Coerce ``val`` to a positive integer id, or None."""
+    try:
+        val = int(val)
+    except (TypeError, ValueError):
+        return None
+    return val if val > 0 else None
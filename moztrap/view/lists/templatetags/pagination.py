@@ -2,7 +2,7 @@
 Template tags for pagination.
 
 """
-from django.template import Library
+from django.template import Library, Variable
 
 from classytags.core import Tag, Options
 from classytags.arguments import Argument
@@ -16,10 +16,16 @@ register = Library()
 
 
 class Paginate(Tag):
-    """Paginate the given queryset, placing a Pager in the template context."""
+    """
+    Paginate the given queryset, placing a Pager in the template context.
+
+    If the view was decorated with ``keyset`` for this queryset, the pager is
+    a ``KeysetPager``.
+
+    """
     name = "paginate"
     options = Options(
-        Argument("queryset"),
+        Argument("queryset", resolve=False),
         "as",
         Argument("varname", resolve=False),
         )
@@ -28,8 +34,15 @@ class Paginate(Tag):
     def render_tag(self, context, queryset, varname):
         """Place Pager for given ``queryset`` in context as ``varname``."""
         request = context["request"]
-        pagesize, pagenum = pagination.from_request(request)
-        context[varname] = pagination.Pager(queryset, pagesize, pagenum)
+        keyset = context.get("keyset_pagination", {})
+        qs = Variable(queryset).resolve(context)
+        if queryset in keyset:
+            pagesize, after, before = pagination.keyset_from_request(request)
+            context[varname] = pagination.KeysetPager(
+                qs, pagesize, after, before, count_limit=keyset[queryset])
+        else:
+            pagesize, pagenum = pagination.from_request(request)
+            context[varname] = pagination.Pager(qs, pagesize, pagenum)
         return u""
 
 
@@ -50,6 +63,26 @@ def pagesize_url(request, pagesize):
     return pagination.pagesize_url(request.get_full_path(), pagesize)
 
 
+@register.filter
+def after_url(request, after):
+    """Return current full URL with keyset position after ``after``."""
+    return pagination.keyset_url(request.get_full_path(), after=after)
+
+
+
+@register.filter
+def before_url(request, before):
+    """Return current full URL with keyset position before ``before``."""
+    return pagination.keyset_url(request.get_full_path(), before=before)
+
+
+
+@register.filter
+def first_page_url(request):
+    """Return current full URL at first keyset page."""
+    return pagination.keyset_url(request.get_full_path())
+
+
 @register.filter
 def pagenumber(request):
     """Return pagenumber of given request."""
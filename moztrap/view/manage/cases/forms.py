@@ -189,7 +189,6 @@ class AddCaseForm(BaseAddCaseForm, BaseCaseVersionForm, BaseCaseForm):
             )
 
         version_kwargs["case"] = case
-        version_kwargs["user"] = self.user
 
         del version_kwargs["add_tags"]
         del version_kwargs["add_attachment"]
@@ -211,16 +210,20 @@ class AddCaseForm(BaseAddCaseForm, BaseCaseVersionForm, BaseCaseForm):
             productversions.extend(product.versions.filter(
                     order__gt=productversions[0].order))
 
+        caseversions = []
         for productversion in productversions:
             this_version_kwargs = version_kwargs.copy()
             this_version_kwargs["productversion"] = productversion
-            caseversion = model.CaseVersion.objects.create(
-                **this_version_kwargs)
+            caseversion = model.CaseVersion(**this_version_kwargs)
+            caseversion.save(
+                user=self.user, skip_set_latest=True, skip_sync_name=True)
+            caseversions.append(caseversion)
             steps_formset = StepFormSet(
                 data=self.data, instance=caseversion)
             steps_formset.save(user=self.user)
             self.save_tags(caseversion)
             self.save_attachments(caseversion)
+        model.CaseVersion.sync_cases(caseversions, user=self.user)
 
         return case
 
@@ -275,6 +278,7 @@ class AddBulkCaseForm(BaseAddCaseForm, BaseCaseForm):
         suite = self.cleaned_data.get("suite")
 
         cases = []
+        caseversions = []
 
         order = 0
         if suite:
@@ -294,7 +298,6 @@ class AddBulkCaseForm(BaseAddCaseForm, BaseCaseForm):
 
             version_kwargs["case"] = case
             version_kwargs["status"] = self.cleaned_data["status"]
-            version_kwargs["user"] = self.user
 
             if suite:
                 order += 1
@@ -308,8 +311,10 @@ class AddBulkCaseForm(BaseAddCaseForm, BaseCaseForm):
             for productversion in productversions:
                 this_version_kwargs = version_kwargs.copy()
                 this_version_kwargs["productversion"] = productversion
-                caseversion = model.CaseVersion.objects.create(
-                    **this_version_kwargs)
+                caseversion = model.CaseVersion(**this_version_kwargs)
+                caseversion.save(
+                    user=self.user, skip_set_latest=True, skip_sync_name=True)
+                caseversions.append(caseversion)
                 for i, step_kwargs in enumerate(steps_data, 1):
                     model.CaseStep.objects.create(
                         user=self.user,
@@ -320,6 +325,8 @@ class AddBulkCaseForm(BaseAddCaseForm, BaseCaseForm):
 
             cases.append(case)
 
+        model.CaseVersion.sync_cases(caseversions, user=self.user)
+
         return cases
 
 
@@ -39,6 +39,7 @@ from . import forms
     permission="library.manage_cases")
 @lists.finder(ManageFinder)
 @lists.filter("caseversions", filterset_class=CaseVersionFilterSet)
+@lists.keyset("caseversions")
 @lists.sort("caseversions")
 @ajax("manage/case/list/_cases_list.html")
 def cases_list(request):
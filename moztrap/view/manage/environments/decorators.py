@@ -69,7 +69,8 @@ def category_element_ajax_add_edit(view_func):
                     # the original widget queryset, but we don't have access to
                     # that here. soon this whole editing-on-the-form thing will
                     # go away anyway.
-                    cat.choice_elements = cat.elements.order_by("name")
+                    cat.choice_elements = (
+                        cat.elements.with_deletable().order_by("name"))
                     data["html"] = render_to_string(
                         template_name,
                         {
@@ -44,7 +44,8 @@ class EnvironmentElementSelectMultiple(mtforms.MTSelectMultiple):
             element = c[1].obj
             available.setdefault(element.category, []).append(element)
         # ensure we also include empty categories
-        categories = list(model.Category.objects.order_by("name"))
+        categories = list(
+            model.Category.objects.with_deletable().order_by("name"))
         for category in categories:
             # annotate with elements available in this widget
             category.choice_elements = available.get(category, [])
@@ -57,7 +58,7 @@ class EnvironmentElementSelectMultiple(mtforms.MTSelectMultiple):
 class AddProfileForm(ProfileForm):
     """Form for adding a profile."""
     elements = mtforms.MTModelMultipleChoiceField(
-        queryset=model.Element.objects.order_by(
+        queryset=model.Element.objects.with_deletable().order_by(
             "category", "name").select_related(),
         widget=EnvironmentElementSelectMultiple,
         error_messages={"required": "Please select at least one element."})
@@ -14,6 +14,7 @@ from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
 
 from moztrap import model
+from moztrap.model.autocomplete import NameIndex
 
 from moztrap.view.filters import ProfileFilterSet, EnvironmentFilterSet
 from moztrap.view.lists import decorators as lists
@@ -26,6 +27,11 @@ from .decorators import category_element_ajax_add_edit
 
 
 
+# per-process autocomplete index of element names
+element_index = NameIndex(model.Element)
+
+
+
 @never_cache
 @login_maybe_required
 @lists.actions(
@@ -133,7 +139,7 @@ def profile_edit(request, profile_id):
         "manage/environment/edit_profile.html",
         {
             "profile": profile,
-            "environments": profile.environments.all(),
+            "environments": profile.environments.with_labels(),
             }
         )
 
@@ -184,7 +190,7 @@ def productversion_environments_edit(request, productversion_id):
         "manage/environment/productversion.html",
         {
             "productversion": productversion,
-            "environments": productversion.environments.all(),
+            "environments": productversion.environments.with_labels(),
             "populate_form": form,
             }
         )
@@ -195,23 +201,17 @@ def productversion_environments_edit(request, productversion_id):
 @login_required
 def element_autocomplete(request):
     text = request.GET.get("text")
-    elements = []
-    if text is not None:
-        elements = model.Element.objects.filter(
-            name__icontains=text)
     suggestions = []
-    for e in elements:
-        start = e.name.lower().index(text.lower())
-        pre = e.name[:start]
-        post = e.name[start + len(text):]
-        suggestions.append({
-                "preText": pre,
-                "typedText": text,
-                "postText": post,
-                "id": e.id,
-                "name": e.name,
-                "type": "element",
-                })
+    if text:
+        for s in element_index.suggest(text):
+            suggestions.append({
+                    "preText": s.name[:s.start],
+                    "typedText": text,
+                    "postText": s.name[s.start + len(text):],
+                    "id": s.id,
+                    "name": s.name,
+                    "type": "element",
+                    })
     return HttpResponse(
         json.dumps(
             {
@@ -262,7 +262,7 @@ def narrow_environments(request, object_type, object_id):
         request,
         "manage/environment/narrowing.html",
         {
-            "environments": obj.productversion.environments.all(),
+            "environments": obj.productversion.environments.with_labels(),
             "selected_env_ids": current_env_ids,
             "filters": EnvironmentFilterSet().bind(),  # for JS filtering
             "obj": obj,
@@ -59,8 +59,10 @@ class EditProductVersionForm(BaseProductVersionForm):
         if fill_from:
             # get the cases we already have in this version
             existing = pv.caseversions.all().values_list("case_id", flat=True)
-            for cv in fill_from.caseversions.exclude(case_id__in=existing):
-                cv.clone(overrides={"productversion": pv, "name": cv.name})
+            pv.clone_caseversions(
+                fill_from.caseversions.exclude(case_id__in=existing),
+                user=user,
+                )
 
         return pv
 
@@ -91,7 +93,6 @@ class AddProductVersionForm(BaseProductVersionForm):
         clone_from = self.cleaned_data.get("clone_from")
         if clone_from:
             pv.environments.add(*clone_from.environments.all())
-            for cv in clone_from.caseversions.all():
-                cv.clone(overrides={"productversion": pv, "name": cv.name})
+            pv.clone_caseversions(clone_from.caseversions.all(), user=user)
 
         return pv
@@ -2,6 +2,9 @@
 Manage views for runs.
 
 """
+import json
+
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
 from django.views.decorators.cache import never_cache
@@ -29,7 +32,8 @@ from . import forms
 @lists.actions(
     model.Run,
     ["delete", "clone", "activate", "draft", "deactivate", "refresh"],
-    permission="execution.manage_runs")
+    permission="execution.manage_runs",
+    methods={"activate": "enqueue_activate", "refresh": "enqueue_refresh"})
 @lists.finder(ManageFinder)
 @lists.filter("runs", filterset_class=RunFilterSet)
 @lists.sort("runs")
@@ -63,6 +67,25 @@ def run_details(request, run_id):
 
 
 
+@never_cache
+@login_maybe_required
+def run_jobs(request, run_id):
+    """Return status of the run's background jobs in JSON format."""
+    run = get_object_or_404(model.Run, pk=run_id)
+    return HttpResponse(
+        json.dumps(
+            {
+                "jobs": [
+                    job.status_data(request.user)
+                    for job in run.get_jobs()[:10]
+                    ]
+                }
+            ),
+        content_type="application/json",
+        )
+
+
+
 @never_cache
 @permission_required("execution.manage_runs")
 def run_add(request):
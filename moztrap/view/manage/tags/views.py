@@ -4,7 +4,6 @@ Manage views for tags.
 """
 import json
 
-from django.db.models import Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
@@ -13,6 +12,7 @@ from django.views.decorators.cache import never_cache
 from django.contrib import messages
 
 from moztrap import model
+from moztrap.model.autocomplete import NameIndex, ALL
 
 from moztrap.view.filters import TagFilterSet
 from moztrap.view.lists import decorators as lists
@@ -27,6 +27,11 @@ from . import forms
 
 
 
+# per-process autocomplete index of tag names, by product
+tag_index = NameIndex(model.Tag, scope_field="product")
+
+
+
 @never_cache
 @login_maybe_required
 @lists.actions(
@@ -127,28 +132,26 @@ def tag_autocomplete(request):
     """Return autocomplete list of existing tags in JSON format."""
     text = request.GET.get("text")
     product_id = request.GET.get("product-id")
-    if text is not None:
-        tags = model.Tag.objects.filter(name__icontains=text)
-        if product_id is not None:
-            tags = tags.filter(Q(product=product_id) | Q(product=None))
-    else:
-        tags = []
     suggestions = []
-    for tag in tags:
-        # can't just use split due to case; we match "text" insensitively, but
-        # want pre and post to be case-accurate
-        start = tag.name.lower().index(text.lower())
-        pre = tag.name[:start]
-        post = tag.name[start + len(text):]
-        suggestions.append({
-                "preText": pre,
-                "typedText": text,
-                "postText": post,
-                "id": tag.id,
-                "product-id": tag.product.id if tag.product else None,
-                "name": tag.name,
-                "type": "tag",
-                })
+    if text:
+        scopes = [ALL]
+        if product_id is not None:
+            try:
+                scopes = [int(product_id), None]
+            except ValueError:
+                scopes = [None]
+        for s in tag_index.suggest(text, scopes):
+            # we match "text" insensitively, but want pre and post to be
+            # case-accurate
+            suggestions.append({
+                    "preText": s.name[:s.start],
+                    "typedText": text,
+                    "postText": s.name[s.start + len(text):],
+                    "id": s.id,
+                    "product-id": s.scope,
+                    "name": s.name,
+                    "type": "tag",
+                    })
     return HttpResponse(
         json.dumps(
             {
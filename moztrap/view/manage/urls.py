@@ -80,6 +80,11 @@ urlpatterns = patterns(
         "runs.views.run_details",
         name="manage_run_details"),
 
+    # ajax background job status
+    url(r"^runs/_jobs/(?P<run_id>\d+)/$",
+        "runs.views.run_jobs",
+        name="manage_run_jobs"),
+
     # add
     url(r"^run/add/$",
         "runs.views.run_add",
@@ -30,7 +30,8 @@ def results_list(request, rcv_id):
         "results/result/results.html",
         {
             "results": model.Result.objects.filter(
-                runcaseversion=rcv).select_related(),
+                runcaseversion=rcv).select_related().prefetch_related(
+                "environment__elements__category"),
             "runcaseversion": rcv,
             }
         )
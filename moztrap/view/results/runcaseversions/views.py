@@ -20,6 +20,7 @@ from ..finders import ResultsFinder
 @login_maybe_required
 @lists.finder(ResultsFinder)
 @lists.filter("runcaseversions", filterset_class=RunCaseVersionFilterSet)
+@lists.keyset("runcaseversions")
 @lists.sort("runcaseversions")
 @ajax("results/case/list/_cases_list.html")
 def runcaseversions_list(request):
@@ -28,7 +29,8 @@ def runcaseversions_list(request):
         request,
         "results/case/cases.html",
         {
-            "runcaseversions": model.RunCaseVersion.objects.select_related(),
+            "runcaseversions": model.RunCaseVersion.objects.select_related(
+                ).with_result_stats(),
             }
         )
 
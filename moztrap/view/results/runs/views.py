@@ -28,7 +28,8 @@ def runs_list(request):
         request,
         "results/run/runs.html",
         {
-            "runs": model.Run.objects.select_related(),
+            "runs": model.Run.objects.select_related(
+                "productversion__product", "summary"),
             }
         )
 
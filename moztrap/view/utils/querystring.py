@@ -18,7 +18,7 @@ def update_querystring(url, **kwargs):
     queryargs = urlparse.parse_qs(parts[4], keep_blank_values=False)
     for k, v in kwargs.iteritems():
         if v is None:
-            del queryargs[k]
+            queryargs.pop(k, None)
         else:
             queryargs[k] = v
 
@@ -93,6 +93,21 @@
                         markSelected();
                     }
                 });
+            },
+
+            // Windowed columns end with a link to load their next objects
+            moreClick = function () {
+                context.on('click', options.moreSelector, function (e) {
+                    var thisItem = $(this).closest('li');
+                    $.get(
+                        $(this).attr('href'),
+                        function (response) {
+                            thisItem.replaceWith(response.html);
+                            markSelected();
+                        }
+                    );
+                    e.preventDefault();
+                });
             };
 
         context.find('.finder').data('cols', options.numberCols);
@@ -135,6 +150,7 @@
         });
 
         itemClick();
+        moreClick();
     };
 
     /* Setup plugin defaults */
@@ -152,7 +168,8 @@
         itemSelector: '.finderinput',       // Selector for items in each section
         callback: null,                     // Callback function, currently runs after input in any section (except lastChild) is selected
         lastChildCallback: null,            // Callback function, currently runs after input in last section is selected
-        sortLinkSelector: '.sortlink'       // Selector for link (in header) to sort items in that column
+        sortLinkSelector: '.sortlink',      // Selector for link (in header) to sort items in that column
+        moreSelector: '.findermore .more'   // Selector for link (at end of section) to load more items
 
     };
 }(jQuery));
\ No newline at end of file
@@ -11,6 +11,14 @@ import mock
 
 class DBMixin(object):
     """Mixin for MozTrap test case classes that need the database."""
+    def _pre_setup(self):
+        """Discard data cached from tables, as their rows are rolled back."""
+        from django.db.models import get_models
+        from moztrap.model import counts
+        counts.invalidate(*get_models(include_auto_created=True))
+        super(DBMixin, self)._pre_setup()
+
+
     @property
     def model(self):
         """The data model."""
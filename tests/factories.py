@@ -374,3 +374,10 @@ class TagFactory(factory.Factory):
     FACTORY_FOR = model.Tag
 
     name = "Test Tag"
+
+
+
+class JobFactory(factory.Factory):
+    FACTORY_FOR = model.Job
+
+    kind = "test.job"
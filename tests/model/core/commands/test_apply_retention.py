@@ -0,0 +1,82 @@
+"""
+Tests for management command to archive or purge old results.
+
+"""
+from cStringIO import StringIO
+import datetime
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+
+from mock import patch
+
+from tests import case
+
+
+
+
+class ApplyRetentionTest(case.DBTestCase):
+    """Tests for apply_retention management command."""
+    def call_command(self, *args, **kwargs):
+        """Runs the management command under test and returns stdout output."""
+        with patch("sys.stdout", StringIO()) as stdout:
+            call_command("apply_retention", *args, **kwargs)
+
+        stdout.seek(0)
+        return stdout.read()
+
+
+    def create_deleted(self, days):
+        """Create a result deleted ``days`` days ago."""
+        r = self.F.ResultFactory.create()
+        self.model.Result.everything.filter(pk=r.pk).update(
+            notrack=True,
+            deleted_on=datetime.datetime.utcnow() - datetime.timedelta(
+                days=days),
+            )
+
+
+    def test_archive(self):
+        """Archives results deleted more than --days ago."""
+        self.create_deleted(10)
+
+        output = self.call_command(days=5)
+
+        self.assertEqual(
+            output,
+            "Archived 1 results and 0 step results older than 5 days.\n")
+        self.assertEqual(self.model.ArchivedResult.objects.count(), 1)
+
+
+    def test_dry_run(self):
+        """Dry run only reports what would be purged."""
+        self.create_deleted(10)
+
+        output = self.call_command(days=5, purge=True, dry_run=True)
+
+        self.assertEqual(
+            output,
+            "Would purge 1 results and 0 step results older than 5 days.\n")
+        self.assertEqual(self.model.Result.everything.count(), 1)
+
+
+    def test_negative_days(self):
+        """Negative --days is an error."""
+        with patch("sys.stderr", StringIO()) as stderr:
+            with patch("sys.exit") as exit:
+                self.call_command(days=-1)
+
+        stderr.seek(0)
+        self.assertEqual(
+            stderr.read(), "Error: --days must not be negative.\n")
+        exit.assert_called_with(1)
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+    def test_schedule(self):
+        """--schedule queues the recurring retention job."""
+        output = self.call_command(schedule=True)
+
+        job = self.model.Job.objects.get()
+        self.assertEqual(job.kind, "results.retention")
+        self.assertTrue(output.startswith(u"Queued {0}".format(job)))
@@ -0,0 +1,79 @@
+"""
+Tests for management command to benchmark run activation.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+
+class BenchmarkActivationTest(case.TransactionTestCase):
+    """Tests for benchmark_activation management command."""
+    def call_command(self, **kwargs):
+        """Runs the management command under test and returns stdout output."""
+        with patch("sys.stdout", StringIO()) as stdout:
+            call_command("benchmark_activation", **kwargs)
+
+        stdout.seek(0)
+        return stdout.read()
+
+
+    def test_reports_timings(self):
+        """One line of timings is output per size."""
+        output = self.call_command(sizes="3,5", envs=2)
+
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertRegexpMatches(
+            lines[0],
+            r"^3 caseversions x 2 environments: "
+            r"activate \d+\.\d\ds, refresh \d+\.\d\ds$",
+            )
+        self.assertTrue(lines[1].startswith("5 caseversions x 2 environments"))
+
+
+    def test_activates_all_caseversions(self):
+        """The benchmarked run gets a runcaseversion per caseversion."""
+        from moztrap.model.execution.models import Run
+        counts = []
+        real_activate = Run.activate
+
+        def activate(run, *args, **kwargs):
+            real_activate(run, *args, **kwargs)
+            counts.append(
+                (run.runcaseversions.count(),
+                 self.model.RunCaseVersion.environments.through.objects.count()
+                 ))
+
+        with patch.object(Run, "activate", activate):
+            self.call_command(sizes="4", envs=3, verbosity=0)
+
+        self.assertEqual(counts, [(4, 12)])
+
+
+    def test_nothing_kept(self):
+        """All benchmark data is rolled back."""
+        self.call_command(sizes="3", envs=2)
+
+        self.assertEqual(self.model.Product.everything.count(), 0)
+        self.assertEqual(self.model.Run.everything.count(), 0)
+        self.assertEqual(self.model.CaseVersion.everything.count(), 0)
+
+
+    def test_bad_sizes(self):
+        """Error if sizes aren't integers."""
+        with patch("sys.stderr", StringIO()) as stderr:
+            with patch("sys.exit"):
+                self.call_command(sizes="10,lots")
+
+        stderr.seek(0)
+        self.assertEqual(
+            stderr.read(),
+            "Error: --sizes must be comma-separated integers, not '10,lots'.\n"
+            )
@@ -0,0 +1,59 @@
+"""
+Tests for management command to benchmark list filtering.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class BenchmarkFiltersTest(case.TransactionTestCase):
+    """Tests for benchmark_filters management command."""
+    def call_command(self, **kwargs):
+        """Runs the management command under test and returns stdout output."""
+        with patch("sys.stdout", StringIO()) as stdout:
+            call_command("benchmark_filters", **kwargs)
+
+        stdout.seek(0)
+        return stdout.read()
+
+
+    def test_reports_timings(self):
+        """One line of timings is output per filter combination."""
+        output = self.call_command(size=4, repeat=1)
+
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertRegexpMatches(
+            lines[0],
+            r"^manage cases by tag \(1 found\): "
+            r"joined \d+\.\d{3}s, subquery \d+\.\d{3}s$",
+            )
+        self.assertTrue(
+            lines[5].startswith("run tests by tag (1 found): joined "))
+
+
+    def test_nothing_kept(self):
+        """All benchmark data is deleted."""
+        self.call_command(size=3, repeat=1)
+
+        self.assertEqual(self.model.Product.everything.count(), 0)
+        self.assertEqual(self.model.Run.everything.count(), 0)
+        self.assertEqual(self.model.Tag.everything.count(), 0)
+        self.assertEqual(self.model.CaseStep.everything.count(), 0)
+
+
+    def test_bad_size(self):
+        """Error if size isn't positive."""
+        with patch("sys.stderr", StringIO()) as stderr:
+            with patch("sys.exit"):
+                self.call_command(size=0)
+
+        stderr.seek(0)
+        self.assertEqual(
+            stderr.read(), "Error: --size and --repeat must be positive.\n")
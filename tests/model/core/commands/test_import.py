@@ -136,7 +136,14 @@ class ImportCasesTest(case.DBTestCase):
         with self.tempfile(json.dumps(data)) as path:
             output = self.call_command("Foo", "1.0", path)
 
-        self.assertEqual(output, ("Imported 1 cases\nImported 0 suites\n", ""))
+        self.assertEqual(
+            output,
+            (
+                "Committed 1 items of {0}: 1 cases, 0 suites, 0 warnings.\n"
+                "Imported 1 cases\nImported 0 suites\n".format(path),
+                "",
+                )
+            )
         self.assertEqual(self.model.CaseVersion.objects.get().name, "Foo")
 
 
@@ -151,7 +158,8 @@ class ImportCasesTest(case.DBTestCase):
                 ]}
 
         with self.tempfile(json.dumps(data)) as path:
-            output = self.call_command("Foo", "1.0", path, force_dupes=True)
+            output = self.call_command(
+                "Foo", "1.0", path, force_dupes=True, verbosity=0)
 
         self.assertEqual(("Imported 2 cases\nImported 0 suites\n", ""), output)
         self.assertEqual(
@@ -170,7 +178,7 @@ class ImportCasesTest(case.DBTestCase):
                 ]}
 
         with self.tempfile(json.dumps(data)) as path:
-            output = self.call_command("Foo", "1.0", path)
+            output = self.call_command("Foo", "1.0", path, verbosity=0)
 
         self.assertEqual(
             "Skipped: Case with this name already exists for this product",
@@ -198,7 +206,7 @@ class ImportCasesTest(case.DBTestCase):
                 fh.write(json.dumps(data2))
                 fh.close()
 
-            output = self.call_command("Foo", "1.0", dir)
+            output = self.call_command("Foo", "1.0", dir, verbosity=0)
 
         self.assertEqual(output, ("Imported 2 cases\nImported 0 suites\n", ""))
         self.assertEqual(
@@ -222,7 +230,7 @@ class ImportCasesTest(case.DBTestCase):
                 fh.write(json.dumps(data2))
                 fh.close()
 
-            output = self.call_command("Foo", "1.0", dir)
+            output = self.call_command("Foo", "1.0", dir, verbosity=0)
 
         self.assertEqual(output, ("Imported 1 cases\nImported 0 suites\n", ""))
         self.assertEqual(self.model.CaseVersion.objects.get().name, "Foo")
@@ -237,3 +245,104 @@ class ImportCasesTest(case.DBTestCase):
 
         self.assertEqual(output, ("No files found to import.\n", ""))
         self.assertEqual(self.model.CaseVersion.objects.count(), 0)
+
+
+    def test_chunks(self):
+        """Items are committed in chunks, reporting progress after each."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        data = {
+            "suites": [{"name": "FooSuite"}],
+            "cases": [
+                {"name": "Foo", "suites": ["FooSuite"]},
+                {"name": "Bar", "steps": [{"instruction": "do this"}]},
+                ]
+            }
+
+        with self.tempfile(json.dumps(data)) as path:
+            output = self.call_command("Foo", "1.0", path, chunk_size=2)
+
+        self.assertEqual(
+            output[0].splitlines()[:2],
+            [
+                "Committed 2 items of {0}: 1 cases, 1 suites, "
+                "1 warnings.".format(path),
+                "Committed 3 items of {0}: 2 cases, 1 suites, "
+                "1 warnings.".format(path),
+                ]
+            )
+        self.assertEqual(
+            self.model.Suite.objects.get().cases.get().versions.get().name,
+            "Foo",
+            )
+
+
+    def test_bad_json_after_chunk(self):
+        """Chunks before malformed JSON are committed and checkpointed."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        contents = (
+            '{"cases": [{"name": "Foo"}, {"name": "Bar"}, {"name": "Baz"},')
+        checkpoint = os.path.join(mkdtemp(), "checkpoint.json")
+
+        with self.tempfile(contents) as path:
+            output = self.call_command(
+                "Foo", "1.0", path, chunk_size=2, checkpoint=checkpoint)
+
+            with open(checkpoint) as fh:
+                self.assertEqual(json.load(fh), {os.path.abspath(path): 2})
+
+        self.assertIn("Error: Could not parse JSON: Expecting", output[1])
+        self.assertEqual(
+            set(self.model.CaseVersion.objects.values_list("name", flat=True)),
+            set(["Foo", "Bar"]))
+
+
+    def test_resume_from_checkpoint(self):
+        """Items committed before an interruption are skipped on resume."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        data = {
+            "cases": [
+                {"name": "Foo", "steps": [{"instruction": "do this"}]},
+                {"name": "Bar", "steps": [{"instruction": "do this"}]},
+                ]
+            }
+        checkpoint = os.path.join(mkdtemp(), "checkpoint.json")
+
+        with self.tempfile(json.dumps(data)) as path:
+            with open(checkpoint, "w") as fh:
+                json.dump({os.path.abspath(path): 1}, fh)
+
+            output = self.call_command(
+                "Foo", "1.0", path, checkpoint=checkpoint, verbosity=0)
+
+        self.assertEqual(output, ("Imported 1 cases\nImported 0 suites\n", ""))
+        self.assertEqual(self.model.CaseVersion.objects.get().name, "Bar")
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+    def test_resume_skips_completed_files(self):
+        """Files completely imported before an interruption are skipped."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        data = {
+            "cases": [{"name": "Foo", "steps": [{"instruction": "do this"}]}]}
+        checkpoint = os.path.join(mkdtemp(), "checkpoint.json")
+
+        with self.tempfile(json.dumps(data)) as path:
+            with open(checkpoint, "w") as fh:
+                json.dump({os.path.abspath(path): True}, fh)
+
+            output = self.call_command(
+                "Foo", "1.0", path, checkpoint=checkpoint)
+
+        self.assertEqual(
+            output,
+            (
+                "Skipping {0}: already imported.\n"
+                "No files found to import.\n".format(path),
+                "",
+                )
+            )
+        self.assertEqual(self.model.CaseVersion.objects.count(), 0)
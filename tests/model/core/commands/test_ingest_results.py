@@ -0,0 +1,123 @@
+"""
+Tests for management command to ingest newline-delimited JSON results.
+
+"""
+from cStringIO import StringIO
+import json
+import os
+from tempfile import mkstemp
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class IngestResultsTest(case.DBTestCase):
+    """Tests for ingest_results management command."""
+    def setUp(self):
+        """Set up a runcaseversion in an environment, and a tester."""
+        self.rcv = self.F.RunCaseVersionFactory.create()
+        self.env = self.F.EnvironmentFactory.create()
+        self.rcv.environments.add(self.env)
+        self.user = self.F.UserFactory.create(username="tester")
+
+
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("ingest_results", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def write(self, contents):
+        """Write ``contents`` to a temporary file and return its path."""
+        (fd, path) = mkstemp()
+        fh = os.fdopen(fd, "w")
+        fh.write(contents)
+        fh.close()
+        self.addCleanup(os.remove, path)
+        return path
+
+
+    def line(self, status="passed"):
+        """Return a line of newline-delimited JSON for a result."""
+        return json.dumps(
+            {
+                "case": self.rcv.caseversion.case.id,
+                "environment": self.env.id,
+                "run_id": self.rcv.run.id,
+                "status": status,
+                }
+            ) + "\n"
+
+
+    def test_ingest(self):
+        """Records results, reporting each commit and any errors."""
+        path = self.write(self.line() + self.line("failed") + "{}\n")
+
+        output = self.call_command("tester", path, chunk_size=2)
+
+        self.assertEqual(
+            output,
+            (
+                "Committed 2 lines: 2 results, 0 errors.\n"
+                "Committed 3 lines: 2 results, 1 errors.\n"
+                "Line 3: bad result object data missing key: 'status'\n"
+                "Processed 3 lines: 2 results recorded, 1 errors.\n",
+                "",
+                )
+            )
+        result = self.model.Result.objects.get(status="failed")
+        self.assertEqual(result.tester, self.user)
+
+
+    def test_stdin(self):
+        """Reads from stdin if the filename is -."""
+        with patch("sys.stdin", StringIO(self.line())):
+            self.call_command("tester", "-", verbosity=0)
+
+        self.assertEqual(self.model.Result.objects.count(), 1)
+
+
+    def test_skip(self):
+        """Skips the given number of lines."""
+        path = self.write(self.line("failed") + self.line())
+
+        self.call_command("tester", path, skip=1, verbosity=0)
+
+        self.assertEqual(self.model.Result.objects.get().status, "passed")
+
+
+    def test_no_args(self):
+        """Command shows usage."""
+        output = self.call_command()
+
+        self.assertEqual(output, ("", "Error: Usage: <username> <filename>\n"))
+
+
+    def test_bad_user(self):
+        """Error if given non-existent username."""
+        output = self.call_command("nobody", "file.json")
+
+        self.assertEqual(output, ("", 'Error: User "nobody" does not exist\n'))
+
+
+    def test_bad_file(self):
+        """Error if the file can't be opened."""
+        stdout, stderr = self.call_command("tester", "/does/not/exist")
+
+        self.assertTrue(
+            stderr.startswith('Error: Could not open file "/does/not/exist"'))
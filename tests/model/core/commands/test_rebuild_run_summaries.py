@@ -0,0 +1,97 @@
+"""
+Tests for management command to rebuild run summaries.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+
+class RebuildRunSummariesTest(case.DBTestCase):
+    """Tests for rebuild_run_summaries management command."""
+    def call_command(self, *args, **kwargs):
+        """Runs the management command under test and returns stdout output."""
+        with patch("sys.stdout", StringIO()) as stdout:
+            call_command("rebuild_run_summaries", *args, **kwargs)
+
+        stdout.seek(0)
+        return stdout.read()
+
+
+    def create_run(self, name="Some Run"):
+        """Create and return a run with one passed result in one env."""
+        envs = self.F.EnvironmentFactory.create_full_set({"OS": ["Linux"]})
+        run = self.F.RunFactory.create(name=name, environments=envs)
+        rcv = self.F.RunCaseVersionFactory.create(run=run, environments=envs)
+        self.F.ResultFactory.create(
+            runcaseversion=rcv, environment=envs[0], status="passed")
+        return run
+
+
+    def test_creates_missing(self):
+        """Runs without a summary get one."""
+        run = self.create_run()
+
+        output = self.call_command()
+
+        summary = self.model.RunSummary.everything.get(run=run)
+        self.assertEqual(summary.passed, 1)
+        self.assertEqual(summary.completion(), 1)
+        self.assertEqual(
+            output, "Rebuilt 1 run summaries; 0 had drifted.\n")
+
+
+    def test_verbose_reports_created(self):
+        """With verbosity 2, newly created summaries are reported."""
+        run = self.create_run()
+
+        output = self.call_command(verbosity=2)
+
+        self.assertIn(
+            "Run 'Some Run' (id {0}): summary created.".format(run.id),
+            output)
+
+
+    def test_reports_drift(self):
+        """Summaries that differ from a fresh count are fixed and reported."""
+        run = self.create_run()
+        run.get_summary()
+        self.model.RunSummary.everything.filter(run=run).update(
+            passed=3, total=0)
+
+        output = self.call_command()
+
+        self.assertEqual(
+            output,
+            "Run 'Some Run' (id {0}) had drifted: "
+            "passed 3 -> 1, total 0 -> 1\n"
+            "Rebuilt 1 run summaries; 1 had drifted.\n".format(run.id)
+            )
+        self.assertEqual(
+            self.model.RunSummary.everything.get(run=run).passed, 1)
+
+
+    def test_only_given_runs(self):
+        """If run ids are given, only those runs are rebuilt."""
+        run = self.create_run()
+        other = self.create_run("Other Run")
+
+        output = self.call_command(str(run.id))
+
+        self.assertEqual(
+            output, "Rebuilt 1 run summaries; 0 had drifted.\n")
+        self.assertFalse(
+            self.model.RunSummary.everything.filter(run=other).exists())
+
+
+    def test_quiet(self):
+        """With verbosity 0, nothing is output."""
+        self.create_run()
+
+        self.assertEqual(self.call_command(verbosity=0), "")
@@ -0,0 +1,54 @@
+"""
+Tests for management command to rebuild the search index.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class RebuildSearchIndexTest(case.DBTestCase):
+    """Tests for rebuild_search_index management command."""
+    def call_command(self, *args, **kwargs):
+        """Runs the management command under test and returns stdout output."""
+        with patch("sys.stdout", StringIO()) as stdout:
+            call_command("rebuild_search_index", *args, **kwargs)
+
+        stdout.seek(0)
+        return stdout.read()
+
+
+    def tokens(self, cv):
+        """Return sorted (field, token) indexed for ``cv``."""
+        return sorted(
+            self.model.SearchToken.objects.filter(
+                caseversion=cv).values_list("field", "token"))
+
+
+    def test_rebuilds(self):
+        """Index is rebuilt for all caseversions."""
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        self.model.SearchToken.objects.all().delete()
+
+        output = self.call_command()
+
+        self.assertEqual(self.tokens(cv), [("name", "in"), ("name", "log")])
+        self.assertEqual(output, "Indexed 1 caseversions.\n")
+
+
+    def test_given_caseversions(self):
+        """Only the given caseversions are indexed."""
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        cv2 = self.F.CaseVersionFactory.create(name="Log out")
+        self.model.SearchToken.objects.all().delete()
+
+        output = self.call_command(str(cv2.id))
+
+        self.assertEqual(self.tokens(cv), [])
+        self.assertEqual(self.tokens(cv2), [("name", "log"), ("name", "out")])
+        self.assertEqual(output, "Indexed 1 caseversions.\n")
@@ -0,0 +1,112 @@
+"""
+Tests for management command to process background jobs.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+
+from mock import patch
+
+from tests import case
+
+
+
+
+@override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+class RunJobsTest(case.DBTestCase):
+    """Tests for run_jobs management command."""
+    def call_command(self, **kwargs):
+        """Runs the management command under test and returns stdout output."""
+        kwargs.setdefault("once", True)
+        with patch("sys.stdout", StringIO()) as stdout:
+            call_command("run_jobs", **kwargs)
+
+        stdout.seek(0)
+        return stdout.read()
+
+
+    def test_processes_due_jobs(self):
+        """With --once, all due jobs are run and the command exits."""
+        r1 = self.F.RunFactory.create(status="draft")
+        r2 = self.F.RunFactory.create(status="draft")
+        j1 = r1.enqueue_activate()
+        j2 = r2.enqueue_activate()
+
+        output = self.call_command()
+
+        self.assertEqual(
+            output,
+            "run.activate job {0} (attempt 1): done\n"
+            "run.activate job {1} (attempt 1): done\n".format(j1.id, j2.id)
+            )
+        self.assertEqual(self.refresh(r1).status, "active")
+        self.assertEqual(self.refresh(r2).status, "active")
+
+
+    def test_max_jobs(self):
+        """Stops after --max-jobs jobs."""
+        j1 = self.F.RunFactory.create().enqueue_activate()
+        j2 = self.F.RunFactory.create().enqueue_activate()
+
+        self.call_command(max_jobs=1, verbosity=0)
+
+        self.assertEqual(self.refresh(j1).status, "done")
+        self.assertEqual(self.refresh(j2).status, "queued")
+
+
+    def test_failed_job_reported(self):
+        """A job that raises is reported as queued for retry."""
+        job = self.F.JobFactory.create(kind="test.job")
+
+        def fail(target, user=None):
+            raise ValueError("oops")
+
+        with patch.dict(
+                "moztrap.model.jobs.models._handlers", {"test.job": fail}):
+            output = self.call_command()
+
+        self.assertEqual(
+            output, "test.job job {0} (attempt 1): queued\n".format(job.id))
+
+
+    def test_sleeps_when_idle(self):
+        """Without --once, polls again after sleeping when no job is due."""
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            self.F.RunFactory.create().enqueue_activate()
+
+        with patch("time.sleep", sleep):
+            self.call_command(once=False, sleep=2, max_jobs=1, verbosity=0)
+
+        self.assertEqual(sleeps, [2])
+
+
+    def test_ends_transaction_before_sleeping(self):
+        """A job queued after an empty poll is seen by the next poll."""
+        events = []
+
+        def sleep(seconds):
+            events.append("sleep")
+            self.F.RunFactory.create().enqueue_activate()
+
+        with patch(
+                "moztrap.model.core.management.commands.run_jobs."
+                "transaction") as transaction:
+            transaction.commit_unless_managed.side_effect = (
+                lambda: events.append("commit"))
+            with patch("time.sleep", sleep):
+                self.call_command(once=False, max_jobs=1, verbosity=0)
+
+        self.assertEqual(events, ["commit", "sleep", "commit"])
+        self.assertEqual(self.model.Job.objects.get().status, "done")
+
+
+    def test_verbose_total(self):
+        """With verbosity 2, total processed is reported."""
+        output = self.call_command(verbosity=2)
+
+        self.assertEqual(output, "Processed 0 jobs.\n")
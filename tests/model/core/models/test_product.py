@@ -52,3 +52,39 @@ class ProductTest(case.DBTestCase):
 
         self.assertEqual(self.refresh(v1).order, 1)
         self.assertEqual(self.refresh(v2).order, 2)
+
+
+    def test_reorder_versions_sets_latest_caseversions(self):
+        """reorder_versions marks caseversions of latest versions latest."""
+        p = self.F.ProductFactory()
+        v1 = self.F.ProductVersionFactory(product=p, version="1")
+        v2 = self.F.ProductVersionFactory(product=p, version="2")
+        c1 = self.F.CaseFactory(product=p)
+        c2 = self.F.CaseFactory(product=p)
+        self.F.CaseVersionFactory(case=c1, productversion=v1)
+        self.F.CaseVersionFactory(case=c1, productversion=v2)
+        self.F.CaseVersionFactory(case=c2, productversion=v1)
+        self.model.CaseVersion.everything.update(latest=False, notrack=True)
+        self.model.ProductVersion.everything.filter(pk=v1.pk).update(
+            version="3", notrack=True)
+
+        p.reorder_versions()
+
+        self.assertEqual(
+            set(
+                (cv.case, cv.productversion.version)
+                for cv in self.model.CaseVersion.objects.filter(latest=True)
+                ),
+            set([(c1, "3"), (c2, "3")]),
+            )
+
+
+    def test_reorder_versions_queries(self):
+        """reorder_versions takes the same number of queries for any size."""
+        for size in [1, 5]:
+            pv = self.F.ProductVersionFactory()
+            for i in range(size):
+                self.F.CaseVersionFactory(productversion=pv)
+
+            with self.assertNumQueries(4):
+                pv.product.reorder_versions()
@@ -104,6 +104,53 @@ class ProductVersionTest(case.DBTestCase):
         self.assertEqual(len(new.team.all()), 2)
 
 
+    def test_clone_caseversions(self):
+        """Caseversions cloned into a version keep name and case."""
+        cs = self.F.CaseStepFactory.create(instruction="Frobnicate")
+        cv = cs.caseversion
+        pv = self.F.ProductVersionFactory.create(
+            product=cv.productversion.product, version="2.0")
+        u = self.F.UserFactory.create()
+
+        pv.clone_caseversions([cv], user=u)
+
+        new = pv.caseversions.get()
+        self.assertEqual(new.case, cv.case)
+        self.assertEqual(new.name, cv.name)
+        self.assertEqual(new.created_by, u)
+        self.assertEqual(new.steps.get().instruction, "Frobnicate")
+
+
+    def test_clone_caseversions_latest(self):
+        """Caseversions cloned into a later version become the latest."""
+        cv = self.F.CaseVersionFactory.create()
+        pv = self.F.ProductVersionFactory.create(
+            product=cv.productversion.product, version="2.0")
+
+        pv.clone_caseversions([cv])
+
+        self.assertTrue(pv.caseversions.get().latest)
+        self.assertFalse(self.refresh(cv).latest)
+
+
+    def test_clone_caseversions_searchable(self):
+        """Cloned caseversions and steps are added to the search index."""
+        from moztrap.model.library import search
+        cs = self.F.CaseStepFactory.create(instruction="Frobnicate")
+        pv = self.F.ProductVersionFactory.create(
+            product=cs.caseversion.productversion.product, version="2.0")
+
+        pv.clone_caseversions([cs.caseversion])
+
+        self.assertEqual(
+            set(
+                self.model.CaseVersion.objects.filter(
+                    pk__in=search.matching("instruction", "frob"))
+                ),
+            set([cs.caseversion, pv.caseversions.get()]),
+            )
+
+
     def test_adding_new_version_reorders(self):
         """Adding a new product version reorders the versions."""
         p = self.F.ProductFactory.create()
@@ -273,3 +320,91 @@ class SortByVersionTest(case.DBTestCase):
     def test_pre_release(self):
         """Alpha strings prior to "final" are pre-release versions."""
         self.assertOrder("1.1a", "1.1")
+
+
+
+class ProductVersionEnvironmentsTest(case.DBTestCase):
+    """Tests for cascading environment changes from a productversion."""
+    def setUp(self):
+        """A productversion with caseversions and a draft run."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux"]})
+        self.pv = self.F.ProductVersionFactory.create(
+            environments=self.envs[1:])
+        self.run = self.F.RunFactory.create(
+            productversion=self.pv, status="draft")
+
+
+    def create_caseversions(self, num):
+        """Create ``num`` caseversions of the productversion."""
+        for i in range(num):
+            self.F.CaseVersionFactory.create(productversion=self.pv)
+
+
+    def test_add_envs_counts(self):
+        """add_envs returns number of links added for each model."""
+        self.create_caseversions(3)
+
+        touched = self.pv.add_envs(self.envs[0])
+
+        self.assertEqual(
+            touched,
+            {
+                self.model.ProductVersion: 1,
+                self.model.Run: 1,
+                self.model.CaseVersion: 3,
+                }
+            )
+
+
+    def test_add_envs_existing(self):
+        """Adding envs an object already has adds nothing for it."""
+        self.create_caseversions(1)
+        self.pv.add_envs(self.envs[0])
+
+        touched = self.pv.add_envs(*self.envs)
+
+        self.assertEqual(set(touched.values()), set([0]))
+        self.assertEqual(set(self.run.environments.all()), set(self.envs))
+
+
+    def test_add_envs_by_id(self):
+        """Environments can be given by id."""
+        self.create_caseversions(1)
+
+        self.pv.add_envs(str(self.envs[0].id))
+
+        cv = self.model.CaseVersion.objects.get()
+        self.assertEqual(set(cv.environments.all()), set(self.envs))
+
+
+    def test_add_envs_queries(self):
+        """The queries needed don't depend on the number of caseversions."""
+        self.create_caseversions(1)
+        with self.assertNumQueries(3):
+            self.pv.add_envs(self.envs[0])
+
+        self.pv.remove_envs(self.envs[0])
+        self.create_caseversions(4)
+        with self.assertNumQueries(3):
+            touched = self.pv.add_envs(self.envs[0])
+
+        self.assertEqual(touched[self.model.CaseVersion], 5)
+
+
+    def test_remove_envs_counts(self):
+        """remove_envs returns number of links removed for each model."""
+        self.create_caseversions(2)
+
+        touched = self.pv.remove_envs(self.envs[1])
+
+        self.assertEqual(
+            touched,
+            {
+                self.model.ProductVersion: 1,
+                self.model.Run: 1,
+                self.model.CaseVersion: 2,
+                self.model.RunCaseVersion: 0,
+                }
+            )
+        self.assertEqual(list(self.run.environments.all()), [])
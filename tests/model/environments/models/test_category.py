@@ -56,3 +56,31 @@ class CategoryTest(case.DBTestCase):
         env.delete()
 
         self.assertTrue(el.category.deletable)
+
+
+    def test_with_deletable(self):
+        """with_deletable loads deletability of all categories in one query."""
+        el = self.F.ElementFactory.create(category__name="OS")
+        self.F.CategoryFactory.create(name="Language")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el)
+
+        with self.assertNumQueries(2):
+            found = [
+                (c.name, c.deletable)
+                for c in self.model.Category.objects.with_deletable()
+                ]
+
+        self.assertEqual(found, [("Language", True), ("OS", False)])
+
+
+    def test_queryset_delete_prevention(self):
+        """Deleting a queryset including a category in use is prevented."""
+        el = self.F.ElementFactory.create(category__name="OS")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el)
+
+        with self.assertRaises(self.model.ProtectedError):
+            self.model.Category.objects.all().delete()
+
+        self.assertIsNone(self.refresh(el.category).deleted_on)
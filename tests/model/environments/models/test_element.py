@@ -56,3 +56,45 @@ class ElementTest(case.DBTestCase):
         env.delete()
 
         self.assertTrue(el.deletable)
+
+
+    def test_with_deletable(self):
+        """with_deletable loads deletability of all elements in one query."""
+        used = self.F.ElementFactory.create(name="Debian")
+        self.F.ElementFactory.create(name="Ubuntu")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(used)
+
+        with self.assertNumQueries(2):
+            found = [
+                (e.name, e.deletable)
+                for e in self.model.Element.objects.with_deletable()
+                ]
+
+        self.assertEqual(found, [("Debian", False), ("Ubuntu", True)])
+
+
+    def test_queryset_delete_prevention(self):
+        """Deleting a queryset including an element in use is prevented."""
+        used = self.F.ElementFactory.create(name="Debian")
+        unused = self.F.ElementFactory.create(name="Ubuntu")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(used)
+
+        with self.assertRaises(self.model.ProtectedError):
+            self.model.Element.objects.all().delete()
+
+        self.assertIsNone(self.refresh(used).deleted_on)
+        self.assertIsNone(self.refresh(unused).deleted_on)
+
+
+    def test_queryset_delete_unused(self):
+        """A queryset of elements not in use can be deleted."""
+        el = self.F.ElementFactory.create(name="Debian")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el)
+        env.delete()
+
+        self.model.Element.objects.all().delete()
+
+        self.assertIsNotNone(self.refresh(el).deleted_on)
@@ -98,3 +98,69 @@ class EnvironmentTest(case.DBTestCase):
         env = self.refresh(env)
         self.assertEqual(env.profile, None)
         self.assertEqual(env.modified_by, u)
+
+
+
+class EnvironmentWithLabelsTest(case.DBTestCase):
+    """Tests for batch-loading elements with ``with_labels``."""
+    def setUp(self):
+        """Create a few environments."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux"], "Language": ["English", "German"]})
+
+
+    def test_labels(self):
+        """Labels and ordered elements of all envs need only three queries."""
+        with self.assertNumQueries(3):
+            labels = sorted(
+                (unicode(e), [el.name for el in e.ordered_elements()])
+                for e in self.model.Environment.objects.with_labels())
+
+        self.assertEqual(
+            labels,
+            sorted(
+                (unicode(e), [el.name for el in e.ordered_elements()])
+                for e in self.envs
+                )
+            )
+
+
+    def test_related(self):
+        """Environments of a related manager can be loaded with labels."""
+        profile = self.F.ProfileFactory.create()
+        profile.environments.add(*self.envs)
+
+        with self.assertNumQueries(3):
+            labels = set(
+                unicode(e) for e in profile.environments.with_labels())
+
+        self.assertEqual(labels, set(unicode(e) for e in self.envs))
+
+
+
+class EnvironmentWithDeletableTest(case.DBTestCase):
+    """Tests for batch-loading deletability with ``with_deletable``."""
+    def test_with_deletable(self):
+        """Deletability of all environments is loaded in one query."""
+        used = self.F.EnvironmentFactory.create()
+        unused = self.F.EnvironmentFactory.create()
+        self.F.ProductVersionFactory.create().environments.add(used)
+
+        with self.assertNumQueries(2):
+            found = dict(
+                (e.id, e.deletable)
+                for e in self.model.Environment.objects.with_deletable()
+                )
+
+        self.assertEqual(found, {used.id: False, unused.id: True})
+
+
+    def test_queryset_delete_prevention(self):
+        """Deleting a queryset including an environment in use is prevented."""
+        env = self.F.EnvironmentFactory.create()
+        self.F.ProductVersionFactory.create().environments.add(env)
+
+        with self.assertRaises(self.model.ProtectedError):
+            self.model.Environment.objects.all().delete()
+
+        self.assertIsNone(self.refresh(env).deleted_on)
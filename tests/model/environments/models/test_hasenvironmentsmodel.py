@@ -2,6 +2,8 @@
 Tests for ``HasEnvironmentsModel``.
 
 """
+from django.db import transaction
+
 from tests import case
 
 
@@ -24,3 +26,36 @@ class HasEnvironmentsModelTest(case.TestCase):
     def test_cascade_envs_to(self):
         """cascade_envs_to returns empty dict in base class."""
         self.assertEqual(self.model_class.cascade_envs_to([], True), {})
+
+
+
+class HasEnvironmentsTransactionTest(case.TransactionTestCase):
+    """Transactional tests for adding and removing environments."""
+    def setUp(self):
+        """Set up a product version and an environment."""
+        self.pv = self.F.ProductVersionFactory.create()
+        self.env = self.F.EnvironmentFactory.create()
+
+
+    def test_add_envs_does_not_commit(self):
+        """add_envs leaves committing to the caller's transaction."""
+        with transaction.commit_manually():
+            try:
+                self.pv.add_envs(self.env)
+            finally:
+                transaction.rollback()
+
+        self.assertEqual(list(self.pv.environments.all()), [])
+
+
+    def test_remove_envs_does_not_commit(self):
+        """remove_envs leaves committing to the caller's transaction."""
+        self.pv.add_envs(self.env)
+
+        with transaction.commit_manually():
+            try:
+                self.pv.remove_envs(self.env)
+            finally:
+                transaction.rollback()
+
+        self.assertEqual(list(self.pv.environments.all()), [self.env])
@@ -2,6 +2,8 @@
 Tests for Profile model.
 
 """
+from django.db import transaction
+
 from tests import case
 
 
@@ -43,6 +45,58 @@ class ProfileTest(case.DBTestCase):
             )
 
 
+    def test_generate_environments_created_by(self):
+        """Generated environments are created by the given user."""
+        el = self.F.ElementFactory.create()
+        u = self.F.UserFactory.create()
+
+        p = self.model.Profile.generate("New Profile", el, user=u)
+
+        env = p.environments.get()
+        self.assertEqual(env.created_by, u)
+        self.assertEqual(env.modified_by, u)
+        self.assertEqual(list(env.elements.all()), [el])
+
+
+    def test_generate_queries(self):
+        """Number of queries doesn't depend on number of combinations."""
+        elements = []
+        for c in range(3):
+            category = self.F.CategoryFactory.create()
+            for e in range(3):
+                elements.append(
+                    self.F.ElementFactory.create(category=category))
+
+        with self.assertNumQueries(4):
+            p = self.model.Profile.generate("New Profile", *elements)
+
+        self.assertEqual(p.environments.count(), 27)
+        self.assertEqual(
+            len(set(
+                tuple(sorted(e.id for e in env.elements.all()))
+                for env in p.environments.all()
+                )),
+            27,
+            )
+
+
+    def test_generate_dry_run(self):
+        """A dry run returns the number of combinations, creating nothing."""
+        os = self.F.CategoryFactory(name="Operating System")
+        browser = self.F.CategoryFactory(name="Browser")
+        windows = self.F.ElementFactory(name="Windows", category=os)
+        linux = self.F.ElementFactory(name="Linux", category=os)
+        firefox = self.F.ElementFactory(name="Firefox", category=browser)
+
+        with self.assertNumQueries(0):
+            found = self.model.Profile.generate(
+                "New Profile", windows, linux, firefox, dry_run=True)
+
+        self.assertEqual(found, 2)
+        self.assertEqual(self.model.Profile.objects.count(), 0)
+        self.assertEqual(self.model.Environment.objects.count(), 0)
+
+
     def test_clone(self):
         """Cloning a profile prefixes name with 'Cloned'."""
         p = self.F.ProfileFactory.create(name="Foo")
@@ -73,3 +127,20 @@ class ProfileTest(case.DBTestCase):
 
         self.assertEqual(
             [c.name for c in p.categories()], ["Browser", "OS"])
+
+
+
+class ProfileTransactionTest(case.TransactionTestCase):
+    """Transactional tests for Profile model."""
+    def test_generate_does_not_commit(self):
+        """generate leaves committing to the caller's transaction."""
+        e = self.F.ElementFactory.create()
+
+        with transaction.commit_manually():
+            try:
+                self.model.Profile.generate("Test Profile", e)
+            finally:
+                transaction.rollback()
+
+        self.assertEqual(self.model.Profile.objects.count(), 0)
+        self.assertEqual(self.model.Environment.objects.count(), 0)
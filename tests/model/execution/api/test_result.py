@@ -5,6 +5,12 @@ This is a write-only resource via ``patch``.  So no read for lists, etc.
 This works by providing results for an existing test run.
 
 """
+import json
+import urllib
+
+from django.core.urlresolvers import reverse
+
+from moztrap.model import API_VERSION
 
 from tests import case
 
@@ -305,3 +311,162 @@ class ResultResourceTest(case.api.ApiTestCase):
             params=params,
             status=401,
             )
+
+
+    def test_submit_results_partial(self):
+        """Good results are recorded; errors are reported for bad ones."""
+        user = self.F.UserFactory.create(
+            username="foo",
+            permissions=["execution.execute"],
+            )
+        apikey = self.F.ApiKeyFactory.create(owner=user)
+        envs = self.F.EnvironmentFactory.create_full_set(
+                {"OS": ["OS X"]})
+        pv = self.F.ProductVersionFactory.create(environments=envs)
+        r1 = self.F.RunFactory.create(name="RunA", productversion=pv)
+
+        c_p = self.F.CaseVersionFactory.create(
+            case__product=pv.product,
+            productversion=pv,
+            name="PassCase",
+            )
+
+        self.factory.create(caseversion=c_p, run=r1, environments=envs)
+
+        # submit results for these cases
+        params = {"username": user.username, "api_key": apikey.key}
+        payload = {
+            "objects": [
+                {
+                    "case": c_p.case.id,
+                    "environment": envs[0].id,
+                    "run_id": r1.id,
+                    "status": "passed"
+                    },
+                {
+                    "case": c_p.case.id,
+                    "environment": envs[0].id,
+                    "run_id": r1.id,
+                    },
+                ]
+            }
+
+        res = self.patch(
+            self.get_list_url(self.resource_name),
+            params=params,
+            payload=payload,
+            status=202,
+            )
+
+        self.assertEqual(res.json["created"], 1)
+        self.assertEqual(
+            res.json["errors"],
+            [
+                {
+                    "index": 1,
+                    "error": "bad result object data missing key: 'status'",
+                    }
+                ]
+            )
+        result = self.model.Result.objects.get()
+        self.assertEqual(result.status, "passed")
+
+
+
+class ResultStreamTest(case.api.ApiTestCase):
+    """Tests for streaming newline-delimited JSON results."""
+    def setUp(self):
+        """Set up a runcaseversion and a user who can report results."""
+        super(ResultStreamTest, self).setUp()
+        self.user = self.F.UserFactory.create(
+            username="foo",
+            permissions=["execution.execute"],
+            )
+        self.apikey = self.F.ApiKeyFactory.create(owner=self.user)
+        self.rcv = self.F.RunCaseVersionFactory.create()
+        self.env = self.F.EnvironmentFactory.create()
+        self.rcv.environments.add(self.env)
+
+
+    @property
+    def url(self):
+        """The stream endpoint URL."""
+        return reverse(
+            "api_stream_results",
+            kwargs={"resource_name": "result", "api_name": API_VERSION},
+            )
+
+
+    def line(self, status="passed"):
+        """Return a line of newline-delimited JSON for a result."""
+        return json.dumps(
+            {
+                "case": self.rcv.caseversion.case.id,
+                "environment": self.env.id,
+                "run_id": self.rcv.run.id,
+                "status": status,
+                }
+            ) + "\n"
+
+
+    def stream(self, body, status=200, **params):
+        """POST ``body`` to the stream endpoint; return the response."""
+        params.setdefault("username", self.user.username)
+        params.setdefault("api_key", self.apikey.key)
+        return self.app.post(
+            "{0}?{1}".format(self.url, urllib.urlencode(params)),
+            body,
+            headers={"content-type": "application/x-ndjson"},
+            status=status,
+            )
+
+
+    def test_stream(self):
+        """Records each line; returns a summary."""
+        res = self.stream(
+            self.line() + self.line("failed") + self.line("bogus"),
+            chunk_size=2,
+            )
+
+        self.assertEqual(res.json["created"], 2)
+        self.assertEqual(res.json["processed"], 3)
+        self.assertEqual(res.json["chunks"], 2)
+        self.assertEqual(
+            res.json["errors"],
+            [{"index": 2, "error": "invalid result status: bogus"}],
+            )
+        self.assertEqual(self.model.Result.objects.count(), 2)
+
+
+    def test_skip(self):
+        """Lines already processed can be skipped."""
+        res = self.stream(self.line("failed") + self.line(), skip=1)
+
+        self.assertEqual(res.json["created"], 1)
+        self.assertEqual(self.model.Result.objects.get().status, "passed")
+
+
+    def test_all_bad(self):
+        """If nothing could be recorded, the response is a 400."""
+        res = self.stream("{}\n", status=400)
+
+        self.assertEqual(res.json["error_count"], 1)
+
+
+    def test_bad_chunk_size(self):
+        """A non-integer chunk size is a 400."""
+        self.stream(self.line(), chunk_size="foo", status=400)
+
+
+    def test_get(self):
+        """Only POST is allowed."""
+        self.app.get(self.url, status=405)
+
+
+    def test_no_authorization(self):
+        """Users without permission to report results are rejected."""
+        user = self.F.UserFactory.create(username="bar")
+        apikey = self.F.ApiKeyFactory.create(owner=user)
+
+        self.stream(
+            self.line(), username=user.username, api_key=apikey.key, status=401)
@@ -2,6 +2,7 @@
 Tests for RunResource api.
 
 """
+from django.test.utils import override_settings
 
 from tests import case
 
@@ -457,3 +458,38 @@ class RunResourceTest(case.api.ApiTestCase):
             params=params,
             status=401,
             )
+
+
+
+@override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+class RunJobsResourceTest(case.api.ApiTestCase):
+    """Tests for the run jobs status endpoint."""
+    def url(self, run_id):
+        """Return URL of the jobs endpoint for given run id."""
+        return "/api/v1/run/{0}/jobs/".format(run_id)
+
+
+    def test_jobs(self):
+        """Lists status of the run's jobs, newest first."""
+        r = self.F.RunFactory.create()
+        j1 = r.enqueue_activate()
+        j2 = r.enqueue_refresh()
+
+        res = self.get(self.url(r.id))
+
+        self.assertEqual(
+            [(j["id"], j["kind"], j["status"]) for j in res.json["objects"]],
+            [(j2.id, "run.refresh", "queued"), (j1.id, "run.activate", "queued")]
+            )
+
+
+    def test_no_such_run(self):
+        """404 for a run that doesn't exist."""
+        self.get(self.url(9999), status=404)
+
+
+    def test_get_only(self):
+        """Can't POST to the jobs endpoint."""
+        r = self.F.RunFactory.create()
+
+        self.post(self.url(r.id), {}, status=405)
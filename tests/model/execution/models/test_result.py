@@ -2,6 +2,8 @@
 Tests for Result model.
 
 """
+from django.db import transaction
+
 from tests import case
 
 
@@ -67,3 +69,145 @@ class ResultTest(case.DBTestCase):
         self.assertEqual(r2.status, "failed")
         self.assertEqual(r2.is_latest, True)
         self.assertEqual(r1.is_latest, False)
+
+
+
+class ResultSummariesTest(case.DBTestCase):
+    """Tests for ``result_summary`` and ``result_summaries`` functions."""
+    def setUp(self):
+        """Set up two runs; the first with two runcaseversions."""
+        self.run1 = self.F.RunFactory.create()
+        self.run2 = self.F.RunFactory.create()
+        self.rcv1 = self.F.RunCaseVersionFactory.create(run=self.run1)
+        self.rcv2 = self.F.RunCaseVersionFactory.create(run=self.run1)
+        self.rcv3 = self.F.RunCaseVersionFactory.create(run=self.run2)
+
+        tester = self.F.UserFactory.create()
+        env = self.F.EnvironmentFactory.create()
+        for rcv, status in [
+                (self.rcv1, "failed"),
+                (self.rcv1, "passed"),
+                (self.rcv2, "started"),
+                (self.rcv2, "invalidated"),
+                (self.rcv3, "failed"),
+                ]:
+            self.F.ResultFactory.create(
+                runcaseversion=rcv,
+                tester=tester,
+                environment=env,
+                status=status,
+                )
+
+
+    def summary(self, passed=0, failed=0, invalidated=0):
+        """Return expected summary dict."""
+        return {"passed": passed, "failed": failed, "invalidated": invalidated}
+
+
+    def test_result_summary_one_query(self):
+        """``result_summary`` counts latest results in a single query."""
+        from moztrap.model.execution.models import result_summary
+
+        with self.assertNumQueries(1):
+            summary = result_summary(
+                self.model.Result.objects.filter(runcaseversion__run=self.run1))
+
+        self.assertEqual(summary, self.summary(passed=1, invalidated=1))
+
+
+    def test_result_summary_ignores_superseded(self):
+        """``result_summary`` only counts latest results."""
+        from moztrap.model.execution.models import result_summary
+
+        result = self.rcv3.results.get()
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv3,
+            tester=result.tester,
+            environment=result.environment,
+            status="passed",
+            )
+
+        self.assertEqual(
+            result_summary(self.rcv3.results.all()), self.summary(passed=1))
+
+
+    def test_runs(self):
+        """``result_summaries`` of runs are keyed by run id."""
+        from moztrap.model.execution.models import result_summaries
+
+        with self.assertNumQueries(1):
+            summaries = result_summaries([self.run1, self.run2])
+
+        self.assertEqual(
+            summaries,
+            {
+                self.run1.id: self.summary(passed=1, invalidated=1),
+                self.run2.id: self.summary(failed=1),
+                }
+            )
+
+
+    def test_runcaseversions(self):
+        """``result_summaries`` of runcaseversions are keyed by their id."""
+        from moztrap.model.execution.models import result_summaries
+
+        summaries = result_summaries([self.rcv1, self.rcv2, self.rcv3])
+
+        self.assertEqual(
+            summaries,
+            {
+                self.rcv1.id: self.summary(passed=1),
+                self.rcv2.id: self.summary(invalidated=1),
+                self.rcv3.id: self.summary(failed=1),
+                }
+            )
+
+
+    def test_queryset(self):
+        """``result_summaries`` accepts a queryset, as a subquery."""
+        from moztrap.model.execution.models import result_summaries
+
+        with self.assertNumQueries(1):
+            summaries = result_summaries(
+                self.model.RunCaseVersion.objects.filter(run=self.run1))
+
+        self.assertEqual(summaries[self.rcv1.id], self.summary(passed=1))
+        self.assertEqual(summaries[self.rcv2.id], self.summary(invalidated=1))
+        self.assertNotIn(self.rcv3.id, summaries)
+
+
+    def test_no_results(self):
+        """Parents without any results get zero counts."""
+        from moztrap.model.execution.models import result_summaries
+
+        run = self.F.RunFactory.create()
+
+        self.assertEqual(result_summaries([run]), {run.id: self.summary()})
+
+
+    def test_empty(self):
+        """No parents, no queries."""
+        from moztrap.model.execution.models import result_summaries
+
+        with self.assertNumQueries(0):
+            self.assertEqual(result_summaries([]), {})
+
+
+
+class ResultTransactionTest(case.TransactionTestCase):
+    """Tests for transactional behavior of saving a Result."""
+    def test_save_does_not_commit(self):
+        """Saving a result leaves the caller's transaction uncommitted."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        self.model.RunSummary.refresh(rcv.run)
+
+        with transaction.commit_manually():
+            try:
+                self.F.ResultFactory.create(
+                    runcaseversion=rcv, status="passed")
+            finally:
+                transaction.rollback()
+
+        self.assertEqual(self.model.Result.everything.count(), 0)
+        self.assertEqual(
+            self.model.RunSummary.objects.get(run=rcv.run).passed, 0)
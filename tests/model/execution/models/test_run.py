@@ -6,6 +6,7 @@ import datetime
 from mock import patch
 
 from django.core.exceptions import ValidationError
+from django.test.utils import override_settings
 
 from moztrap.model.execution.models import Run
 
@@ -276,6 +277,155 @@ class RunTest(case.DBTestCase):
 
 
 
+@override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+class RunJobsTest(case.DBTestCase):
+    """Tests for queueing background jobs on runs."""
+    def run_job(self, job):
+        """Claim and run the given queued job; return it refreshed."""
+        job.claim("test")
+        job.execute()
+        return self.refresh(job)
+
+
+    def test_enqueue_activate(self):
+        """Run is activated once the queued job is run."""
+        r = self.F.RunFactory.create(status="draft")
+        u = self.F.UserFactory.create()
+
+        job = r.enqueue_activate(user=u)
+
+        self.assertEqual(self.refresh(r).status, "draft")
+        job = self.run_job(job)
+        self.assertEqual(job.status, "done")
+        r = self.refresh(r)
+        self.assertEqual(r.status, "active")
+        self.assertEqual(r.modified_by, u)
+
+
+    def test_enqueue_refresh(self):
+        """Queued refresh job locks in new suite cases for an active run."""
+        envs = self.F.EnvironmentFactory.create_full_set({"OS": ["Linux"]})
+        r = self.F.RunFactory.create(status="active", environments=envs)
+        cv = self.F.CaseVersionFactory.create(
+            productversion=r.productversion,
+            status="active",
+            environments=envs,
+            )
+        ts = self.F.SuiteFactory.create(
+            product=r.productversion.product, status="active")
+        self.F.SuiteCaseFactory.create(suite=ts, case=cv.case)
+        self.F.RunSuiteFactory.create(suite=ts, run=r)
+
+        self.run_job(r.enqueue_refresh())
+
+        self.assertEqual(
+            [rcv.caseversion for rcv in r.runcaseversions.all()], [cv])
+
+
+    def test_enqueue_clone_for_series(self):
+        """Queued job clones and activates a series run; result is its id."""
+        r = self.F.RunFactory.create(status="active", is_series=True)
+
+        job = self.run_job(r.enqueue_clone_for_series("1234"))
+
+        new = self.model.Run.objects.get(pk=job.get_result())
+        self.assertEqual(new.series, r)
+        self.assertEqual(new.build, "1234")
+        self.assertEqual(new.status, "active")
+
+
+    def test_get_jobs(self):
+        """Returns jobs for this run only, newest first."""
+        r = self.F.RunFactory.create()
+        j1 = r.enqueue_activate()
+        j2 = r.enqueue_refresh()
+        self.F.RunFactory.create().enqueue_activate()
+        self.model.Job.enqueue("run.activate")
+
+        self.assertEqual(list(r.get_jobs()), [j2, j1])
+
+
+
+class RunAddCaseVersionsTest(case.DBTestCase):
+    """Tests for ``Run.add_caseversions``."""
+    def setUp(self):
+        """Set up a run with two environments, and two caseversions."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux", "Windows"]})
+        self.pv = self.F.ProductVersionFactory.create(
+            environments=self.envs[:2])
+        self.run = self.F.RunFactory.create(productversion=self.pv)
+        self.cv1 = self.F.CaseVersionFactory.create(
+            productversion=self.pv, environments=self.envs)
+        self.cv2 = self.F.CaseVersionFactory.create(
+            productversion=self.pv, environments=self.envs[1:])
+
+
+    def test_creates(self):
+        """Creates runcaseversions; returns map of caseversion id to rcv id."""
+        u = self.F.UserFactory.create()
+
+        rcv_ids = self.run.add_caseversions([self.cv1.id, self.cv2.id], user=u)
+
+        rcvs = self.model.RunCaseVersion.objects.filter(run=self.run)
+        self.assertEqual(
+            rcv_ids, dict((rcv.caseversion_id, rcv.id) for rcv in rcvs))
+        self.assertEqual(len(rcv_ids), 2)
+        self.assertEqual(rcvs[0].created_by, u)
+
+
+    def test_environments(self):
+        """New rcvs get the environments their cv has in common with run."""
+        rcv_ids = self.run.add_caseversions([self.cv1.id, self.cv2.id])
+
+        self.assertEqual(
+            set(self.model.RunCaseVersion.objects.get(
+                    pk=rcv_ids[self.cv1.id]).environments.all()),
+            set(self.envs[:2]),
+            )
+        self.assertEqual(
+            set(self.model.RunCaseVersion.objects.get(
+                    pk=rcv_ids[self.cv2.id]).environments.all()),
+            set([self.envs[1]]),
+            )
+
+
+    def test_existing(self):
+        """Existing runcaseversions are reused and left alone."""
+        rcv = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion=self.cv1)
+        rcv.environments.clear()
+
+        rcv_ids = self.run.add_caseversions([self.cv1.id, self.cv2.id])
+
+        self.assertEqual(rcv_ids[self.cv1.id], rcv.id)
+        self.assertEqual(self.run.runcaseversions.count(), 2)
+        self.assertEqual(rcv.environments.count(), 0)
+
+
+    def test_summary(self):
+        """The run's stored summary total counts the new combinations."""
+        self.model.RunSummary.refresh(self.run)
+
+        self.run.add_caseversions([self.cv1.id, self.cv2.id])
+
+        self.assertEqual(self.run.get_summary().total, 3)
+
+
+    def test_query_count(self):
+        """The number of queries doesn't depend on the number of cvs."""
+        cv_ids = [
+            self.F.CaseVersionFactory.create(
+                productversion=self.pv, environments=self.envs).id
+            for i in range(5)
+            ]
+
+        # existing rcvs, insert, new rcvs, env links insert, summary update
+        with self.assertNumQueries(5):
+            self.run.add_caseversions(cv_ids)
+
+
+
 class RunActivationTest(case.DBTestCase):
     """Tests for activating runs and locking-in runcaseversions."""
 
@@ -449,6 +599,80 @@ class RunActivationTest(case.DBTestCase):
         self.assertOrderedCaseVersions(r, [tcv1, tcv2, tcv3, tcv4])
 
 
+    def _create_suite_run(self, num):
+        """Create a run with a suite of ``num`` ordered active caseversions."""
+        ts = self.F.SuiteFactory.create(product=self.p, status="active")
+        cvs = []
+        for i in range(num):
+            cv = self.F.CaseVersionFactory.create(
+                productversion=self.pv8, status="active")
+            self.F.SuiteCaseFactory.create(suite=ts, case=cv.case, order=i)
+            cvs.append(cv)
+        r = self.F.RunFactory.create(productversion=self.pv8)
+        self.F.RunSuiteFactory.create(suite=ts, run=r)
+        return r, ts, cvs
+
+
+    @patch("moztrap.model.execution.models.BULK_CHUNK_SIZE", 2)
+    def test_chunked(self):
+        """Bulk writes split into several chunks give the same result."""
+        r, ts, cvs = self._create_suite_run(5)
+
+        r.activate()
+
+        self.assertOrderedCaseVersions(r, cvs)
+        self.assertEqual(
+            self.F.model.RunCaseVersion.environments.through.objects.filter(
+                runcaseversion__run=r).count(),
+            20,
+            )
+
+
+    @patch("moztrap.model.execution.models.BULK_CHUNK_SIZE", 2)
+    def test_reorder_existing(self):
+        """Refreshing updates the order of only the moved runcaseversions."""
+        r, ts, cvs = self._create_suite_run(5)
+        r.activate()
+        rcvs = dict(
+            (rcv.caseversion_id, rcv) for rcv in r.runcaseversions.all())
+
+        ts.suitecases.filter(case=cvs[0].case).update(order=10)
+        r.refresh()
+
+        self.assertOrderedCaseVersions(r, cvs[1:] + cvs[:1])
+        self.assertEqual(
+            [self.refresh(rcvs[cv.id]).cc_version - rcvs[cv.id].cc_version
+             for cv in cvs],
+            [1, 1, 1, 1, 1],
+            )
+
+
+    def test_refresh_unchanged(self):
+        """Refreshing with nothing changed doesn't touch runcaseversions."""
+        r, ts, cvs = self._create_suite_run(3)
+        r.activate()
+        before = list(r.runcaseversions.values_list("id", "cc_version"))
+
+        r.refresh()
+
+        self.assertEqual(
+            list(r.runcaseversions.values_list("id", "cc_version")), before)
+
+
+    def test_deleted_environment_not_linked(self):
+        """A soft-deleted environment isn't linked to runcaseversions."""
+        r, ts, cvs = self._create_suite_run(1)
+        self.model.Environment.objects.filter(pk=self.envs[0].pk).update(
+            deleted_on=datetime.datetime.utcnow())
+
+        r.activate()
+
+        self.assertEqual(
+            set(r.runcaseversions.get().environments.all()),
+            set(self.envs[1:]),
+            )
+
+
     def test_sets_status_active(self):
         """Sets status of run to active."""
         r = self.F.RunFactory.create(status="draft")
@@ -666,17 +890,9 @@ class RunActivationTest(case.DBTestCase):
         Queries explained:
         ------------------
 
-        Query 1: Get the environment ids from this run
-
-            "SELECT `environments_environment`.`id` FROM
-            `environments_environment` INNER JOIN
-            `execution_run_environments` ON (`environments_environment`.`id`
-             = `execution_run_environments`.`environment_id`) WHERE (
-             `environments_environment`.`deleted_on` IS NULL AND
-             `execution_run_environments`.`run_id` = 1 )",
-
-        Query 2: Get the caseversion ids that SHOULD be included in this run,
-            in order
+        Query 1: Get the caseversion ids that SHOULD be included in this run,
+            in order.  Only environments of the run are joined in, so there
+            is no separate query for them.
 
             "SELECT DISTINCT cv.id as id
             FROM execution_run as r
@@ -691,43 +907,38 @@ class RunActivationTest(case.DBTestCase):
                     AND cv.productversion_id = r.productversion_id
                 INNER JOIN library_caseversion_environments as cve
                     ON cv.id = cve.caseversion_id
+                INNER JOIN execution_run_environments as re
+                    ON re.environment_id = cve.environment_id
+                    AND re.run_id = r.id
+                INNER JOIN environments_environment as e
+                    ON e.id = re.environment_id
             WHERE cv.status = 'active'
+                AND cv.deleted_on IS NULL
                 AND s.status = 'active'
+                AND e.deleted_on IS NULL
                 AND rs.run_id = 1
-                AND cve.environment_id IN (1,2,3,4)
-            ORDER BY rs.order, sc.order
+            ORDER BY rs.`order`, sc.`order`
             ",
 
-        Query 3-6: Get all the runcaseversions that are not in the result of
-         Query 2
-            to be used for delete. and then delete them.
+        Query 2: Get ids and caseversion ids of existing runcaseversions, to
+            find those that are not in the result of Query 1.
 
             "SELECT `execution_runcaseversion`.`id`,
-            `execution_runcaseversion`.`created_on`,
-            `execution_runcaseversion`.`created_by_id`,
-            `execution_runcaseversion`.`modified_on`,
-            `execution_runcaseversion`.`modified_by_id`,
-            `execution_runcaseversion`.`deleted_on`,
-            `execution_runcaseversion`.`deleted_by_id`,
-            `execution_runcaseversion`.`cc_version`,
-            `execution_runcaseversion`.`run_id`, `execution_runcaseversion`
-            .`caseversion_id`, `execution_runcaseversion`.`order` FROM
+            `execution_runcaseversion`.`caseversion_id` FROM
             `execution_runcaseversion` WHERE (`execution_runcaseversion`
             .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` =
-            1  AND NOT (`execution_runcaseversion`.`caseversion_id` IN (2,
-            3, 4, 5, 6, 7))) ORDER BY `execution_runcaseversion`.`order` ASC",
-
-            "SELECT `execution_result`.`id`, `execution_result`
-            .`created_on`, `execution_result`.`created_by_id`,
-            `execution_result`.`modified_on`,
-            `execution_result`.`modified_by_id`,
-            `execution_result`.`deleted_on`, `execution_result`
-            .`deleted_by_id`, `execution_result`.`cc_version`,
-            `execution_result`.`tester_id`, `execution_result`
-            .`runcaseversion_id`, `execution_result`.`environment_id`,
-            `execution_result`.`status`, `execution_result`.`comment`,
-            `execution_result`.`is_latest`, `execution_result`.`review`,
-            `execution_result`.`reviewed_by_id` FROM `execution_result`
+            1 ) ORDER BY `execution_runcaseversion`.`order` ASC",
+
+        Query 3-6: Delete those runcaseversions (one chunk), and the results
+            and environment links that cascade from them.
+
+            "SELECT `execution_runcaseversion`.`id`, ... FROM
+            `execution_runcaseversion` WHERE (`execution_runcaseversion`
+            .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` =
+            1  AND `execution_runcaseversion`.`id` IN (1))
+            ORDER BY `execution_runcaseversion`.`order` ASC",
+
+            "SELECT `execution_result`.`id`, ... FROM `execution_result`
             WHERE `execution_result`.`runcaseversion_id` IN (1)",
 
             "DELETE FROM `execution_runcaseversion_environments` WHERE
@@ -741,142 +952,109 @@ class RunActivationTest(case.DBTestCase):
             COUNT(`execution_runcaseversion`.`caseversion_id`) AS
             `num_records` FROM `execution_runcaseversion` WHERE (
             `execution_runcaseversion`.`deleted_on` IS NULL AND
-            `execution_runcaseversion`.`run_id` = 8 ) GROUP BY
+            `execution_runcaseversion`.`run_id` = 1 ) GROUP BY
             `execution_runcaseversion`.`caseversion_id` HAVING COUNT(
             `execution_runcaseversion`.`caseversion_id`) > 1  ORDER BY
             `execution_runcaseversion`.`order` ASC
 
-        Query 8: Get existing runcaseversions with the caseversion ids so we
-         can use
-            Them to build the new RunCaseVersion objects we will only be
-            updated
-            with order in the bulk create.
+        Query 8: Get the remaining runcaseversions with their caseversion ids
+            and order, so only new ones are created and only moved ones
+            updated.
 
             "SELECT `execution_runcaseversion`.`id`,
-            `execution_runcaseversion`.`caseversion_id` FROM
+            `execution_runcaseversion`.`caseversion_id`,
+            `execution_runcaseversion`.`order` FROM
             `execution_runcaseversion` WHERE (`execution_runcaseversion`
             .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` =
             1 ) ORDER BY `execution_runcaseversion`.`order` ASC",
 
-        Query 9: update order on existing rcvs
+        Query 9: update order on existing rcvs that moved (one chunk)
 
-            "UPDATE `execution_runcaseversion` SET `modified_on` =
-            '2013-03-15 01:00:08', `modified_by_id` = NULL, `order` = 4,
-            `cc_version` = `execution_runcaseversion`.`cc_version` + 1 WHERE
-             (`execution_runcaseversion`.`deleted_on` IS NULL AND
-             `execution_runcaseversion`.`run_id` = 8  AND
-             `execution_runcaseversion`.`caseversion_id` = 16 )",
+            "UPDATE `execution_runcaseversion`
+            SET `order` = CASE `id` WHEN 2 THEN 4 END,
+                `modified_on` = '2013-03-15 01:00:08',
+                `modified_by_id` = NULL,
+                `cc_version` = `cc_version` + 1
+            WHERE `id` IN (2)",
 
-        Query 10: bulk insert for RunCaseVersions
+        Query 10: bulk insert for RunCaseVersions (one chunk)
 
             "INSERT INTO `execution_runcaseversion` (`created_on`,
             `created_by_id`, `modified_on`, `modified_by_id`, `deleted_on`,
             `deleted_by_id`, `cc_version`, `run_id`, `caseversion_id`,
             `order`) VALUES ('2013-03-15 01:00:08', NULL,
-            '2013-03-15 01:00:08', NULL, NULL, NULL, 0, 8, 13, 1),
-            ('2013-03-15 01:00:08', NULL, '2013-03-15 01:00:08', NULL, NULL,
-             NULL, 0, 8, 14, 2), ('2013-03-15 01:00:08', NULL,
-             '2013-03-15 01:00:08', NULL, NULL, NULL, 0, 8, 15, 3),
-             ('2013-03-15 01:00:08', NULL, '2013-03-15 01:00:08', NULL, NULL,
-             NULL, 0, 8, 17, 5), ('2013-03-15 01:00:08', NULL,
-             '2013-03-15 01:00:08', NULL, NULL, NULL, 0, 8, 18, 6)"
-
-        Query 11: In order to add the runcaseversion_environment records,
-            we need to have all the relevant runcaseversions and prefetch the
-            environments for the caseversions
-
-            "SELECT `execution_runcaseversion`.`id`,
-            `execution_runcaseversion`.`created_on`,
-            `execution_runcaseversion`.`created_by_id`,
-            `execution_runcaseversion`.`modified_on`,
-            `execution_runcaseversion`.`modified_by_id`,
-            `execution_runcaseversion`.`deleted_on`,
-            `execution_runcaseversion`.`deleted_by_id`,
-            `execution_runcaseversion`.`cc_version`,
-            `execution_runcaseversion`.`run_id`, `execution_runcaseversion`
-            .`caseversion_id`, `execution_runcaseversion`.`order`,
-            `library_caseversion`.`id`, `library_caseversion`.`created_on`,
-            `library_caseversion`.`created_by_id`, `library_caseversion`
-            .`modified_on`, `library_caseversion`.`modified_by_id`,
-            `library_caseversion`.`deleted_on`, `library_caseversion`
-            .`deleted_by_id`, `library_caseversion`.`cc_version`,
-            `library_caseversion`.`status`, `library_caseversion`
-            .`productversion_id`, `library_caseversion`.`case_id`,
-            `library_caseversion`.`name`, `library_caseversion`
-            .`description`, `library_caseversion`.`latest`,
-            `library_caseversion`.`envs_narrowed` FROM
-            `execution_runcaseversion` INNER JOIN `library_caseversion` ON (
-            `execution_runcaseversion`.`caseversion_id` =
-            `library_caseversion`.`id`) WHERE (`execution_runcaseversion`
-            .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` =
-            1 ) ORDER BY `execution_runcaseversion`.`order` ASC",
-
-        Query 12: This is the prefetch_related query used with Query 9.  Django
-            makes a separate query and links them in-memory.
-
-            "SELECT (`library_caseversion_environments`.`caseversion_id`) AS
-             `_prefetch_related_val`, `environments_environment`.`id`,
-             `environments_environment`.`created_on`,
-             `environments_environment`.`created_by_id`,
-             `environments_environment`.`modified_on`,
-             `environments_environment`.`modified_by_id`,
-             `environments_environment`.`deleted_on`,
-             `environments_environment`.`deleted_by_id`,
-             `environments_environment`.`cc_version`,
-             `environments_environment`.`profile_id` FROM
-             `environments_environment` INNER JOIN
-             `library_caseversion_environments` ON (
-             `environments_environment`.`id` =
-             `library_caseversion_environments`.`environment_id`) WHERE (
-             `environments_environment`.`deleted_on` IS NULL AND
-             `library_caseversion_environments`.`caseversion_id` IN (2, 3,
-             4, 5, 6, 7))",
-
-        Query 13: runcaseversion_environments that already existed that
-        pertain to
-            the runcaseversions that are still relevant.
-
-            "SELECT `execution_runcaseversion_environments`
-            .`runcaseversion_id`, `execution_runcaseversion_environments`
-            .`environment_id` FROM `execution_runcaseversion_environments`
-            WHERE `execution_runcaseversion_environments`
-            .`runcaseversion_id` IN (3, 4, 5, 2, 6, 7)",
-
-        Query 14: Get the environments for this run so we can find the
-        intersection
-            with the caseversions.
-
-            "SELECT `environments_environment`.`id` FROM
-            `environments_environment` INNER JOIN
-            `execution_run_environments` ON (`environments_environment`.`id`
-             = `execution_run_environments`.`environment_id`) WHERE (
-             `environments_environment`.`deleted_on` IS NULL AND
-             `execution_run_environments`.`run_id` = 1 )",
-
-        Query 15: Find the runcaseversion_environments that are no longer
-        relevant.
-
-            "SELECT `execution_runcaseversion_environments`.`id`,
-            `execution_runcaseversion_environments`.`runcaseversion_id`,
-            `execution_runcaseversion_environments`.`environment_id` FROM
-            `execution_runcaseversion_environments`
-            WHERE ((`execution_runcaseversion_environments`.`runcaseversion_id`
-            = 2  AND `execution_runcaseversion_environments`.`environment_id`
-            = 5 ))",
-
-        Query 16: Delete the runcaseversion_environments that pertained to the
-            caseversion that are no longer relevant.
-
-            "DELETE FROM `execution_runcaseversion_environments` WHERE `id`
-            IN (9)",
-
-        Query 17: Bulk insert of runcaseversion_environment mappings.
+            '2013-03-15 01:00:08', NULL, NULL, NULL, 0, 1, 3, 1),
+            ... ('2013-03-15 01:00:08', NULL, '2013-03-15 01:00:08', NULL,
+            NULL, NULL, 0, 1, 7, 6)"
+
+        Query 11: Delete runcaseversion_environments that are no longer
+            in both the run and the caseversion.
+
+            "DELETE FROM `execution_runcaseversion_environments`
+            WHERE runcaseversion_id IN (
+                SELECT id FROM execution_runcaseversion
+                WHERE run_id = 1 AND deleted_on IS NULL)
+            AND NOT EXISTS (
+                SELECT 1 FROM execution_runcaseversion as rcv
+                    INNER JOIN library_caseversion_environments as cve
+                        ON cve.caseversion_id = rcv.caseversion_id
+                    INNER JOIN execution_run_environments as re
+                        ON re.environment_id = cve.environment_id
+                        AND re.run_id = rcv.run_id
+                    INNER JOIN environments_environment as e
+                        ON e.id = cve.environment_id
+                WHERE rcv.run_id = 1
+                    AND rcv.deleted_on IS NULL
+                    AND e.deleted_on IS NULL
+                    AND rcv.id = `execution_runcaseversion_environments`
+                        .runcaseversion_id
+                    AND cve.environment_id =
+                        `execution_runcaseversion_environments`
+                        .environment_id)",
+
+        Query 12: Insert the runcaseversion_environments that are missing.
 
             "INSERT INTO `execution_runcaseversion_environments`
-            (`runcaseversion_id`, `environment_id`) VALUES (7, 3), (5, 4),
-            (3, 1), (3, 3), (6, 4), (7, 4), (5, 2), (6, 1), (4, 4), (3, 2),
-            (7, 1), (6, 3), (6, 2), (4, 3), (4, 2), (3, 4), (5, 1), (4, 1),
-            (7, 2), (5, 3)",
+                (runcaseversion_id, environment_id)
+            SELECT rcv.id, cve.environment_id
+            FROM execution_runcaseversion as rcv
+                INNER JOIN ... (as in Query 11)
+            WHERE rcv.run_id = 1
+                AND rcv.deleted_on IS NULL
+                AND e.deleted_on IS NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM `execution_runcaseversion_environments`
+                        as existing
+                    WHERE existing.runcaseversion_id = rcv.id
+                    AND existing.environment_id = cve.environment_id)",
+
+        Query 13-16: Recount the results and case/env combos of the run for
+            its ``RunSummary``, and look for an existing summary.
+
+            "SELECT `execution_result`.`status`, COUNT(`execution_result`
+            .`id`) AS `count` FROM `execution_result` INNER JOIN
+            `execution_runcaseversion` ON (`execution_result`
+            .`runcaseversion_id` = `execution_runcaseversion`.`id`) WHERE
+            (`execution_result`.`deleted_on` IS NULL AND
+            `execution_runcaseversion`.`run_id` = 1  AND
+            `execution_result`.`is_latest` = 1  AND
+            `execution_result`.`status` IN ('passed', 'failed',
+            'invalidated')) GROUP BY `execution_result`.`status`",
+
+            "SELECT COUNT(DISTINCT ...) FROM (SELECT DISTINCT
+            `execution_result`.`runcaseversion_id`, `execution_result`
+            .`environment_id` ...)",
+
+            "SELECT COUNT(*) FROM `execution_runcaseversion_environments`
+            INNER JOIN `execution_runcaseversion` ON ...
+            WHERE `execution_runcaseversion`.`run_id` = 1 ",
+
+            "SELECT ... FROM `execution_runsummary` WHERE
+            `execution_runsummary`.`run_id` = 1 ",
+
+        Query 17: Store the new ``RunSummary``.
+
+            "INSERT INTO `execution_runsummary` ..."
 
         Query 18: Update the test run to make it active.
 
@@ -940,7 +1118,9 @@ class RunActivationTest(case.DBTestCase):
         connection.queries = []
 
         try:
-            with self.assertNumQueries(18):
+            # deleting unneeded runcaseversions also checks for their
+            # archived results
+            with self.assertNumQueries(19):
                 r.activate()
 
             # to debug, uncomment these lines:
@@ -955,7 +1135,7 @@ class RunActivationTest(case.DBTestCase):
             deletes = [x["sql"] for x in connection.queries if x["sql"].startswith("DELETE")]
 
             self.assertEqual(len(selects), 11)
-            self.assertEqual(len(inserts), 2)
+            self.assertEqual(len(inserts), 3)
             self.assertEqual(len(updates), 2)
             self.assertEqual(len(deletes), 3)
         except AssertionError as e:
@@ -464,3 +464,117 @@ class RunCaseVersionTest(case.DBTestCase):
 
         r = rcv.results.get(is_latest=True)
         self.assertEqual(r.stepresults.count(), 0)
+
+
+
+class RunCaseVersionResultStatsTest(case.DBTestCase):
+    """Tests for batch-loading result stats with ``with_result_stats``."""
+    def setUp(self):
+        """Set up two runcaseversions in two envs, with results."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        self.rcv1 = self.F.RunCaseVersionFactory.create(environments=self.envs)
+        self.rcv2 = self.F.RunCaseVersionFactory.create(
+            environments=self.envs[:1])
+        self.t1 = self.F.UserFactory.create()
+        self.t2 = self.F.UserFactory.create()
+
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv1, environment=self.envs[0],
+            tester=self.t1, status="failed")
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv1, environment=self.envs[0],
+            tester=self.t1, status="passed")
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv1, environment=self.envs[1],
+            tester=self.t2, status="started")
+        sr = self.F.StepResultFactory.create(
+            result__runcaseversion=self.rcv2,
+            result__environment=self.envs[0],
+            result__tester=self.t2,
+            result__status="invalidated",
+            bug_url="http://www.example.com/bug1")
+        self.F.StepResultFactory.create(
+            result=sr.result, bug_url="http://www.example.com/bug1")
+
+
+    def get_rcvs(self):
+        """Return list of both runcaseversions, with stats loaded."""
+        return list(
+            self.model.RunCaseVersion.objects.with_result_stats().filter(
+                pk__in=[self.rcv1.pk, self.rcv2.pk]).order_by("id"))
+
+
+    def assertSameStats(self, batched, single):
+        """Assert that batch-loaded stats equal individually queried ones."""
+        self.assertEqual(batched.completion(), single.completion())
+        self.assertEqual(batched.result_summary(), single.result_summary())
+        self.assertEqual(set(batched.testers()), set(single.testers()))
+        self.assertEqual(batched.bug_urls(), single.bug_urls())
+
+
+    def test_matches_individual(self):
+        """Batch-loaded stats match those of individual instances."""
+        rcv1, rcv2 = self.get_rcvs()
+
+        self.assertSameStats(rcv1, self.rcv1)
+        self.assertSameStats(rcv2, self.rcv2)
+
+
+    def test_values(self):
+        """Batch-loaded stats have the expected values."""
+        rcv1, rcv2 = self.get_rcvs()
+
+        self.assertEqual(rcv1.completion(), 0.5)
+        self.assertEqual(
+            rcv1.result_summary(),
+            {"passed": 1, "failed": 0, "invalidated": 0})
+        self.assertEqual(rcv1.testers(), [self.t1, self.t2])
+        self.assertEqual(rcv1.bug_urls(), set())
+        self.assertEqual(rcv2.completion(), 1)
+        self.assertEqual(rcv2.bug_urls(), set(["http://www.example.com/bug1"]))
+
+
+    def test_constant_queries(self):
+        """Loading stats costs the same number of queries for any page size."""
+        with self.assertNumQueries(7):
+            rcvs = self.get_rcvs()
+
+        with self.assertNumQueries(0):
+            for rcv in rcvs:
+                rcv.completion()
+                rcv.result_summary()
+                rcv.testers()
+                rcv.bug_urls()
+
+
+    def test_survives_clone(self):
+        """Stats loading carries through to sliced and filtered clones."""
+        qs = self.model.RunCaseVersion.objects.with_result_stats()
+
+        rcv = qs.filter(pk=self.rcv1.pk).order_by("id")[:1][0]
+
+        self.assertEqual(rcv._completion, 0.5)
+
+
+    def test_not_by_default(self):
+        """Without ``with_result_stats``, nothing is attached."""
+        rcv = self.model.RunCaseVersion.objects.get(pk=self.rcv1.pk)
+
+        self.assertFalse(hasattr(rcv, "_completion"))
+
+
+    def test_empty(self):
+        """An empty page doesn't query for stats."""
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(self.model.RunCaseVersion.objects.with_result_stats(
+                    ).filter(pk=0)),
+                [])
+
+
+    def test_related_manager(self):
+        """Runcaseversions of a run can batch-load stats too."""
+        rcv = self.rcv1.run.runcaseversions.with_result_stats().get()
+
+        self.assertEqual(rcv._completion, 0.5)
@@ -0,0 +1,251 @@
+"""
+Tests for RunSummary model.
+
+"""
+from mock import patch
+
+from tests import case
+
+
+
+class RunSummaryTest(case.DBTestCase):
+    """Tests for RunSummary and its incremental maintenance."""
+    def setUp(self):
+        """Set up a run with two envs and a runcaseversion in both."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        pv = self.F.ProductVersionFactory(environments=self.envs)
+        self.run = self.F.RunFactory(productversion=pv)
+        self.rcv = self.F.RunCaseVersionFactory(
+            run=self.run, caseversion__productversion=pv)
+        self.user = self.F.UserFactory()
+
+
+    def stored(self):
+        """Return the RunSummary for the run as it is in the database."""
+        return self.model.RunSummary.everything.get(run=self.run)
+
+
+    def assertStored(self, **expected):
+        """Assert stored counters for the run; unlisted ones must be 0."""
+        summary = self.stored()
+        self.assertEqual(
+            dict((c, getattr(summary, c)) for c in summary.COUNTERS),
+            dict((c, expected.get(c, 0)) for c in summary.COUNTERS),
+            )
+
+
+    def test_unicode(self):
+        """Unicode representation names the run."""
+        self.run.name = "FF10"
+
+        self.assertEqual(
+            unicode(self.model.RunSummary(run=self.run)),
+            u"Summary of run 'FF10'")
+
+
+    def test_built_on_first_use(self):
+        """A run's summary is counted from scratch the first time it's needed."""
+        self.rcv.result_pass(self.envs[0], user=self.user)
+
+        self.assertFalse(
+            self.model.RunSummary.everything.filter(run=self.run).exists())
+
+        self.assertEqual(self.run.completion(), 0.5)
+        self.assertStored(passed=1, completed=1, total=2)
+
+
+    def test_new_result_counted(self):
+        """A new completed result is added to the stored summary."""
+        self.run.get_summary()
+
+        self.rcv.result_fail(self.envs[0], user=self.user)
+
+        self.assertStored(failed=1, completed=1, total=2)
+
+
+    def test_uncompleted_result_not_counted(self):
+        """A started result doesn't change the summary."""
+        self.run.get_summary()
+
+        self.rcv.start(self.envs[0], user=self.user)
+
+        self.assertStored(total=2)
+
+
+    def test_superseded_result_subtracted(self):
+        """A result that is no longer latest is subtracted again."""
+        self.run.get_summary()
+
+        self.rcv.result_fail(self.envs[0], user=self.user)
+        self.rcv.result_pass(self.envs[0], user=self.user)
+
+        self.assertStored(passed=1, completed=1, total=2)
+
+
+    def test_other_testers_results_kept(self):
+        """Latest results of different testers are counted separately."""
+        self.run.get_summary()
+
+        self.rcv.result_fail(self.envs[0], user=self.user)
+        self.rcv.result_pass(self.envs[0], user=self.F.UserFactory())
+
+        self.assertStored(passed=1, failed=1, completed=1, total=2)
+
+
+    def test_completed_combos(self):
+        """Completed count is distinct case/env combos with a result."""
+        self.run.get_summary()
+
+        self.rcv.result_pass(self.envs[0], user=self.user)
+        self.rcv.result_pass(self.envs[1], user=self.user)
+
+        self.assertStored(passed=2, completed=2, total=2)
+        self.assertEqual(self.refresh(self.run).completion(), 1)
+
+
+    def test_changed_result_recounted(self):
+        """Changing an existing result recounts the summary."""
+        self.rcv.result_pass(self.envs[0], user=self.user)
+        self.run.get_summary()
+
+        r = self.rcv.results.get()
+        r.status = "failed"
+        r.save()
+
+        self.assertStored(failed=1, completed=1, total=2)
+
+
+    def test_new_runcaseversion_adds_total(self):
+        """A new runcaseversion adds its environments to the total."""
+        self.run.get_summary()
+
+        self.F.RunCaseVersionFactory(
+            run=self.run,
+            caseversion__productversion=self.run.productversion)
+
+        self.assertStored(total=4)
+
+
+    def test_env_removal_recounted(self):
+        """Removing environments from a run recounts its summary."""
+        self.rcv.result_pass(self.envs[0], user=self.user)
+        self.run.get_summary()
+
+        self.run.remove_envs(self.envs[1])
+
+        self.assertStored(passed=1, completed=1, total=1)
+
+
+    def test_deleted_result(self):
+        """Deleting a result recounts the stored summary."""
+        self.run.get_summary()
+        self.rcv.result_pass(self.envs[0], user=self.user)
+        result = self.model.Result.objects.get()
+
+        result.delete()
+
+        self.assertStored(total=2)
+
+
+    def test_deleted_results_queryset(self):
+        """Deleting a queryset of results recounts the stored summary."""
+        self.run.get_summary()
+        self.rcv.result_pass(self.envs[0], user=self.user)
+
+        self.model.Result.objects.all().delete()
+
+        self.assertStored(total=2)
+
+
+    def test_undeleted_result(self):
+        """Undeleting a result recounts the stored summary."""
+        self.run.get_summary()
+        self.rcv.result_pass(self.envs[0], user=self.user)
+        result = self.model.Result.objects.get()
+        result.delete()
+
+        self.refresh(result).undelete()
+
+        self.assertStored(passed=1, completed=1, total=2)
+
+
+    def test_refreshed_on_activate(self):
+        """Activating a run recounts its summary."""
+        self.run.get_summary()
+        self.model.RunSummary.everything.filter(run=self.run).update(
+            total=10, passed=3)
+
+        self.run.activate()
+
+        self.assertStored()
+
+
+    def test_adjust_without_summary(self):
+        """Adjusting a run with no stored summary does nothing."""
+        self.model.RunSummary.adjust(self.run, passed=1)
+
+        self.assertFalse(
+            self.model.RunSummary.everything.filter(run=self.run).exists())
+
+
+    def test_refresh_returns_current(self):
+        """``refresh`` updates and returns the existing summary."""
+        first = self.model.RunSummary.refresh(self.run)
+        self.rcv.results.create(
+            environment=self.envs[0], tester=self.user, status="invalidated")
+
+        second = self.model.RunSummary.refresh(self.run.id)
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(second.invalidated, 1)
+        self.assertEqual(self.refresh(second).cc_version, second.cc_version)
+
+
+    def test_refresh_concurrent_create(self):
+        """If the summary is created meanwhile, ``refresh`` updates that."""
+        first = self.model.RunSummary.refresh(self.run)
+        self.rcv.results.create(
+            environment=self.envs[0], tester=self.user, status="invalidated")
+
+        # the summary didn't exist yet when looked up...
+        with patch.object(self.model.RunSummary.everything, "get") as get:
+            get.side_effect = self.model.RunSummary.DoesNotExist
+            second = self.model.RunSummary.refresh(self.run)
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(self.model.RunSummary.everything.count(), 1)
+        self.assertEqual(self.refresh(first).invalidated, 1)
+
+
+    def test_result_summary(self):
+        """``result_summary`` returns dict of stored result counts."""
+        s = self.model.RunSummary(passed=2, failed=1, invalidated=3)
+
+        self.assertEqual(
+            s.result_summary(), {"passed": 2, "failed": 1, "invalidated": 3})
+
+
+    def test_completion_empty(self):
+        """If no case/env combos, ``completion`` returns zero."""
+        self.assertEqual(self.model.RunSummary().completion(), 0)
+
+
+    def test_select_related(self):
+        """Summary can be selected along with the run."""
+        self.run.get_summary()
+
+        run = self.model.Run.objects.select_related("summary").get(
+            pk=self.run.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(run.completion(), 0)
+
+
+    def test_select_related_missing(self):
+        """A run selected without a stored summary still gets one built."""
+        run = self.model.Run.objects.select_related("summary").get(
+            pk=self.run.pk)
+
+        self.assertEqual(run.result_summary()["passed"], 0)
+        self.assertStored(total=2)
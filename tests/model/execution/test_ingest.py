@@ -0,0 +1,542 @@
+"""Tests for bulk result ingest."""
+import json
+
+from django.core.exceptions import ValidationError
+
+from mock import patch
+
+from tests import case
+
+
+
+class IngestResultsTest(case.DBTestCase):
+    """Tests for ``ingest_results``."""
+    def setUp(self):
+        """Set up a run of two caseversions in two environments."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux"]})
+        pv = self.F.ProductVersionFactory.create(environments=self.envs)
+        self.run = self.F.RunFactory.create(productversion=pv)
+        self.cv1 = self.F.CaseVersionFactory.create(
+            case__product=pv.product, productversion=pv)
+        self.cv2 = self.F.CaseVersionFactory.create(
+            case__product=pv.product, productversion=pv)
+        self.step = self.F.CaseStepFactory.create(caseversion=self.cv2)
+        self.rcv1 = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion=self.cv1, environments=self.envs)
+        self.rcv2 = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion=self.cv2, environments=self.envs)
+        self.user = self.F.UserFactory.create()
+
+
+    def ingest(self, items, **kwargs):
+        """Ingest ``items`` for self.user; return ``IngestResult``."""
+        from moztrap.model.execution.ingest import ingest_results
+        return ingest_results(items, self.user, **kwargs)
+
+
+    def item(self, cv, env, status="passed", **kwargs):
+        """Return submitted result dict for ``cv`` in ``env``."""
+        item = {
+            "case": str(cv.case.id),
+            "environment": str(env.id),
+            "run_id": str(self.run.id),
+            "status": status,
+            }
+        item.update(kwargs)
+        return item
+
+
+    def test_create(self):
+        """Creates latest results with the submitted values."""
+        outcome = self.ingest(
+            [
+                self.item(self.cv1, self.envs[0]),
+                self.item(
+                    self.cv1, self.envs[1], "invalidated", comment="huh"),
+                ]
+            )
+
+        self.assertEqual(outcome.created, 2)
+        self.assertEqual(outcome.errors, [])
+        r1, r2 = self.model.Result.objects.order_by("id")
+        self.assertEqual(
+            (r1.runcaseversion, r1.environment, r1.status, r1.tester),
+            (self.rcv1, self.envs[0], "passed", self.user),
+            )
+        self.assertEqual(
+            (r2.environment, r2.status, r2.comment),
+            (self.envs[1], "invalidated", "huh"),
+            )
+        self.assertTrue(r1.is_latest and r2.is_latest)
+        self.assertEqual(r1.created_by, self.user)
+
+
+    def test_failed_step(self):
+        """A failed result with step number gets a failed step result."""
+        self.ingest(
+            [
+                self.item(
+                    self.cv2,
+                    self.envs[0],
+                    "failed",
+                    stepnumber=1,
+                    bug="http://example.com/1",
+                    ),
+                self.item(self.cv2, self.envs[1], "failed", stepnumber=3),
+                ]
+            )
+
+        sr = self.model.StepResult.objects.get()
+        self.assertEqual(sr.step, self.step)
+        self.assertEqual(sr.status, "failed")
+        self.assertEqual(sr.bug_url, "http://example.com/1")
+        self.assertEqual(sr.result.environment, self.envs[0])
+
+
+    def test_failed_steps_same_environment(self):
+        """Each failed step result belongs to the result it was sent with."""
+        self.ingest(
+            [
+                self.item(
+                    self.cv2,
+                    self.envs[0],
+                    "failed",
+                    stepnumber=1,
+                    bug="http://example.com/1",
+                    ),
+                self.item(self.cv1, self.envs[0], "failed"),
+                self.item(
+                    self.cv2,
+                    self.envs[0],
+                    "failed",
+                    stepnumber=1,
+                    bug="http://example.com/2",
+                    ),
+                ]
+            )
+
+        results = self.model.Result.objects.filter(
+            runcaseversion=self.rcv2).order_by("id")
+        self.assertEqual(
+            [r.stepresults.get().bug_url for r in results],
+            ["http://example.com/1", "http://example.com/2"],
+            )
+
+
+    def test_failed_bumps_runcaseversion(self):
+        """A failed result marks its runcaseversion modified by the user."""
+        self.ingest([self.item(self.cv1, self.envs[0], "failed")])
+
+        rcv = self.refresh(self.rcv1)
+        self.assertEqual(rcv.modified_by, self.user)
+        self.assertEqual(rcv.cc_version, self.rcv1.cc_version + 1)
+
+
+    def test_supersedes_latest(self):
+        """New results unset is_latest on this user's previous results."""
+        mine = self.F.ResultFactory.create(
+            runcaseversion=self.rcv1,
+            environment=self.envs[0],
+            tester=self.user,
+            status="failed",
+            )
+        other_env = self.F.ResultFactory.create(
+            runcaseversion=self.rcv1,
+            environment=self.envs[1],
+            tester=self.user,
+            status="failed",
+            )
+        theirs = self.F.ResultFactory.create(
+            runcaseversion=self.rcv1,
+            environment=self.envs[0],
+            status="failed",
+            )
+
+        self.ingest([self.item(self.cv1, self.envs[0])])
+
+        self.assertFalse(self.refresh(mine).is_latest)
+        self.assertTrue(self.refresh(other_env).is_latest)
+        self.assertTrue(self.refresh(theirs).is_latest)
+
+
+    def test_last_duplicate_latest(self):
+        """Of duplicates within a batch, only the last one is latest."""
+        self.ingest(
+            [
+                self.item(self.cv1, self.envs[0], "failed"),
+                self.item(self.cv1, self.envs[0], "passed"),
+                ]
+            )
+
+        self.assertEqual(
+            list(
+                self.model.Result.objects.order_by("id").values_list(
+                    "status", "is_latest")),
+            [("failed", False), ("passed", True)],
+            )
+
+
+    def test_summary(self):
+        """The run's stored summary is kept up to date."""
+        self.model.RunSummary.refresh(self.run)
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv1,
+            environment=self.envs[0],
+            tester=self.user,
+            status="failed",
+            )
+
+        self.ingest(
+            [
+                self.item(self.cv1, self.envs[0]),
+                self.item(self.cv2, self.envs[0], "failed"),
+                self.item(self.cv2, self.envs[0], "invalidated"),
+                self.item(self.cv2, self.envs[1], "failed"),
+                ]
+            )
+
+        summary = self.model.RunSummary.objects.get(run=self.run)
+        self.assertEqual(
+            dict((k, getattr(summary, k)) for k in summary.COUNTERS),
+            self.model.RunSummary.compute(self.run),
+            )
+        self.assertEqual(summary.passed, 1)
+        self.assertEqual(summary.failed, 1)
+        self.assertEqual(summary.invalidated, 1)
+        self.assertEqual(summary.completed, 3)
+
+
+    def test_errors(self):
+        """Bad items are reported by index; the rest are recorded."""
+        outcome = self.ingest(
+            [
+                self.item(self.cv1, self.envs[0]),
+                {"case": "1", "environment": "1", "run_id": "1"},
+                self.item(self.cv1, self.envs[0], "bogus"),
+                self.item(self.cv1, self.envs[0], case="foo"),
+                "not a dict",
+                ],
+            offset=10,
+            )
+
+        self.assertEqual(outcome.created, 1)
+        self.assertEqual(
+            outcome.errors,
+            [
+                (11, "bad result object data missing key: 'status'"),
+                (12, "invalid result status: bogus"),
+                (13, "bad result object data: invalid literal for int() "
+                 "with base 10: 'foo'"),
+                (14, "result object must be a dictionary"),
+                ]
+            )
+        self.assertEqual(self.model.Result.objects.count(), 1)
+
+
+    def test_unresolvable(self):
+        """Unknown environments and runcaseversions are errors."""
+        other_env = self.F.EnvironmentFactory.create()
+        outcome = self.ingest(
+            [
+                self.item(self.cv1, self.envs[0], environment="0"),
+                self.item(self.cv1, other_env),
+                ]
+            )
+
+        self.assertEqual(outcome.created, 0)
+        self.assertEqual(
+            outcome.errors,
+            [
+                (0, "Specified environment does not exist: 0"),
+                (1, "RunCaseVersion not found for run: {0}, case: {1}, "
+                 "environment: {2}".format(
+                        self.run.id, self.cv1.case.id, other_env.id)),
+                ]
+            )
+
+
+    def test_as_dict(self):
+        """``as_dict`` returns a JSON-friendly summary."""
+        outcome = self.ingest(
+            [self.item(self.cv1, self.envs[0]), {}])
+
+        self.assertEqual(
+            outcome.as_dict(),
+            {
+                "created": 1,
+                "errors": [
+                    {
+                        "index": 1,
+                        "error": "bad result object data missing key: "
+                        "'status'",
+                        },
+                    ],
+                }
+            )
+
+
+    def test_queries(self):
+        """The number of queries doesn't depend on the number of results."""
+        items = [
+            self.item(cv, env, status, stepnumber=1)
+            for cv in [self.cv1, self.cv2]
+            for env in self.envs
+            for status in ["passed", "failed"]
+            ]
+
+        # 1 env lookup, 1 rcv lookup, 1 env link lookup, 1 previous results
+        # lookup, 2 latest updates (one per env), 1 max result id, 1 results
+        # insert, 1 result ids lookup, 1 step lookup, 1 step result insert,
+        # 1 rcv update, 1 summary update
+        with self.assertNumQueries(13):
+            self.ingest(items)
+
+        self.assertEqual(self.model.Result.objects.count(), 8)
+        self.assertEqual(self.model.StepResult.objects.count(), 2)
+
+
+
+class IngestStreamTest(case.DBTestCase):
+    """Tests for ``ingest_stream``."""
+    def setUp(self):
+        """Set up a runcaseversion in an environment."""
+        self.rcv = self.F.RunCaseVersionFactory.create()
+        self.env = self.F.EnvironmentFactory.create()
+        self.rcv.environments.add(self.env)
+        self.user = self.F.UserFactory.create()
+
+
+    def line(self, status="passed"):
+        """Return a line of newline-delimited JSON for a result."""
+        return json.dumps(
+            {
+                "case": self.rcv.caseversion.case.id,
+                "environment": self.env.id,
+                "run_id": self.rcv.run.id,
+                "status": status,
+                }
+            ) + "\n"
+
+
+    def ingest(self, lines, **kwargs):
+        """Ingest ``lines`` for self.user; return ``StreamIngestResult``."""
+        from moztrap.model.execution.ingest import ingest_stream
+        return ingest_stream(iter(lines), self.user, **kwargs)
+
+
+    def test_ingest(self):
+        """Records results from lines of JSON; ignores blank lines."""
+        outcome = self.ingest(
+            [self.line(), "\n", self.line("failed"), "{oops\n"])
+
+        data = outcome.as_dict()
+        errors = data.pop("errors")
+        self.assertEqual(
+            data,
+            {"created": 2, "processed": 4, "chunks": 1, "error_count": 1},
+            )
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]["index"], 3)
+        self.assertTrue(errors[0]["error"].startswith("invalid JSON: "))
+        self.assertEqual(
+            list(
+                self.model.Result.objects.order_by("id").values_list(
+                    "status", flat=True)),
+            ["passed", "failed"],
+            )
+
+
+    def test_chunks(self):
+        """Commits results in chunks, reporting progress after each."""
+        seen = []
+        outcome = self.ingest(
+            [self.line()] * 5,
+            chunk_size=2,
+            progress=lambda o: seen.append((o.processed, o.created)),
+            )
+
+        self.assertEqual(outcome.chunks, 3)
+        self.assertEqual(seen, [(2, 2), (4, 4), (5, 5)])
+
+
+    def test_error_indexes(self):
+        """Errors are reported by line index across chunks."""
+        outcome = self.ingest(
+            [self.line(), self.line(), self.line("bogus"), "{}\n"],
+            chunk_size=2,
+            )
+
+        self.assertEqual(
+            outcome.errors,
+            [
+                (2, "invalid result status: bogus"),
+                (3, "bad result object data missing key: 'status'"),
+                ]
+            )
+
+
+    def test_skip(self):
+        """Skipped lines are counted as processed but not recorded."""
+        outcome = self.ingest(
+            [self.line("failed"), self.line("failed"), self.line()], skip=2)
+
+        self.assertEqual((outcome.processed, outcome.created), (3, 1))
+        self.assertEqual(
+            self.model.Result.objects.get().status, "passed")
+
+
+    def test_max_errors(self):
+        """Only the first ``max_errors`` errors are kept; all are counted."""
+        outcome = self.ingest(["{}\n"] * 3, max_errors=2)
+
+        self.assertEqual(outcome.error_count, 3)
+        self.assertEqual([i for i, m in outcome.errors], [0, 1])
+
+
+
+class RecordRunResultsTest(case.DBTestCase):
+    """Tests for ``record_run_results``."""
+    def setUp(self):
+        """Set up a new run, and a caseversion in its product version."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux"]})
+        pv = self.F.ProductVersionFactory.create(environments=self.envs)
+        self.run = self.F.RunFactory.create(productversion=pv)
+        self.cv = self.F.CaseVersionFactory.create(
+            productversion=pv, environments=self.envs[:1])
+        self.user = self.F.UserFactory.create()
+
+
+    def record(self, items):
+        """Record ``items`` for self.run and self.user."""
+        from moztrap.model.execution.ingest import record_run_results
+        return record_run_results(self.run, items, self.user)
+
+
+    def item(self, env, status="passed", **kwargs):
+        """Return submitted result dict for self.cv in ``env``."""
+        item = {
+            "case": str(self.cv.case.id),
+            "environment": str(env.id),
+            "status": status,
+            }
+        item.update(kwargs)
+        return item
+
+
+    def test_record(self):
+        """Adds the case to the run and records the results."""
+        self.record(
+            [self.item(self.envs[0]), self.item(self.envs[1], "failed")])
+
+        rcv = self.model.RunCaseVersion.objects.get(run=self.run)
+        self.assertEqual(rcv.caseversion, self.cv)
+        self.assertEqual(list(rcv.environments.all()), [self.envs[0]])
+        self.assertEqual(
+            list(
+                rcv.results.order_by("id").values_list(
+                    "environment", "status", "tester")),
+            [
+                (self.envs[0].id, "passed", self.user.id),
+                (self.envs[1].id, "failed", self.user.id),
+                ]
+            )
+
+
+    def test_bad_case(self):
+        """Nothing is recorded if a case isn't in the product version."""
+        other = self.F.CaseFactory.create()
+
+        with self.assertRaises(ValidationError) as cm:
+            self.record(
+                [self.item(self.envs[0]), self.item(self.envs[0], case=other.id)])
+
+        self.assertEqual(
+            cm.exception.messages,
+            [
+                "No caseversion in product version {0} for case(s): {1}".format(
+                    self.run.productversion.id, other.id)
+                ]
+            )
+        self.assertEqual(self.model.RunCaseVersion.objects.count(), 0)
+
+
+    def test_bad_environment(self):
+        """Nothing is recorded if an environment doesn't exist."""
+        with self.assertRaises(ValidationError) as cm:
+            self.record([self.item(self.envs[0], environment="0")])
+
+        self.assertEqual(
+            cm.exception.messages,
+            ["Specified environment does not exist: 0"],
+            )
+
+
+    def test_bad_item(self):
+        """Nothing is recorded if an item is malformed."""
+        with self.assertRaises(ValidationError):
+            self.record([{"case": str(self.cv.case.id)}])
+
+
+    def test_query_count(self):
+        """The number of queries doesn't depend on the number of results."""
+        items = [self.item(self.envs[0])]
+        for i in range(5):
+            cv = self.F.CaseVersionFactory.create(
+                productversion=self.run.productversion,
+                environments=self.envs,
+                )
+            items.append(
+                self.item(self.envs[1], "invalidated", case=str(cv.case.id)))
+
+        # 1 caseversion lookup, 1 environment lookup, 5 to add caseversions,
+        # 1 previous results lookup, 2 latest updates, 1 max result id,
+        # 1 results insert, 1 result ids lookup, 1 summary update
+        with self.assertNumQueries(14):
+            self.record(items)
+
+        self.assertEqual(self.model.Result.objects.count(), 6)
+
+
+
+class RecordRunResultsTransactionTest(case.TransactionTestCase):
+    """Transactional tests for creating a run with results via the API."""
+    def test_bad_result_rolls_back_run(self):
+        """A result that fails to record rolls back the run created for it."""
+        from django.db import DatabaseError
+        from django.http import HttpRequest
+        from tastypie.bundle import Bundle
+        from moztrap.model.execution.api import RunResource
+
+        env = self.F.EnvironmentFactory.create()
+        pv = self.F.ProductVersionFactory.create(environments=[env])
+        cv = self.F.CaseVersionFactory.create(
+            productversion=pv, environments=[env])
+        self.F.CaseStepFactory.create(caseversion=cv)
+        request = HttpRequest()
+        request.user = self.F.UserFactory.create()
+        data = {
+            "name": "a run",
+            "productversion": "/api/v1/productversion/{0}/".format(pv.id),
+            "environments": ["/api/v1/environment/{0}/".format(env.id)],
+            "runcaseversions": [
+                {
+                    "case": str(cv.case.id),
+                    "environment": str(env.id),
+                    "status": "failed",
+                    "stepnumber": 1,
+                    },
+                ],
+            }
+
+        with patch(
+                "moztrap.model.execution.ingest._record_step_failures") as rsf:
+            rsf.side_effect = DatabaseError("bad row")
+            with self.assertRaises(DatabaseError):
+                RunResource().obj_create(
+                    Bundle(data=data, request=request), request=request)
+
+        self.assertEqual(self.model.Run.everything.count(), 0)
+        self.assertEqual(self.model.RunCaseVersion.everything.count(), 0)
+        self.assertEqual(self.model.Result.everything.count(), 0)
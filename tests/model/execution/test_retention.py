@@ -0,0 +1,222 @@
+"""Tests for archiving and purging old results."""
+import datetime
+
+from django.test.utils import override_settings
+
+from mock import patch
+
+from tests import case
+
+
+
+class ApplyRetentionTest(case.DBTestCase):
+    """Tests for ``apply_retention``."""
+    def setUp(self):
+        """Set up a runcaseversion in an environment, and a tester."""
+        self.rcv = self.F.RunCaseVersionFactory.create()
+        self.env = self.F.EnvironmentFactory.create()
+        self.tester = self.F.UserFactory.create()
+        self.step = self.F.CaseStepFactory.create(
+            caseversion=self.rcv.caseversion)
+
+
+    def apply(self, days=365, **kwargs):
+        """Apply retention of ``days``; return counts by model."""
+        from moztrap.model.execution.retention import apply_retention
+        return apply_retention(days, **kwargs)
+
+
+    def result(self, age=0, deleted=False, **kwargs):
+        """
+        Create and return a result with a step result, ``age`` days old.
+
+        The age is set on ``modified_on``, or on ``deleted_on`` if ``deleted``.
+
+        """
+        r = self.F.ResultFactory.create(
+            tester=self.tester,
+            runcaseversion=self.rcv,
+            environment=self.env,
+            status="passed",
+            **kwargs)
+        self.F.StepResultFactory.create(result=r, step=self.step)
+        when = datetime.datetime.utcnow() - datetime.timedelta(days=age)
+        field = "deleted_on" if deleted else "modified_on"
+        self.model.Result.everything.filter(pk=r.pk).update(
+            notrack=True, **{field: when})
+        return r
+
+
+    def superseded(self, age):
+        """Create and return a result superseded ``age`` days ago."""
+        old = self.result()
+        self.F.ResultFactory.create(
+            tester=self.tester, runcaseversion=self.rcv, environment=self.env)
+        self.model.Result.everything.filter(pk=old.pk).update(
+            notrack=True,
+            modified_on=datetime.datetime.utcnow() - datetime.timedelta(
+                days=age),
+            )
+        return old
+
+
+    def test_archives_superseded(self):
+        """Results superseded long ago are moved to the archive."""
+        r = self.superseded(400)
+
+        found = self.apply()
+
+        self.assertEqual(
+            found, {self.model.Result: 1, self.model.StepResult: 1})
+        self.assertFalse(self.model.Result.everything.filter(pk=r.pk).exists())
+        archived = self.model.Result.archived.get(pk=r.pk)
+        self.assertEqual(archived.runcaseversion, self.rcv)
+        self.assertEqual(archived.status, "passed")
+        self.assertEqual(archived.is_latest, False)
+        self.assertEqual(archived.created_on, r.created_on)
+        self.assertEqual(
+            [s.step for s in archived.stepresults.all()], [self.step])
+        self.assertEqual(self.model.StepResult.everything.count(), 0)
+
+
+    def test_archives_deleted(self):
+        """Results deleted long ago are moved to the archive."""
+        r = self.result(400, deleted=True)
+
+        self.apply()
+
+        self.assertIsNot(
+            self.model.ArchivedResult.objects.get(pk=r.pk).deleted_on, None)
+        self.assertEqual(self.model.Result.everything.count(), 0)
+
+
+    def test_keeps_recent(self):
+        """Results superseded or deleted recently are kept."""
+        superseded = self.superseded(10)
+        deleted = self.result(10, deleted=True)
+
+        found = self.apply()
+
+        self.assertEqual(
+            found, {self.model.Result: 0, self.model.StepResult: 0})
+        self.assertEqual(
+            set(self.model.Result.everything.values_list("id", flat=True)),
+            set([superseded.id, deleted.id, superseded.id + 1]),
+            )
+
+
+    def test_keeps_latest(self):
+        """Latest results are kept, however old."""
+        r = self.result(400)
+
+        self.apply()
+
+        self.assertEqual(list(self.model.Result.objects.all()), [r])
+        self.assertEqual(self.model.ArchivedResult.objects.count(), 0)
+
+
+    def test_purge(self):
+        """With ``purge``, old results are deleted, not archived."""
+        self.superseded(400)
+
+        found = self.apply(purge=True)
+
+        self.assertEqual(
+            found, {self.model.Result: 1, self.model.StepResult: 1})
+        self.assertEqual(self.model.Result.everything.count(), 1)
+        self.assertEqual(self.model.ArchivedResult.objects.count(), 0)
+        self.assertEqual(self.model.ArchivedStepResult.objects.count(), 0)
+
+
+    def test_dry_run(self):
+        """With ``dry_run``, counts are reported but nothing changes."""
+        self.superseded(400)
+
+        found = self.apply(dry_run=True)
+
+        self.assertEqual(
+            found, {self.model.Result: 1, self.model.StepResult: 1})
+        self.assertEqual(self.model.Result.everything.count(), 2)
+        self.assertEqual(self.model.ArchivedResult.objects.count(), 0)
+
+
+    def test_refreshes_summaries(self):
+        """Stored summaries of the affected runs are recounted."""
+        self.superseded(400)
+        summary = self.model.RunSummary.refresh(self.rcv.run)
+        self.assertEqual(summary.completed, 1)
+
+        self.apply()
+
+        summary = self.model.RunSummary.objects.get(run=self.rcv.run)
+        self.assertEqual(summary.completed, 0)
+
+
+    def test_windows(self):
+        """Results are moved in windows of ``RETENTION_CHUNK_SIZE`` ids."""
+        for i in range(3):
+            self.result(400, deleted=True)
+
+        with patch(
+                "moztrap.model.execution.retention.RETENTION_CHUNK_SIZE", 2):
+            found = self.apply()
+
+        self.assertEqual(
+            found, {self.model.Result: 3, self.model.StepResult: 3})
+        self.assertEqual(self.model.ArchivedResult.objects.count(), 3)
+
+
+
+@override_settings(
+    MOZTRAP_RETENTION_DAYS=365,
+    MOZTRAP_RETENTION_PURGE=False,
+    MOZTRAP_RETENTION_INTERVAL=3600,
+    MOZTRAP_JOBS_ALWAYS_EAGER=False,
+    )
+class ScheduleTest(case.DBTestCase):
+    """Tests for the recurring retention job."""
+    def schedule(self, **kwargs):
+        from moztrap.model.execution.retention import schedule
+        return schedule(**kwargs)
+
+
+    def test_schedule_once(self):
+        """Only one retention job is queued at a time."""
+        job = self.schedule()
+
+        self.assertEqual(self.schedule(), job)
+        self.assertEqual(job.kind, "results.retention")
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=True)
+    def test_job_reschedules(self):
+        """The job applies retention, then queues itself to run again."""
+        job = self.schedule()
+
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.get_result(), {"Result": 0, "StepResult": 0})
+        later = self.model.Job.objects.get(status="queued")
+        self.assertEqual(later.kind, "results.retention")
+        self.assertGreater(
+            later.run_after,
+            datetime.datetime.utcnow() + datetime.timedelta(seconds=3500),
+            )
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=True)
+    def test_failed_job_reschedules(self):
+        """A failing run still queues the next one."""
+        with patch(
+                "moztrap.model.execution.retention.apply_retention") as apply:
+            apply.side_effect = ValueError("database is down")
+            with self.assertRaises(ValueError):
+                self.schedule()
+
+        job = self.model.Job.objects.get(status="failed")
+        self.assertIn("database is down", job.error)
+        later = self.model.Job.objects.get(status="queued")
+        self.assertEqual(later.kind, "results.retention")
+        self.assertGreater(
+            later.run_after,
+            datetime.datetime.utcnow() + datetime.timedelta(seconds=3500),
+            )
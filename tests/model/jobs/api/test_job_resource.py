@@ -0,0 +1,65 @@
+"""
+Tests for JobResource api.
+
+"""
+from tests import case
+
+
+
+class JobResourceTest(case.api.ApiTestCase):
+
+    @property
+    def factory(self):
+        """The model factory for Jobs."""
+        return self.F.JobFactory
+
+
+    @property
+    def resource_name(self):
+        return "job"
+
+
+    def test_job_detail(self):
+        """Get status of a single job."""
+        job = self.factory.create(
+            kind="run.clone_for_series",
+            status="done",
+            attempts=1,
+            result="7",
+            object_id=3,
+            )
+
+        res = self.get_detail(job.id)
+
+        self.assertEqual(res.json["id"], unicode(job.id))
+        self.assertEqual(res.json["kind"], u"run.clone_for_series")
+        self.assertEqual(res.json["status"], u"done")
+        self.assertEqual(res.json["object_id"], 3)
+        self.assertEqual(res.json["attempts"], 1)
+        self.assertEqual(res.json["result"], 7)
+        self.assertEqual(res.json["finished"], True)
+
+
+    def test_filter_by_status(self):
+        """Jobs can be filtered by status."""
+        self.factory.create(status="done")
+        queued = self.factory.create(status="queued")
+
+        res = self.get_list(params={"status": "queued"})
+
+        self.assertEqual(
+            [o["id"] for o in res.json["objects"]], [unicode(queued.id)])
+
+
+    def test_no_error(self):
+        """The job's error traceback isn't exposed."""
+        job = self.factory.create(status="failed", error="Traceback")
+
+        res = self.get_detail(job.id)
+
+        self.assertNotIn("error", res.json)
+
+
+    def test_read_only(self):
+        """Jobs can't be created via the API."""
+        self.post(self.get_list_url(self.resource_name), {}, status=405)
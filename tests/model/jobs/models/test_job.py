@@ -0,0 +1,320 @@
+"""
+Tests for Job model.
+
+"""
+import datetime
+
+from django.test.utils import override_settings
+
+from mock import patch
+
+from tests import case
+
+
+
+@override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+class JobTest(case.DBTestCase):
+    """Tests for Job model."""
+    def handlers(self, **handlers):
+        """Patch registered job handlers to (only) the given kinds."""
+        return patch.dict(
+            "moztrap.model.jobs.models._handlers",
+            dict((k.replace("_", "."), v) for k, v in handlers.items()),
+            clear=True,
+            )
+
+
+    def claimed(self, **kwargs):
+        """Create and return a claimed job."""
+        job = self.F.JobFactory.create(**kwargs)
+        job.claim("worker")
+        return job
+
+
+    def test_unicode(self):
+        """Unicode representation is kind and id."""
+        j = self.F.JobFactory(kind="run.activate")
+        j.id = 3
+
+        self.assertEqual(unicode(j), u"run.activate job 3")
+
+
+    def test_enqueue(self):
+        """A queued job records its target, arguments and user."""
+        run = self.F.RunFactory.create()
+        user = self.F.UserFactory.create()
+
+        job = self.model.Job.enqueue("test.job", run, user=user, build="3")
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(job.target, run)
+        self.assertEqual(job.get_arguments(), {"build": "3"})
+        self.assertEqual(job.created_by, user)
+
+
+    def test_enqueue_no_target(self):
+        """A job need not have a target object."""
+        job = self.model.Job.enqueue("test.job")
+
+        self.assertEqual(self.refresh(job).target, None)
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=True)
+    def test_enqueue_eager(self):
+        """With always-eager setting, job is run immediately."""
+        calls = []
+
+        def record(target, user=None, x=None):
+            calls.append(x)
+            return x * 2
+
+        with self.handlers(test_job=record):
+            job = self.model.Job.enqueue("test.job", x=2)
+
+        self.assertEqual(calls, [2])
+        self.assertEqual(self.refresh(job).status, "done")
+        self.assertEqual(job.get_result(), 4)
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=True)
+    def test_enqueue_eager_error(self):
+        """An eager job that raises fails at once, and the error propagates."""
+        def fail(target, user=None):
+            raise ValueError("oops")
+
+        with self.handlers(test_job=fail):
+            with self.assertRaises(ValueError):
+                self.model.Job.enqueue("test.job")
+
+        job = self.model.Job.objects.get()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("ValueError: oops", job.error)
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=True)
+    def test_enqueue_run_after(self):
+        """A job queued to run later isn't run eagerly."""
+        calls = []
+        later = datetime.datetime(2100, 1, 1)
+
+        with self.handlers(test_job=lambda target, user=None: calls.append(1)):
+            job = self.model.Job.enqueue("test.job", run_after=later)
+
+        self.assertEqual(calls, [])
+        job = self.refresh(job)
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(job.run_after, later)
+
+
+    def test_claim(self):
+        """Claiming a queued job marks it running and counts an attempt."""
+        job = self.F.JobFactory.create()
+
+        self.assertTrue(job.claim("w1"))
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "running")
+        self.assertEqual(job.worker, "w1")
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.started_on)
+
+
+    def test_claim_lost(self):
+        """A job already claimed by another worker can't be claimed."""
+        job = self.F.JobFactory.create()
+        other = self.model.Job.objects.get(pk=job.pk)
+        other.claim("w1")
+
+        self.assertFalse(job.claim("w2"))
+        self.assertEqual(self.refresh(job).worker, "w1")
+
+
+    def test_claim_next(self):
+        """Claims the oldest due queued job."""
+        self.F.JobFactory.create(status="done")
+        self.F.JobFactory.create(
+            run_after=datetime.datetime.utcnow() + datetime.timedelta(
+                hours=1))
+        first = self.F.JobFactory.create()
+        self.F.JobFactory.create()
+
+        job = self.model.Job.claim_next("w1")
+
+        self.assertEqual(job, first)
+        self.assertEqual(job.status, "running")
+
+
+    def test_claim_next_none(self):
+        """Returns None if no job is due."""
+        self.F.JobFactory.create(status="running")
+
+        self.assertIsNone(self.model.Job.claim_next("w1"))
+
+
+    def stale(self, **kwargs):
+        """Create and return a job claimed two hours ago."""
+        job = self.claimed(**kwargs)
+        self.model.Job.objects.filter(pk=job.pk).update(
+            notrack=True,
+            started_on=datetime.datetime.utcnow() - datetime.timedelta(
+                hours=2),
+            )
+        return job
+
+
+    def test_recover_stale(self):
+        """A job running past the timeout is queued again."""
+        job = self.stale()
+
+        self.assertEqual(self.model.Job.recover_stale(3600), 1)
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.error, "Timed out after 3600 seconds.")
+
+
+    def test_recover_stale_final(self):
+        """A stale job with no attempts left fails."""
+        job = self.stale(max_attempts=1)
+
+        self.model.Job.recover_stale(3600)
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "failed")
+        self.assertTrue(job.finished)
+
+
+    def test_recover_stale_recent(self):
+        """A job running for less than the timeout is left alone."""
+        job = self.claimed()
+
+        self.assertEqual(self.model.Job.recover_stale(3600), 0)
+        self.assertEqual(self.refresh(job).status, "running")
+
+
+    @override_settings(MOZTRAP_JOBS_TIMEOUT=3600)
+    def test_claim_next_recovers_stale(self):
+        """A stale job is claimed again by the next worker to poll."""
+        job = self.stale()
+
+        self.assertEqual(self.model.Job.claim_next("w2"), job)
+        self.assertEqual(self.refresh(job).attempts, 2)
+
+
+    def test_execute(self):
+        """Handler is called with target, user and arguments."""
+        run = self.F.RunFactory.create()
+        user = self.F.UserFactory.create()
+        calls = []
+
+        def record(target, user=None, **kwargs):
+            calls.append((target, user, kwargs))
+            return {"ok": True}
+
+        job = self.model.Job.enqueue("test.job", run, user=user, build="3")
+        job.claim("w1")
+        with self.handlers(test_job=record):
+            job.execute()
+
+        self.assertEqual(calls, [(run, user, {"build": "3"})])
+        job = self.refresh(job)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.get_result(), {"ok": True})
+        self.assertIsNotNone(job.finished_on)
+        self.assertTrue(job.finished)
+
+
+    def test_execute_error_requeued(self):
+        """A job that raises is queued again for later, with the error."""
+        def fail(target, user=None):
+            raise ValueError("oops")
+
+        job = self.claimed()
+        with self.handlers(test_job=fail):
+            job.execute()
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "queued")
+        self.assertIn("ValueError: oops", job.error)
+        self.assertGreater(job.run_after, datetime.datetime.utcnow())
+        self.assertIsNone(self.model.Job.claim_next("w1"))
+
+
+    def test_execute_error_final(self):
+        """After max attempts, a job that raises has failed for good."""
+        def fail(target, user=None):
+            raise ValueError("oops")
+
+        job = self.claimed(max_attempts=1)
+        with self.handlers(test_job=fail):
+            job.execute()
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "failed")
+        self.assertIn("ValueError: oops", job.error)
+        self.assertTrue(job.finished)
+
+
+    def test_execute_unknown_kind(self):
+        """A job of a kind with no handler fails."""
+        job = self.claimed(kind="no.such")
+
+        with self.handlers():
+            job.execute()
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "No handler for job kind 'no.such'.")
+
+
+    def test_retry(self):
+        """A failed job can be queued again."""
+        job = self.F.JobFactory.create(status="failed", attempts=3)
+
+        job.retry()
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(self.model.Job.claim_next("w1"), job)
+
+
+    def test_status_data(self):
+        """Status data is a JSON-ready summary of the job."""
+        job = self.F.JobFactory.create(
+            kind="run.activate",
+            status="done",
+            attempts=1,
+            result="5",
+            created_on=datetime.datetime(2012, 1, 2, 3, 4, 5),
+            finished_on=datetime.datetime(2012, 1, 2, 3, 4, 6),
+            )
+
+        self.assertEqual(
+            job.status_data(),
+            {
+                "id": job.id,
+                "kind": "run.activate",
+                "status": "done",
+                "finished": True,
+                "attempts": 1,
+                "result": 5,
+                "created_on": "2012-01-02T03:04:05",
+                "started_on": None,
+                "finished_on": "2012-01-02T03:04:06",
+                }
+            )
+
+
+    def test_status_data_error_for_creator(self):
+        """Only the job's creator gets the error in its status data."""
+        creator = self.F.UserFactory.create()
+        job = self.model.Job.enqueue("test.job", user=creator)
+        job.error = "Traceback"
+
+        self.assertEqual(job.status_data(creator)["error"], "Traceback")
+        self.assertNotIn("error", job.status_data())
+        self.assertNotIn(
+            "error", job.status_data(self.F.UserFactory.create()))
@@ -141,6 +141,30 @@ class CaseVersionResourceTest(ApiCrudCases):
         self.assertEqual(res.text, self._product_mismatch_message)
 
 
+    def test_search_name(self):
+        """Can filter by keyword search of the name."""
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        self.F.CaseVersionFactory.create(name="Log out")
+
+        res = self.get_list(params={"search_name": "log in"})
+
+        self.assertEqual(
+            [o["id"] for o in res.json["objects"]], [unicode(cv.id)])
+
+
+    def test_search_instruction(self):
+        """Can filter by keyword search of the step instructions."""
+        step = self.F.CaseStepFactory.create(instruction="Click login")
+        self.F.CaseStepFactory.create(instruction="Click logout")
+
+        res = self.get_list(params={"search_instruction": "login"})
+
+        self.assertEqual(
+            [o["id"] for o in res.json["objects"]],
+            [unicode(step.caseversion.id)],
+            )
+
+
 
 class CaseVersionSelectionResourceTest(case.api.ApiTestCase):
 
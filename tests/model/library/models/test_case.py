@@ -28,6 +28,27 @@ class CaseTest(case.DBTestCase):
         self.assertEqual(new.versions.get().name, "Cloned: CV 1")
 
 
+    def test_clone_versions_latest(self):
+        """Versions cloned with a case are marked latest as appropriate."""
+        c = self.F.CaseFactory.create()
+        pv1 = self.F.ProductVersionFactory.create(
+            product=c.product, version="1")
+        pv2 = self.F.ProductVersionFactory.create(
+            product=c.product, version="2")
+        self.F.CaseVersionFactory.create(case=c, productversion=pv1)
+        self.F.CaseVersionFactory.create(case=c, productversion=pv2)
+
+        new = c.clone()
+
+        self.assertEqual(
+            [
+                (cv.productversion, cv.latest)
+                for cv in new.versions.order_by("productversion__order")
+                ],
+            [(pv1, False), (pv2, True)],
+            )
+
+
     def test_all_versions(self):
         """Returns ordered product versions paired with caseversion or None."""
         c = self.F.CaseFactory()
@@ -384,6 +405,80 @@ class CaseVersionTest(case.DBTestCase):
             case=cv.case, productversion=cv.productversion)
 
 
+    def test_save_syncs_name(self):
+        """Saving a caseversion renames the other versions of its case."""
+        c = self.F.CaseFactory.create()
+        p = c.product
+        cv1 = self.F.CaseVersionFactory.create(
+            productversion__product=p, productversion__version="1", case=c,
+            name="Old")
+        cv2 = self.F.CaseVersionFactory.create(
+            productversion__product=p, productversion__version="2", case=c,
+            name="Old")
+        cc_version = self.refresh(cv1).cc_version
+        u = self.F.UserFactory.create()
+
+        cv2 = self.refresh(cv2)
+        cv2.name = "New"
+        cv2.save(user=u)
+
+        cv1 = self.refresh(cv1)
+        self.assertEqual(cv1.name, "New")
+        self.assertEqual(cv1.modified_by, u)
+        self.assertGreater(cv1.cc_version, cc_version)
+
+
+    def test_save_syncs_name_search_index(self):
+        """Renamed versions are found by their new name."""
+        from moztrap.model.library import search
+        c = self.F.CaseFactory.create()
+        p = c.product
+        cv1 = self.F.CaseVersionFactory.create(
+            productversion__product=p, productversion__version="1", case=c,
+            name="Old")
+        cv2 = self.F.CaseVersionFactory.create(
+            productversion__product=p, productversion__version="2", case=c,
+            name="Old")
+
+        cv2 = self.refresh(cv2)
+        cv2.name = "Renamed"
+        cv2.save()
+
+        self.assertEqual(
+            set(
+                self.model.CaseVersion.objects.filter(
+                    pk__in=search.matching("name", "renamed"))
+                ),
+            set([cv1, cv2]),
+            )
+
+
+    def test_sync_cases(self):
+        """sync_cases syncs names and latest versions of a saved batch."""
+        c = self.F.CaseFactory.create()
+        pv1 = self.F.ProductVersionFactory.create(
+            product=c.product, version="1")
+        pv2 = self.F.ProductVersionFactory.create(
+            product=c.product, version="2")
+        cv1 = self.F.CaseVersionFactory.create(
+            productversion=pv1, case=c, name="Old")
+        cv2 = self.model.CaseVersion(productversion=pv2, case=c, name="New")
+        cv2.save(skip_set_latest=True, skip_sync_name=True)
+
+        self.model.CaseVersion.sync_cases([cv2])
+
+        self.assertEqual(
+            [(cv.name, cv.latest) for cv in c.versions.all()],
+            [("New", False), ("New", True)],
+            )
+        # renamed and no longer latest, each bumping its version
+        old = self.refresh(cv1)
+        self.assertEqual(
+            (old.name, old.latest, old.cc_version),
+            ("New", False, cv1.cc_version + 2),
+            )
+
+
 
 class CaseStepTest(case.DBTestCase):
     """Tests for the CaseStep model."""
@@ -1,9 +1,14 @@
 """Tests for suite/case importer."""
+from cStringIO import StringIO
+import json
+
 from tests import case
 
 from mock import patch
 
-from moztrap.model.library.importer import ImportResult, SuiteImporter
+from moztrap.model.library.importer import (
+    ImportResult, SuiteImporter, StreamImportResult, JSONStreamError,
+    stream_items)
 
 
 
@@ -153,242 +158,26 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
 
     def test_create_two_caseversions_same_user(self):
         """
-        Two caseversions that both use the same user.  Test that import caches
-        the user and doesn't have to query for it a second time.
-
-        Expect 19 queries for this import:
-
-        Query 1: Ensure this caseversion does not already exist for this
-        productversion::
-
-            SELECT (1) AS `a` FROM `library_caseversion` WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`name` = Foo AND
-            `library_caseversion`.`productversion_id` = 12 ) LIMIT 1
-
-        Query 2: Find the user for this email::
-
-            SELECT `auth_user`.`id`, `auth_user`.`username`,
-            `auth_user`.`first_name`, `auth_user`.`last_name`,
-            `auth_user`.`email`, `auth_user`.`password`,
-            `auth_user`.`is_staff`, `auth_user`.`is_active`,
-            `auth_user`.`is_superuser`, `auth_user`.`last_login`,
-            `auth_user`.`date_joined` FROM `auth_user` WHERE
-            `auth_user`.`email` = sumbudee@mozilla.com
-
-        Transaction: SAVEPOINT s140735243669888_x1
-
-        Query 3: Create the first new case object::
-
-            INSERT INTO `library_case` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `product_id`) VALUES (2012-03-07 19:35:34, None, 2012-03-07
-            19:35:34, None, None, None, 12)
-
-        Queries 4-8: Create the first new caseversion object::
-
-            INSERT INTO `library_caseversion` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `status`, `productversion_id`, `case_id`, `name`, `description`,
-            `latest`, `envs_narrowed`) VALUES (2012-03-07 19:35:34, 2,
-            2012-03-07 19:35:34, 2, None, None, draft, 12, 10, Foo, , False,
-            False)
-
-             SELECT `environments_environment`.`id`,
-            `environments_environment`.`created_on`,
-            `environments_environment`.`created_by_id`,
-            `environments_environment`.`modified_on`,
-            `environments_environment`.`modified_by_id`,
-            `environments_environment`.`deleted_on`,
-            `environments_environment`.`deleted_by_id`,
-            `environments_environment`.`profile_id` FROM
-            `environments_environment` INNER JOIN
-            `core_productversion_environments` ON
-            (`environments_environment`.`id` =
-            `core_productversion_environments`.`environment_id`) WHERE
-            (`environments_environment`.`deleted_on` IS NULL AND
-            `core_productversion_environments`.`productversion_id` = 12 )
-
-             SELECT `library_caseversion`.`id`,
-            `library_caseversion`.`created_on`,
-            `library_caseversion`.`created_by_id`,
-            `library_caseversion`.`modified_on`,
-            `library_caseversion`.`modified_by_id`,
-            `library_caseversion`.`deleted_on`,
-            `library_caseversion`.`deleted_by_id`,
-            `library_caseversion`.`status`,
-            `library_caseversion`.`productversion_id`,
-            `library_caseversion`.`case_id`, `library_caseversion`.`name`,
-            `library_caseversion`.`description`,
-            `library_caseversion`.`latest`,
-            `library_caseversion`.`envs_narrowed` FROM `library_caseversion`
-            INNER JOIN `core_productversion` ON
-            (`library_caseversion`.`productversion_id` =
-            `core_productversion`.`id`) WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`case_id` = 10 ) ORDER BY
-            `core_productversion`.`order` DESC LIMIT 1
-
-             UPDATE `library_caseversion` SET `latest` = False WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`case_id` = 10 )
-
-             UPDATE `library_caseversion` SET `created_on` = 2012-03-07
-            19:35:34, `created_by_id` = 2, `modified_on` = 2012-03-07 19:35:34,
-            `modified_by_id` = 2, `deleted_on` = NULL, `deleted_by_id` = NULL,
-            `status` = draft, `productversion_id` = 12, `case_id` = 10, `name`
-            = Foo, `description` = , `latest` = True, `envs_narrowed` = False
-            WHERE `library_caseversion`.`id` = 10
-
-        Query 9: During save, check if there are other caseversions for this
-                 case to sync names.
-            SELECT `library_caseversion`.`id`, `library_caseversion`
-            .`created_on`,
-            `library_caseversion`.`created_by_id`, `library_caseversion`
-            .`modified_on`,
-            `library_caseversion`.`modified_by_id`, `library_caseversion`
-            .`deleted_on`,
-            `library_caseversion`.`deleted_by_id`, `library_caseversion`
-            .`cc_version`,
-            `library_caseversion`.`status`, `library_caseversion`
-            .`productversion_id`,
-            `library_caseversion`.`case_id`, `library_caseversion`.`name`,
-            `library_caseversion`.`description`, `library_caseversion`
-            .`latest`,
-            `library_caseversion`.`envs_narrowed` FROM `library_caseversion`
-             INNER JOIN
-            `core_productversion` ON (`library_caseversion`
-            .`productversion_id` =
-            `core_productversion`.`id`) WHERE (`library_caseversion`
-            .`deleted_on` IS
-            NULL AND `library_caseversion`.`case_id` = 1 ) ORDER BY
-            `library_caseversion`.`case_id` ASC,
-            `core_productversion`.`order` ASC
-
-        Query 10: Add the new step to the caseversion::
-
-            INSERT INTO `library_casestep` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `caseversion_id`, `number`, `instruction`, `expected`) VALUES
-            (2012-03-07 19:35:34, None, 2012-03-07 19:35:34, None, None, None,
-            10, 1, do this, )
-
-        Transaction: RELEASE SAVEPOINT s140735243669888_x1
-
-        Query 11: Ensure the second caseversion with this name and pv doesn't
-        exist::
-
-            SELECT (1) AS `a` FROM `library_caseversion` WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`name` = Bar AND
-            `library_caseversion`.`productversion_id` = 12 ) LIMIT 1
-
-        Transaction: SAVEPOINT s140735243669888_x2
-
-        **NOTE: We didn't have to search for the user again, since it was
-        cached**
-
-        Query 12: Create the second new case::
-
-            INSERT INTO `library_case` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `product_id`) VALUES (2012-03-07 19:35:34, None, 2012-03-07
-            19:35:34, None, None, None, 12)
-
-        Queries 13-17: Create the second new caseversion::
-
-             INSERT INTO `library_caseversion` (`created_on`, `created_by_id`,
-             `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-             `status`, `productversion_id`, `case_id`, `name`, `description`,
-             `latest`, `envs_narrowed`) VALUES (2012-03-07 19:35:34, 2,
-             2012-03-07 19:35:34, 2, None, None, draft, 12, 11, Bar, , False,
-             False)
-
-              SELECT `environments_environment`.`id`,
-             `environments_environment`.`created_on`,
-             `environments_environment`.`created_by_id`,
-             `environments_environment`.`modified_on`,
-             `environments_environment`.`modified_by_id`,
-             `environments_environment`.`deleted_on`,
-             `environments_environment`.`deleted_by_id`,
-             `environments_environment`.`profile_id` FROM
-             `environments_environment` INNER JOIN
-             `core_productversion_environments` ON
-             (`environments_environment`.`id` =
-             `core_productversion_environments`.`environment_id`) WHERE
-             (`environments_environment`.`deleted_on` IS NULL AND
-             `core_productversion_environments`.`productversion_id` = 12 )
-
-              SELECT `library_caseversion`.`id`,
-             `library_caseversion`.`created_on`,
-             `library_caseversion`.`created_by_id`,
-             `library_caseversion`.`modified_on`,
-             `library_caseversion`.`modified_by_id`,
-             `library_caseversion`.`deleted_on`,
-             `library_caseversion`.`deleted_by_id`,
-             `library_caseversion`.`status`,
-             `library_caseversion`.`productversion_id`,
-             `library_caseversion`.`case_id`, `library_caseversion`.`name`,
-             `library_caseversion`.`description`,
-             `library_caseversion`.`latest`,
-             `library_caseversion`.`envs_narrowed` FROM `library_caseversion`
-             INNER JOIN `core_productversion` ON
-             (`library_caseversion`.`productversion_id` =
-             `core_productversion`.`id`) WHERE
-             (`library_caseversion`.`deleted_on` IS NULL AND
-             `library_caseversion`.`case_id` = 11 ) ORDER BY
-             `core_productversion`.`order` DESC LIMIT 1
-
-              UPDATE `library_caseversion` SET `latest` = False WHERE
-             (`library_caseversion`.`deleted_on` IS NULL AND
-             `library_caseversion`.`case_id` = 11 )
-
-              UPDATE `library_caseversion` SET `created_on` = 2012-03-07
-             19:35:34, `created_by_id` = 2, `modified_on` = 2012-03-07
-             19:35:34, `modified_by_id` = 2, `deleted_on` = NULL,
-             `deleted_by_id` = NULL, `status` = draft, `productversion_id` =
-             12, `case_id` = 11, `name` = Bar, `description` = , `latest` =
-             True, `envs_narrowed` = False WHERE `library_caseversion`.`id` =
-             11
-
-        Query 18: Check for other caseversions for the same case to sync names
-
-            SELECT `library_caseversion`.`id`, `library_caseversion`
-            .`created_on`,
-            `library_caseversion`.`created_by_id`, `library_caseversion`
-            .`modified_on`,
-            `library_caseversion`.`modified_by_id`, `library_caseversion`
-            .`deleted_on`,
-            `library_caseversion`.`deleted_by_id`, `library_caseversion`
-            .`cc_version`,
-            `library_caseversion`.`status`, `library_caseversion`
-            .`productversion_id`,
-            `library_caseversion`.`case_id`, `library_caseversion`.`name`,
-            `library_caseversion`.`description`, `library_caseversion`
-            .`latest`,
-            `library_caseversion`.`envs_narrowed` FROM `library_caseversion`
-             INNER JOIN
-            `core_productversion` ON (`library_caseversion`
-            .`productversion_id` =
-            `core_productversion`.`id`) WHERE (`library_caseversion`
-            .`deleted_on` IS
-            NULL AND `library_caseversion`.`case_id` = 2 ) ORDER BY
-            `library_caseversion`.`case_id` ASC,
-            `core_productversion`.`order` ASC
-
-        Query 19: Add the step to the second caseversion::
-
-            INSERT INTO `library_casestep` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `caseversion_id`, `number`, `instruction`, `expected`) VALUES
-            (2012-03-07 19:35:34, None, 2012-03-07 19:35:34, None, None, None,
-            11, 1, do this, )
-
-        Transaction: RELEASE SAVEPOINT s140735243669888_x2
-
-        Note: Django 1.4 now logs transaction points in the connection.queries
-
-        EXPECT: 19 Queries + 4 Transaction actions = 23 queries.
+        Two caseversions that both use the same user.  Test that import looks
+        up the user once and writes both cases together.
+
+        Expect 14 queries for this import:
+
+        Query 1: Find the users for all emails in the chunk.
+
+        Query 2: Load the names of existing caseversions of this
+        productversion.
+
+        Queries 3-5: Find the largest case id, insert both cases, read back
+        their ids.
+
+        Queries 6-8: The same for the caseversions.
+
+        Query 9: Insert the steps of both caseversions.
+
+        Query 10: Load the environments of the productversion.
+
+        Queries 11-14: Index the new caseversions for search.
 
         To re-capture this query list, use a block like this in place
             of the "with self.assertNumQueries..." block::
@@ -425,7 +214,7 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
             }
 
         # Test code as normal
-        with self.assertNumQueries(23):
+        with self.assertNumQueries(14):
             result = self.import_data(case_data)
 
         cv1 = self.model.CaseVersion.objects.get(name="Foo")
@@ -435,6 +224,59 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
         self.assertEqual(result.num_cases, 2)
 
 
+    def test_queries_independent_of_size(self):
+        """The number of queries doesn't grow with the number of cases."""
+        def case_data(names):
+            return {
+                "cases": [
+                    {
+                        "name": name,
+                        "steps": [{"instruction": "do this"}],
+                        "tags": ["FooTag"],
+                        "suites": ["FooSuite"],
+                        }
+                    for name in names
+                    ]
+                }
+
+        # create the tag and suite first
+        self.import_data(case_data(["Bar"]))
+
+        with self.assertNumQueries(17):
+            self.import_data(case_data(["Foo"]))
+        with self.assertNumQueries(17):
+            result = self.import_data(
+                case_data(["Case {0}".format(i) for i in range(20)]))
+
+        self.assertEqual(result.num_cases, 20)
+        self.assertEqual(
+            self.model.Suite.objects.get().cases.count(), 22)
+
+
+    def test_chunks(self):
+        """Cases are validated and written in chunks."""
+        with patch("moztrap.model.library.importer.IMPORT_CHUNK_SIZE", 2):
+            result = self.import_data(
+                {
+                    "cases": [
+                        {
+                            "name": name,
+                            "steps": [{"instruction": "do this"}],
+                            "tags": ["FooTag"],
+                            }
+                        for name in ["Foo", "Bar", "Baz", "foo"]
+                        ]
+                    }
+                )
+
+        self.assertEqual(result.num_cases, 3)
+        self.assertEqual(
+            result.warnings[0]["reason"],
+            ImportResult.SKIP_CASE_NAME_CONFLICT,
+            )
+        self.assertEqual(self.model.Tag.objects.get().caseversions.count(), 3)
+
+
     def test_create_caseversion_no_existing_user(self):
         """A caseversion with a user that does not exist in the db."""
 
@@ -721,6 +563,129 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
 
 
 
+class ImportStreamTest(ImporterTestBase, case.DBTestCase):
+    """Tests for ``Importer.import_stream``."""
+    def import_stream(self, items, **kwargs):
+        """Call ``import_stream`` with ``items`` and return result."""
+        from moztrap.model.library.importer import Importer
+        return Importer().import_stream(self.pv, items, **kwargs)
+
+
+    def test_chunks(self):
+        """Items are imported in chunks, calling progress after each."""
+        processed = []
+
+        result = self.import_stream(
+            [
+                ("suites", {"name": "FooSuite"}),
+                ("cases", {"name": "Foo", "suites": ["FooSuite"]}),
+                ("cases", {"name": "Bar", "suites": ["FooSuite"]}),
+                ],
+            chunk_size=2,
+            progress=lambda r: processed.append(r.processed),
+            )
+
+        self.assertEqual(processed, [2, 3])
+        self.assertEqual(result.num_cases, 2)
+        self.assertEqual(result.num_suites, 1)
+        self.assertEqual(self.model.Suite.objects.get().cases.count(), 2)
+
+
+    def test_skip(self):
+        """Skipped items are counted as processed, but not imported."""
+        result = self.import_stream(
+            [("cases", {"name": "Foo"}), ("cases", {"name": "Bar"})],
+            skip=1,
+            )
+
+        self.assertEqual(result.processed, 2)
+        self.assertEqual(self.model.CaseVersion.objects.get().name, "Bar")
+
+
+    def test_max_warnings(self):
+        """Only the first ``max_warnings`` warnings are kept."""
+        result = StreamImportResult(max_warnings=1)
+        for i in range(3):
+            result.warn(ImportResult.SKIP_CASE_NO_NAME, {})
+
+        self.assertEqual(result.warning_count, 3)
+        self.assertEqual(len(result.warnings), 1)
+        self.assertEqual(
+            result.get_as_list()[1:],
+            ["Omitted 2 more warnings", "Imported 0 cases", "Imported 0 suites"],
+            )
+
+
+
+class StreamItemsTest(case.TestCase):
+    """Tests for ``stream_items``."""
+    def items(self, text, read_size=1):
+        """Return list of items in ``text``, read ``read_size`` at a time."""
+        return list(stream_items(StringIO(text), read_size))
+
+
+    def test_items(self):
+        """Suites and cases are yielded in order; other keys are ignored."""
+        data = {
+            "meta": {"exported": [1, 2.5, None, True]},
+            "suites": [{"name": "FooSuite"}],
+            "cases": [{"name": "Foo", "steps": [{"instruction": "do"}]}],
+            }
+
+        for read_size in [1, 3, 1024]:
+            self.assertEqual(
+                sorted(self.items(json.dumps(data), read_size)),
+                [("cases", data["cases"][0]), ("suites", data["suites"][0])],
+                )
+
+
+    def test_non_ascii(self):
+        """UTF-8 characters split between reads are decoded."""
+        text = json.dumps(
+            {"cases": [{"name": u"F\xf6\xf6"}]}, ensure_ascii=False)
+
+        self.assertEqual(
+            self.items(text.encode("utf-8")),
+            [("cases", {"name": u"F\xf6\xf6"})],
+            )
+
+
+    def test_numbers_at_read_boundary(self):
+        """A number isn't cut short at the end of a read."""
+        self.assertEqual(
+            self.items('{"cases": [12345]}', read_size=13),
+            [("cases", 12345)],
+            )
+
+
+    def test_empty(self):
+        """An empty object or empty arrays have no items."""
+        self.assertEqual(self.items('{}'), [])
+        self.assertEqual(self.items('{"cases": [], "suites": []}'), [])
+
+
+    def test_malformed(self):
+        """Malformed JSON raises ``JSONStreamError`` with its position."""
+        for text, message in [
+                ("", "Expecting {: byte 0"),
+                ("{", "Expecting property name: byte 1"),
+                ('{"cases": [1 2]}', "Expecting , delimiter: byte 13"),
+                ('{"cases": [1]} x', "Extra data: byte 15"),
+                ]:
+            with self.assertRaises(JSONStreamError) as cm:
+                self.items(text)
+            self.assertEqual(str(cm.exception), message)
+
+
+    def test_item_too_large(self):
+        """An item larger than ``STREAM_MAX_ITEM_SIZE`` is an error."""
+        with patch(
+                "moztrap.model.library.importer.STREAM_MAX_ITEM_SIZE", 10):
+            with self.assertRaises(JSONStreamError):
+                self.items('{"cases": ["' + "x" * 20 + '"]}')
+
+
+
 class ImporterTransactionTest(ImporterTestBase, case.TransactionTestCase):
     """Tests for ``Importer`` transactional behavior."""
 
@@ -766,7 +731,6 @@ class ImporterTransactionTest(ImporterTestBase, case.TransactionTestCase):
         self.assertEqual(self.model.CaseVersion.objects.count(), 0)
 
 
-    # @@@ This test won't work till we upgrade to Django 1.4
     def test_step_no_instruction_skip(self):
         """Skip import on case with step and no instruction."""
         result = self.import_data(
@@ -780,10 +744,9 @@ class ImporterTransactionTest(ImporterTestBase, case.TransactionTestCase):
                 }
             )
 
-        # @@@ The savepoint-rollback won't work until Django 1.4.
-        # cv = self.model.CaseVersion.objects.all()
-        # self.assertFalse(list(cv))
-        # self.assertEqual(result.num_cases, 0)
+        cv = self.model.CaseVersion.objects.all()
+        self.assertFalse(list(cv))
+        self.assertEqual(result.num_cases, 0)
         self.assertEqual(
             result.warnings[0]["reason"],
             ImportResult.SKIP_STEP_NO_INSTRUCTION,
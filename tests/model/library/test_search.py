@@ -0,0 +1,196 @@
+# coding: utf-8
+"""
+Tests for keyword search of caseversion text.
+
+"""
+from django.test.utils import override_settings
+
+from tests import case
+
+
+
+class SearchTestCase(case.DBTestCase):
+    """Base class for search tests."""
+    @property
+    def search(self):
+        """The module under test."""
+        from moztrap.model.library import search
+        return search
+
+
+    def matching(self, field, text):
+        """Return set of ids of caseversions ``field`` matching ``text``."""
+        return set(
+            self.model.CaseVersion.objects.filter(
+                pk__in=self.search.matching(field, text)).values_list(
+                "id", flat=True))
+
+
+    def tokens(self, cv):
+        """Return sorted (field, token) indexed for ``cv``."""
+        return sorted(
+            self.model.SearchToken.objects.filter(
+                caseversion=cv).values_list("field", "token"))
+
+
+
+class TokenizeTest(SearchTestCase):
+    """Tests for ``tokenize``."""
+    def test_words(self):
+        """Lower-cased words, without punctuation."""
+        self.assertEqual(
+            self.search.tokenize(u"Log in, then Log-out ùê!"),
+            set([u"log", u"in", u"then", u"out", u"ùê"]))
+
+
+    def test_none(self):
+        """None has no words."""
+        self.assertEqual(self.search.tokenize(None), set())
+
+
+    def test_truncated(self):
+        """Long words are truncated to fit the index."""
+        self.assertEqual(self.search.tokenize("a" * 60), set(["a" * 50]))
+
+
+
+class TokenIndexTest(SearchTestCase):
+    """Tests for keeping the token index up to date."""
+    def test_caseversion_created(self):
+        """A new caseversion's name and description are indexed."""
+        cv = self.F.CaseVersionFactory.create(
+            name="Log in", description="Log in ok")
+
+        self.assertEqual(
+            self.tokens(cv),
+            [
+                ("description", "in"),
+                ("description", "log"),
+                ("description", "ok"),
+                ("name", "in"),
+                ("name", "log"),
+                ]
+            )
+
+
+    def test_caseversion_changed(self):
+        """Changing a caseversion's name re-indexes it."""
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        cv.name = "Sign out"
+        cv.save()
+
+        self.assertEqual(self.tokens(cv), [("name", "out"), ("name", "sign")])
+
+
+    def test_step_changes(self):
+        """Adding, changing and deleting steps re-indexes step fields."""
+        cv = self.F.CaseVersionFactory.create(name="Case")
+        step = self.F.CaseStepFactory.create(
+            caseversion=cv, instruction="Click", expected="Done")
+        self.assertEqual(
+            self.tokens(cv),
+            [("expected", "done"), ("instruction", "click"), ("name", "case")])
+
+        step.instruction = "Press"
+        step.save()
+        self.assertIn(("instruction", "press"), self.tokens(cv))
+
+        step.delete(permanent=True)
+        self.assertEqual(self.tokens(cv), [("name", "case")])
+
+
+    def test_index(self):
+        """``index`` rebuilds the index of the given caseversions."""
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        self.F.CaseStepFactory.create(caseversion=cv, instruction="Click")
+        self.model.SearchToken.objects.all().delete()
+
+        with self.assertNumQueries(4):
+            self.search.index([cv.id])
+
+        self.assertEqual(
+            self.tokens(cv),
+            [("instruction", "click"), ("name", "in"), ("name", "log")])
+
+
+    def test_index_fields(self):
+        """``index`` can update only some fields."""
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        self.F.CaseStepFactory.create(caseversion=cv, instruction="Click")
+        self.model.SearchToken.objects.filter(field="name").delete()
+
+        self.search.index([cv.id], ["instruction"])
+
+        self.assertEqual(self.tokens(cv), [("instruction", "click")])
+
+
+
+class TokenIndexBackendTest(SearchTestCase):
+    """Tests for searching with the token index."""
+    def setUp(self):
+        self.login = self.F.CaseVersionFactory.create(name="Log in")
+        self.logout = self.F.CaseVersionFactory.create(name="Logout")
+        self.blog = self.F.CaseVersionFactory.create(name="Read the blog")
+
+
+    def test_prefix(self):
+        """Matches words starting with the search text."""
+        self.assertEqual(
+            self.matching("name", "log"), set([self.login.id, self.logout.id]))
+
+
+    def test_not_infix(self):
+        """Doesn't match text in the middle of a word."""
+        self.assertEqual(self.matching("name", "og"), set())
+
+
+    def test_all_words(self):
+        """Every word of the text must match."""
+        self.assertEqual(self.matching("name", "in log"), set([self.login.id]))
+
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.matching("name", "BLOG"), set([self.blog.id]))
+
+
+    def test_steps(self):
+        """Words of different steps of a caseversion all match it."""
+        self.F.CaseStepFactory.create(
+            caseversion=self.login, number=1, instruction="Open site")
+        self.F.CaseStepFactory.create(
+            caseversion=self.login, number=2, instruction="Click login")
+
+        self.assertEqual(
+            self.matching("instruction", "site click"), set([self.login.id]))
+
+
+    def test_no_words(self):
+        """Text without words is searched for as-is."""
+        cv = self.F.CaseVersionFactory.create(name="A -- B")
+
+        self.assertEqual(self.matching("name", "--"), set([cv.id]))
+
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            self.search.matching("foo", "bar")
+
+
+
+@override_settings(
+    MOZTRAP_SEARCH_BACKEND="moztrap.model.library.search.LikeBackend")
+class LikeBackendTest(SearchTestCase):
+    """Tests for searching without an index."""
+    def test_substring(self):
+        """Matches the text anywhere in the field."""
+        cv = self.F.CaseVersionFactory.create(name="Logout")
+        self.F.CaseVersionFactory.create(name="Log in")
+
+        self.assertEqual(self.matching("name", "gout"), set([cv.id]))
+
+
+    def test_no_index(self):
+        """Nothing is indexed."""
+        cv = self.F.CaseVersionFactory.create(name="Logout")
+
+        self.assertEqual(self.tokens(cv), [])
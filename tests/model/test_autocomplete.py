@@ -0,0 +1,122 @@
+"""
+Tests for autocomplete name indexes.
+
+"""
+from tests import case
+
+
+
+class NameIndexTest(case.DBTestCase):
+    """Tests for ``NameIndex``."""
+    def setUp(self):
+        """Start with an empty cache."""
+        from django.core.cache import cache
+        cache.clear()
+
+
+    def index(self, **kwargs):
+        """Return a new tag name index."""
+        from moztrap.model.autocomplete import NameIndex
+        return NameIndex(self.model.Tag, **kwargs)
+
+
+    def names(self, suggestions):
+        """Return list of names of ``suggestions``."""
+        return [s.name for s in suggestions]
+
+
+    def test_prefix_first(self):
+        """Names starting with the text come first, then alphabetically."""
+        for name in ["Bar", "abar", "barn", "Cbar", "foo"]:
+            self.F.TagFactory.create(name=name)
+
+        self.assertEqual(
+            self.names(self.index().suggest("BAR")),
+            ["Bar", "barn", "abar", "Cbar"],
+            )
+
+
+    def test_start(self):
+        """Suggestion gives the position of the match in the name."""
+        self.F.TagFactory.create(name="FooBar")
+
+        s = self.index().suggest("bar")[0]
+
+        self.assertEqual((s.name, s.start), ("FooBar", 3))
+
+
+    def test_limit(self):
+        """No more than ``limit`` suggestions are returned."""
+        for i in range(5):
+            self.F.TagFactory.create(name="tag {0}".format(i))
+
+        self.assertEqual(
+            self.names(self.index().suggest("tag", limit=3)),
+            ["tag 0", "tag 1", "tag 2"],
+            )
+
+
+    def test_scopes(self):
+        """Only objects in the given scopes are suggested."""
+        p1 = self.F.ProductFactory.create()
+        p2 = self.F.ProductFactory.create()
+        self.F.TagFactory.create(name="t1", product=p1)
+        self.F.TagFactory.create(name="t2", product=p2)
+        self.F.TagFactory.create(name="t3")
+
+        found = self.index(scope_field="product").suggest("t", [p1.id, None])
+
+        self.assertEqual(
+            [(s.name, s.scope) for s in found], [("t1", p1.id), ("t3", None)])
+
+
+    def test_deleted(self):
+        """Deleted objects are not suggested."""
+        self.F.TagFactory.create(name="foo")
+        self.F.TagFactory.create(name="food").delete()
+
+        self.assertEqual(self.names(self.index().suggest("foo")), ["foo"])
+
+
+    def test_cached(self):
+        """A second suggestion doesn't query the database."""
+        self.F.TagFactory.create(name="foo")
+        index = self.index()
+        index.suggest("f")
+
+        with self.assertNumQueries(0):
+            found = index.suggest("fo")
+
+        self.assertEqual(self.names(found), ["foo"])
+
+
+    def test_reloaded_after_change(self):
+        """Saving an object reloads the index."""
+        t = self.F.TagFactory.create(name="foo")
+        index = self.index()
+        index.suggest("f")
+
+        t.name = "bar"
+        t.save()
+        self.F.TagFactory.create(name="fab")
+
+        self.assertEqual(self.names(index.suggest("f")), ["fab"])
+
+
+    def test_reloaded_when_old(self):
+        """An index older than the count cache timeout is reloaded."""
+        import time
+        from django.conf import settings
+        from mock import patch
+        with patch("moztrap.model.autocomplete.counts") as mock_counts:
+            # as if writes were made by other processes with their own cache
+            mock_counts.generation.return_value = "unchanged"
+            index = self.index()
+            index.suggest("f")
+            self.F.TagFactory.create(name="foo")
+
+            self.assertEqual(self.names(index.suggest("f")), [])
+            with patch("moztrap.model.autocomplete.time") as mock_time:
+                mock_time.time.return_value = (
+                    time.time() + settings.MOZTRAP_COUNT_CACHE_TIMEOUT + 1)
+                self.assertEqual(self.names(index.suggest("f")), ["foo"])
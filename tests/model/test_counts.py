@@ -0,0 +1,164 @@
+"""
+Tests for cached counts.
+
+"""
+from tests import case
+
+
+
+class CachedCountTest(case.DBTestCase):
+    """Tests for ``cached_count``."""
+    def setUp(self):
+        """Start with an empty cache, and a few products."""
+        from django.core.cache import cache
+        cache.clear()
+        self.products = [
+            self.F.ProductFactory.create(name=name) for name in "abc"]
+
+
+    def count(self, queryset, limit=None):
+        """Return cached count of ``queryset``."""
+        from moztrap.model.counts import cached_count
+        return cached_count(queryset, limit)
+
+
+    def test_count(self):
+        """Returns count, and False for not capped."""
+        self.assertEqual(self.count(self.model.Product.objects.all()), (3, False))
+
+
+    def test_cached(self):
+        """Counting the same query again doesn't hit the database."""
+        self.count(self.model.Product.objects.filter(name__in=["a", "b"]))
+
+        with self.assertNumQueries(0):
+            found = self.count(
+                self.model.Product.objects.filter(name__in=["a", "b"]))
+
+        self.assertEqual(found, (2, False))
+
+
+    def test_ordering_ignored(self):
+        """Differently ordered querysets share a count."""
+        self.count(self.model.Product.objects.order_by("name"))
+
+        with self.assertNumQueries(0):
+            self.count(self.model.Product.objects.order_by("-id"))
+
+
+    def test_filters_counted_separately(self):
+        """Different filters are counted separately."""
+        self.count(self.model.Product.objects.filter(name="a"))
+
+        self.assertEqual(
+            self.count(self.model.Product.objects.filter(name__in="ab")),
+            (2, False),
+            )
+
+
+    def test_limit(self):
+        """Past ``limit``, the count is capped."""
+        self.assertEqual(
+            self.count(self.model.Product.objects.all(), limit=2), (2, True))
+
+
+    def test_limit_counted_in_database(self):
+        """A capped count is a single COUNT query, not a fetch of ids."""
+        from django.db import connection
+        self.F.CaseVersionFactory.create(case__product=self.products[0])
+        self.F.CaseVersionFactory.create(case__product=self.products[0])
+        qs = self.model.Product.objects.filter(
+            cases__versions__isnull=False).distinct()
+
+        connection.use_debug_cursor = True
+        try:
+            found = self.count(qs, limit=5)
+            sql = connection.queries[-1]["sql"]
+        finally:
+            connection.use_debug_cursor = None
+
+        self.assertEqual(found, (1, False))
+        self.assertTrue(sql.startswith("SELECT COUNT(*) FROM ("), sql)
+
+
+    def test_limit_not_reached(self):
+        """Up to ``limit``, the count is exact."""
+        self.assertEqual(
+            self.count(self.model.Product.objects.all(), limit=3), (3, False))
+
+
+    def test_save_invalidates(self):
+        """Saving an object of the counted model discards the count."""
+        self.count(self.model.Product.objects.all())
+        self.F.ProductFactory.create()
+
+        self.assertEqual(
+            self.count(self.model.Product.objects.all()), (4, False))
+
+
+    def test_save_existing_invalidates(self):
+        """Saving changes to an existing object discards the count."""
+        self.count(self.model.Product.objects.filter(name="a"))
+        self.products[1].name = "a"
+        self.products[1].save()
+
+        self.assertEqual(
+            self.count(self.model.Product.objects.filter(name="a")),
+            (2, False),
+            )
+
+
+    def test_delete_invalidates(self):
+        """Soft-deleting an object of the counted model discards the count."""
+        self.count(self.model.Product.objects.all())
+        self.products[0].delete()
+
+        self.assertEqual(
+            self.count(self.model.Product.objects.all()), (2, False))
+
+
+    def test_bulk_update_invalidates(self):
+        """A bulk update of the counted model discards the count."""
+        self.count(self.model.Product.objects.filter(name="a"))
+        self.model.Product.objects.update(name="a")
+
+        self.assertEqual(
+            self.count(self.model.Product.objects.filter(name="a")),
+            (3, False),
+            )
+
+
+    def test_joined_table_invalidates(self):
+        """A write to a table joined by the count discards the count."""
+        t = self.F.TagFactory.create()
+        pv = self.F.ProductVersionFactory.create(product=self.products[0])
+        cv = self.F.CaseVersionFactory.create(productversion=pv)
+        qs = self.model.CaseVersion.objects.filter(tags=t)
+        self.count(qs)
+        cv.tags.add(t)
+
+        self.assertEqual(self.count(qs), (1, False))
+
+
+    def test_subquery_table_invalidates(self):
+        """A write to a table read by a filter subquery discards the count."""
+        t = self.F.TagFactory.create()
+        pv = self.F.ProductVersionFactory.create(product=self.products[0])
+        cv = self.F.CaseVersionFactory.create(productversion=pv)
+        qs = self.model.CaseVersion.objects.filter(
+            pk__in=self.model.CaseVersion.objects.filter(
+                tags=t).values("pk"))
+        self.count(qs)
+        cv.tags.add(t)
+
+        self.assertEqual(self.count(qs), (1, False))
+
+
+
+    def test_unrelated_write(self):
+        """A write to a table not in the count keeps the count."""
+        self.count(self.model.Product.objects.all())
+        self.F.TagFactory.create()
+
+        with self.assertNumQueries(0):
+            self.count(self.model.Product.objects.all())
@@ -8,6 +8,8 @@ a test-only model.
 """
 import datetime
 
+from django.db import connection, transaction
+
 from mock import patch
 
 from tests import case
@@ -433,6 +435,110 @@ class CascadeDeleteTest(MTModelTestCase):
             self.refresh(s).deleted_on, self.refresh(p).deleted_on)
 
 
+    def test_counts(self):
+        """delete() returns number of objects deleted per model."""
+        p = self.F.ProductFactory.create()
+        self.F.SuiteFactory.create(product=p)
+        self.F.SuiteFactory.create(product=p)
+
+        found = p.delete()
+
+        self.assertEqual(found, {self.model.Product: 1, self.model.Suite: 2})
+
+
+    def test_counts_skip_deleted(self):
+        """Previously deleted dependents are not counted."""
+        p = self.F.ProductFactory.create()
+        self.F.SuiteFactory.create(product=p)
+        self.F.SuiteFactory.create(product=p).delete()
+
+        found = self.model.Product.objects.all().delete()
+
+        self.assertEqual(found[self.model.Suite], 1)
+
+
+    def test_empty_queryset(self):
+        """Deleting a queryset that can't match anything deletes nothing."""
+        self.F.ProductFactory.create()
+
+        found = self.model.Product.objects.filter(id__in=[]).delete()
+
+        self.assertEqual(found, {})
+        self.assertEqual(self.model.Product.objects.count(), 1)
+
+
+    def test_queries_independent_of_size(self):
+        """Number of queries doesn't grow with the number of dependents."""
+        def queries(num_suites):
+            p = self.F.ProductFactory.create()
+            for i in range(num_suites):
+                self.F.SuiteFactory.create(product=p)
+            connection.use_debug_cursor = True
+            connection.queries = []
+            try:
+                p.delete()
+                return len(connection.queries)
+            finally:
+                connection.use_debug_cursor = None
+
+        self.assertEqual(queries(5), queries(1))
+
+
+    def test_batches(self):
+        """Dependents are updated in batches of ``DELETE_BATCH_SIZE`` ids."""
+        p = self.F.ProductFactory.create()
+        suites = [self.F.SuiteFactory.create(product=p) for i in range(3)]
+
+        with patch("moztrap.model.mtmodel.DELETE_BATCH_SIZE", 1):
+            found = p.delete()
+
+        self.assertEqual(found[self.model.Suite], 3)
+        for s in suites:
+            self.assertIsNot(self.refresh(s).deleted_on, None)
+
+
+    def test_through_deleted(self):
+        """Deletion cascades through dependents that were already deleted."""
+        p = self.F.ProductFactory.create()
+        pv = self.F.ProductVersionFactory.create(product=p)
+        pv.delete()
+        r = self.F.RunFactory.create(productversion=pv)
+
+        found = p.delete()
+
+        self.assertEqual(found[self.model.Run], 1)
+        self.assertNotIn(self.model.ProductVersion, found)
+        self.assertIsNot(self.refresh(r).deleted_on, None)
+
+
+    def test_self_relation(self):
+        """Deletion cascades along a relation of a model to itself."""
+        r1 = self.F.RunFactory.create(is_series=True)
+        r2 = self.F.RunFactory.create(
+            productversion=r1.productversion, series=r1)
+        r3 = self.F.RunFactory.create(
+            productversion=r1.productversion, series=r2)
+
+        found = r1.delete()
+
+        self.assertEqual(found[self.model.Run], 3)
+        self.assertIsNot(self.refresh(r3).deleted_on, None)
+
+
+    def test_self_relation_cycle(self):
+        """A cycle along a relation of a model to itself ends the cascade."""
+        r1 = self.F.RunFactory.create(is_series=True)
+        r2 = self.F.RunFactory.create(
+            productversion=r1.productversion, series=r1)
+        self.model.Run.everything.filter(pk=r1.pk).update(
+            notrack=True, series=r2)
+
+        found = r1.delete()
+
+        self.assertEqual(found[self.model.Run], 2)
+        self.assertIsNot(self.refresh(r2).deleted_on, None)
+
+
 
 class UndeleteMixin(object):
     """Utility assertions mixin for undelete tests."""
@@ -510,6 +616,43 @@ class CascadeUndeleteTest(UndeleteMixin, MTModelTestCase):
         self.assertIsNot(self.refresh(s).deleted_on, None)
 
 
+    def test_through_deleted(self):
+        """Undelete cascades through dependents deleted at another time."""
+        p = self.F.ProductFactory.create()
+        pv = self.F.ProductVersionFactory.create(product=p)
+        with patch("moztrap.model.mtmodel.datetime") as mock_dt:
+            mock_dt.datetime.utcnow.return_value = datetime.datetime(
+                2011, 12, 13, 10, 23, 58)
+            pv.delete()
+            r = self.F.RunFactory.create(productversion=pv)
+            mock_dt.datetime.utcnow.return_value = datetime.datetime(
+                2011, 12, 14, 9, 18, 22)
+            p.delete()
+
+        self.refresh(p).undelete()
+
+        self.assertNotDeleted(self.refresh(r))
+        self.assertIsNot(self.refresh(pv).deleted_on, None)
+
+
+    def test_counts(self):
+        """undelete() returns number of objects undeleted per model."""
+        p = self.F.ProductFactory.create()
+        self.F.SuiteFactory.create(product=p)
+        p.delete()
+
+        found = self.refresh(p).undelete()
+
+        self.assertEqual(found, {self.model.Product: 1, self.model.Suite: 1})
+
+
+    def test_not_deleted(self):
+        """Undeleting objects that aren't deleted changes nothing."""
+        p = self.F.ProductFactory.create()
+
+        self.assertEqual(p.undelete(), {})
+
+
 
 class CloneTest(UndeleteMixin, MTModelTestCase):
     """Tests for cloning."""
@@ -570,6 +713,63 @@ class CloneTest(UndeleteMixin, MTModelTestCase):
         self.assertEqual(new.modified_by, u2)
 
 
+    def test_cascade_queries(self):
+        """Cascade-cloning takes the same number of queries for any size."""
+        for size in [2, 6]:
+            p = self.F.ProfileFactory.create()
+            self.F.EnvironmentFactory.create_full_set(
+                {"OS": ["OS {0}".format(i) for i in range(size)]}, profile=p)
+
+            with self.assertNumQueries(7):
+                new = p.clone()
+
+            self.assertEqual(new.environments.count(), size)
+
+
+    def test_cascade_m2m_follows_clones(self):
+        """Each cloned object gets the m2m relations of its own source."""
+        p = self.F.ProfileFactory.create()
+        self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Linux", "Windows"], "Browser": ["Firefox", "Chrome"]},
+            profile=p,
+            )
+
+        new = p.clone()
+
+        self.assertEqual(
+            sorted(unicode(e) for e in new.environments.all()),
+            sorted(unicode(e) for e in p.environments.all()),
+            )
+
+
+    def test_cascade_created_by(self):
+        """Objects cloned in cascade are created by the cloning user."""
+        p = self.F.ProfileFactory.create()
+        self.F.EnvironmentFactory.create_full_set({"OS": ["OS X"]}, profile=p)
+
+        new = p.clone(user=self.user)
+
+        self.assertEqual(new.environments.get().created_by, self.user)
+
+
+
+class CloneTransactionTest(case.TransactionTestCase):
+    """Transactional tests for cloning."""
+    def test_does_not_commit(self):
+        """Cloning leaves committing to the caller's transaction."""
+        p = self.F.ProfileFactory.create()
+        self.F.EnvironmentFactory.create_full_set({"OS": ["OS X"]}, profile=p)
+
+        with transaction.commit_manually():
+            try:
+                p.clone()
+            finally:
+                transaction.rollback()
+
+        self.assertEqual(self.model.Profile.objects.count(), 1)
+        self.assertEqual(self.model.Environment.objects.count(), 1)
+
+
 
 class MTManagerTest(MTModelTestCase):
     """Tests for MTManager."""
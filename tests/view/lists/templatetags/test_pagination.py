@@ -33,6 +33,33 @@ class PaginateTest(case.DBTestCase):
         self.assertEqual(output, "4 5 6 ")
 
 
+    def test_paginate_keyset(self):
+        """Places KeysetPager in context if view asked for it."""
+        from moztrap.model.tags.models import Tag
+
+        tpl = template.Template(
+            "{% load pagination %}{% paginate queryset as pager %}"
+            "{% for obj in pager.objects %}{{ obj }} {% endfor %}"
+            "{{ pager.total }}")
+
+        tags = [self.F.TagFactory.create(name=str(i)) for i in range(1, 7)]
+        request = Mock()
+        request.GET = {"pagesize": 2, "after": str(tags[1].id)}
+        qs = Tag.objects.order_by("name")
+
+        output = tpl.render(
+            template.Context(
+                {
+                    "request": request,
+                    "queryset": qs,
+                    "keyset_pagination": {"queryset": 5},
+                    }
+                )
+            )
+
+        self.assertEqual(output, "3 4 5")
+
+
 class FilterTest(case.TestCase):
     """Tests for template filters."""
     def test_pagenumber_url(self):
@@ -57,6 +84,33 @@ class FilterTest(case.TestCase):
             "http://localhost/?pagenumber=1&pagesize=20")
 
 
+    def test_after_url(self):
+        """``after_url`` sets keyset position in URL."""
+        from moztrap.view.lists.templatetags.pagination import after_url
+        request = Mock()
+        request.get_full_path.return_value = (
+            "http://localhost/?pagenumber=2")
+        self.assertEqual(
+            after_url(request, 3), "http://localhost/?after=3")
+
+
+    def test_before_url(self):
+        """``before_url`` sets keyset position in URL."""
+        from moztrap.view.lists.templatetags.pagination import before_url
+        request = Mock()
+        request.get_full_path.return_value = "http://localhost/?after=2"
+        self.assertEqual(
+            before_url(request, 3), "http://localhost/?before=3")
+
+
+    def test_first_page_url(self):
+        """``first_page_url`` removes keyset position from URL."""
+        from moztrap.view.lists.templatetags.pagination import first_page_url
+        request = Mock()
+        request.get_full_path.return_value = "http://localhost/?before=2"
+        self.assertEqual(first_page_url(request), "http://localhost/")
+
+
     def test_pagenumber(self):
         """``pagenumber`` gets the pagenumber from the request."""
         from moztrap.view.lists.templatetags.pagination import pagenumber
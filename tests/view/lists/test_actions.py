@@ -133,6 +133,21 @@ class ActionsTest(case.TestCase):
         instance.doit.assert_called_with(user=req.user)
 
 
+    def test_action_method_mapped(self):
+        """An action can be mapped to a differently-named method."""
+        req = self.req("post", "/the/url", data={"action-doit": "3"})
+
+        self.view(
+            req,
+            self.actions(
+                self.mock_model, ["doit"], methods={"doit": "doit_later"}),
+            )
+
+        instance = self.mock_model._base_manager.get.return_value
+        instance.doit_later.assert_called_with(user=req.user)
+        self.assertFalse(instance.doit.called)
+
+
     def test_POST_no_action(self):
         """Without fallthrough, redirects even if no action taken."""
         req = self.req("post", "/the/url", data={})
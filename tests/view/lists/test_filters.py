@@ -3,10 +3,11 @@ Tests for queryset-filtering.
 
 """
 from django.http import QueryDict
-from mock import Mock
+from mock import Mock, patch
 
 from django.template.response import TemplateResponse
 from django.test import RequestFactory
+from django.db.models import Q
 from django.utils.datastructures import MultiValueDict
 
 from tests import case
@@ -470,16 +471,28 @@ class FilterTest(FiltersTestCase):
         self.assertEqual(f.key, "name")
 
 
-    def test_filter(self):
+    @patch("moztrap.view.lists.filters.filter_queryset")
+    def test_filter(self, filter_queryset):
         """Filters queryset so ``self.lookup`` field value is in ``values``."""
         f = self.filters.Filter("name", lookup="lookup")
 
         qs = Mock()
         qs2 = f.filter(qs, ["1", "2"])
 
-        qs.filter.assert_called_with(lookup__in=["1", "2"])
-        qs.filter.return_value.distinct.assert_called_with()
-        self.assertEqual(qs2, qs.filter.return_value.distinct.return_value)
+        filter_queryset.assert_called_with(qs, lookup__in=["1", "2"])
+        self.assertEqual(qs2, filter_queryset.return_value)
+
+
+    @patch("moztrap.view.lists.filters.filter_queryset")
+    def test_filter_extra_filters(self, filter_queryset):
+        """Extra filters are applied along with the values."""
+        f = self.filters.Filter(
+            "name", lookup="lookup", extra_filters={"other": True})
+
+        qs = Mock()
+        f.filter(qs, ["1"])
+
+        filter_queryset.assert_called_with(qs, lookup__in=["1"], other=True)
 
 
     def test_options(self):
@@ -602,19 +615,18 @@ class KeywordExactFilterTest(FiltersTestCase):
 
 class KeywordFilterTest(FiltersTestCase):
     """Tests for KeywordFilter."""
-    def test_filter(self):
+    @patch("moztrap.view.lists.filters.filter_queryset")
+    def test_filter(self, filter_queryset):
         """Filters queryset by 'contains' all values."""
         f = self.filters.KeywordFilter("name")
 
         qs = Mock()
         qs2 = f.filter(qs, ["one", "two"])
 
-        qs.filter.assert_called_with(name__icontains="one")
-        qs.filter.return_value.filter.assert_called_with(name__icontains="two")
-        qs.filter.return_value.filter.return_value.distinct.assert_called_with()
-        self.assertIs(
-            qs2,
-            qs.filter.return_value.filter.return_value.distinct.return_value)
+        filter_queryset.assert_any_call(qs, name__icontains="one")
+        filter_queryset.assert_called_with(
+            filter_queryset.return_value, name__icontains="two")
+        self.assertIs(qs2, filter_queryset.return_value)
 
 
     def test_filter_doesnt_touch_queryset_if_no_values(self):
@@ -629,6 +641,156 @@ class KeywordFilterTest(FiltersTestCase):
 
 
 
+class FilterQuerysetTest(case.DBTestCase):
+    """Tests for ``filter_queryset`` function."""
+    def filter(self, queryset, *args, **kwargs):
+        """Call the function under test."""
+        from moztrap.view.lists.filters import filter_queryset
+        return filter_queryset(queryset, *args, **kwargs)
+
+
+    def test_single_valued(self):
+        """Lookups on single-valued relations filter directly."""
+        cv = self.F.CaseVersionFactory.create()
+        self.F.CaseVersionFactory.create()
+
+        qs = self.filter(
+            self.model.CaseVersion.objects.all(),
+            case__product=cv.case.product,
+            )
+
+        self.assertEqual(list(qs), [cv])
+        self.assertNotIn("IN (SELECT", str(qs.query))
+
+
+    def test_multivalued_no_duplicates(self):
+        """Object matching through several related objects is listed once."""
+        cv = self.F.CaseVersionFactory.create()
+        self.F.CaseStepFactory.create(caseversion=cv, instruction="log in")
+        self.F.CaseStepFactory.create(caseversion=cv, instruction="log out")
+        self.F.CaseVersionFactory.create()
+
+        qs = self.filter(
+            self.model.CaseVersion.objects.all(),
+            steps__instruction__icontains="log",
+            )
+
+        self.assertEqual(list(qs), [cv])
+        self.assertEqual(qs.count(), 1)
+        self.assertFalse(qs.query.distinct)
+
+
+    def test_multivalued_same_related_object(self):
+        """Lookups in one call must match the same related object."""
+        r = self.F.ResultFactory.create(status="passed")
+        rcv = r.runcaseversion
+        self.F.ResultFactory.create(
+            runcaseversion=rcv,
+            tester=r.tester,
+            environment=r.environment,
+            status="failed",
+            )
+
+        qs = self.filter(
+            self.model.RunCaseVersion.objects.all(),
+            results__status__in=["passed"],
+            results__is_latest=True,
+            )
+
+        self.assertEqual(list(qs), [])
+
+
+    def test_q_object(self):
+        """Multi-valued lookups in Q objects are found."""
+        t = self.F.TagFactory.create(name="foo")
+        cv = self.F.CaseVersionFactory.create()
+        cv.tags.add(t)
+        self.F.CaseVersionFactory.create()
+
+        qs = self.filter(
+            self.model.CaseVersion.objects.all(),
+            Q(name="nope") | Q(tags__name="foo"),
+            )
+
+        self.assertEqual(list(qs), [cv])
+        self.assertIn("IN (SELECT", str(qs.query))
+
+
+    def test_keeps_other_filters(self):
+        """The queryset's existing filters are kept."""
+        cv = self.F.CaseVersionFactory.create(name="one")
+        cv2 = self.F.CaseVersionFactory.create(name="two")
+        t = self.F.TagFactory.create()
+        cv.tags.add(t)
+        cv2.tags.add(t)
+
+        qs = self.filter(
+            self.model.CaseVersion.objects.filter(name="two"), tags=t)
+
+        self.assertEqual(list(qs), [cv2])
+
+
+
+class IsMultivaluedTest(FiltersTestCase):
+    """Tests for ``is_multivalued`` function."""
+    def check(self, lookup):
+        from moztrap.model import CaseVersion
+        return self.filters.is_multivalued(CaseVersion, lookup)
+
+
+    def test_local_field(self):
+        self.assertFalse(self.check("name__icontains"))
+
+
+    def test_foreign_key(self):
+        self.assertFalse(self.check("case__product__name"))
+
+
+    def test_pk(self):
+        self.assertFalse(self.check("case__pk"))
+
+
+    def test_many_to_many(self):
+        self.assertTrue(self.check("tags"))
+
+
+    def test_reverse_foreign_key(self):
+        self.assertTrue(self.check("steps__instruction__icontains"))
+
+
+    def test_beyond_foreign_key(self):
+        self.assertTrue(self.check("case__suites__id"))
+
+
+
+class SearchFilterTest(case.DBTestCase):
+    """Tests for SearchFilter."""
+    def test_filter_caseversions(self):
+        """Filters caseversions by search of all values."""
+        from moztrap.view.lists.filters import SearchFilter
+        f = SearchFilter("name", lookup="pk")
+        cv = self.F.CaseVersionFactory.create(name="Log in")
+        self.F.CaseVersionFactory.create(name="Log out")
+
+        qs = f.filter(self.model.CaseVersion.objects.all(), ["log", "in"])
+
+        self.assertEqual(list(qs), [cv])
+
+
+    def test_filter_related(self):
+        """Filters objects by search of their caseversion."""
+        from moztrap.view.lists.filters import SearchFilter
+        f = SearchFilter("expected result", field="expected")
+        step = self.F.CaseStepFactory.create(expected="Logged in")
+        rcv = self.F.RunCaseVersionFactory.create(caseversion=step.caseversion)
+        self.F.RunCaseVersionFactory.create()
+
+        qs = f.filter(self.model.RunCaseVersion.objects.all(), ["logged"])
+
+        self.assertEqual(list(qs), [rcv])
+
+
+
 class PinnedFilterTest(FiltersTestCase):
     """Tests for pinned filters"""
 
@@ -105,7 +105,39 @@ class FinderDecoratorTest(case.DBTestCase):
             )
 
         f.column_template.assert_called_with("things")
-        f.objects.assert_called_with("things", "2")
+        f.objects.assert_called_with("things", "2", 0)
+
+
+    @patch("moztrap.view.lists.finder.render")
+    def test_ajax_offset(self, render):
+        """Ajax request can give offset of column objects, and omit parent."""
+        MockFinder = Mock()
+        f = MockFinder.return_value
+
+        req = RequestFactory().get(
+            "/some/url",
+            {"finder": "1", "col": "things", "offset": "20"},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.on_template_response(
+            {}, request=req, decorator=self.finder(MockFinder))
+
+        f.objects.assert_called_with("things", None, 20)
+
+
+    @patch("moztrap.view.lists.finder.render")
+    def test_ajax_bad_offset(self, render):
+        """Ajax request with bad offset gets column objects from start."""
+        MockFinder = Mock()
+        f = MockFinder.return_value
+
+        req = RequestFactory().get(
+            "/some/url",
+            {"finder": "1", "col": "things", "id": "2", "offset": "x"},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.on_template_response(
+            {}, request=req, decorator=self.finder(MockFinder))
+
+        f.objects.assert_called_with("things", "2", 0)
 
 
     def test_no_ajax(self):
@@ -199,6 +231,20 @@ class FinderTest(case.DBTestCase):
             )
 
 
+    def test_parent_lookups(self):
+        """Maps column name to lookup of parent column objects."""
+        f = self.ManageFinder()
+
+        self.assertEqual(
+            f.parent_lookups,
+            {
+                "productversions": "product",
+                "runs": "productversion",
+                "suites": "runs",
+                }
+            )
+
+
     def test_column_template(self):
         """Joins finder base template to column template name."""
         f = self.ManageFinder()
@@ -316,6 +362,59 @@ class FinderTest(case.DBTestCase):
         self.assertEqual(list(objects), [rs.suite])
 
 
+    def test_objects_cached(self):
+        """Objects are cached until their tables are written to."""
+        f = self.ManageFinder()
+
+        pv = self.F.ProductVersionFactory.create()
+        f.objects("productversions", pv.product.pk)
+
+        with self.assertNumQueries(0):
+            objects = f.objects("productversions", pv.product.pk)
+
+        self.assertEqual(list(objects), [pv])
+
+        pv2 = self.F.ProductVersionFactory.create(product=pv.product)
+
+        self.assertEqual(
+            set(f.objects("productversions", pv.product.pk)), set([pv, pv2]))
+
+
+    def test_objects_window(self):
+        """Only page_size objects are returned, with URL for more."""
+        from moztrap.view.lists.finder import Finder, Column
+
+        class SmallFinder(Finder):
+            columns = [
+                Column(
+                    "products",
+                    "_products.html",
+                    self.model.Product.objects.order_by("name"),
+                    page_size=2,
+                    ),
+                ]
+
+        f = SmallFinder()
+        p = [self.F.ProductFactory.create(name=n) for n in "abc"]
+
+        first = f.objects("products")
+        rest = f.objects("products", offset=2)
+
+        self.assertEqual(list(first), p[:2])
+        self.assertEqual(first.more_url, "?finder=1&col=products&offset=2")
+        self.assertEqual(list(rest), p[2:])
+        self.assertEqual(rest.more_url, None)
+
+
+    def test_more_query_url(self):
+        """Returns ajax query url for column objects from offset."""
+        f = self.ManageFinder()
+
+        url = f.more_query_url("suites", 5, 100)
+
+        self.assertEqual(url, "?finder=1&col=suites&id=5&offset=100")
+
+
     def test_no_parent_relationship(self):
         """If no relationship to parent model is found, raises ValueError."""
         from moztrap.view.lists.finder import Finder, Column
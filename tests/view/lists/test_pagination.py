@@ -2,7 +2,7 @@
 Tests for pagination utilities.
 
 """
-from mock import Mock
+from mock import Mock, patch
 
 from tests import case
 
@@ -97,6 +97,19 @@ class TestPagenumberUrl(case.TestCase):
 
 class TestPager(case.DBTestCase):
     """Tests for ``Pager`` class."""
+    def setUp(self):
+        """Count mock querysets with their ``count`` method."""
+        def count(qs, limit):
+            found = qs.count()
+            if limit is None or found <= limit:
+                return found, False
+            return limit, True
+
+        patcher = patch("moztrap.view.lists.pagination.cached_count")
+        patcher.start().side_effect = count
+        self.addCleanup(patcher.stop)
+
+
     @property
     def pager(self):
         """The class under test."""
@@ -341,6 +354,288 @@ class TestPager(case.DBTestCase):
         self.assertEqual(self.pager(self.qs(25), 20, 1).next, 2)
 
 
+    def test_total_capped(self):
+        """Past ``count_limit`` objects, the total is capped."""
+        p = self.pager(self.qs(25), 10, 1, count_limit=20)
+
+        self.assertEqual(p.total, 20)
+        self.assertTrue(p.total_capped)
+
+
+    def test_total_not_capped(self):
+        """Up to ``count_limit`` objects, the total is exact."""
+        p = self.pager(self.qs(20), 10, 1, count_limit=20)
+
+        self.assertEqual(p.total, 20)
+        self.assertFalse(p.total_capped)
+
+
+    def test_pages_capped_past_limit(self):
+        """A page past the count limit is included in the pages."""
+        p = self.pager(self.qs(50), 10, 3, count_limit=20)
+
+        self.assertEqual(list(p.pages()), [1, 2, 3])
+
+
+    def test_high_capped_past_limit(self):
+        """Past the count limit, the last ordinal isn't constrained."""
+        self.assertEqual(
+            self.pager(self.qs(50), 10, 3, count_limit=20).high, 30)
+
+
+    def test_next_capped_full_page(self):
+        """Past the count limit, there is a next page after a full page."""
+        qs = self.qs(50)
+        qs.__getitem__.return_value = range(10)
+        p = self.pager(qs, 10, 2, count_limit=20)
+
+        self.assertEqual(p.next, 3)
+
+
+    def test_next_capped_partial_page(self):
+        """Past the count limit, a page that isn't full is the last."""
+        qs = self.qs(50)
+        qs.__getitem__.return_value = range(5)
+        p = self.pager(qs, 10, 3, count_limit=20)
+
+        self.assertEqual(p.next, None)
+
+
+
+class TestKeysetFromRequest(case.TestCase):
+    """Tests for ``keyset_from_request`` function."""
+    def _check(self, GET, result):
+        """Assert that a request with ``GET`` params gives ``result``"""
+        from moztrap.view.lists.pagination import keyset_from_request
+        request = Mock()
+        request.GET = GET
+        self.assertEqual(keyset_from_request(request), result)
+
+
+    def test_defaults(self):
+        """Defaults to first page, 20 per page."""
+        self._check({}, (20, None, None))
+
+
+    def test_after(self):
+        """After takes precedence over before."""
+        self._check({"pagesize": "10", "after": "3", "before": "2"}, (10, 3, None))
+
+
+    def test_before(self):
+        """Before is given if there is no after."""
+        self._check({"before": "2"}, (20, None, 2))
+
+
+    def test_invalid(self):
+        """Invalid ids are ignored."""
+        self._check({"after": "foo", "before": "-2"}, (20, None, None))
+
+
+
+class TestKeysetUrl(case.TestCase):
+    """Tests for ``keyset_url`` function."""
+    def test_after(self):
+        """Sets after, removing before and pagenumber."""
+        from moztrap.view.lists.pagination import keyset_url
+        self.assertEqual(
+            Url(keyset_url("/?before=3&pagenumber=2&pagesize=10", after=5)),
+            Url("/?after=5&pagesize=10"),
+            )
+
+
+    def test_first(self):
+        """With no position, returns first page URL."""
+        from moztrap.view.lists.pagination import keyset_url
+        self.assertEqual(keyset_url("/?after=3"), "/")
+
+
+
+class TestKeysetPager(case.DBTestCase):
+    """Tests for KeysetPager."""
+    def setUp(self):
+        """Create products; names in reverse order of creation."""
+        self.products = [
+            self.F.ProductFactory.create(name=name)
+            for name in ["e", "d", "c", "b", "b", "a"]
+            ]
+
+
+    def pager(self, *args, **kwargs):
+        """Return ``KeysetPager`` of products ordered by ``order_by``."""
+        from moztrap.view.lists.pagination import KeysetPager
+        order_by = kwargs.pop("order_by", ["name"])
+        qs = self.model.Product.objects.order_by(*order_by)
+        return KeysetPager(qs, *args, **kwargs)
+
+
+    def names(self, pager):
+        """Return names (and ids) of the products on ``pager``'s page."""
+        return [(p.name, p.id) for p in pager.objects]
+
+
+    def ordered(self, start, end):
+        """Return (name, id) of products, in name order, from start to end."""
+        ordered = sorted(self.products, key=lambda p: (p.name, p.id))
+        return [(p.name, p.id) for p in ordered[start:end]]
+
+
+    def test_first_page(self):
+        """With no position, returns the first page."""
+        pager = self.pager(2)
+
+        self.assertEqual(self.names(pager), self.ordered(0, 2))
+        self.assertEqual(pager.prev, None)
+        self.assertEqual(pager.next, pager.objects[-1].id)
+
+
+    def test_walk_forward(self):
+        """Following ``next`` visits every object once, ties broken by id."""
+        seen = []
+        after = None
+        while True:
+            pager = self.pager(2, after=after)
+            seen.extend(self.names(pager))
+            after = pager.next
+            if after is None:
+                break
+
+        self.assertEqual(seen, self.ordered(0, 6))
+
+
+    def test_walk_backward(self):
+        """Following ``prev`` from the end visits every object once."""
+        ordered = self.ordered(0, 6)
+        pager = self.pager(2, after=ordered[3][1])
+        self.assertEqual(self.names(pager), ordered[4:6])
+        self.assertEqual(pager.next, None)
+
+        pager = self.pager(2, before=pager.prev)
+        self.assertEqual(self.names(pager), ordered[2:4])
+        pager = self.pager(2, before=pager.prev)
+        self.assertEqual(self.names(pager), ordered[0:2])
+        self.assertEqual(pager.prev, None)
+        self.assertEqual(pager.next, ordered[1][1])
+
+
+    def test_before_first(self):
+        """Seeking before the first object gives the first page."""
+        first = self.ordered(0, 1)[0][1]
+
+        pager = self.pager(2, before=first)
+
+        self.assertEqual(self.names(pager), self.ordered(0, 2))
+
+
+    def test_descending(self):
+        """Descending sorts seek the other way."""
+        pager = self.pager(2, order_by=["-name"])
+        pager = self.pager(2, after=pager.next, order_by=["-name"])
+
+        self.assertEqual(
+            [name for name, id in self.names(pager)], ["c", "b"])
+
+
+    def test_default_ordering(self):
+        """With no explicit ordering, model's default ordering is used."""
+        from moztrap.view.lists.pagination import KeysetPager
+        pager = KeysetPager(self.model.RunCaseVersion.objects.all(), 10)
+
+        self.assertEqual(pager.key_fields(), [("order", False), ("id", False)])
+
+
+    def test_null_values(self):
+        """Objects with NULL sort values are paged through, sorted lowest."""
+        from moztrap.view.lists.pagination import KeysetPager
+        for build in [None, "2", None, "1"]:
+            self.F.RunFactory.create(build=build)
+
+        seen = []
+        after = None
+        while True:
+            pager = KeysetPager(
+                self.model.Run.objects.order_by("build"), 1, after=after)
+            seen.extend(r.build for r in pager.objects)
+            after = pager.next
+            if after is None:
+                break
+
+        self.assertEqual(seen, [None, None, "1", "2"])
+
+
+    def test_related_ordering(self):
+        """A relation sorts (and seeks) by the related model's ordering."""
+        from moztrap.view.lists.pagination import KeysetPager
+        # product names and version orders both run against creation order
+        pvs = []
+        for product in self.products[:3]:
+            for order in [2, 1]:
+                pvs.append(
+                    self.F.ProductVersionFactory.create(
+                        product=product, version=str(order), order=order))
+        for pv in pvs:
+            self.F.CaseVersionFactory.create(productversion=pv)
+
+        seen = []
+        after = None
+        while True:
+            pager = KeysetPager(
+                self.model.CaseVersion.objects.order_by("productversion"),
+                2,
+                after=after,
+                )
+            seen.extend(cv.id for cv in pager.objects)
+            after = pager.next
+            if after is None:
+                break
+
+        self.assertEqual(
+            seen,
+            list(
+                self.model.CaseVersion.objects.order_by(
+                    "productversion", "id").values_list("id", flat=True))
+            )
+
+
+    def test_missing_position(self):
+        """If the position object is gone, returns the first page."""
+        pager = self.pager(2, after=0)
+
+        self.assertEqual(self.names(pager), self.ordered(0, 2))
+
+
+    def test_total_capped(self):
+        """Counting stops at ``count_limit``."""
+        pager = self.pager(2, count_limit=4)
+
+        self.assertEqual(pager.total, 4)
+        self.assertTrue(pager.total_capped)
+
+
+    def test_total_exact(self):
+        """With no ``count_limit``, all objects are counted."""
+        pager = self.pager(2, count_limit=None)
+
+        self.assertEqual(pager.total, 6)
+        self.assertFalse(pager.total_capped)
+
+
+    def test_total_not_counted(self):
+        """With ``count_limit`` False, there is no total."""
+        pager = self.pager(2, count_limit=False)
+
+        self.assertEqual(pager.total, None)
+        self.assertFalse(pager.counted)
+
+
+    def test_queries(self):
+        """A deep page takes a position lookup and the page query."""
+        pager = self.pager(2, after=self.products[0].id)
+
+        with self.assertNumQueries(2):
+            pager.objects
+
+
 
 class TestPositiveInteger(case.TestCase):
     """Tests for ``positive_integer`` function."""
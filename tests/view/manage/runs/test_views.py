@@ -6,6 +6,7 @@ Tests for run management views.
 from datetime import date
 
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 
 from tests import case
 
@@ -37,6 +38,102 @@ class RunsTest(case.view.manage.ListViewTestCase,
         return reverse("manage_runs")
 
 
+    def test_activate(self):
+        """By default, the job activating a run is run right away."""
+        self.add_perm(self.perm)
+
+        r = self.factory.create(status="draft")
+
+        self.get_form().submit(
+            name="action-activate",
+            index=0,
+            headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+
+        self.assertEqual(self.refresh(r).status, "active")
+        self.assertEqual(r.get_jobs().get().status, "done")
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+    def test_activate_worker(self):
+        """Without eager jobs, activating a run queues a job for a worker."""
+        self.add_perm(self.perm)
+
+        r = self.factory.create(status="draft")
+
+        self.get_form().submit(
+            name="action-activate",
+            index=0,
+            headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+
+        self.assertEqual(self.refresh(r).status, "draft")
+        job = r.get_jobs().get()
+        self.assertEqual(job.kind, "run.activate")
+        self.assertEqual(job.created_by, self.user)
+
+        job.claim("test")
+        job.execute()
+
+        self.assertEqual(self.refresh(r).status, "active")
+
+
+    @override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+    def test_refresh(self):
+        """Refreshing a run queues a job."""
+        self.add_perm(self.perm)
+
+        r = self.factory.create(status="active")
+
+        self.get_form().submit(
+            name="action-refresh",
+            index=0,
+            headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+
+        self.assertEqual(r.get_jobs().get().kind, "run.refresh")
+
+
+
+@override_settings(MOZTRAP_JOBS_ALWAYS_EAGER=False)
+class RunJobsTest(case.view.AuthenticatedViewTestCase,
+                  case.view.NoCacheTest,
+                  ):
+    """Test for run background jobs status ajax view."""
+    def setUp(self):
+        """Setup for run jobs tests; create a run."""
+        super(RunJobsTest, self).setUp()
+        self.testrun = self.F.RunFactory.create()
+
+
+    @property
+    def url(self):
+        """Shortcut for run jobs url."""
+        return reverse(
+            "manage_run_jobs",
+            kwargs=dict(run_id=self.testrun.id)
+            )
+
+
+    def test_jobs(self):
+        """Returns status of the run's jobs in JSON."""
+        job = self.testrun.enqueue_activate()
+
+        res = self.get(headers={"X-Requested-With": "XMLHttpRequest"})
+
+        self.assertEqual(
+            [(j["id"], j["status"], j["finished"]) for j in res.json["jobs"]],
+            [(job.id, "queued", False)],
+            )
+
+
+    def test_no_jobs(self):
+        """Empty list if run has no jobs."""
+        res = self.get(headers={"X-Requested-With": "XMLHttpRequest"})
+
+        self.assertEqual(res.json["jobs"], [])
+
+
 
 class RunDetailTest(case.view.AuthenticatedViewTestCase,
                     case.view.NoCacheTest,
@@ -332,3 +332,26 @@ class TagsAutocompleteTest(case.view.AuthenticatedViewTestCase,
         res = self.get()
 
         self.assertEqual(res.json, {"suggestions": []})
+
+
+    def test_ranked(self):
+        """Tags starting with the query come first."""
+        self.F.TagFactory.create(name="a foo")
+        self.F.TagFactory.create(name="foo")
+
+        res = self.get("foo")
+
+        self.assertEqual(
+            [t["name"] for t in res.json["suggestions"]], ["foo", "a foo"])
+
+
+    def test_limited(self):
+        """No more than ``AUTOCOMPLETE_LIMIT`` tags are returned."""
+        from moztrap.model.autocomplete import AUTOCOMPLETE_LIMIT
+        for i in range(AUTOCOMPLETE_LIMIT + 1):
+            self.F.TagFactory.create(name="tag {0:02d}".format(i))
+
+        res = self.get("tag")
+
+        self.assertEqual(
+            len(res.json["suggestions"]), AUTOCOMPLETE_LIMIT)
@@ -58,6 +58,24 @@ class ResultsViewTest(case.view.ListViewTestCase,
         res.mustcontain("<p>{@onclick=alert(1)}paragraph</p>")
 
 
+    def test_environment(self):
+        """Includes environment elements of each result, in category order."""
+        envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Linux", "Windows"], "Language": ["English"]})
+        for env in envs:
+            self.factory(environment=env)
+
+        res = self.get()
+
+        self.assertEqual(
+            sorted(
+                [li.text for li in ul.findAll("li")]
+                for ul in res.html.findAll("ul", "envlist")
+                ),
+            [["English", "Linux"], ["English", "Windows"]],
+            )
+
+
     def test_filter_by_status(self):
         """Can filter by status."""
         self.factory(status="passed", tester__username="Tester 1")
@@ -27,6 +27,21 @@ class RunCaseVersionResultsViewTest(case.view.ListViewTestCase,
         return reverse("results_runcaseversions")
 
 
+    def test_completion_and_summary(self):
+        """List items show completion and result summary."""
+        envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        rcv = self.F.RunCaseVersionFactory.create(environments=envs)
+        self.F.ResultFactory.create(
+            runcaseversion=rcv, environment=envs[0], status="failed")
+
+        res = self.get()
+
+        res.mustcontain('data-perc="50"')
+        res.mustcontain('<a href="{0}" class="failed " title="failed">1'.format(
+            reverse("results_results", kwargs={"rcv_id": rcv.id})))
+
+
     def test_filter_by_status(self):
         """Can filter by status."""
         self.F.RunCaseVersionFactory.create(